@@ -0,0 +1,472 @@
+"""
+Модуль HTTP API сервиса Audio Highlight.
+
+Принимает аудиофайлы и ставит задания на выделение хайлайтов
+или формирование плейлиста в ограниченную очередь, см. lib.jobs.
+Статус задания можно опрашивать (в том числе с ожиданием завершения),
+а результаты скачиваются потоково. Если очередь заполнена,
+сервис отвечает 429, а при остановке - 503. Под нагрузкой хайлайты
+ищутся на более дешёвом уровне качества, см. lib.tiers.
+
+Запуск из корня репозитория:
+    python api.py --port 8080
+"""
+
+import argparse
+import asyncio
+import os
+from typing import Dict, List, Tuple
+from aiohttp import web
+from lib.audio_writer import (
+    AUDIO_FORMATS,
+    LOSSY_FORMATS,
+    OUTPUT_BITRATES,
+    get_mime_type,
+)
+from lib.highlight import HIGHLIGHT_TIERS
+from lib.jobs import (
+    JOB_WORKERS,
+    QUEUE_SIZE,
+    Job,
+    JobQueue,
+    QueueFullError,
+)
+from lib.metrics import PREFIX, enable_profiling, get_metrics
+from lib.model import (
+    MODEL_VARIANT_ENV,
+    MODEL_VARIANTS,
+    variant_weights_path,
+)
+from lib.output import record_served
+from lib.parallel import shutdown_executors
+from lib.session_pool import (
+    configure_from_args,
+    record_session_pool_metrics,
+)
+from lib.tiers import AUTO_TIER, TIER_THRESHOLDS, TierPolicy
+from lib.utils import NotSupportedModelException
+
+
+MAX_UPLOAD_BYTES = 200 * 1024 ** 2
+MAX_FILES = 32
+MAX_WAIT_SEC = 60
+RETRY_AFTER_SEC = 5
+QUEUE_KEY = web.AppKey("queue", JobQueue)
+
+
+async def read_files(
+    request: web.Request,
+) -> Tuple[List[Tuple[str, bytes]], Dict[str, str]]:
+    """
+    Асинхронная функция чтения multipart-запроса с аудиофайлами.
+    Загрузка отклоняется до чтения тела, если очередь заполнена,
+    а суммарный размер файлов ограничен MAX_UPLOAD_BYTES.
+
+    :param
+    request : aiohttp.web.Request
+        Запрос с полями "files" (аудиофайлы) и текстовыми параметрами.
+    :return:
+    files : List[Tuple[str, bytes]]
+        Список пар (имя файла, содержимое).
+    fields : Dict[str, str]
+        Текстовые поля запроса.
+    """
+    check_capacity(request)
+    files = []
+    fields = {}
+    total = 0
+    reader = await request.multipart()
+    async for part in reader:
+        if part.filename:
+            if len(files) >= MAX_FILES:
+                raise web.HTTPRequestEntityTooLarge(
+                    max_size=MAX_FILES,
+                    actual_size=len(files) + 1,
+                    text=f"At most {MAX_FILES} files per job",
+                )
+            data = bytearray()
+            while chunk := await part.read_chunk():
+                total += len(chunk)
+                if total > MAX_UPLOAD_BYTES:
+                    raise web.HTTPRequestEntityTooLarge(
+                        max_size=MAX_UPLOAD_BYTES,
+                        actual_size=total,
+                    )
+                data.extend(chunk)
+            files.append((part.filename, bytes(data)))
+        elif part.name:
+            fields[part.name] = await part.text()
+    if not files:
+        raise web.HTTPBadRequest(text="No audio files uploaded")
+    return files, fields
+
+
+def check_capacity(
+    request: web.Request,
+) -> None:
+    """
+    Функция проверки, что очередь может принять задание:
+    если очередь заполнена, отвечает 429, а если сервис
+    остановлен - 503.
+
+    :param
+    request : aiohttp.web.Request
+        Запрос.
+    """
+    queue = request.app[QUEUE_KEY]
+    headers = {"Retry-After": str(RETRY_AFTER_SEC)}
+    if not queue.accepting:
+        raise web.HTTPServiceUnavailable(
+            text="Service is shutting down", headers=headers
+        )
+    if queue.full:
+        raise web.HTTPTooManyRequests(
+            text="Job queue is full", headers=headers
+        )
+
+
+def read_output_params(
+    fields: Dict[str, str],
+) -> Dict[str, str | int | None]:
+    """
+    Функция чтения параметров кодирования результатов задания:
+    поле format (ключ AUDIO_FORMATS, по умолчанию wav) и поле
+    bitrate_kbps (одно из OUTPUT_BITRATES) для форматов со сжатием
+    с потерями. Неверные значения отклоняются с ответом 400.
+
+    :param
+    fields : Dict[str, str]
+        Текстовые поля запроса.
+    :return:
+    params : Dict[str, str | int | None]
+        Параметры задания "format" и "bitrate_kbps".
+    """
+    audio_format = fields.get("format", "wav").lower()
+    if audio_format not in AUDIO_FORMATS:
+        raise web.HTTPBadRequest(
+            text=f"format must be one of {', '.join(AUDIO_FORMATS)}"
+        )
+    bitrate_kbps = None
+    if "bitrate_kbps" in fields:
+        if audio_format not in LOSSY_FORMATS:
+            raise web.HTTPBadRequest(
+                text=f"bitrate_kbps is only supported for "
+                     f"{', '.join(LOSSY_FORMATS)}"
+            )
+        try:
+            bitrate_kbps = int(fields["bitrate_kbps"])
+        except ValueError:
+            bitrate_kbps = None
+        if bitrate_kbps not in OUTPUT_BITRATES:
+            raise web.HTTPBadRequest(
+                text=f"bitrate_kbps must be one of "
+                     f"{', '.join(map(str, OUTPUT_BITRATES))}"
+            )
+    return {"format": audio_format, "bitrate_kbps": bitrate_kbps}
+
+
+def submit_job(
+    request: web.Request,
+    job: Job,
+) -> web.Response:
+    """
+    Функция постановки задания в очередь с ответом 202.
+    Если пока читались файлы очередь заполнилась, отвечает 429.
+
+    :param
+    request : aiohttp.web.Request
+        Запрос.
+    job : Job
+        Задание.
+    :return:
+    response : aiohttp.web.Response
+        Описание поставленного задания.
+    """
+    check_capacity(request)
+    try:
+        request.app[QUEUE_KEY].submit(job)
+    except QueueFullError as e:
+        raise web.HTTPTooManyRequests(
+            text=e.msg, headers={"Retry-After": str(RETRY_AFTER_SEC)}
+        ) from e
+    return web.json_response(
+        job.to_dict(),
+        status=202,
+        headers={"Location": f"/jobs/{job.id}"},
+    )
+
+
+async def create_highlights(request: web.Request) -> web.Response:
+    """
+    Обработчик POST /highlights: задание на выделение хайлайтов.
+    Необязательное поле full_track=1 включает поиск по всему треку,
+    поле tier задаёт уровень качества (по умолчанию auto - уровень
+    выбирается по нагрузке), поле native_rate=1 отдаёт хайлайты
+    в исходной частоте дискретизации файлов вместо частоты модели,
+    поля format и bitrate_kbps - формат результатов,
+    см. read_output_params.
+    """
+    files, fields = await read_files(request)
+    output_params = read_output_params(fields)
+    full_track = fields.get("full_track", "0").lower() in ("1", "true")
+    native_rate = fields.get("native_rate", "0").lower() in ("1", "true")
+    tier = fields.get("tier", AUTO_TIER)
+    if tier != AUTO_TIER and tier not in HIGHLIGHT_TIERS:
+        raise web.HTTPBadRequest(
+            text=f"tier must be one of {AUTO_TIER}, "
+                 f"{', '.join(HIGHLIGHT_TIERS)}"
+        )
+    return submit_job(
+        request,
+        Job(
+            "highlights",
+            files,
+            {
+                "full_track": full_track,
+                "tier": tier,
+                "native_rate": native_rate,
+                **output_params,
+            },
+        ),
+    )
+
+
+async def create_playlist(request: web.Request) -> web.Response:
+    """
+    Обработчик POST /playlists: задание на формирование плейлиста.
+    Необязательное поле cross_len - длина перекрытия в секундах,
+    поля format и bitrate_kbps - формат плейлиста,
+    см. read_output_params.
+    """
+    files, fields = await read_files(request)
+    output_params = read_output_params(fields)
+    try:
+        cross_len = float(fields.get("cross_len", 5))
+    except ValueError:
+        raise web.HTTPBadRequest(text="cross_len must be a number") from None
+    return submit_job(
+        request,
+        Job("playlist", files, {"cross_len": cross_len, **output_params}),
+    )
+
+
+def find_job(request: web.Request) -> Job:
+    """
+    Функция получения задания по идентификатору из пути запроса.
+    """
+    job = request.app[QUEUE_KEY].get(request.match_info["job_id"])
+    if job is None:
+        raise web.HTTPNotFound(text="Job not found")
+    return job
+
+
+async def get_job(request: web.Request) -> web.Response:
+    """
+    Обработчик GET /jobs/{job_id}: статус задания.
+    Параметр wait (секунды, не более MAX_WAIT_SEC) включает
+    ожидание завершения задания (long polling).
+    """
+    job = find_job(request)
+    try:
+        wait = min(float(request.query.get("wait", 0)), MAX_WAIT_SEC)
+    except ValueError:
+        raise web.HTTPBadRequest(text="wait must be a number") from None
+    if wait > 0 and not job.done.is_set():
+        try:
+            await asyncio.wait_for(job.done.wait(), wait)
+        except asyncio.TimeoutError:
+            pass
+    return web.json_response(job.to_dict())
+
+
+async def get_result(request: web.Request) -> web.FileResponse:
+    """
+    Обработчик GET /jobs/{job_id}/results/{idx}: файл результата
+    в формате задания, отдаётся потоково.
+    """
+    job = find_job(request)
+    if not job.done.is_set():
+        raise web.HTTPConflict(text=f"Job is {job.status}")
+    try:
+        result = job.results[int(request.match_info["idx"])]
+    except (ValueError, IndexError):
+        raise web.HTTPNotFound(text="Result not found") from None
+    if "path" not in result or not os.path.exists(result["path"]):
+        raise web.HTTPNotFound(text=result.get("error", "Result not found"))
+    record_served(
+        job.kind, os.path.getsize(result["path"]), result["format"]
+    )
+    return web.FileResponse(
+        result["path"],
+        headers={"Content-Type": get_mime_type(result["format"])},
+    )
+
+
+async def metrics(request: web.Request) -> web.Response:
+    """
+    Обработчик GET /metrics: метрики в текстовом формате Prometheus,
+    см. lib.metrics.
+    """
+    queue = request.app[QUEUE_KEY]
+    get_metrics().set(f"{PREFIX}_jobs_retained", len(queue))
+    record_session_pool_metrics()
+    return web.Response(
+        text=get_metrics().render(),
+        content_type="text/plain",
+        charset="utf-8",
+    )
+
+
+async def health(request: web.Request) -> web.Response:
+    """
+    Обработчик GET /health: состояние очереди.
+    """
+    queue = request.app[QUEUE_KEY]
+    return web.json_response(
+        {"accepting": queue.accepting, "pending": queue.pending},
+        status=200 if queue.accepting else 503,
+    )
+
+
+def create_app(
+    queue_size: int = QUEUE_SIZE,
+    workers: int = JOB_WORKERS,
+    track_workers: int | None = None,
+    policy: TierPolicy | None = None,
+) -> web.Application:
+    """
+    Функция создания приложения HTTP API. Очередь заданий
+    запускается и останавливается вместе с приложением.
+
+    :param
+    queue_size : int = QUEUE_SIZE
+        Максимальное количество ожидающих заданий.
+    workers : int = JOB_WORKERS
+        Количество одновременно обрабатываемых заданий.
+    track_workers : int | None = None
+        Количество параллельных исполнителей внутри задания,
+        см. lib.parallel.gather_tracks.
+    policy : TierPolicy | None = None
+        Политика выбора уровня качества хайлайтов, см. lib.tiers.
+    :return:
+    app : aiohttp.web.Application
+        Приложение.
+    """
+    app = web.Application()
+
+    async def queue_context(app: web.Application):
+        queue = JobQueue(
+            queue_size, workers, track_workers=track_workers, policy=policy
+        )
+        queue.start()
+        app[QUEUE_KEY] = queue
+        yield
+        await queue.stop()
+
+    app.cleanup_ctx.append(queue_context)
+    app.add_routes(
+        [
+            web.post("/highlights", create_highlights),
+            web.post("/playlists", create_playlist),
+            web.get("/jobs/{job_id}", get_job),
+            web.get("/jobs/{job_id}/results/{idx}", get_result),
+            web.get("/metrics", metrics),
+            web.get("/health", health),
+        ]
+    )
+    return app
+
+
+def main():
+    """
+    Точка входа HTTP API.
+    """
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS)
+    parser.add_argument("--track-workers", type=int, default=None)
+    parser.add_argument(
+        "--model",
+        choices=list(MODEL_VARIANTS),
+        default=None,
+        help="вариант весов модели, см. lib.model.MODEL_VARIANTS",
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=None,
+        help="количество ONNX-сессий в пуле процесса, "
+             "см. lib.session_pool.POOL_SIZE",
+    )
+    parser.add_argument(
+        "--intra-op-threads",
+        type=int,
+        default=None,
+        help="количество потоков внутри оператора ONNX-сессии, "
+             "см. lib.session_pool.INTRA_OP_NUM_THREADS",
+    )
+    for tier, (depth, cost) in TIER_THRESHOLDS.items():
+        parser.add_argument(
+            f"--{tier}-queue-depth",
+            type=int,
+            default=depth,
+            help=f"глубина очереди, начиная с которой уровень {tier} "
+                 "выбирается для заданий с tier=auto",
+        )
+        parser.add_argument(
+            f"--{tier}-cost",
+            type=float,
+            default=cost,
+            help=f"сглаженные секунды обработки на секунду аудио "
+                 f"без ожидания в очереди, начиная с которых "
+                 f"выбирается уровень {tier}",
+        )
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        default=0,
+        help="сохранять профили N самых медленных заданий, см. lib.metrics",
+    )
+    args = parser.parse_args()
+    enable_profiling(args.profile_top)
+    if args.model is not None:
+        try:
+            variant_weights_path(args.model)
+        except NotSupportedModelException as e:
+            parser.error(f"--model {args.model}: {e.msg}")
+        # через окружение вариант передаётся и процессам-исполнителям
+        os.environ[MODEL_VARIANT_ENV] = args.model
+    # настройки пула сессий передаются процессам-исполнителям
+    # через окружение, см. lib.session_pool.get_session_pool
+    try:
+        configure_from_args(args.pool_size, args.intra_op_threads)
+    except ValueError as e:
+        parser.error(str(e))
+    policy = TierPolicy(
+        {
+            tier: (
+                getattr(args, f"{tier}_queue_depth"),
+                getattr(args, f"{tier}_cost"),
+            )
+            for tier in TIER_THRESHOLDS
+        }
+    )
+    try:
+        web.run_app(
+            create_app(
+                args.queue_size, args.workers, args.track_workers, policy
+            ),
+            host=args.host,
+            port=args.port,
+        )
+    finally:
+        shutdown_executors()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,29 +4,125 @@
 Запускает веб-сервис на основе Streamlit.
 """
 
-import io
-import tempfile
 import asyncio
+import uuid
 from time import time
-from typing import Tuple, List
-import librosa as lb
+from typing import Callable, Dict, List, Tuple
+import numpy as np
 import streamlit as st
-import soundfile as sf
 import pandas as pd
-from aiocache import cached
-from numpy import ndarray
-from lib.playlist_forming import playlist_pipeline
-from lib.highlight import get_highlights_list
-from lib.utils import FeedbackMessage, send_telegram_message
+from lib.audio_store import SessionAudioStore
+from lib.cache import bytes_hash, get_result_cache, make_key
+from lib.metrics import get_metrics, request
+from lib.model import MAX_TRACK_DURATION_SEC
+from lib.parallel import TrackProcessingError
+from lib.playlist_forming import IncrementalPlaylist
+from lib.highlight import DEFAULT_TIER, HIGHLIGHT_TIERS, get_highlights_list
+from lib.audio_writer import (
+    AUDIO_FORMATS,
+    DEFAULT_BITRATE_KBPS,
+    LOSSY_FORMATS,
+    OUTPUT_BITRATES,
+    write_blocks,
+)
+from lib.output import (
+    EncodedAudio,
+    encode_result,
+    get_output_janitor,
+    record_served,
+)
+from lib.notifications import notify
+from lib.session_pool import record_session_pool_metrics
+from lib.scheduler import GROUP_TRACKS, get_inference_scheduler
+from lib.tiers import AUTO_TIER, get_tier_policy
+from lib.utils import FeedbackMessage
+
+
+async def get_highlights(
+    files_df: dict,
+    session_id: str,
+    full_track: bool = False,
+    requested_tier: str = AUTO_TIER,
+    on_position: Callable[[int], None] | None = None,
+) -> Tuple[List[np.ndarray], str]:
+    """
+    Асинхронная функция выделения хайлайтов через общий планировщик
+    задач lib.scheduler. Треки обрабатываются порциями
+    по GROUP_TRACKS, и каждая порция ждёт своей очереди, поэтому
+    большая загрузка не задерживает запросы других сессий.
+
+    :param
+    files_df : dict
+        Словарь с данными аудиофайлов для обработки,
+        см. get_playlist.
+    session_id : str
+        Идентификатор сессии.
+    full_track : bool = False
+        Если True, хайлайт ищется по всему треку.
+    requested_tier : str = AUTO_TIER
+        Уровень качества, см. lib.tiers.
+    on_position : Callable[[int], None] | None = None
+        Функция, которой передаётся позиция в очереди планировщика.
+    :return:
+    highlights : List[numpy.ndarray]
+        Хайлайты треков.
+    tier : str
+        Уровень качества, на котором выделены хайлайты.
+    """
+    scheduler = get_inference_scheduler()
+    tier = None
+    highlights = []
+    for start in range(0, len(files_df["track_audio"]), GROUP_TRACKS):
+        audio = files_df["track_audio"][start:start + GROUP_TRACKS]
+        async with scheduler.slot(
+            session_id, sum(len(track) for track in audio), on_position
+        ):
+            if tier is None:
+                # уровень выбирается по очереди на момент запуска
+                tier = get_tier_policy().choose(
+                    scheduler.pending, requested_tier
+                )
+            sample_rates = files_df["track_sr"][start:start + GROUP_TRACKS]
+            # политика учитывает время обработки порции без ожидания
+            # в планировщике, нормированное на длительность аудио
+            with get_tier_policy().track(
+                sum(
+                    len(track) / sample_rate
+                    for track, sample_rate in zip(audio, sample_rates)
+                )
+            ):
+                highlights.extend(
+                    await get_highlights_list(
+                        audio,
+                        sample_rates,
+                        chunked=full_track,
+                        tier=tier,
+                    )
+                )
+    return highlights, tier or DEFAULT_TIER
 
 
-@cached()
 async def get_playlist(
-    files_df: dict
-) -> Tuple[List[ndarray] | ndarray, int | float]:
+    files_df: dict,
+    builder: IncrementalPlaylist,
+    audio_format: str = "wav",
+    bitrate_kbps: int | None = None,
+    session_id: str = "",
+    on_position: Callable[[int], None] | None = None,
+    requested_tier: str = AUTO_TIER,
+    full_track: bool = False,
+) -> Tuple[str, int | float, Dict[str, int] | None, str]:
     """
     Кэшируемая асинхронная функция, принимающая словарь с аудиофайлами
     для последующего формирования плейлиста из выделенных хайлайтов.
+    Плейлист собирается инкрементально: хайлайты и темп треков,
+    обработанных в этой сессии раньше, не вычисляются повторно,
+    а склейка пишется в файл блоками, см.
+    IncrementalPlaylist.build_stream. Путь к файлу сохраняется
+    в кэше результатов по ключам треков и уровню качества, общем
+    для всех сессий; временные файлы удаляются
+    lib.output.OutputJanitor. Сборка ждёт своей очереди в общем
+    планировщике задач lib.scheduler.
 
     :param
     files_df : dict
@@ -34,21 +130,91 @@ async def get_playlist(
             'track_name' - список названий аудиофайлов
             'track_audio' - список аудиофайлов
             'track_sr' - список sample rate аудиофайлов
+            'track_key' - список ключей содержимого аудиофайлов
+    builder : IncrementalPlaylist
+        Сборщик плейлиста сессии.
+    audio_format : str = "wav"
+        Формат плейлиста, ключ AUDIO_FORMATS.
+    bitrate_kbps : int | None = None
+        Битрейт для форматов со сжатием с потерями.
+    session_id : str = ""
+        Идентификатор сессии для очереди планировщика.
+    on_position : Callable[[int], None] | None = None
+        Функция, которой передаётся позиция в очереди планировщика.
+    requested_tier : str = AUTO_TIER
+        Уровень качества, см. lib.tiers.
+    full_track : bool = False
+        Если True, хайлайты ищутся по всему треку, как
+        в get_highlights.
     :return:
-    data_merged : List[ndarray] | ndarray
-        ndarray со склеенными хайлайтами переданных треков.
+    playlist_tempfile : str
+        Имя временного файла с плейлистом.
     sample_rate : int | float
         sample rate конечного аудиофайла с плейлистом.
+    reuse : Dict[str, int] | None
+        Объём переиспользованной работы, см.
+        IncrementalPlaylist.last_build. None - плейлист взят из кэша.
+    tier : str
+        Уровень качества, на котором выделены хайлайты.
     """
-    return await playlist_pipeline(
-        data=files_df["track_audio"],
-        sample_rates=files_df["track_sr"],
+    cache = get_result_cache()
+    janitor = get_output_janitor()
+    scheduler = get_inference_scheduler()
+    # уровень выбирается до поиска в кэше: плейлисты разных уровней
+    # хранятся под разными ключами
+    tier = get_tier_policy().choose(scheduler.pending, requested_tier)
+    key = make_key(
+        bytes_hash(",".join(files_df["track_key"]).encode()),
+        "playlist",
+        audio_format=audio_format,
+        bitrate_kbps=bitrate_kbps,
+        tier=tier,
+        chunked=full_track,
     )
+    cached_playlist = cache.get(key)
+    if cached_playlist is not None and janitor.touch(cached_playlist[0]):
+        return *cached_playlist, None, tier
+
+    # память и стоимость сборки определяются треками,
+    # которые ещё не обработаны на этом уровне
+    new_tracks = [
+        (track, sample_rate)
+        for track_key, track, sample_rate in zip(
+            files_df["track_key"],
+            files_df["track_audio"],
+            files_df["track_sr"],
+        )
+        if (track_key, tier, full_track) not in builder
+    ]
+    async with scheduler.slot(
+        session_id, sum(len(track) for track, _ in new_tracks), on_position
+    ):
+        # плейлист пишется блоками, без буфера на весь плейлист
+        with get_tier_policy().track(
+            sum(len(track) / sample_rate for track, sample_rate in new_tracks)
+        ):
+            blocks, sample_rate = await builder.build_stream(
+                files_df["track_key"],
+                files_df["track_audio"],
+                files_df["track_sr"],
+                tier,
+                full_track,
+            )
+        path = janitor.new_path(f".{audio_format}")
+        await write_blocks(
+            path,
+            blocks,
+            sample_rate,
+            audio_format,
+            bitrate_kbps=bitrate_kbps,
+        )
+    cache.set(key, (path, sample_rate))
+    return path, sample_rate, builder.last_build, tier
 
 
 @st.fragment
 def download_file(
-    audio_tempfile: str,
+    encoded: EncodedAudio,
     filename: str,
 ):
     """
@@ -56,19 +222,18 @@ def download_file(
     аудиофайла (хайлайта или плейлиста хайлайтов) в веб-сервисе.
 
     :param
-    audio_tempfile : str
-        Имя tempfile.
+    encoded : EncodedAudio
+        Закодированный аудиофайл, тот же, что передан плееру.
     filename: str
         Имя аудиофайла, переданного сервису для обработки.
     :return: None
     """
-    with open(audio_tempfile, "rb") as output_file:
-        st.download_button(
-            label="Скачать файл",
-            data=output_file,
-            file_name=f"{filename}_{int(time())}.wav",
-            mime="audio/wav",
-        )
+    st.download_button(
+        label="Скачать файл",
+        data=encoded.data,
+        file_name=encoded.file_name(f"{filename}_{int(time())}"),
+        mime=encoded.mime,
+    )
 
 
 async def main():
@@ -101,9 +266,11 @@ async def main():
                 contact=st.session_state.user_contact,
                 message_text=st.session_state.user_feedback_text,
             )
-            send_telegram_message(message=message)
+            # сообщение отправляется в фоне, ответа Telegram не ждём
             st.session_state["feedback_form_submit_text"] = (
                 "Спасибо за Ваш отзыв!"
+                if notify(message)
+                else "Не удалось отправить отзыв, попробуйте позже."
             )
 
         st.session_state.user_name = ""
@@ -123,25 +290,100 @@ async def main():
         accept_multiple_files=True,
         type=["mp3", "wav"],
     )
+    full_track = st.checkbox(
+        "Искать хайлайт по всему треку",
+        help=(
+            "Трек анализируется целиком, а не только первые "
+            f"{MAX_TRACK_DURATION_SEC} секунд. Подходит для миксов "
+            "и лайв-сетов, но работает дольше."
+        ),
+    )
+    requested_tier = st.selectbox(
+        "Качество поиска хайлайта",
+        [AUTO_TIER, *HIGHLIGHT_TIERS],
+        help=(
+            "full - нейросеть, fast - нейросеть на упрощённых признаках, "
+            "heuristic - по громкости трека, без нейросети. "
+            "auto - full, пока сервис не перегружен."
+        ),
+    )
+    output_format = st.selectbox(
+        "Формат результата",
+        list(AUDIO_FORMATS),
+        index=list(AUDIO_FORMATS).index("mp3"),
+    )
+    bitrate_kbps = None
+    if output_format in LOSSY_FORMATS:
+        bitrate_kbps = st.select_slider(
+            "Битрейт, кбит/с",
+            options=OUTPUT_BITRATES,
+            value=DEFAULT_BITRATE_KBPS,
+        )
     tracks_df = {
         "track_name": [],
         "track_audio": [],
         "track_sr": [],
+        "track_key": [],
     }
+    max_duration = None if full_track else MAX_TRACK_DURATION_SEC
+
+    # файлы декодируются один раз за сессию, а не при каждом
+    # перезапуске скрипта
+    if "audio_store" not in st.session_state:
+        st.session_state.audio_store = SessionAudioStore()
+    decoded_tracks = await st.session_state.audio_store.load(
+        [
+            (
+                uploaded_file.file_id,
+                uploaded_file.name,
+                uploaded_file.getvalue,
+            )
+            for uploaded_file in uploaded_files
+        ],
+        max_duration=max_duration,
+    )
+    for track in decoded_tracks:
+        if isinstance(track, TrackProcessingError):
+            st.warning(
+                f"Не удалось прочитать файл "
+                f"{uploaded_files[track.track_idx].name}"
+            )
+            continue
+        tracks_df["track_name"].append(track.name)
+        tracks_df["track_audio"].append(track.audio)
+        tracks_df["track_sr"].append(track.sample_rate)
+        tracks_df["track_key"].append(
+            make_key(track.content_hash, "audio", max_duration=max_duration)
+        )
 
-    for uploaded_file in uploaded_files:
-        bytes_data = uploaded_file.read()
-        audio, sr = lb.load(path=io.BytesIO(bytes_data))
-        tracks_df["track_name"].append(uploaded_file.name)
-        tracks_df["track_audio"].append(audio)
-        tracks_df["track_sr"].append(sr)
+    # сессия ставит задачи в общую очередь планировщика
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    queue_status = st.empty()
 
-    if len(uploaded_files) > 0:
+    def show_position(position: int) -> None:
+        """
+        Функция вывода позиции задачи в очереди планировщика.
+
+        :param
+        position : int
+            Количество задач, которые будут запущены раньше.
+        """
+        queue_status.info(
+            f"Сервис загружен, запрос в очереди: позиция {position + 1}"
+        )
+
+    # хайлайты и темп треков сохраняются между сборками плейлиста
+    if "playlist_builder" not in st.session_state:
+        st.session_state.playlist_builder = IncrementalPlaylist()
+    st.session_state.playlist_builder.retain(tracks_df["track_key"])
+
+    if len(tracks_df["track_name"]) > 0:
         tracks_table = st.data_editor(
             pd.DataFrame.from_dict(
                 {
                     "track_name": tracks_df["track_name"],
-                    "check_box": [True] * len(uploaded_files),
+                    "check_box": [True] * len(tracks_df["track_name"]),
                 }
             ),
             column_config={
@@ -157,6 +399,7 @@ async def main():
             "track_name": [],
             "track_audio": [],
             "track_sr": [],
+            "track_key": [],
         }
         for idx, value in enumerate(tracks_table["check_box"]):
             if value:
@@ -165,51 +408,80 @@ async def main():
 
         # Кнопка для выделения хайлайтов из выбранных треков
         if st.button("Выделить хайлайты из выбранных треков"):
-            highlights_lst = await get_highlights_list(
-                tracks_to_get_highlight["track_audio"],
-                tracks_to_get_highlight["track_sr"],
-            )
-            for idx, highlight in enumerate(highlights_lst):
-                st.write(f"{tracks_to_get_highlight['track_name'][idx]}")
-                with tempfile.NamedTemporaryFile(
-                    delete=False,
-                    suffix=".wav"
-                ) as fp:
-                    sf.write(
-                        fp.name,
-                        highlight,
-                        tracks_to_get_highlight["track_sr"][idx],
-                    )
-                    fp.close()
-                    st.audio(
-                        highlight,
-                        sample_rate=tracks_to_get_highlight["track_sr"][idx],
-                    )
-                    filename = (
-                        f"{tracks_to_get_highlight['track_name'][idx][:-4]}"
-                        "_highlight"
-                    )
-                    download_file(
-                        audio_tempfile=fp.name,
-                        filename=filename,
+            with request("highlights"):
+                highlights_lst, tier = await get_highlights(
+                    tracks_to_get_highlight,
+                    st.session_state.session_id,
+                    full_track,
+                    requested_tier,
+                    show_position,
+                )
+                queue_status.empty()
+                # каждый хайлайт кодируется один раз, результат
+                # отдаётся и плееру, и кнопке скачивания
+                encoded_lst = await asyncio.gather(
+                    *(
+                        asyncio.to_thread(
+                            encode_result,
+                            highlight,
+                            tracks_to_get_highlight["track_sr"][idx],
+                            output_format,
+                            bitrate_kbps,
+                        )
+                        for idx, highlight in enumerate(highlights_lst)
                     )
+                )
+                record_served(
+                    "highlights",
+                    sum(encoded.size for encoded in encoded_lst),
+                    output_format,
+                )
+            record_session_pool_metrics()
+            get_metrics().write()
+            st.caption(f"Уровень качества: {tier}")
+            for idx, encoded in enumerate(encoded_lst):
+                st.write(f"{tracks_to_get_highlight['track_name'][idx]}")
+                st.audio(encoded.data, format=encoded.mime)
+                filename = (
+                    f"{tracks_to_get_highlight['track_name'][idx][:-4]}"
+                    "_highlight"
+                )
+                download_file(
+                    encoded=encoded,
+                    filename=filename,
+                )
 
         # Кнопка для формирования из выбранных треков плейлиста
         if st.button("Сформировать плейлист из хайлайтов выбранных треков"):
-            playlist, playlist_sr = await get_playlist(
-                tracks_to_get_highlight
-            )
-            with tempfile.NamedTemporaryFile(
-                delete=False,
-                suffix=".wav"
-            ) as fp:
-                sf.write(fp.name, playlist, playlist_sr)
-                fp.close()
-                st.audio(playlist, sample_rate=playlist_sr)
-                download_file(
-                    audio_tempfile=fp.name,
-                    filename="highlights_playlist"
+            with st.spinner("Формируем плейлист..."), request("playlist"):
+                playlist_tempfile, _, reuse, tier = await get_playlist(
+                    tracks_to_get_highlight,
+                    st.session_state.playlist_builder,
+                    output_format,
+                    bitrate_kbps,
+                    st.session_state.session_id,
+                    show_position,
+                    requested_tier,
+                    full_track,
                 )
+                queue_status.empty()
+                encoded = await asyncio.to_thread(
+                    EncodedAudio.from_file, playlist_tempfile, output_format
+                )
+                record_served("playlist", encoded.size, output_format)
+            record_session_pool_metrics()
+            get_metrics().write()
+            st.caption(f"Уровень качества: {tier}")
+            if reuse is not None:
+                st.caption(
+                    f"Обработано треков: {reuse['tracks_computed']}, "
+                    f"взято из прошлых сборок: {reuse['tracks_reused']}"
+                )
+            st.audio(encoded.data, format=encoded.mime)
+            download_file(
+                encoded=encoded,
+                filename="highlights_playlist"
+            )
 
     with st.expander("Связаться с нами"):
         with st.form("my_form"):
@@ -0,0 +1,666 @@
+"""
+Модуль пакетной обработки аудиофайлов Audio Highlight без веб-интерфейса.
+
+Выделяет хайлайты (и при необходимости плейлисты) из треков
+в директориях и файлах-манифестах. Результаты записываются рядом
+с исходными треками, а уже обработанные треки при повторном запуске
+пропускаются, поэтому прерванную обработку можно продолжить.
+
+Запуск из корня репозитория:
+    python batch.py music/ catalogue.txt --workers 4 --offsets csv
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+from time import perf_counter
+from typing import AsyncIterator, Dict, List, Tuple
+import numpy as np
+from lib.analysis import estimate_tempos
+from lib.audio_writer import AUDIO_FORMATS, single_block, write_blocks
+from lib.crossfade import stream_setlist
+from lib.highlight import (
+    DEFAULT_TIER,
+    HIGHLIGHT_TIERS,
+    get_highlights_list,
+    slice_window,
+)
+from lib.ingest import (
+    AUDIO_EXTENSIONS,
+    DEFAULT_QUALITY,
+    RESAMPLE_QUALITY,
+    decode_uploads,
+)
+from lib.metrics import (
+    METRICS_PATH,
+    enable_profiling,
+    get_metrics,
+    request,
+)
+from lib.model import (
+    MAX_TRACK_DURATION_SEC,
+    MODEL_VARIANT_ENV,
+    MODEL_VARIANTS,
+    variant_weights_path,
+)
+from lib.parallel import (
+    PARALLEL_BACKEND,
+    SUPPORTED_BACKENDS,
+    TrackProcessingError,
+)
+from lib.session_pool import (
+    configure_from_args,
+    record_session_pool_metrics,
+)
+from lib.utils import NotSupportedModelException
+
+
+OFFSETS_FORMATS = ("json", "csv")
+HIGHLIGHT_SUFFIX = "_highlight"
+PLAYLIST_NAME = "playlist"
+GROUP_SIZE = 16
+
+
+class BatchStats:
+    """
+    Класс статистики пакетной обработки.
+
+    :param
+    tracks : int
+        Количество обработанных треков.
+    failed : int
+        Количество треков, которые не удалось обработать.
+    skipped : int
+        Количество треков, обработанных при предыдущих запусках.
+    audio_sec : float
+        Суммарная длительность проанализированного аудио в секундах.
+    """
+
+    def __init__(self):
+        """
+        Конструктор класса BatchStats.
+        """
+        self.tracks = 0
+        self.failed = 0
+        self.skipped = 0
+        self.audio_sec = 0.0
+        self._start = perf_counter()
+
+    def __str__(self):
+        elapsed = max(perf_counter() - self._start, 1e-9)
+        return (
+            f"processed {self.tracks}, failed {self.failed}, "
+            f"skipped {self.skipped} in {elapsed:.1f} s: "
+            f"{self.tracks / elapsed:.2f} tracks/s, "
+            f"{self.audio_sec / elapsed:.1f} audio-hours/hour"
+        )
+
+
+def collect_tracks(
+    inputs: List[str],
+) -> Dict[str, List[str]]:
+    """
+    Функция сбора путей к трекам из директорий и файлов-манифестов.
+    Директории обходятся рекурсивно. Манифест - текстовый файл
+    с путём к треку в каждой строке, относительные пути считаются
+    от директории манифеста, пустые строки и строки с # пропускаются.
+
+    :param
+    inputs : List[str]
+        Пути к директориям и манифестам.
+    :return:
+    sources : Dict[str, List[str]]
+        Пути к трекам по источникам в порядке передачи.
+    """
+    sources = {}
+    for source in inputs:
+        tracks = []
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                tracks.extend(
+                    os.path.join(root, file) for file in sorted(files)
+                    if file.lower().endswith(AUDIO_EXTENSIONS)
+                    and not is_output(file)
+                )
+        elif os.path.isfile(source):
+            base_dir = os.path.dirname(os.path.abspath(source))
+            with open(source, "r", encoding="utf-8") as manifest:
+                for line in manifest:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        tracks.append(os.path.join(base_dir, line))
+        else:
+            raise FileNotFoundError(
+                f"No such directory or manifest: {source}"
+            )
+        sources[source] = tracks
+    return sources
+
+
+def is_output(
+    file: str,
+) -> bool:
+    """
+    Функция проверки, что аудиофайл записан пакетной обработкой.
+
+    :param
+    file : str
+        Имя файла.
+    :return:
+    is_output : bool
+        True для хайлайтов и плейлистов.
+    """
+    stem = os.path.splitext(os.path.basename(file))[0]
+    return stem.endswith(HIGHLIGHT_SUFFIX) or stem == PLAYLIST_NAME
+
+
+def output_paths(
+    track_path: str,
+    audio_format: str,
+    offsets_format: str,
+) -> Tuple[str, str]:
+    """
+    Функция получения путей результатов обработки трека.
+
+    :param
+    track_path : str
+        Путь к треку.
+    audio_format : str
+        Формат файла хайлайта.
+    offsets_format : str
+        Формат файла с началом хайлайта: "json" или "csv".
+    :return:
+    highlight_path : str
+        Путь к файлу хайлайта.
+    offsets_path : str
+        Путь к файлу с началом хайлайта. Записывается последним
+        и отмечает трек как обработанный.
+    """
+    stem = os.path.splitext(track_path)[0] + HIGHLIGHT_SUFFIX
+    return f"{stem}.{audio_format}", f"{stem}.{offsets_format}"
+
+
+def write_offsets(
+    path: str,
+    offsets: Dict[str, str | float],
+) -> None:
+    """
+    Функция атомарной записи начала хайлайта: файл сначала
+    записывается во временный, а затем переименовывается,
+    поэтому после сбоя не остаётся недописанных файлов.
+
+    :param
+    path : str
+        Путь к файлу ".json" или ".csv".
+    offsets : Dict[str, str | float]
+        Описание хайлайта.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="") as file:
+        if path.endswith(".csv"):
+            writer = csv.DictWriter(file, fieldnames=list(offsets))
+            writer.writeheader()
+            writer.writerow(offsets)
+        else:
+            json.dump(offsets, file, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+async def write_audio(
+    path: str,
+    blocks: AsyncIterator[np.ndarray],
+    sample_rate: int | float,
+    audio_format: str,
+) -> None:
+    """
+    Асинхронная функция атомарной записи аудио по блокам,
+    см. lib.audio_writer.write_blocks.
+
+    :param
+    path : str
+        Путь к итоговому файлу.
+    blocks : AsyncIterator[numpy.ndarray]
+        Асинхронный генератор моно-блоков аудио.
+    sample_rate : int | float
+        Частота дискретизации аудио.
+    audio_format : str
+        Формат файла: "wav", "flac", "ogg" или "mp3".
+    """
+    tmp_path = f"{path}.tmp"
+    await write_blocks(tmp_path, blocks, sample_rate, audio_format)
+    os.replace(tmp_path, path)
+
+
+async def read_files(
+    paths: List[str],
+) -> List[Tuple[str, bytes] | None]:
+    """
+    Асинхронная функция чтения файлов в пуле потоков.
+
+    :param
+    paths : List[str]
+        Пути к файлам.
+    :return:
+    files : List[Tuple[str, bytes] | None]
+        Пары (путь, содержимое). None - файл не удалось прочитать.
+    """
+    def read(path):
+        try:
+            with open(path, "rb") as file:
+                return path, file.read()
+        except OSError as e:
+            logging.warning("Cannot read %s: %s", path, e)
+            return None
+
+    return list(
+        await asyncio.gather(*[asyncio.to_thread(read, p) for p in paths])
+    )
+
+
+async def process_group(
+    paths: List[str],
+    args: argparse.Namespace,
+    stats: BatchStats,
+) -> None:
+    """
+    Асинхронная функция обработки группы треков: треки декодируются,
+    из них параллельно выделяются хайлайты, после чего хайлайт
+    и его начало записываются рядом с каждым треком.
+
+    :param
+    paths : List[str]
+        Пути к необработанным трекам.
+    args : argparse.Namespace
+        Параметры запуска.
+    stats : BatchStats
+        Статистика обработки, обновляется на месте.
+    """
+    files = [file for file in await read_files(paths) if file is not None]
+    stats.failed += len(paths) - len(files)
+    decoded = await decode_uploads(
+        files,
+        max_duration=None if args.full_track else MAX_TRACK_DURATION_SEC,
+        quality=args.quality,
+    )
+    tracks = []
+    for track in decoded:
+        if isinstance(track, TrackProcessingError):
+            logging.warning(
+                "Cannot decode %s: %s", files[track.track_idx][0], track.msg
+            )
+            stats.failed += 1
+        else:
+            tracks.append(track)
+    del files, decoded
+    if not tracks:
+        return
+
+    results = await get_highlights_list(
+        [track.audio for track in tracks],
+        [track.sample_rate for track in tracks],
+        batch_size=args.batch_size,
+        workers=args.workers,
+        backend=args.backend,
+        return_exceptions=True,
+        chunked=args.full_track,
+        return_offsets=True,
+        tier=args.tier,
+    )
+    for track, result in zip(tracks, results):
+        if isinstance(result, TrackProcessingError):
+            logging.warning("Cannot process %s: %s", track.name, result.msg)
+            stats.failed += 1
+            continue
+        highlight = result.highlight
+        highlight_path, offsets_path = output_paths(
+            track.name, args.audio_format, args.offsets
+        )
+        await write_audio(
+            highlight_path,
+            single_block(highlight),
+            track.sample_rate,
+            args.audio_format,
+        )
+        write_offsets(
+            offsets_path,
+            {
+                "track": os.path.basename(track.name),
+                "highlight": os.path.basename(highlight_path),
+                "start_sec": round(float(result.start_sec), 3),
+                "duration_sec": round(len(highlight) / track.sample_rate, 3),
+                "track_duration_sec": round(track.duration, 3),
+                "tier": result.tier,
+            },
+        )
+        stats.tracks += 1
+        stats.audio_sec += track.duration
+
+
+def read_offsets(
+    path: str,
+) -> Dict[str, str | float] | None:
+    """
+    Функция чтения описания хайлайта, записанного write_offsets.
+
+    :param
+    path : str
+        Путь к файлу ".json" или ".csv".
+    :return:
+    offsets : Dict[str, str | float] | None
+        Описание хайлайта. None - файла нет или его не удалось
+        прочитать.
+    """
+    try:
+        with open(path, "r", encoding="utf-8", newline="") as file:
+            if path.endswith(".csv"):
+                return next(csv.DictReader(file), None)
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning("Cannot read %s: %s", path, e)
+        return None
+
+
+async def playlist_group(
+    paths: List[str],
+    args: argparse.Namespace,
+) -> List[Tuple[np.ndarray, int | float, float]]:
+    """
+    Асинхронная функция подготовки группы треков к плейлисту:
+    треки декодируются, хайлайты вырезаются по началам, сохранённым
+    при обработке треков, и выделяются заново только для треков
+    без сохранённого начала, после чего оценивается темп треков.
+    Целые треки после обработки группы не хранятся.
+
+    :param
+    paths : List[str]
+        Пути к трекам.
+    args : argparse.Namespace
+        Параметры запуска.
+    :return:
+    highlights : List[Tuple[numpy.ndarray, int | float, float]]
+        Хайлайты успешно обработанных треков с частотой
+        дискретизации и темпом в исходном порядке.
+    """
+    files = [file for file in await read_files(paths) if file is not None]
+    tracks = [
+        track for track in await decode_uploads(
+            files,
+            max_duration=None if args.full_track else MAX_TRACK_DURATION_SEC,
+            quality=args.quality,
+        )
+        if not isinstance(track, TrackProcessingError)
+    ]
+    del files
+    if not tracks:
+        return []
+
+    highlights: List[np.ndarray | TrackProcessingError | None] = []
+    for track in tracks:
+        offsets = read_offsets(
+            output_paths(track.name, args.audio_format, args.offsets)[1]
+        )
+        highlights.append(
+            None if offsets is None else slice_window(
+                track.audio,
+                track.sample_rate,
+                float(offsets["start_sec"]),
+                float(offsets["duration_sec"]),
+            )
+        )
+    missing = [
+        idx for idx, highlight in enumerate(highlights) if highlight is None
+    ]
+    if missing:
+        computed = await get_highlights_list(
+            [tracks[idx].audio for idx in missing],
+            [tracks[idx].sample_rate for idx in missing],
+            batch_size=args.batch_size,
+            workers=args.workers,
+            backend=args.backend,
+            return_exceptions=True,
+            chunked=args.full_track,
+            tier=args.tier,
+        )
+        for idx, highlight in zip(missing, computed):
+            highlights[idx] = highlight
+    tempos = await estimate_tempos(
+        [track.audio for track in tracks],
+        [track.sample_rate for track in tracks],
+        workers=args.workers,
+        backend=args.backend,
+    )
+
+    group = []
+    for track, highlight, tempo in zip(tracks, highlights, tempos):
+        errors = [
+            result for result in (highlight, tempo)
+            if isinstance(result, Exception)
+        ]
+        if errors:
+            logging.warning("Track skipped from playlist. %s", errors[0])
+            continue
+        # копия, чтобы не удерживать в памяти целый трек
+        group.append((np.copy(highlight), track.sample_rate, tempo))
+    return group
+
+
+async def build_playlist(
+    source: str,
+    paths: List[str],
+    args: argparse.Namespace,
+) -> None:
+    """
+    Асинхронная функция формирования плейлиста из треков источника.
+    Треки обрабатываются группами по args.group_size (см.
+    playlist_group), хайлайты сортируются по темпу и склеиваются
+    в потоковом режиме, см. lib.crossfade.stream_setlist. Плейлист
+    записывается в директорию источника (или манифеста)
+    и не пересобирается, если уже существует.
+
+    :param
+    source : str
+        Директория или манифест.
+    paths : List[str]
+        Пути к трекам источника.
+    args : argparse.Namespace
+        Параметры запуска.
+    """
+    base_dir = source if os.path.isdir(source) else os.path.dirname(
+        os.path.abspath(source)
+    )
+    path = os.path.join(base_dir, f"{PLAYLIST_NAME}.{args.audio_format}")
+    if os.path.exists(path) or not paths:
+        return
+    highlights = []
+    for start in range(0, len(paths), args.group_size):
+        highlights.extend(
+            await playlist_group(paths[start: start + args.group_size], args)
+        )
+    if not highlights:
+        logging.warning("No tracks to form a playlist from %s", source)
+        return
+    data, sample_rates, tempos = (list(column) for column in zip(*highlights))
+    del highlights
+    # сортировка стабильна: треки с равным темпом
+    # остаются в порядке источника
+    selected_idxs = sorted(range(len(data)), key=tempos.__getitem__)
+    blocks = stream_setlist(
+        data, sample_rates, selected_idxs, args.cross_len
+    )
+    await write_audio(path, blocks, min(sample_rates), args.audio_format)
+    logging.info("Playlist written to %s", path)
+
+
+async def run_batch(
+    args: argparse.Namespace,
+) -> BatchStats:
+    """
+    Асинхронная функция пакетной обработки.
+    Треки обрабатываются группами по args.group_size, чтобы
+    в памяти одновременно находилось ограниченное число треков.
+
+    :param
+    args : argparse.Namespace
+        Параметры запуска.
+    :return:
+    stats : BatchStats
+        Статистика обработки.
+    """
+    sources = collect_tracks(args.inputs)
+    stats = BatchStats()
+    pending = []
+    for paths in sources.values():
+        for path in paths:
+            if os.path.exists(
+                output_paths(path, args.audio_format, args.offsets)[1]
+            ):
+                stats.skipped += 1
+            else:
+                pending.append(path)
+    logging.info(
+        "%d tracks to process, %d already done", len(pending), stats.skipped
+    )
+
+    for start in range(0, len(pending), args.group_size):
+        with request("batch_group"):
+            await process_group(
+                pending[start: start + args.group_size], args, stats
+            )
+        logging.info("%s", stats)
+        if args.metrics:
+            record_session_pool_metrics()
+            get_metrics().write(args.metrics)
+
+    if args.playlist:
+        for source, paths in sources.items():
+            await build_playlist(source, paths, args)
+    return stats
+
+
+def main():
+    """
+    Точка входа пакетной обработки.
+    """
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        help="директории с треками или манифесты со списком путей",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="количество параллельных исполнителей, см. lib.parallel",
+    )
+    parser.add_argument(
+        "--backend", choices=SUPPORTED_BACKENDS, default=PARALLEL_BACKEND
+    )
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument(
+        "--group-size",
+        type=int,
+        default=GROUP_SIZE,
+        help="количество треков, одновременно находящихся в памяти",
+    )
+    parser.add_argument(
+        "--full-track",
+        action="store_true",
+        help="искать хайлайт по всему треку, а не только "
+             f"в первых {MAX_TRACK_DURATION_SEC} секундах",
+    )
+    parser.add_argument(
+        "--quality", choices=list(RESAMPLE_QUALITY), default=DEFAULT_QUALITY
+    )
+    parser.add_argument(
+        "--tier",
+        choices=HIGHLIGHT_TIERS,
+        default=DEFAULT_TIER,
+        help="уровень качества поиска хайлайта: fast и heuristic "
+             "быстрее, но начало хайлайта может отличаться от full",
+    )
+    parser.add_argument(
+        "--model",
+        choices=list(MODEL_VARIANTS),
+        default=None,
+        help="вариант весов модели, см. lib.model.MODEL_VARIANTS",
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=None,
+        help="количество ONNX-сессий в пуле процесса, "
+             "см. lib.session_pool.POOL_SIZE",
+    )
+    parser.add_argument(
+        "--intra-op-threads",
+        type=int,
+        default=None,
+        help="количество потоков внутри оператора ONNX-сессии, "
+             "см. lib.session_pool.INTRA_OP_NUM_THREADS",
+    )
+    parser.add_argument(
+        "--audio-format", choices=list(AUDIO_FORMATS), default="wav"
+    )
+    parser.add_argument("--offsets", choices=OFFSETS_FORMATS, default="json")
+    parser.add_argument(
+        "--playlist",
+        action="store_true",
+        help="сформировать плейлист из треков каждого источника",
+    )
+    parser.add_argument(
+        "--cross-len",
+        type=float,
+        default=5,
+        help="длина перекрытия треков в плейлисте в секундах",
+    )
+    parser.add_argument(
+        "--metrics",
+        nargs="?",
+        const=METRICS_PATH,
+        default=None,
+        help="записывать метрики в формате Prometheus в файл "
+             "после каждой группы, см. lib.metrics",
+    )
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        default=0,
+        help="сохранять профили N самых медленных групп",
+    )
+    args = parser.parse_args()
+    enable_profiling(args.profile_top)
+    if args.group_size < 1:
+        parser.error("--group-size must be positive")
+    if args.model is not None:
+        try:
+            variant_weights_path(args.model)
+        except NotSupportedModelException as e:
+            parser.error(f"--model {args.model}: {e.msg}")
+        # через окружение вариант передаётся и процессам-исполнителям
+        os.environ[MODEL_VARIANT_ENV] = args.model
+    # настройки пула сессий передаются процессам-исполнителям
+    # через окружение, см. lib.session_pool.get_session_pool
+    try:
+        configure_from_args(args.pool_size, args.intra_op_threads)
+    except ValueError as e:
+        parser.error(str(e))
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+    )
+    stats = asyncio.run(run_batch(args))
+    print(stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+"""
+Пакет с бенчмарками пайплайна выделения хайлайтов и формирования плейлиста.
+"""
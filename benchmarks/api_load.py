@@ -0,0 +1,126 @@
+"""
+Бенчмарк HTTP API: поднимает сервис в текущем процессе, отправляет
+задания с синтетическими треками быстрее, чем они обрабатываются,
+и выводит количество принятых и отклонённых (429) заданий
+и время их выполнения. Внешние сервисы не нужны.
+
+Запуск из корня репозитория:
+    python -m benchmarks.api_load --jobs 12 --queue-size 4
+"""
+
+import argparse
+import asyncio
+import io
+from time import perf_counter
+import aiohttp
+import soundfile as sf
+from aiohttp.test_utils import TestClient, TestServer
+from api import create_app
+from benchmarks.synthetic import generate_track
+
+
+def encode_wav(
+    duration_sec: int | float,
+    seed: int,
+    sample_rate: int = 22050,
+) -> bytes:
+    """
+    Функция генерации синтетического трека в формате .wav.
+
+    :param
+    duration_sec : int | float
+        Длительность трека в секундах.
+    seed : int
+        Зерно генератора случайных чисел.
+    sample_rate : int = 22050
+        Частота дискретизации трека.
+    :return:
+    data : bytes
+        Содержимое .wav файла.
+    """
+    buffer = io.BytesIO()
+    sf.write(
+        buffer,
+        generate_track(duration_sec, sample_rate, seed),
+        sample_rate,
+        format="WAV",
+    )
+    return buffer.getvalue()
+
+
+async def run_benchmark(
+    n_jobs: int,
+    tracks_per_job: int,
+    queue_size: int,
+    workers: int,
+) -> None:
+    """
+    Асинхронная функция нагрузки HTTP API заданиями на хайлайты.
+
+    :param
+    n_jobs : int
+        Количество одновременно отправляемых заданий.
+    tracks_per_job : int
+        Количество треков в задании.
+    queue_size : int
+        Размер очереди заданий.
+    workers : int
+        Количество исполнителей очереди.
+    """
+    tracks = [encode_wav(90, seed) for seed in range(tracks_per_job)]
+    app = create_app(queue_size=queue_size, workers=workers)
+    async with TestClient(TestServer(app)) as client:
+
+        async def submit():
+            form = aiohttp.FormData()
+            for idx, data in enumerate(tracks):
+                form.add_field(
+                    "files", data, filename=f"{idx}.wav",
+                    content_type="audio/wav",
+                )
+            response = await client.post("/highlights", data=form)
+            if response.status != 202:
+                return response.status, None
+            return response.status, await response.json()
+
+        start = perf_counter()
+        submitted = await asyncio.gather(*[submit() for _ in range(n_jobs)])
+        accepted = [job for status, job in submitted if status == 202]
+        statuses = [status for status, _ in submitted]
+        for job in accepted:
+            while True:
+                response = await client.get(f"/jobs/{job['id']}?wait=30")
+                job = await response.json()
+                if job["status"] in ("done", "failed"):
+                    break
+            if job["status"] == "done":
+                result = await client.get(f"/jobs/{job['id']}/results/0")
+                await result.read()
+        elapsed = perf_counter() - start
+
+    print(f"{'accepted':>10} {'429':>6} {'503':>6} {'total, s':>10}")
+    print(
+        f"{len(accepted):>10} {statuses.count(429):>6} "
+        f"{statuses.count(503):>6} {elapsed:>10.2f}"
+    )
+
+
+def main():
+    """
+    Точка входа бенчмарка.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=12)
+    parser.add_argument("--tracks-per-job", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+    asyncio.run(
+        run_benchmark(
+            args.jobs, args.tracks_per_job, args.queue_size, args.workers
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
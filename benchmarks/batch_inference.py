@@ -0,0 +1,71 @@
+"""
+Бенчмарк пакетного инференса: сравнивает время предсказания
+для нескольких треков при разных размерах пакета.
+
+Запуск из корня репозитория:
+    python -m benchmarks.batch_inference --tracks 8 --batch-sizes 1 2 4 8
+"""
+
+import argparse
+import asyncio
+from time import perf_counter
+from typing import List
+import numpy as np
+from benchmarks.synthetic import generate_tracks
+from lib.model import AudioHighlightsModel
+
+
+async def run_benchmark(
+    n_tracks: int,
+    batch_sizes: List[int],
+    repeats: int,
+) -> None:
+    """
+    Асинхронная функция замера времени пакетного предсказания.
+
+    :param
+    n_tracks : int
+        Количество синтетических треков.
+    batch_sizes : List[int]
+        Размеры пакета для сравнения.
+    repeats : int
+        Количество повторов замера для каждого размера пакета.
+    """
+    rng = np.random.default_rng(0)
+    durations = rng.uniform(120, 200, size=n_tracks).tolist()
+    tracks = generate_tracks(durations)
+    model = AudioHighlightsModel()
+    features = [await model.extract_features(track) for track in tracks]
+    # прогрев сессии
+    await model.predict(features[0])
+
+    print(f"{'batch_size':>10} {'total, s':>10} {'per track, ms':>14}")
+    for batch_size in batch_sizes:
+        timings = []
+        for _ in range(repeats):
+            start = perf_counter()
+            await model.predict_batch(features, batch_size)
+            timings.append(perf_counter() - start)
+        best = min(timings)
+        print(
+            f"{batch_size:>10} {best:>10.3f} "
+            f"{1000 * best / n_tracks:>14.1f}"
+        )
+
+
+def main():
+    """
+    Точка входа бенчмарка.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tracks", type=int, default=8)
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8]
+    )
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.tracks, args.batch_sizes, args.repeats))
+
+
+if __name__ == "__main__":
+    main()
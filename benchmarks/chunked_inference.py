@@ -0,0 +1,122 @@
+"""
+Бенчмарк потокового инференса: сравнивает предсказание по
+перекрывающимся окнам (AudioHighlightsModel.run_chunked) с предсказанием
+по признакам всего трека на треках короче MAX_TRACK_DURATION_SEC
+и показывает пиковую память потокового режима на длинных треках.
+
+Запуск из корня репозитория:
+    python -m benchmarks.chunked_inference --durations 60 120 190 --long 1800
+"""
+
+import argparse
+import tracemalloc
+from time import perf_counter
+from typing import Callable, List, Tuple
+import numpy as np
+from benchmarks.synthetic import generate_track
+from lib.model import AudioHighlightsModel
+from lib.window_search import find_top_windows
+
+
+def measure(
+    func: Callable[[], List[float]],
+) -> Tuple[List[float], float, float]:
+    """
+    Функция замера времени и пиковой памяти numpy-аллокаций.
+
+    :param
+    func : Callable[[], List[float]]
+        Замеряемая функция предсказания.
+    :return:
+    prediction : List[float]
+        Результат функции.
+    seconds : float
+        Время исполнения.
+    peak_mb : float
+        Пиковый объём памяти в МБ.
+    """
+    tracemalloc.start()
+    start = perf_counter()
+    prediction = func()
+    seconds = perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return prediction, seconds, peak / 1024 ** 2
+
+
+def run_benchmark(
+    durations: List[float],
+    long_durations: List[float],
+    highlight_duration: int,
+) -> None:
+    """
+    Функция сравнения полного и потокового инференса.
+
+    :param
+    durations : List[float]
+        Длительности треков для сравнения двух режимов в секундах.
+    long_durations : List[float]
+        Длительности длинных треков только для потокового режима.
+    highlight_duration : int
+        Длительность хайлайта для сравнения найденных окон.
+    """
+    model = AudioHighlightsModel()
+    # прогрев сессии
+    model.run_chunked(generate_track(10))
+
+    print(
+        f"{'duration, s':>11} {'full, s':>8} {'full, MB':>9} "
+        f"{'chunked, s':>10} {'chunked, MB':>11} {'max diff':>9} "
+        f"{'same start':>10}"
+    )
+    for duration in durations:
+        track = generate_track(duration, seed=int(duration))
+        full, full_sec, full_mb = measure(
+            lambda: model.run(model.compute_features(track))
+        )
+        chunked, chunked_sec, chunked_mb = measure(
+            lambda: model.run_chunked(track)
+        )
+        length = min(len(full), len(chunked))
+        diff = float(
+            np.abs(np.subtract(full[:length], chunked[:length])).max()
+        )
+        same_start = (
+            find_top_windows(full, highlight_duration)[0].start_sec
+            == find_top_windows(chunked, highlight_duration)[0].start_sec
+        )
+        print(
+            f"{duration:>11.0f} {full_sec:>8.2f} {full_mb:>9.1f} "
+            f"{chunked_sec:>10.2f} {chunked_mb:>11.1f} {diff:>9.2e} "
+            f"{str(same_start):>10}"
+        )
+
+    for duration in long_durations:
+        track = generate_track(duration, seed=int(duration))
+        _, chunked_sec, chunked_mb = measure(
+            lambda: model.run_chunked(track)
+        )
+        print(
+            f"{duration:>11.0f} {'-':>8} {'-':>9} "
+            f"{chunked_sec:>10.2f} {chunked_mb:>11.1f} {'-':>9} {'-':>10}"
+        )
+
+
+def main():
+    """
+    Точка входа бенчмарка.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--durations", type=float, nargs="+", default=[60, 120, 190]
+    )
+    parser.add_argument(
+        "--long", type=float, nargs="*", default=[600, 1800]
+    )
+    parser.add_argument("--highlight-duration", type=int, default=30)
+    args = parser.parse_args()
+    run_benchmark(args.durations, args.long, args.highlight_duration)
+
+
+if __name__ == "__main__":
+    main()
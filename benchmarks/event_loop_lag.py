@@ -0,0 +1,122 @@
+"""
+Бенчмарк отзывчивости цикла событий: измеряет задержку цикла,
+пока строится плейлист из 10 синтетических треков.
+
+Запуск из корня репозитория:
+    python -m benchmarks.event_loop_lag --max-lag-ms 100
+
+Завершается с кодом 1, если максимальная задержка
+превысила допустимую.
+"""
+
+import argparse
+import asyncio
+import sys
+from time import perf_counter
+from typing import List
+import numpy as np
+from benchmarks.synthetic import generate_tracks
+from lib.playlist_forming import playlist_pipeline
+
+
+async def measure_lag(
+    interval_sec: float,
+    lags: List[float],
+    stop: asyncio.Event,
+) -> None:
+    """
+    Асинхронная функция, просыпающаяся с заданным интервалом
+    и записывающая опоздание каждого пробуждения.
+
+    :param
+    interval_sec : float
+        Интервал между пробуждениями в секундах.
+    lags : List[float]
+        Список, в который записываются задержки в секундах.
+    stop : asyncio.Event
+        Событие остановки замера.
+    """
+    while not stop.is_set():
+        start = perf_counter()
+        await asyncio.sleep(interval_sec)
+        lags.append(perf_counter() - start - interval_sec)
+
+
+async def run_benchmark(
+    n_tracks: int,
+    workers: int,
+    backend: str,
+    interval_sec: float,
+) -> List[float]:
+    """
+    Асинхронная функция построения плейлиста с параллельным
+    замером задержки цикла событий.
+
+    :param
+    n_tracks : int
+        Количество синтетических треков.
+    workers : int
+        Количество параллельных исполнителей.
+    backend : str
+        Тип пула исполнителей: "process" или "thread".
+    interval_sec : float
+        Интервал замера задержки в секундах.
+    :return:
+    lags : List[float]
+        Задержки цикла событий в секундах.
+    """
+    rng = np.random.default_rng(0)
+    durations = rng.uniform(60, 200, size=n_tracks).tolist()
+    tracks = generate_tracks(durations)
+    sample_rates = [22050] * n_tracks
+
+    lags: List[float] = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(measure_lag(interval_sec, lags, stop))
+    start = perf_counter()
+    await playlist_pipeline(
+        tracks,
+        sample_rates,
+        workers=workers,
+        backend=backend,
+    )
+    elapsed = perf_counter() - start
+    stop.set()
+    await monitor
+    print(f"playlist built in {elapsed:.2f} s, {len(lags)} lag samples")
+    return lags
+
+
+def main():
+    """
+    Точка входа бенчмарка.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tracks", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--backend", default="thread")
+    parser.add_argument("--interval-ms", type=float, default=10)
+    parser.add_argument("--max-lag-ms", type=float, default=100)
+    args = parser.parse_args()
+
+    lags = asyncio.run(
+        run_benchmark(
+            args.tracks,
+            args.workers,
+            args.backend,
+            args.interval_ms / 1000,
+        )
+    )
+    lags_ms = 1000 * np.array(lags)
+    max_lag = lags_ms.max()
+    print(
+        f"event loop lag: mean {lags_ms.mean():.1f} ms, "
+        f"p99 {np.percentile(lags_ms, 99):.1f} ms, max {max_lag:.1f} ms"
+    )
+    if max_lag > args.max_lag_ms:
+        print(f"FAIL: max lag exceeds {args.max_lag_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Бенчмарк выделения признаков модели: сравнивает прежнюю реализацию
+(float64 дополнение, np.concatenate и приведение к float32 перед
+инференсом) с AudioHighlightsModel.compute_features и пакетным
+compute_features_batch. Для каждого способа выводится время, пиковая
+память numpy-аллокаций в байтах на секунду аудио и отличие признаков
+от прежней реализации.
+
+Запуск из корня репозитория:
+    python -m benchmarks.feature_extraction --durations 60 120 200
+"""
+
+import argparse
+import tracemalloc
+from time import perf_counter
+from typing import Any, Callable, List, Tuple
+import librosa as lb
+import numpy as np
+from benchmarks.synthetic import generate_tracks
+from lib.model import (
+    N_FFT,
+    N_HOP,
+    SR,
+    AudioHighlightsModel,
+    mel_filterbank,
+)
+
+
+def legacy_features(track: np.ndarray) -> np.ndarray:
+    """
+    Функция выделения признаков прежним способом, вместе
+    с приведением к float32, которое делалось перед инференсом.
+
+    :param
+    track : numpy.ndarray
+        Аудиофайл с частотой дискретизации SR.
+    :return:
+    features : numpy.ndarray
+        Признаки трека.
+    """
+    data = mel_filterbank() @ np.abs(
+        lb.stft(y=track, n_fft=N_FFT, hop_length=N_HOP)
+    )
+    data = np.reshape(data, (data.shape[0], data.shape[1], 1))
+    remain = data.shape[1] % 9
+    data = np.concatenate((data, np.zeros([128, 9 - remain, 1])), axis=1)
+    return np.expand_dims(data, axis=0).astype(np.float32)
+
+
+def measure(
+    func: Callable[[], Any],
+) -> Tuple[Any, float, int]:
+    """
+    Функция замера времени и пиковой памяти numpy-аллокаций.
+
+    :param
+    func : Callable[[], Any]
+        Замеряемая функция.
+    :return:
+    result : Any
+        Результат функции.
+    seconds : float
+        Время исполнения.
+    peak : int
+        Пиковый объём памяти в байтах.
+    """
+    func()
+    start = perf_counter()
+    result = func()
+    seconds = perf_counter() - start
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def max_diff(
+    features: List[np.ndarray],
+    reference: List[np.ndarray],
+) -> float:
+    """
+    Функция максимального отличия признаков на общих кадрах:
+    прежняя реализация добавляла 9 лишних кадров, если длина
+    признаков уже была кратна 9.
+    """
+    return max(
+        float(
+            np.abs(
+                value[:, :, :base.shape[2]] - base[:, :, :value.shape[2]]
+            ).max()
+        )
+        for value, base in zip(features, reference)
+    )
+
+
+def run_benchmark(
+    durations: List[float],
+    batch_size: int,
+) -> None:
+    """
+    Функция сравнения способов выделения признаков.
+
+    :param
+    durations : List[float]
+        Длительности треков в секундах.
+    batch_size : int
+        Количество треков в одном вызове compute_features_batch.
+    """
+    print(
+        f"{'method':>8} {'duration, s':>11} {'time, s':>8} "
+        f"{'peak, B/s':>10} {'max diff':>9}"
+    )
+    for duration in durations:
+        tracks = generate_tracks([duration] * batch_size, SR)
+        audio_sec = duration * batch_size
+        reference, legacy_sec, legacy_peak = measure(
+            lambda: [legacy_features(track) for track in tracks]
+        )
+        single, single_sec, single_peak = measure(
+            lambda: [
+                AudioHighlightsModel.compute_features(track)
+                for track in tracks
+            ]
+        )
+        batch, batch_sec, batch_peak = measure(
+            lambda: AudioHighlightsModel.compute_features_batch(tracks)
+        )
+        for name, features, seconds, peak in (
+            ("legacy", reference, legacy_sec, legacy_peak),
+            ("single", single, single_sec, single_peak),
+            ("batch", batch, batch_sec, batch_peak),
+        ):
+            print(
+                f"{name:>8} {duration:>11.0f} {seconds:>8.3f} "
+                f"{peak / audio_sec:>10.0f} "
+                f"{max_diff(features, reference):>9.2e}"
+            )
+
+
+def main():
+    """
+    Точка входа бенчмарка.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--durations", type=float, nargs="+", default=[60, 120, 200]
+    )
+    parser.add_argument("--batch-size", type=int, default=4)
+    args = parser.parse_args()
+    run_benchmark(args.durations, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
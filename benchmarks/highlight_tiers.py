@@ -0,0 +1,158 @@
+"""
+Бенчмарк уровней качества поиска хайлайта (см. lib.highlight.
+HIGHLIGHT_TIERS): время выделения хайлайта на каждом уровне, ускорение
+относительно full и доля треков, для которых начало хайлайта совпадает
+с началом, найденным на уровне full, с точностью до --tolerance секунд.
+Кэш результатов на время замеров отключается.
+
+Эталонный набор - директория с треками (--reference) или синтетические
+треки. Для оценки качества эвристики нужна реальная музыка: огибающая
+синтетических треков не похожа на структуру настоящих композиций.
+
+Запуск из корня репозитория:
+    python -m benchmarks.highlight_tiers --reference music/ --variant fp32
+"""
+
+import argparse
+import os
+import sys
+from time import perf_counter
+from typing import Dict, List
+import numpy as np
+from benchmarks.synthetic import generate_track
+from lib.cache import ResultCache, set_result_cache
+from lib.highlight import (
+    HIGHLIGHT_TIERS,
+    crop_track,
+    extract_highlight_offset,
+)
+from lib.ingest import decode_audio, list_audio_files
+from lib.model import MODEL_VARIANTS, SR, AudioHighlightsModel
+
+
+def load_reference(
+    directory: str | None,
+    n_tracks: int,
+) -> List[np.ndarray]:
+    """
+    Функция загрузки эталонного набора треков с частотой SR,
+    обрезанных до длительности, которую обрабатывает модель.
+
+    :param
+    directory : str | None
+        Директория с треками. Если не передана,
+        генерируются синтетические треки.
+    n_tracks : int
+        Максимальное количество треков.
+    :return:
+    tracks : List[numpy.ndarray]
+        Треки.
+    """
+    if directory is None:
+        rng = np.random.default_rng(0)
+        tracks = [
+            generate_track(duration, SR, seed)
+            for seed, duration in enumerate(
+                rng.uniform(60, 200, size=n_tracks).tolist()
+            )
+        ]
+    else:
+        tracks = []
+        for path in list_audio_files(directory)[:n_tracks]:
+            with open(path, "rb") as audio_file:
+                tracks.append(
+                    decode_audio(
+                        os.path.basename(path), audio_file.read()
+                    ).audio
+                )
+    return [crop_track(track, SR)[0] for track in tracks]
+
+
+def run_tier(
+    tier: str,
+    tracks: List[np.ndarray],
+    model: AudioHighlightsModel,
+) -> Dict[str, float | List[float]]:
+    """
+    Функция замера уровня качества на эталонном наборе.
+
+    :param
+    tier : str
+        Уровень из HIGHLIGHT_TIERS.
+    tracks : List[numpy.ndarray]
+        Эталонный набор, см. load_reference.
+    model : AudioHighlightsModel
+        Модель для уровней full и fast.
+    :return:
+    result : Dict[str, float | List[float]]
+        Суммарное время выделения хайлайтов в секундах
+        и начала хайлайтов по трекам.
+    """
+    # прогрев: загрузка сессии, выделение буферов, компиляция numba
+    extract_highlight_offset(tracks[0], SR, model, tier=tier)
+    starts = []
+    total_sec = 0.0
+    for track in tracks:
+        start = perf_counter()
+        result = extract_highlight_offset(track, SR, model, tier=tier)
+        total_sec += perf_counter() - start
+        starts.append(float(result.start_sec))
+    return {"total_sec": total_sec, "starts": starts}
+
+
+def main():
+    """
+    Точка входа бенчмарка.
+    """
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--reference", default=None)
+    parser.add_argument("--tracks", type=int, default=16)
+    parser.add_argument(
+        "--variant",
+        choices=list(MODEL_VARIANTS),
+        default=None,
+        help="вариант весов модели, см. lib.model.MODEL_VARIANTS",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.0,
+        help="допустимое отличие начала хайлайта в секундах",
+    )
+    args = parser.parse_args()
+
+    tracks = load_reference(args.reference, args.tracks)
+    if not tracks:
+        sys.exit("reference set is empty")
+    model = AudioHighlightsModel(variant=args.variant)
+    previous_cache = set_result_cache(ResultCache(None, memory_bytes=0))
+    try:
+        results = {
+            tier: run_tier(tier, tracks, model) for tier in HIGHLIGHT_TIERS
+        }
+    finally:
+        if previous_cache is not None:
+            set_result_cache(previous_cache)
+
+    base = results["full"]
+    print(
+        f"{'tier':>10} {'time, s':>8} {'speedup':>8} "
+        f"{'agree':>6} {'mean diff, s':>13}"
+    )
+    for tier, result in results.items():
+        diffs = np.abs(
+            np.asarray(result["starts"]) - np.asarray(base["starts"])
+        )
+        print(
+            f"{tier:>10} {result['total_sec']:>8.3f} "
+            f"{base['total_sec'] / result['total_sec']:>7.2f}x "
+            f"{np.mean(diffs <= args.tolerance):>6.1%} "
+            f"{diffs.mean():>13.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Бенчмарк инкрементальной склейки плейлиста: для синтетических
+хайлайтов сравнивает полную склейку assemble_playlist
+с lib.crossfade.PlaylistBuffer, когда пользователь снимает
+и снова отмечает по одному треку. Выводится время пересборки
+и доля сэмплов, которые не пришлось смешивать заново.
+
+Запуск из корня репозитория:
+    python -m benchmarks.incremental_playlist --tracks 20 --duration 30
+"""
+
+import argparse
+from time import perf_counter
+import numpy as np
+from benchmarks.synthetic import generate_tracks
+from lib.crossfade import PlaylistBuffer, assemble_playlist
+from lib.model import SR
+
+
+def run_benchmark(n_tracks: int, duration: float) -> None:
+    """
+    Функция сравнения полной и инкрементальной склейки.
+
+    :param
+    n_tracks : int
+        Количество треков.
+    duration : float
+        Длительность хайлайта в секундах.
+    """
+    highlights = [
+        track.astype(np.float32, copy=False)
+        for track in generate_tracks([duration] * n_tracks, SR)
+    ]
+    keys = [str(idx) for idx in range(n_tracks)]
+    buffer = PlaylistBuffer()
+    buffer.render(keys, highlights, SR)
+
+    full_sec = 0.0
+    incremental_sec = 0.0
+    reused = 0
+    total = 0
+    # снимаем и снова отмечаем каждый трек по очереди
+    for removed in range(n_tracks):
+        selections = [
+            [idx for idx in range(n_tracks) if idx != removed],
+            list(range(n_tracks)),
+        ]
+        for selection in selections:
+            start = perf_counter()
+            reference, _ = assemble_playlist(
+                highlights, [SR] * n_tracks, selection
+            )
+            full_sec += perf_counter() - start
+
+            start = perf_counter()
+            merged = buffer.render(
+                [keys[idx] for idx in selection],
+                [highlights[idx] for idx in selection],
+                SR,
+            )
+            incremental_sec += perf_counter() - start
+            if not np.array_equal(merged, reference):
+                raise AssertionError("Incremental playlist differs")
+            stats = buffer.last_build
+            reused += stats["samples_in_place"] + stats["samples_moved"]
+            total += stats["samples"]
+
+    builds = 2 * n_tracks
+    print(
+        f"builds: {builds}, full: {full_sec / builds * 1000:.1f} ms, "
+        f"incremental: {incremental_sec / builds * 1000:.1f} ms, "
+        f"samples reused: {reused / total:.1%}"
+    )
+
+
+def main():
+    """
+    Точка входа бенчмарка.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tracks", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30)
+    args = parser.parse_args()
+    run_benchmark(args.tracks, args.duration)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Бенчмарк вариантов весов модели (см. lib.model.MODEL_VARIANTS)
+относительно fp32 модели: ускорение инференса, отклонение кривых
+предсказания и доля треков, для которых выбранное начало хайлайта
+отличается больше допустимого.
+
+Эталонный набор - директория с треками (--reference) или синтетические
+треки. Бенчмарк завершается с кодом 1, если доля расхождений какого-либо
+варианта больше --max-disagreement.
+
+Запуск из корня репозитория:
+    python -m lib.quantization --calibration music/
+    python -m benchmarks.model_variants --reference music/
+"""
+
+import argparse
+import os
+import sys
+from statistics import median
+from time import perf_counter
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from benchmarks.synthetic import generate_track
+from lib.highlight import crop_track, highlight_start
+from lib.ingest import decode_audio, list_audio_files
+from lib.model import (
+    MODEL_VARIANTS,
+    REFERENCE_VARIANT,
+    SR,
+    AudioHighlightsModel,
+)
+
+
+def load_reference(
+    directory: str | None,
+    n_tracks: int,
+) -> List[Tuple[np.ndarray, float]]:
+    """
+    Функция загрузки эталонного набора треков.
+
+    :param
+    directory : str | None
+        Директория с треками. Если не передана,
+        генерируются синтетические треки.
+    n_tracks : int
+        Максимальное количество треков.
+    :return:
+    tracks : List[Tuple[numpy.ndarray, float]]
+        Пары (признаки трека, длительность в секундах).
+    """
+    if directory is None:
+        rng = np.random.default_rng(0)
+        tracks = [
+            generate_track(duration, SR, seed)
+            for seed, duration in enumerate(
+                rng.uniform(60, 200, size=n_tracks).tolist()
+            )
+        ]
+    else:
+        tracks = []
+        for path in list_audio_files(directory)[:n_tracks]:
+            with open(path, "rb") as audio_file:
+                tracks.append(
+                    decode_audio(
+                        os.path.basename(path), audio_file.read()
+                    ).audio
+                )
+    reference = []
+    for track in tracks:
+        track, duration = crop_track(track, SR)
+        reference.append(
+            (AudioHighlightsModel.compute_features(track), duration)
+        )
+    return reference
+
+
+def run_variant(
+    variant: str,
+    reference: List[Tuple[np.ndarray, float]],
+    repeats: int,
+) -> Dict[str, Any]:
+    """
+    Функция замера варианта модели на эталонном наборе.
+
+    :param
+    variant : str
+        Название варианта из MODEL_VARIANTS.
+    reference : List[Tuple[numpy.ndarray, float]]
+        Эталонный набор, см. load_reference.
+    repeats : int
+        Количество повторов замера времени.
+    :return:
+    result : Dict[str, Any]
+        Медианное время инференса всего набора в секундах,
+        предсказания и начала хайлайтов по трекам.
+    """
+    model = AudioHighlightsModel(variant=variant)
+    # прогрев: загрузка сессии и выделение буферов
+    model.run(reference[0][0])
+    timings = []
+    for _ in range(repeats):
+        start = perf_counter()
+        predictions = [model.run(features) for features, _ in reference]
+        timings.append(perf_counter() - start)
+    return {
+        "median_sec": median(timings),
+        "predictions": predictions,
+        "starts": [
+            highlight_start(prediction, duration, model)
+            for prediction, (_, duration) in zip(predictions, reference)
+        ],
+    }
+
+
+def compare(
+    result: Dict[str, Any],
+    base: Dict[str, Any],
+    tolerance: float,
+) -> Dict[str, float]:
+    """
+    Функция сравнения варианта с fp32 моделью.
+
+    :param
+    result : Dict[str, Any]
+        Замеры варианта, см. run_variant.
+    base : Dict[str, Any]
+        Замеры fp32 модели.
+    tolerance : float
+        Допустимое отличие начала хайлайта в секундах.
+    :return:
+    metrics : Dict[str, float]
+        Ускорение, средняя и максимальная абсолютная ошибка кривых,
+        средняя корреляция кривых и доля расхождений начала хайлайта.
+    """
+    errors = []
+    correlations = []
+    for prediction, base_prediction in zip(
+        result["predictions"], base["predictions"]
+    ):
+        length = min(len(prediction), len(base_prediction))
+        curve = np.asarray(prediction[:length], dtype=np.float64)
+        base_curve = np.asarray(base_prediction[:length], dtype=np.float64)
+        errors.append(np.abs(curve - base_curve))
+        if length > 1 and curve.std() > 0 and base_curve.std() > 0:
+            correlations.append(np.corrcoef(curve, base_curve)[0, 1])
+    errors = np.concatenate(errors)
+    disagreements = sum(
+        abs(start - base_start) > tolerance
+        for start, base_start in zip(result["starts"], base["starts"])
+    )
+    return {
+        "speedup": base["median_sec"] / result["median_sec"],
+        "mean_abs_error": float(errors.mean()) if errors.size else 0.0,
+        "max_abs_error": float(errors.max()) if errors.size else 0.0,
+        "correlation": (
+            float(np.mean(correlations)) if correlations else float("nan")
+        ),
+        "disagreement": disagreements / len(base["starts"]),
+    }
+
+
+def main():
+    """
+    Точка входа бенчмарка.
+    """
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--reference", default=None)
+    parser.add_argument("--tracks", type=int, default=16)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument(
+        "--variants",
+        nargs="+",
+        choices=[name for name in MODEL_VARIANTS if name != REFERENCE_VARIANT],
+        default=None,
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.0,
+        help="допустимое отличие начала хайлайта в секундах",
+    )
+    parser.add_argument(
+        "--max-disagreement",
+        type=float,
+        default=None,
+        help="допустимая доля треков с отличающимся началом хайлайта",
+    )
+    args = parser.parse_args()
+
+    if not os.path.exists(MODEL_VARIANTS[REFERENCE_VARIANT]):
+        sys.exit(f"{MODEL_VARIANTS[REFERENCE_VARIANT]} not found")
+    variants = args.variants or [
+        name for name in MODEL_VARIANTS
+        if name != REFERENCE_VARIANT and os.path.exists(MODEL_VARIANTS[name])
+    ]
+    reference = load_reference(args.reference, args.tracks)
+    if not reference:
+        sys.exit("reference set is empty")
+    base = run_variant(REFERENCE_VARIANT, reference, args.repeats)
+
+    print(
+        f"{'variant':>12} {'time, s':>8} {'speedup':>8} {'mean err':>9} "
+        f"{'max err':>8} {'corr':>6} {'disagree':>9}"
+    )
+    print(f"{REFERENCE_VARIANT:>12} {base['median_sec']:>8.3f}")
+    failed = False
+    for variant in variants:
+        if not os.path.exists(MODEL_VARIANTS[variant]):
+            print(f"{variant:>12} {MODEL_VARIANTS[variant]} not found")
+            continue
+        result = run_variant(variant, reference, args.repeats)
+        metrics = compare(result, base, args.tolerance)
+        print(
+            f"{variant:>12} {result['median_sec']:>8.3f} "
+            f"{metrics['speedup']:>7.2f}x {metrics['mean_abs_error']:>9.4f} "
+            f"{metrics['max_abs_error']:>8.4f} {metrics['correlation']:>6.3f} "
+            f"{metrics['disagreement']:>9.1%}"
+        )
+        if (
+            args.max_disagreement is not None
+            and metrics["disagreement"] > args.max_disagreement
+        ):
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Проверка отправки уведомлений на локальной заглушке Telegram Bot API:
+в текущем процессе поднимается сервер, который отвечает медленно,
+возвращает ошибки 5xx и 429 с retry_after при превышении лимита
+сообщений в секунду (с --proxy-429 - текстом без JSON, как прокси).
+Диспетчер lib.notifications получает пачки
+сообщений, после чего выводится, сколько сообщений дошло,
+во сколько запросов они были объединены, количество повторов
+и максимальное время постановки сообщения в очередь.
+Telegram не нужен.
+
+Запуск из корня репозитория:
+    python -m benchmarks.notification_drill --alerts 200 --error-rate 0.2
+"""
+
+import argparse
+import asyncio
+import random
+from time import monotonic, perf_counter
+from typing import List
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from lib.notifications import NotificationDispatcher
+
+
+class TelegramStub:
+    """
+    Класс заглушки метода sendMessage Telegram Bot API.
+
+    :param
+    error_rate : float
+        Доля запросов, на которые отвечается 500.
+    delay_sec : float
+        Задержка ответа в секундах.
+    rate_limit_sec : float
+        Минимальный интервал между сообщениями, при нарушении
+        которого отвечается 429 с retry_after.
+    proxy_429 : bool = False
+        Если True, 429 отвечается текстом с заголовком Retry-After,
+        как отвечают прокси, а не JSON Telegram.
+    """
+
+    def __init__(
+        self,
+        error_rate: float,
+        delay_sec: float,
+        rate_limit_sec: float,
+        proxy_429: bool = False,
+    ):
+        """
+        Конструктор класса TelegramStub.
+
+        :param
+        error_rate : float
+            Доля ответов 500.
+        delay_sec : float
+            Задержка ответа в секундах.
+        rate_limit_sec : float
+            Минимальный интервал между сообщениями в секундах.
+        proxy_429 : bool = False
+            Отвечать 429 текстом без JSON.
+        """
+        self.error_rate = error_rate
+        self.delay_sec = delay_sec
+        self.rate_limit_sec = rate_limit_sec
+        self.proxy_429 = proxy_429
+        self.texts: List[str] = []
+        self.requests = 0
+        self.rate_limited = 0
+        self._last = float("-inf")
+
+    async def send_message(self, request: web.Request) -> web.Response:
+        """
+        Обработчик POST /bot{token}/sendMessage.
+        """
+        self.requests += 1
+        payload = await request.json()
+        await asyncio.sleep(self.delay_sec)
+        if random.random() < self.error_rate:
+            return web.json_response(
+                {"ok": False, "error_code": 500}, status=500
+            )
+        now = monotonic()
+        if now - self._last < self.rate_limit_sec:
+            self.rate_limited += 1
+            if self.proxy_429:
+                return web.Response(
+                    text="Too Many Requests",
+                    status=429,
+                    headers={"Retry-After": "1"},
+                )
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "parameters": {"retry_after": 1},
+                },
+                status=429,
+            )
+        self._last = now
+        self.texts.append(payload["text"])
+        return web.json_response({"ok": True})
+
+
+async def run_drill(
+    n_alerts: int,
+    bursts: int,
+    error_rate: float,
+    delay_sec: float,
+    proxy_429: bool = False,
+) -> None:
+    """
+    Асинхронная функция проверки диспетчера уведомлений.
+
+    :param
+    n_alerts : int
+        Количество сообщений.
+    bursts : int
+        Количество пачек, на которые делятся сообщения.
+    error_rate : float
+        Доля ответов 500 заглушки.
+    delay_sec : float
+        Задержка ответа заглушки в секундах.
+    proxy_429 : bool = False
+        Отвечать 429 текстом без JSON, см. TelegramStub.
+    """
+    random.seed(0)
+    stub = TelegramStub(
+        error_rate, delay_sec, rate_limit_sec=1.0, proxy_429=proxy_429
+    )
+    app = web.Application()
+    app.router.add_post("/bot{token}/sendMessage", stub.send_message)
+    server = TestServer(app)
+    await server.start_server()
+    dispatcher = NotificationDispatcher(
+        "TEST",
+        1,
+        api_url=f"http://{server.host}:{server.port}",
+        coalesce_sec=0.5,
+        max_retries=8,
+    )
+    start = monotonic()
+    submit_sec = []
+    try:
+        per_burst = -(-n_alerts // bursts)
+        for idx in range(n_alerts):
+            submit_start = perf_counter()
+            dispatcher.submit(f"alert #{idx}: container status changed")
+            submit_sec.append(perf_counter() - submit_start)
+            if (idx + 1) % per_burst == 0:
+                await asyncio.sleep(1.5)
+        await asyncio.to_thread(dispatcher.close, 120)
+    finally:
+        await server.close()
+    elapsed = monotonic() - start
+
+    delivered = sum(text.count("alert #") for text in stub.texts)
+    stats = dispatcher.stats
+    print(
+        f"alerts: {n_alerts}, delivered: {delivered}, "
+        f"telegram messages: {len(stub.texts)}, "
+        f"requests: {stub.requests}, rate limited: {stub.rate_limited}"
+    )
+    print(
+        f"retries: {stats['retries']}, failed: {stats['failed']}, "
+        f"dropped: {stats['dropped']}, total: {elapsed:.1f} s, "
+        f"max submit: {max(submit_sec) * 1000:.2f} ms"
+    )
+
+
+def main():
+    """
+    Точка входа проверки.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--alerts", type=int, default=200)
+    parser.add_argument("--bursts", type=int, default=4)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--delay", type=float, default=0.2)
+    parser.add_argument("--proxy-429", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(
+        run_drill(
+            args.alerts,
+            args.bursts,
+            args.error_rate,
+            args.delay,
+            args.proxy_429,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Бенчмарк форматов результата: кодирует синтетический хайлайт
+в каждый формат lib.audio_writer.AUDIO_FORMATS (форматы со сжатием
+с потерями - с каждым из битрейтов) и выводит время кодирования,
+размер результата и его долю от размера WAV.
+
+Запуск из корня репозитория:
+    python -m benchmarks.output_formats --duration 30
+"""
+
+import argparse
+from time import perf_counter
+from typing import List, Tuple
+from benchmarks.synthetic import generate_track
+from lib.audio_writer import AUDIO_FORMATS, LOSSY_FORMATS, OUTPUT_BITRATES
+from lib.model import SR
+from lib.output import encode_result
+
+
+def run_benchmark(duration: float, repeats: int) -> None:
+    """
+    Функция сравнения форматов результата.
+
+    :param
+    duration : float
+        Длительность хайлайта в секундах.
+    repeats : int
+        Количество повторов кодирования, выводится лучшее время.
+    """
+    highlight = generate_track(duration, SR)
+    variants: List[Tuple[str, int | None]] = []
+    for audio_format in AUDIO_FORMATS:
+        if audio_format in LOSSY_FORMATS:
+            variants.extend(
+                (audio_format, bitrate) for bitrate in OUTPUT_BITRATES
+            )
+        else:
+            variants.append((audio_format, None))
+
+    wav_size = None
+    print(
+        f"{'format':>6} {'kbit/s':>6} {'time, s':>8} "
+        f"{'size, KiB':>10} {'of wav':>7}"
+    )
+    for audio_format, bitrate in variants:
+        best = float("inf")
+        for _ in range(repeats):
+            start = perf_counter()
+            encoded = encode_result(highlight, SR, audio_format, bitrate)
+            best = min(best, perf_counter() - start)
+        if wav_size is None:
+            wav_size = encoded.size
+        print(
+            f"{audio_format:>6} {bitrate or '-':>6} {best:>8.3f} "
+            f"{encoded.size / 1024:>10.1f} {encoded.size / wav_size:>7.1%}"
+        )
+
+
+def main():
+    """
+    Точка входа бенчмарка.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    run_benchmark(args.duration, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
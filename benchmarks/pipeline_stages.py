@@ -0,0 +1,352 @@
+"""
+Бенчмарк этапов пайплайна выделения хайлайтов и формирования плейлиста.
+
+На синтетических треках разной длительности и частоты дискретизации
+отдельно замеряются время и пиковая память этапов: декодирование,
+sort_tracks, extract_features, predict, get_max_area_section,
+crossfade_setlist и кодирование WAV. Кэш результатов на время замера
+отключён, чтобы каждый повтор выполнял вычисления заново.
+Если файла весов нет, используется небольшая заменяющая ONNX-модель,
+см. benchmarks.synthetic.make_standin_model.
+
+Результаты можно сохранить как JSON-базу и сравнивать с ней
+последующие запуски: бенчмарк завершается с кодом 1, если время
+или память какого-либо этапа выросли больше допустимого порога.
+
+Запуск из корня репозитория:
+    python -m benchmarks.pipeline_stages --save-baseline
+    python -m benchmarks.pipeline_stages --threshold 0.2
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import tracemalloc
+from statistics import median
+from time import perf_counter
+from typing import Any, Callable, Dict, List
+import librosa as lb
+import numpy as np
+import onnxruntime as rt
+import soundfile as sf
+from benchmarks.synthetic import generate_track, make_standin_model
+from lib.analysis import sort_tracks
+from lib.cache import ResultCache, set_result_cache
+from lib.crossfade import crossfade_setlist
+from lib.highlight import HIGHLIGHT_DURATION_SEC, crop_track, slice_window
+from lib.ingest import decode_audio
+from lib.model import CHUNK_SIZE, AudioHighlightsModel
+from lib.utils import get_max_area_section
+
+
+BASELINE_PATH = os.path.join(
+    "benchmarks", "baselines", "pipeline_stages.json"
+)
+DURATIONS_SEC = (45, 120, 200, 260)
+SAMPLE_RATES = (22050, 44100, 48000)
+# этапы короче этого времени не проверяются на регрессию по времени:
+# их разброс сопоставим с самим замером
+MIN_CHECKED_SEC = 0.005
+
+
+def load_model() -> AudioHighlightsModel:
+    """
+    Функция загрузки модели. Если файла весов нет,
+    модель использует заменяющую ONNX-модель.
+
+    :return:
+    model : AudioHighlightsModel
+        Модель для замеров.
+    """
+    if os.path.exists(AudioHighlightsModel.ONNX_WEIGHTS_PATH):
+        return AudioHighlightsModel()
+
+    path = os.path.join(tempfile.gettempdir(), "audio-highlight-standin.onnx")
+
+    class StandInModel(AudioHighlightsModel):
+        ONNX_WEIGHTS_PATH = make_standin_model(path, CHUNK_SIZE)
+
+    print(
+        f"{AudioHighlightsModel.ONNX_WEIGHTS_PATH} not found, "
+        "using a stand-in ONNX model"
+    )
+    return StandInModel()
+
+
+def measure(
+    func: Callable[[], Any],
+    repeats: int,
+) -> Dict[str, Any]:
+    """
+    Функция замера этапа: время каждого повтора и пиковая память
+    numpy-аллокаций отдельного повтора под tracemalloc.
+
+    :param
+    func : Callable[[], Any]
+        Замеряемый этап.
+    repeats : int
+        Количество повторов замера времени.
+    :return:
+    stage : Dict[str, Any]
+        Минимальное и медианное время в секундах, пиковая память
+        этапа и пиковый RSS процесса в МБ после этапа, а также
+        результат этапа в ключе "result" (не сохраняется в базе).
+    """
+    timings = []
+    for _ in range(repeats):
+        start = perf_counter()
+        result = func()
+        timings.append(perf_counter() - start)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "min_sec": min(timings),
+        "median_sec": median(timings),
+        "peak_mb": peak / 1024 ** 2,
+        "max_rss_mb": peak_rss_mb(),
+        "result": result,
+    }
+
+
+def peak_rss_mb() -> float:
+    """
+    Функция получения пикового RSS процесса в МБ.
+    """
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss в килобайтах на Linux и в байтах на macOS
+    return max_rss / (1024 ** 2 if sys.platform == "darwin" else 1024)
+
+
+def run_stages(
+    n_tracks: int,
+    repeats: int,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Функция последовательного замера этапов пайплайна.
+    Результат каждого этапа передаётся на вход следующему.
+
+    :param
+    n_tracks : int
+        Количество синтетических треков.
+    repeats : int
+        Количество повторов замера каждого этапа.
+    :return:
+    stages : Dict[str, Dict[str, Any]]
+        Замеры по этапам, см. measure.
+    """
+    files = []
+    for idx in range(n_tracks):
+        sample_rate = SAMPLE_RATES[idx % len(SAMPLE_RATES)]
+        buffer = io.BytesIO()
+        sf.write(
+            buffer,
+            generate_track(
+                DURATIONS_SEC[idx % len(DURATIONS_SEC)], sample_rate, idx
+            ),
+            sample_rate,
+            format="WAV",
+        )
+        files.append((f"{idx}.wav", buffer.getvalue()))
+    model = load_model()
+    # прогрев: numba-функции librosa и сессия onnxruntime
+    model.run(model.compute_features(generate_track(10)))
+
+    stages = {}
+    stages["decode"] = measure(
+        lambda: [decode_audio(name, data) for name, data in files], repeats
+    )
+    tracks = stages["decode"]["result"]
+    audio = [crop_track(track.audio, track.sample_rate)[0] for track in tracks]
+    sample_rates = [track.sample_rate for track in tracks]
+
+    stages["sort_tracks"] = measure(
+        lambda: asyncio.run(sort_tracks(audio, sample_rates, workers=1)),
+        repeats,
+    )
+    order = stages["sort_tracks"]["result"]
+
+    stages["extract_features"] = measure(
+        lambda: [model.compute_features(track) for track in audio], repeats
+    )
+    features = stages["extract_features"]["result"]
+
+    stages["predict"] = measure(
+        lambda: [model.run(track_features) for track_features in features],
+        repeats,
+    )
+    predictions = stages["predict"]["result"]
+
+    stages["get_max_area_section"] = measure(
+        lambda: [
+            get_max_area_section(prediction, HIGHLIGHT_DURATION_SEC)
+            for prediction in predictions
+        ],
+        repeats,
+    )
+    highlights = []
+    for idx, start_sec in enumerate(stages["get_max_area_section"]["result"]):
+        duration = len(audio[idx]) / sample_rates[idx]
+        start_sec = max(min(start_sec, duration - HIGHLIGHT_DURATION_SEC), 0)
+        highlights.append(
+            slice_window(
+                audio[idx],
+                sample_rates[idx],
+                start_sec,
+                HIGHLIGHT_DURATION_SEC,
+            )
+        )
+
+    stages["crossfade_setlist"] = measure(
+        lambda: asyncio.run(
+            crossfade_setlist(highlights, sample_rates, order)
+        ),
+        repeats,
+    )
+    playlist, playlist_sr = stages["crossfade_setlist"]["result"]
+
+    def encode():
+        buffer = io.BytesIO()
+        sf.write(buffer, playlist, playlist_sr, format="WAV")
+        return buffer.getbuffer().nbytes
+
+    stages["wav_encode"] = measure(encode, repeats)
+    for stage in stages.values():
+        del stage["result"]
+    return stages
+
+
+def compare(
+    stages: Dict[str, Dict[str, Any]],
+    baseline: Dict[str, Any],
+    threshold: float,
+) -> List[str]:
+    """
+    Функция сравнения замеров с базой.
+
+    :param
+    stages : Dict[str, Dict[str, Any]]
+        Текущие замеры по этапам.
+    baseline : Dict[str, Any]
+        Сохранённая база, см. main.
+    threshold : float
+        Допустимый относительный рост медианного времени
+        и пиковой памяти этапа.
+    :return:
+    regressions : List[str]
+        Описание этапов, превысивших порог.
+    """
+    regressions = []
+    for name, stage in stages.items():
+        base = baseline["stages"].get(name)
+        if base is None:
+            continue
+        if (
+            base["median_sec"] >= MIN_CHECKED_SEC
+            and stage["median_sec"] > base["median_sec"] * (1 + threshold)
+        ):
+            regressions.append(
+                f"{name}: time {base['median_sec']:.3f} s -> "
+                f"{stage['median_sec']:.3f} s"
+            )
+        if stage["peak_mb"] > base["peak_mb"] * (1 + threshold) + 1:
+            regressions.append(
+                f"{name}: memory {base['peak_mb']:.1f} MB -> "
+                f"{stage['peak_mb']:.1f} MB"
+            )
+    return regressions
+
+
+def main():
+    """
+    Точка входа бенчмарка.
+    """
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--tracks", type=int, default=6)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="сохранить результаты как новую базу",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="допустимый относительный рост времени и памяти этапа",
+    )
+    args = parser.parse_args()
+
+    previous_cache = set_result_cache(ResultCache(None, memory_bytes=0))
+    try:
+        stages = run_stages(args.tracks, args.repeats)
+    finally:
+        if previous_cache is not None:
+            set_result_cache(previous_cache)
+    results = {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "librosa": lb.__version__,
+            "onnxruntime": rt.__version__,
+            "machine": platform.machine(),
+            "standin_model": not os.path.exists(
+                AudioHighlightsModel.ONNX_WEIGHTS_PATH
+            ),
+        },
+        "params": {"tracks": args.tracks, "repeats": args.repeats},
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": stages,
+    }
+
+    print(
+        f"{'stage':>22} {'min, s':>8} {'median, s':>10} "
+        f"{'peak, MB':>9} {'max RSS, MB':>12}"
+    )
+    for name, stage in stages.items():
+        print(
+            f"{name:>22} {stage['min_sec']:>8.3f} "
+            f"{stage['median_sec']:>10.3f} {stage['peak_mb']:>9.1f} "
+            f"{stage['max_rss_mb']:>12.1f}"
+        )
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}, run with --save-baseline")
+        return
+
+    with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline["params"] != results["params"]:
+        print(f"WARNING: baseline params differ: {baseline['params']}")
+    for key, value in baseline["environment"].items():
+        if results["environment"].get(key) != value:
+            print(
+                f"environment changed: {key} {value} -> "
+                f"{results['environment'].get(key)}"
+            )
+    regressions = compare(stages, baseline, args.threshold)
+    for regression in regressions:
+        print(f"FAIL: {regression}")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Модуль генерации синтетических аудиоданных для бенчмарков.
+"""
+
+from typing import List
+import numpy as np
+
+
+def generate_track(
+    duration_sec: int | float,
+    sample_rate: int = 22050,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    Функция генерации синтетического трека: сумма гармоник
+    с медленно меняющейся огибающей, ударными импульсами и шумом.
+
+    :param
+    duration_sec : int | float
+        Длительность трека в секундах.
+    sample_rate : int = 22050
+        Частота дискретизации трека.
+    seed : int = 0
+        Зерно генератора случайных чисел.
+    :return:
+    track : numpy.ndarray
+        Моно-трек в формате float32.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration_sec * sample_rate)) / sample_rate
+    base = rng.uniform(110, 440)
+    bpm = rng.uniform(80, 160)
+    envelope = 0.3 + 0.7 * np.sin(2 * np.pi * t / rng.uniform(20, 60)) ** 2
+    track = np.zeros_like(t)
+    for harmonic in range(1, 4):
+        track += np.sin(2 * np.pi * base * harmonic * t) / harmonic
+    beats = (t * bpm / 60) % 1
+    track += 2 * np.exp(-beats * 30) * rng.standard_normal(t.size)
+    track = envelope * track + 0.05 * rng.standard_normal(t.size)
+    return (track / np.abs(track).max()).astype(np.float32)
+
+
+def generate_tracks(
+    durations_sec: List[int | float],
+    sample_rate: int = 22050,
+    seed: int = 0,
+) -> List[np.ndarray]:
+    """
+    Функция генерации списка синтетических треков.
+
+    :param
+    durations_sec : List[int | float]
+        Длительности треков в секундах.
+    sample_rate : int = 22050
+        Частота дискретизации треков.
+    seed : int = 0
+        Зерно генератора случайных чисел для первого трека.
+    :return:
+    tracks : List[numpy.ndarray]
+        Список треков.
+    """
+    return [
+        generate_track(duration, sample_rate, seed + idx)
+        for idx, duration in enumerate(durations_sec)
+    ]
+
+
+def make_standin_model(
+    path: str,
+    chunk_size: int = 43,
+) -> str:
+    """
+    Функция создания небольшой ONNX-модели, заменяющей веса
+    в бенчмарках, если файла весов нет. Модель принимает признаки
+    той же формы (batch, 128, frames, 1) и возвращает по одному
+    значению на чанк из chunk_size кадров: сигмоиду средней
+    энергии мел-спектра. Требует пакет onnx.
+
+    :param
+    path : str
+        Путь, по которому сохраняется модель.
+    chunk_size : int = 43
+        Количество кадров признаков в одном чанке предсказания.
+    :return:
+    path : str
+        Путь к сохранённой модели.
+    """
+    import onnx
+    from onnx import TensorProto, helper
+
+    graph = helper.make_graph(
+        [
+            helper.make_node(
+                "ReduceMean", ["input"], ["energy"], axes=[1], keepdims=1
+            ),
+            helper.make_node(
+                "Squeeze", ["energy", "last_axis"], ["energy_2d"]
+            ),
+            helper.make_node(
+                "AveragePool",
+                ["energy_2d"],
+                ["pooled"],
+                kernel_shape=[chunk_size],
+                strides=[chunk_size],
+            ),
+            helper.make_node("Sigmoid", ["pooled"], ["scores"]),
+            helper.make_node("Squeeze", ["scores", "first_axis"], ["output"]),
+        ],
+        "standin",
+        [
+            helper.make_tensor_value_info(
+                "input", TensorProto.FLOAT, ["N", 128, "T", 1]
+            )
+        ],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, None)],
+        initializer=[
+            helper.make_tensor("last_axis", TensorProto.INT64, [1], [3]),
+            helper.make_tensor("first_axis", TensorProto.INT64, [1], [1]),
+        ],
+    )
+    model = helper.make_model(
+        graph, opset_imports=[helper.make_opsetid("", 13)]
+    )
+    onnx.checker.check_model(model)
+    onnx.save(model, path)
+    return path
@@ -0,0 +1,246 @@
+"""
+Учения Watchdog-бота на поддельном Docker API: в текущем процессе
+поднимается сервер, отвечающий как Docker Engine API, и по сценарию
+меняет статусы, перезапускает контейнеры и поднимает потребление памяти.
+Бот работает против этого сервера с короткими интервалами, а вместо
+телеграма уведомления собираются в список. В конце выводятся
+уведомления и доля процессорного времени, которую занимал бот.
+Docker и телеграм не нужны.
+
+Запуск из корня репозитория:
+    python -m benchmarks.watchdog_drill --interval 0.5 --debounce 1
+"""
+
+import argparse
+import asyncio
+import json
+from time import monotonic, process_time
+from typing import Any, Dict, List
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from lib.watchdog_service import ContainerWatchdog, DockerAPI
+
+
+MEMORY_LIMIT = 512 * 1024 ** 2
+
+
+class FakeDocker:
+    """
+    Класс состояния поддельного Docker: контейнеры с их статусом,
+    временем запуска, счётчиком перезапусков и потреблением ресурсов.
+
+    :param
+    names : List[str]
+        Имена контейнеров, изначально работающих.
+    """
+
+    def __init__(self, names: List[str]):
+        """
+        Конструктор класса FakeDocker.
+
+        :param
+        names : List[str]
+            Имена контейнеров.
+        """
+        self.containers: Dict[str, Dict[str, Any]] = {
+            name: {
+                "status": "running",
+                "started": 0,
+                "restart_count": 0,
+                "memory": 100 * 1024 ** 2,
+                "cpu_total": 0,
+            }
+            for name in names
+        }
+        self.system_total = 0
+        self.subscribers: List[asyncio.Queue] = []
+
+    def emit(self, name: str, action: str) -> None:
+        """
+        Функция отправки события контейнера подписчикам /events.
+        """
+        event = {
+            "Type": "container",
+            "Action": action,
+            "Actor": {"Attributes": {"name": name}},
+        }
+        self.emit_raw(json.dumps(event).encode() + b"\n")
+
+    def emit_raw(self, line: bytes) -> None:
+        """
+        Функция отправки строки потока /events как есть,
+        например, повреждённого события.
+        """
+        for subscriber in self.subscribers:
+            subscriber.put_nowait(line)
+
+    def set_status(self, name: str, status: str) -> None:
+        """
+        Функция смены статуса контейнера.
+        """
+        container = self.containers[name]
+        if status == "running" and container["status"] != "running":
+            container["started"] += 1
+        container["status"] = status
+        self.emit(name, "start" if status == "running" else "die")
+
+    def restart(self, name: str) -> None:
+        """
+        Функция перезапуска контейнера политикой перезапуска.
+        """
+        container = self.containers[name]
+        container["started"] += 1
+        container["restart_count"] += 1
+        self.emit(name, "restart")
+
+    def app(self) -> web.Application:
+        """
+        Функция создания приложения с эндпоинтами Docker API,
+        которые использует lib.watchdog_service.DockerAPI.
+        """
+
+        async def inspect(request: web.Request) -> web.Response:
+            container = self.containers.get(request.match_info["name"])
+            if container is None or container["status"] == "removed":
+                return web.json_response(
+                    {"message": "No such container"}, status=404
+                )
+            return web.json_response(
+                {
+                    "Name": "/" + request.match_info["name"],
+                    "RestartCount": container["restart_count"],
+                    "State": {
+                        "Status": container["status"],
+                        "StartedAt": f"start-{container['started']}",
+                    },
+                }
+            )
+
+        async def stats(request: web.Request) -> web.Response:
+            container = self.containers[request.match_info["name"]]
+            # небольшая постоянная загрузка CPU
+            self.system_total += 10 ** 9
+            container["cpu_total"] += 10 ** 8
+            return web.json_response(
+                {
+                    "cpu_stats": {
+                        "cpu_usage": {"total_usage": container["cpu_total"]},
+                        "system_cpu_usage": self.system_total,
+                        "online_cpus": 1,
+                    },
+                    "memory_stats": {
+                        "usage": container["memory"],
+                        "limit": MEMORY_LIMIT,
+                        "stats": {"inactive_file": 0},
+                    },
+                }
+            )
+
+        async def events(request: web.Request) -> web.StreamResponse:
+            response = web.StreamResponse()
+            await response.prepare(request)
+            queue: asyncio.Queue = asyncio.Queue()
+            self.subscribers.append(queue)
+            try:
+                while True:
+                    await response.write(await queue.get())
+            finally:
+                self.subscribers.remove(queue)
+
+        app = web.Application()
+        app.add_routes(
+            [
+                web.get("/containers/{name}/json", inspect),
+                web.get("/containers/{name}/stats", stats),
+                web.get("/events", events),
+            ]
+        )
+        return app
+
+
+async def run_drill(
+    interval: float,
+    debounce: float,
+) -> None:
+    """
+    Асинхронная функция сценария учений.
+
+    :param
+    interval : float
+        Интервал опроса бота в секундах.
+    debounce : float
+        Время подтверждения изменений в секундах.
+    """
+    names = ["app", "api", "nginx-entrypoint"]
+    docker = FakeDocker(names)
+    messages = []
+    server = TestServer(docker.app())
+    await server.start_server()
+    stop = asyncio.Event()
+    start_wall = monotonic()
+    start_cpu = process_time()
+    try:
+        async with DockerAPI(f"http://{server.host}:{server.port}") as api:
+            watchdog = ContainerWatchdog(
+                api,
+                tuple(names),
+                notify=lambda message: messages.append(
+                    (monotonic() - start_wall, message)
+                ),
+                interval=interval,
+                debounce=debounce,
+            )
+            task = asyncio.create_task(watchdog.run(stop))
+            step = debounce / 4
+            await asyncio.sleep(interval * 2)
+            # кратковременное падение: уведомления о статусе быть не должно
+            docker.set_status("app", "exited")
+            await asyncio.sleep(step)
+            docker.set_status("app", "running")
+            await asyncio.sleep(interval * 2 + debounce)
+            # перезапуск политикой restart
+            docker.restart("api")
+            await asyncio.sleep(interval * 2)
+            # долгое падение и восстановление
+            docker.set_status("api", "exited")
+            await asyncio.sleep(debounce * 2)
+            docker.set_status("api", "running")
+            await asyncio.sleep(debounce * 2)
+            # рост потребления памяти выше порога
+            docker.containers["nginx-entrypoint"]["memory"] = int(
+                MEMORY_LIMIT * 0.95
+            )
+            await asyncio.sleep(debounce * 2 + interval)
+            docker.containers["nginx-entrypoint"]["memory"] = 100 * 1024 ** 2
+            await asyncio.sleep(debounce * 2 + interval)
+            # удалённый контейнер
+            docker.set_status("app", "removed")
+            await asyncio.sleep(debounce * 2 + interval)
+            stop.set()
+            await task
+    finally:
+        await server.close()
+    wall = monotonic() - start_wall
+    cpu = process_time() - start_cpu
+
+    for elapsed, message in messages:
+        print(f"[{elapsed:6.2f} s] {message.replace(chr(10), ' | ')}")
+    print(
+        f"notifications: {len(messages)}, wall time: {wall:.1f} s, "
+        f"CPU time: {cpu:.2f} s ({cpu / wall:.1%})"
+    )
+
+
+def main():
+    """
+    Точка входа учений.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--interval", type=float, default=0.5)
+    parser.add_argument("--debounce", type=float, default=1.0)
+    args = parser.parse_args()
+    asyncio.run(run_drill(args.interval, args.debounce))
+
+
+if __name__ == "__main__":
+    main()
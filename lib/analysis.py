@@ -0,0 +1,224 @@
+"""
+Модуль общего анализа треков.
+
+Для каждого трека один раз вычисляется амплитудный спектр
+анализируемого окна (начала трека, которое обрабатывает модель),
+из которого получаются и признаки модели, и огибающая онсетов
+с оценкой темпа. Признаки сохраняются в кэше результатов под тем же
+ключом, что и в lib.highlight (см. lib.highlight.features_key),
+поэтому выделение хайлайтов после сортировки не вычисляет спектр
+повторно.
+"""
+
+import logging
+from typing import List
+import librosa as lb
+import numpy as np
+from lib.cache import audio_hash, get_result_cache, make_key
+from lib.highlight import crop_track, features_key
+from lib.metrics import stage
+from lib.model import (
+    N_FFT,
+    N_HOP,
+    SR,
+    AudioHighlightsModel,
+    magnitude_spectrogram,
+    mel_filterbank,
+)
+from lib.parallel import (
+    PARALLEL_BACKEND,
+    TrackProcessingError,
+    gather_tracks,
+)
+
+
+# мел-полосы огибающей онсетов, как в librosa.onset.onset_strength
+N_ONSET_MEL = 128
+
+
+class TrackAnalysis:
+    """
+    Класс результатов анализа трека.
+
+    :param
+    features : numpy.ndarray
+        Признаки модели, см. AudioHighlightsModel.compute_features.
+    onset_envelope : numpy.ndarray
+        Огибающая онсетов.
+    tempo : float
+        Темп трека в БПМ.
+    """
+
+    def __init__(
+        self,
+        features: np.ndarray,
+        onset_envelope: np.ndarray,
+        tempo: float,
+    ):
+        """
+        Конструктор класса TrackAnalysis.
+
+        :param
+        features : numpy.ndarray
+            Признаки модели.
+        onset_envelope : numpy.ndarray
+            Огибающая онсетов.
+        tempo : float
+            Темп трека в БПМ.
+        """
+        self.features = features
+        self.onset_envelope = onset_envelope
+        self.tempo = tempo
+
+
+def analyse_track(
+    track: np.ndarray,
+    sample_rate: int | float,
+) -> TrackAnalysis:
+    """
+    Функция анализа трека по одному амплитудному спектру.
+
+    :param
+    track : numpy.ndarray
+        Анализируемое окно трека, см. lib.highlight.crop_track.
+    sample_rate : int | float
+        Частота дискретизации переданного трека. Треки, декодированные
+        не через lib.ingest, приводятся к частоте модели SR.
+    :return:
+    analysis : TrackAnalysis
+        Признаки модели, огибающая онсетов и темп трека.
+    """
+    if sample_rate != SR:
+        track = lb.resample(y=track, orig_sr=sample_rate, target_sr=SR)
+    magnitude = magnitude_spectrogram(track)
+    features = AudioHighlightsModel.features_from_spectrogram(magnitude)
+
+    # огибающая считается по лог-мел-спектру мощности того же STFT,
+    # что эквивалентно librosa.onset.onset_strength(y=track)
+    onset_mel = mel_filterbank(SR, N_FFT, N_ONSET_MEL, 0.0, None) @ (
+        magnitude ** 2
+    )
+    del magnitude
+    onset_envelope = lb.onset.onset_strength(
+        S=lb.power_to_db(onset_mel),
+        sr=SR,
+        hop_length=N_HOP,
+    )
+    tempo = float(
+        lb.feature.tempo(
+            onset_envelope=onset_envelope,
+            sr=SR,
+            hop_length=N_HOP,
+        )[0]
+    )
+    return TrackAnalysis(features, onset_envelope, tempo)
+
+
+def estimate_tempo(
+    data: np.ndarray,
+    sample_rate: int | float,
+) -> float:
+    """
+    Функция оценки темпа трека в БПМ по анализируемому окну.
+    Объявлена на уровне модуля, чтобы исполняться в пуле процессов.
+    Темп и признаки модели сохраняются в кэше результатов
+    по хэшу содержимого окна.
+
+    :param
+    data : numpy.ndarray
+        Аудиофайл.
+    sample_rate : int | float
+        Частота дискретизации переданного трека.
+    :return:
+    tempo : float
+        Темп трека.
+    """
+    track, _ = crop_track(data, sample_rate)
+    content_hash = audio_hash(track, sample_rate)
+    cache = get_result_cache()
+    key = make_key(content_hash, "tempo")
+    tempo = cache.get(key)
+    if tempo is None:
+        with stage("tempo"):
+            analysis = analyse_track(track, sample_rate)
+        tempo = analysis.tempo
+        cache.set(features_key(content_hash), analysis.features)
+        cache.set(key, tempo)
+    return tempo
+
+
+async def estimate_tempos(
+    datas: List[np.ndarray],
+    sample_rates: List[int | float],
+    workers: int | None = None,
+    backend: str = PARALLEL_BACKEND,
+) -> List[float | TrackProcessingError]:
+    """
+    Асинхронная функция параллельной оценки темпа треков,
+    см. estimate_tempo.
+
+    :param
+    datas : List[numpy.ndarray]
+        Список с аудиофайлами.
+    sample_rates : List[int | float]
+        Список частот дискретизации переданных треков.
+    workers : int | None = None
+        Количество параллельных исполнителей,
+        см. lib.parallel.gather_tracks.
+    backend : str = PARALLEL_BACKEND
+        Тип пула исполнителей: "process" или "thread".
+    :return:
+    tempos : List[float | TrackProcessingError]
+        Темпы треков в исходном порядке. Для треков, темп которых
+        оценить не удалось, - TrackProcessingError.
+    """
+    # в исполнители передаётся только анализируемое окно трека
+    return await gather_tracks(
+        estimate_tempo,
+        [
+            (crop_track(data, sample_rates[idx])[0], sample_rates[idx])
+            for idx, data in enumerate(datas)
+        ],
+        workers=workers,
+        backend=backend,
+        return_exceptions=True,
+    )
+
+
+async def sort_tracks(
+    datas: List[np.ndarray],
+    sample_rates: List[int | float],
+    workers: int | None = None,
+    backend: str = PARALLEL_BACKEND,
+) -> List[int]:
+    """
+    Асинхронная функция сортировки треков по БПМ.
+    Темп треков оценивается параллельно, треки, для которых
+    оценить темп не удалось, в результат не попадают.
+
+    :param
+    datas : List[numpy.ndarray]
+        Список с аудиофайлами.
+    sample_rates : List[int | float]
+        Список частот дискретизации переданных треков.
+    workers : int | None = None
+        Количество параллельных исполнителей,
+        см. lib.parallel.gather_tracks.
+    backend : str = PARALLEL_BACKEND
+        Тип пула исполнителей: "process" или "thread".
+    :return:
+    indices_new : List[int]
+        Список индексов отсортированных треков.
+    """
+    tempos = await estimate_tempos(
+        datas, sample_rates, workers=workers, backend=backend
+    )
+    indices = []
+    for idx, tempo in enumerate(tempos):
+        if isinstance(tempo, Exception):
+            logging.warning("Track skipped from sorting. %s", tempo)
+        else:
+            indices.append(idx)
+    # сортировка стабильна: треки с равным темпом
+    # остаются в порядке загрузки
+    return sorted(indices, key=tempos.__getitem__)
@@ -0,0 +1,234 @@
+"""
+Модуль хранилища декодированного аудио сессии Streamlit.
+
+Streamlit перезапускает скрипт приложения при каждом действии
+пользователя, поэтому загруженные файлы декодируются один раз
+и хранятся в сессии по идентификатору загрузки и хэшу содержимого.
+Большие треки сохраняются в .npy во временном каталоге сессии
+и читаются через memory map, небольшие остаются в памяти. Пайплайн
+получает представления (view) сохранённых массивов без копирования,
+доступные только для чтения. Каталог удаляется, когда сессия
+завершается и хранилище собирается сборщиком мусора, или при
+завершении процесса.
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import weakref
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+from lib.cache import bytes_hash
+from lib.ingest import DEFAULT_QUALITY, DecodedTrack, decode_uploads
+from lib.model import MAX_TRACK_DURATION_SEC
+from lib.parallel import TrackProcessingError
+
+
+# треки больше этого размера хранятся на диске (около 95 секунд
+# моно-аудио float32 с частотой модели)
+SPILL_BYTES = 8 * 1024 ** 2
+STORE_DIR_PREFIX = "audio-highlight-session-"
+
+# ключ записи: хэш содержимого, длительность декодирования, качество
+StoreKey = Tuple[str, int | float | None, str]
+
+
+class SessionAudioStore:
+    """
+    Класс хранилища декодированных треков одной сессии.
+
+    :param
+    spill_bytes : int = SPILL_BYTES
+        Размер аудио в байтах, начиная с которого трек хранится
+        в memory-mapped файле.
+    directory : str | None = None
+        Каталог, в котором создаётся временный каталог сессии.
+        None - системный каталог временных файлов.
+    """
+
+    def __init__(
+        self,
+        spill_bytes: int = SPILL_BYTES,
+        directory: str | None = None,
+    ):
+        """
+        Конструктор класса SessionAudioStore.
+
+        :param
+        spill_bytes : int = SPILL_BYTES
+            Размер аудио, начиная с которого трек хранится на диске.
+        directory : str | None = None
+            Каталог для временного каталога сессии.
+        """
+        self.spill_bytes = spill_bytes
+        self.directory = tempfile.mkdtemp(
+            prefix=STORE_DIR_PREFIX, dir=directory
+        )
+        # каталог удаляется вместе с хранилищем или при выходе
+        self._finalizer = weakref.finalize(
+            self, shutil.rmtree, self.directory, ignore_errors=True
+        )
+        self._hashes: Dict[str, str] = {}
+        self._entries: Dict[
+            StoreKey, DecodedTrack | TrackProcessingError
+        ] = {}
+
+        self.decoded = 0
+        self.hits = 0
+        self.spilled_bytes = 0
+
+    def _spill_path(self, key: StoreKey) -> str:
+        """
+        Функция получения пути к файлу трека на диске.
+        """
+        content_hash, max_duration, quality = key
+        return os.path.join(
+            self.directory, f"{content_hash}-{max_duration}-{quality}.npy"
+        )
+
+    def _store(
+        self,
+        key: StoreKey,
+        track: DecodedTrack,
+    ) -> DecodedTrack:
+        """
+        Функция сохранения декодированного трека: большие треки
+        записываются на диск и открываются через memory map.
+        Массив становится доступным только для чтения, чтобы
+        представления, переданные пайплайну, не изменили его.
+        """
+        audio = track.audio
+        if audio.nbytes >= self.spill_bytes:
+            path = self._spill_path(key)
+            np.save(path, audio)
+            audio = np.load(path, mmap_mode="r")
+            self.spilled_bytes += audio.nbytes
+        else:
+            audio.flags.writeable = False
+        return DecodedTrack(
+            track.name,
+            audio,
+            track.sample_rate,
+            track.native_sample_rate,
+            track.content_hash,
+        )
+
+    def _forget(self, file_ids: List[str]) -> None:
+        """
+        Функция удаления записей файлов, которых больше нет
+        среди загруженных.
+        """
+        for file_id in set(self._hashes) - set(file_ids):
+            del self._hashes[file_id]
+        hashes = set(self._hashes.values())
+        for key in [key for key in self._entries if key[0] not in hashes]:
+            entry = self._entries.pop(key)
+            if (
+                isinstance(entry, DecodedTrack)
+                and isinstance(entry.audio, np.memmap)
+            ):
+                self.spilled_bytes -= entry.audio.nbytes
+                try:
+                    os.remove(self._spill_path(key))
+                except OSError:
+                    # файл ещё открыт (Windows), удалится вместе
+                    # с каталогом
+                    pass
+
+    async def load(
+        self,
+        files: List[Tuple[str, str, Callable[[], bytes]]],
+        max_duration: int | float | None = MAX_TRACK_DURATION_SEC,
+        quality: str = DEFAULT_QUALITY,
+    ) -> List[DecodedTrack | TrackProcessingError]:
+        """
+        Асинхронная функция получения декодированных треков.
+        Декодируются только файлы, которых ещё нет в хранилище;
+        содержимое читается и хэшируется один раз для каждой
+        загрузки. Записи файлов, которых нет в files, удаляются.
+
+        :param
+        files : List[Tuple[str, str, Callable[[], bytes]]]
+            Список троек (идентификатор загрузки, имя файла,
+            функция чтения содержимого).
+        max_duration : int | float | None = MAX_TRACK_DURATION_SEC
+            Длительность декодируемого начала файла в секундах.
+            None - файл декодируется целиком.
+        quality : str = DEFAULT_QUALITY
+            Уровень качества передискретизации: "fast", "balanced", "best".
+        :return:
+        tracks : List[DecodedTrack | TrackProcessingError]
+            Треки в порядке files с аудио, доступным только для
+            чтения. Для файлов, которые не удалось декодировать, -
+            TrackProcessingError с индексом файла в files.
+        """
+        self._forget([file_id for file_id, _, _ in files])
+
+        # недостающие записи: имя и содержимое файла
+        missing: Dict[StoreKey, Tuple[str, bytes]] = {}
+        keys = []
+        for file_id, name, read in files:
+            data = None
+            content_hash = self._hashes.get(file_id)
+            if content_hash is None:
+                data = read()
+                content_hash = bytes_hash(data)
+                self._hashes[file_id] = content_hash
+            key = (content_hash, max_duration, quality)
+            keys.append(key)
+            if key in self._entries:
+                self.hits += 1
+            elif key not in missing:
+                missing[key] = (name, read() if data is None else data)
+
+        if missing:
+            decoded = await decode_uploads(
+                list(missing.values()),
+                max_duration=max_duration,
+                quality=quality,
+            )
+            for key, track in zip(missing, decoded):
+                if not isinstance(track, TrackProcessingError):
+                    track = await asyncio.to_thread(self._store, key, track)
+                self._entries[key] = track
+                self.decoded += 1
+
+        tracks = []
+        for idx, ((_, name, _), key) in enumerate(zip(files, keys)):
+            entry = self._entries[key]
+            if isinstance(entry, TrackProcessingError):
+                tracks.append(TrackProcessingError(idx, entry.msg))
+            else:
+                tracks.append(
+                    DecodedTrack(
+                        name,
+                        entry.audio[:],
+                        entry.sample_rate,
+                        entry.native_sample_rate,
+                        entry.content_hash,
+                    )
+                )
+        return tracks
+
+    def close(self) -> None:
+        """
+        Функция очистки хранилища и удаления временного каталога.
+        """
+        self._hashes.clear()
+        self._entries.clear()
+        self.spilled_bytes = 0
+        self._finalizer()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Счётчики хранилища: декодированные файлы, повторные
+        обращения, количество записей и объём аудио на диске.
+        """
+        return {
+            "decoded": self.decoded,
+            "hits": self.hits,
+            "entries": len(self._entries),
+            "spilled_bytes": self.spilled_bytes,
+        }
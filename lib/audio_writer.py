@@ -0,0 +1,188 @@
+"""
+Модуль кодирования аудио: инкрементальная запись в файл по блокам
+и кодирование фрагмента в память.
+"""
+
+import asyncio
+import io
+from typing import Any, AsyncIterator, BinaryIO, Callable, Dict, Tuple
+import numpy as np
+import soundfile as sf
+
+
+# формат: (формат soundfile, подтип, MIME-тип)
+AUDIO_FORMATS: Dict[str, Tuple[str, str, str]] = {
+    "wav": ("WAV", "PCM_16", "audio/wav"),
+    "flac": ("FLAC", "PCM_16", "audio/flac"),
+    "ogg": ("OGG", "VORBIS", "audio/ogg"),
+    "mp3": ("MP3", "MPEG_LAYER_III", "audio/mpeg"),
+}
+# форматы со сжатием с потерями, для которых задаётся битрейт
+LOSSY_FORMATS = ("ogg", "mp3")
+OUTPUT_BITRATES = (96, 128, 192, 256, 320)
+DEFAULT_BITRATE_KBPS = 192
+# диапазоны битрейта MPEG Layer III (уровни сжатия 1 и 0 libsndfile):
+# минимальная частота дискретизации: (минимальный, максимальный битрейт)
+MP3_BITRATE_RANGES = (
+    (32000, (32, 320)),
+    (16000, (8, 160)),
+    (0, (8, 64)),
+)
+
+
+def get_mime_type(audio_format: str) -> str:
+    """
+    Функция получения MIME-типа аудиоформата.
+
+    :param
+    audio_format : str
+        Формат аудио: "wav", "flac", "ogg" или "mp3".
+    :return:
+    mime : str
+        MIME-тип.
+    """
+    return AUDIO_FORMATS[audio_format][2]
+
+
+def encoder_options(
+    audio_format: str,
+    sample_rate: int | float,
+    bitrate_kbps: int | None = None,
+) -> Dict[str, Any]:
+    """
+    Функция получения параметров кодировщика soundfile.
+    Битрейт переводится в уровень сжатия libsndfile (0 - наилучшее
+    качество): для MP3 с постоянным битрейтом уровень линейно
+    соответствует битрейту в диапазоне, допустимом для частоты
+    дискретизации, для Ogg Vorbis задаёт качество VBR в диапазоне
+    битрейтов MPEG-1.
+
+    :param
+    audio_format : str
+        Формат аудио, ключ AUDIO_FORMATS.
+    sample_rate : int | float
+        Частота дискретизации аудио.
+    bitrate_kbps : int | None = None
+        Битрейт в кбит/с для форматов LOSSY_FORMATS.
+        None - DEFAULT_BITRATE_KBPS.
+    :return:
+    options : Dict[str, Any]
+        Именованные аргументы soundfile.SoundFile.
+    """
+    if audio_format not in AUDIO_FORMATS:
+        raise ValueError(f"Unsupported audio format: {audio_format}")
+    sf_format, subtype, _ = AUDIO_FORMATS[audio_format]
+    options = {"format": sf_format, "subtype": subtype}
+    if audio_format in LOSSY_FORMATS:
+        if bitrate_kbps is None:
+            bitrate_kbps = DEFAULT_BITRATE_KBPS
+        min_kbps, max_kbps = MP3_BITRATE_RANGES[0][1]
+        if audio_format == "mp3":
+            options["bitrate_mode"] = "CONSTANT"
+            min_kbps, max_kbps = next(
+                bitrates for min_sample_rate, bitrates in MP3_BITRATE_RANGES
+                if sample_rate >= min_sample_rate
+            )
+        options["compression_level"] = float(
+            np.clip((max_kbps - bitrate_kbps) / (max_kbps - min_kbps), 0, 1)
+        )
+    return options
+
+
+def encode_audio(
+    audio: np.ndarray,
+    sample_rate: int | float,
+    audio_format: str = "wav",
+    bitrate_kbps: int | None = None,
+) -> bytes:
+    """
+    Функция кодирования фрагмента аудио в память.
+
+    :param
+    audio : numpy.ndarray
+        Моно-аудио.
+    sample_rate : int | float
+        Частота дискретизации аудио.
+    audio_format : str = "wav"
+        Формат аудио, ключ AUDIO_FORMATS.
+    bitrate_kbps : int | None = None
+        Битрейт для форматов со сжатием с потерями, см. encoder_options.
+    :return:
+    data : bytes
+        Закодированный файл.
+    """
+    buffer = io.BytesIO()
+    with sf.SoundFile(
+        buffer,
+        mode="w",
+        samplerate=int(sample_rate),
+        channels=1,
+        **encoder_options(audio_format, sample_rate, bitrate_kbps),
+    ) as sound_file:
+        sound_file.write(audio)
+    return buffer.getvalue()
+
+
+async def single_block(
+    block: np.ndarray,
+) -> AsyncIterator[np.ndarray]:
+    """
+    Асинхронный генератор из одного блока аудио, чтобы записать
+    уже собранный в памяти фрагмент через write_blocks.
+
+    :param
+    block : numpy.ndarray
+        Блок аудио.
+    :return:
+    blocks : AsyncIterator[numpy.ndarray]
+        Генератор, отдающий block.
+    """
+    yield block
+
+
+async def write_blocks(
+    file: str | BinaryIO,
+    blocks: AsyncIterator[np.ndarray],
+    sample_rate: int | float,
+    audio_format: str = "wav",
+    on_block: Callable[[int], None] | None = None,
+    bitrate_kbps: int | None = None,
+) -> int:
+    """
+    Асинхронная функция записи аудио в файл по мере поступления блоков.
+    Каждый блок кодируется сразу после получения, поэтому в памяти
+    не хранится весь трек.
+
+    :param
+    file : str | BinaryIO
+        Путь к файлу или открытый на запись бинарный файл.
+    blocks : AsyncIterator[np.ndarray]
+        Асинхронный генератор моно-блоков аудио.
+    sample_rate : int | float
+        Частота дискретизации аудио.
+    audio_format : str = "wav"
+        Формат файла, ключ AUDIO_FORMATS.
+    on_block : Callable[[int], None] | None = None
+        Функция, вызываемая после записи каждого блока
+        с количеством уже записанных сэмплов.
+    bitrate_kbps : int | None = None
+        Битрейт для форматов со сжатием с потерями, см. encoder_options.
+    :return:
+    frames : int
+        Количество записанных сэмплов.
+    """
+    options = encoder_options(audio_format, sample_rate, bitrate_kbps)
+    frames = 0
+    with sf.SoundFile(
+        file,
+        mode="w",
+        samplerate=int(sample_rate),
+        channels=1,
+        **options,
+    ) as sound_file:
+        async for block in blocks:
+            await asyncio.to_thread(sound_file.write, block)
+            frames += len(block)
+            if on_block is not None:
+                on_block(frames)
+    return frames
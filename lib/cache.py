@@ -0,0 +1,476 @@
+"""
+Модуль кэша результатов обработки аудио.
+
+Ключ записи строится по хэшу содержимого аудио, версии весов модели
+и параметрам этапа, поэтому одинаковые треки, загруженные в разных
+сессиях Streamlit, обрабатываются один раз. Кэш двухуровневый:
+в памяти процесса и на диске (общий для всех процессов-исполнителей),
+оба уровня ограничены по размеру и вытесняют давно не использованные
+записи.
+
+Дисковый уровень хранится в приватном каталоге пользователя (права
+0700, владелец проверяется при открытии) и не использует pickle:
+массивы сохраняются в формате .npy и читаются без разрешения pickle,
+остальные значения - в JSON.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import stat
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from time import monotonic
+from typing import Any, Dict, Tuple
+import numpy as np
+
+
+# переменная окружения с корневым каталогом кэшей
+CACHE_ROOT_ENV = "AUDIO_HIGHLIGHT_CACHE_DIR"
+CACHE_ROOT = os.environ.get(CACHE_ROOT_ENV) or os.path.join(
+    os.environ.get("XDG_CACHE_HOME")
+    or os.path.join(os.path.expanduser("~"), ".cache"),
+    "audio-highlight",
+)
+CACHE_DIR = os.path.join(CACHE_ROOT, "results")
+CACHE_MEMORY_BYTES = 256 * 1024 ** 2
+CACHE_DISK_BYTES = 2 * 1024 ** 3
+# версия формата и параметров записей, увеличивается при изменении
+# способа вычисления признаков, предсказаний или хайлайтов
+CACHE_VERSION = 5
+# расширения файлов записей дискового уровня: массивы и JSON
+ARRAY_SUFFIX = ".npy"
+JSON_SUFFIX = ".json"
+# интервал, после которого размер дискового уровня пересчитывается
+# сканированием каталога: в него пишут и другие процессы
+DISK_RESCAN_SEC = 60.0
+# доля disk_bytes, до которой дисковый уровень очищается при
+# переполнении, чтобы следующее вытеснение не требовалось сразу
+DISK_LOW_WATERMARK = 0.9
+
+
+def private_directory(path: str) -> str:
+    """
+    Функция создания каталога, доступного только текущему
+    пользователю. Существующий каталог должен принадлежать
+    текущему пользователю, лишние права у него отзываются.
+
+    :param
+    path : str
+        Путь к каталогу.
+    :return:
+    path : str
+        Путь к каталогу.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise PermissionError(f"{path} is not a directory")
+    # на Windows владельцев и прав POSIX нет
+    if hasattr(os, "getuid"):
+        if info.st_uid != os.getuid():
+            raise PermissionError(f"{path} is owned by another user")
+        if info.st_mode & 0o077:
+            os.chmod(path, 0o700)
+    return path
+
+
+def audio_hash(
+    audio: np.ndarray,
+    sample_rate: int | float,
+) -> str:
+    """
+    Функция вычисления хэша содержимого аудио.
+
+    :param
+    audio : numpy.ndarray
+        Аудиофайл.
+    sample_rate : int | float
+        Частота дискретизации аудиофайла.
+    :return:
+    digest : str
+        Хэш аудио.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{audio.dtype}:{audio.shape}:{sample_rate}".encode())
+    digest.update(np.ascontiguousarray(audio).data)
+    return digest.hexdigest()
+
+
+def bytes_hash(data: bytes) -> str:
+    """
+    Функция вычисления хэша байтов загруженного файла.
+
+    :param
+    data : bytes
+        Содержимое файла.
+    :return:
+    digest : str
+        Хэш файла.
+    """
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+@lru_cache(maxsize=8)
+def _weights_version(path: str, mtime_ns: int, size: int) -> str:
+    """
+    Кэшируемая функция вычисления хэша файла весов.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as weights_file:
+        for chunk in iter(lambda: weights_file.read(1024 ** 2), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def model_version(weights_path: str) -> str:
+    """
+    Функция получения версии модели - хэша файла весов.
+    Хэш пересчитывается только при изменении файла.
+
+    :param
+    weights_path : str
+        Путь к файлу весов модели.
+    :return:
+    version : str
+        Версия модели.
+    """
+    stat = os.stat(weights_path)
+    return _weights_version(weights_path, stat.st_mtime_ns, stat.st_size)
+
+
+def make_key(
+    content_hash: str,
+    stage: str,
+    **params: Any,
+) -> str:
+    """
+    Функция построения ключа записи кэша.
+
+    :param
+    content_hash : str
+        Хэш содержимого аудио.
+    stage : str
+        Этап обработки: "audio", "features", "prediction",
+        "highlight", "tempo" и т.п.
+    params : Any
+        Параметры этапа, включая версию модели, если результат
+        от неё зависит. Должны сериализоваться в JSON.
+    :return:
+    key : str
+        Ключ записи.
+    """
+    payload = json.dumps(
+        [CACHE_VERSION, content_hash, stage, params],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.blake2b(payload.encode(), digest_size=20).hexdigest()
+
+
+def _value_size(value: Any) -> int:
+    """
+    Функция оценки занимаемой значением памяти в байтах.
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(_value_size(item) for item in value.values()) + 64
+    if isinstance(value, (list, tuple)):
+        return sum(_value_size(item) for item in value) + 64
+    return 64
+
+
+def _json_default(value: Any) -> Any:
+    """
+    Функция преобразования скаляров numpy при сериализации в JSON.
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class ResultCache:
+    """
+    Класс двухуровневого кэша результатов с LRU-вытеснением по размеру.
+
+    :param
+    directory : str | None = CACHE_DIR
+        Каталог дискового уровня. None - только кэш в памяти.
+    memory_bytes : int = CACHE_MEMORY_BYTES
+        Максимальный размер уровня в памяти.
+    disk_bytes : int = CACHE_DISK_BYTES
+        Максимальный размер дискового уровня.
+    """
+
+    def __init__(
+        self,
+        directory: str | None = CACHE_DIR,
+        memory_bytes: int = CACHE_MEMORY_BYTES,
+        disk_bytes: int = CACHE_DISK_BYTES,
+    ):
+        """
+        Конструктор класса ResultCache.
+
+        :param
+        directory : str | None = CACHE_DIR
+            Каталог дискового уровня. None - только кэш в памяти.
+        memory_bytes : int = CACHE_MEMORY_BYTES
+            Максимальный размер уровня в памяти.
+        disk_bytes : int = CACHE_DISK_BYTES
+            Максимальный размер дискового уровня.
+        """
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        if directory is not None:
+            private_directory(directory)
+
+        self._memory: OrderedDict[str, Tuple[Any, int]] = OrderedDict()
+        self._memory_used = 0
+        self._lock = threading.Lock()
+        # размер дискового уровня по последнему сканированию каталога
+        # и записям, сделанным после него; первое сохранение
+        # запускает сканирование
+        self._disk_used = 0
+        self._disk_scanned = float("-inf")
+        self._evicting = False
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _path(self, key: str, suffix: str) -> str:
+        """
+        Функция получения пути к файлу записи на диске.
+        """
+        return os.path.join(self.directory, f"{key}{suffix}")
+
+    def _remember(self, key: str, value: Any) -> None:
+        """
+        Функция добавления записи в уровень в памяти
+        с вытеснением давно не использованных записей.
+        """
+        size = _value_size(value)
+        if size > self.memory_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory_used -= self._memory.pop(key)[1]
+            self._memory[key] = (value, size)
+            self._memory_used += size
+            while self._memory_used > self.memory_bytes:
+                _, (_, evicted_size) = self._memory.popitem(last=False)
+                self._memory_used -= evicted_size
+
+    def get(self, key: str) -> Any | None:
+        """
+        Функция получения записи из кэша.
+
+        :param
+        key : str
+            Ключ записи, см. make_key.
+        :return:
+        value : Any | None
+            Сохранённое значение или None, если записи нет.
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[0]
+
+        if self.directory is not None:
+            for suffix in (ARRAY_SUFFIX, JSON_SUFFIX):
+                path = self._path(key, suffix)
+                try:
+                    if suffix == ARRAY_SUFFIX:
+                        value = np.load(path, allow_pickle=False)
+                    else:
+                        with open(path, "rb") as entry_file:
+                            value = json.load(entry_file)
+                    # время доступа для LRU-вытеснения на диске
+                    os.utime(path)
+                except (OSError, EOFError, ValueError):
+                    continue
+                with self._lock:
+                    self.disk_hits += 1
+                self._remember(key, value)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        Функция сохранения записи в кэш.
+
+        :param
+        key : str
+            Ключ записи, см. make_key.
+        value : Any
+            Сохраняемое значение. На диск сохраняются массивы numpy
+            без объектов и значения, сериализуемые в JSON (кортежи
+            читаются с диска как списки), остальные значения хранятся
+            только в памяти.
+        """
+        self._remember(key, value)
+        if self.directory is None:
+            return
+        if isinstance(value, np.ndarray):
+            suffix = ARRAY_SUFFIX
+        else:
+            suffix = JSON_SUFFIX
+            try:
+                payload = json.dumps(value, default=_json_default).encode()
+            except (TypeError, ValueError):
+                return
+        path = self._path(key, suffix)
+        # запись через временный файл, чтобы параллельные процессы
+        # не прочитали частично записанную запись
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as entry_file:
+                if suffix == ARRAY_SUFFIX:
+                    np.save(entry_file, value, allow_pickle=False)
+                else:
+                    entry_file.write(payload)
+            size = os.path.getsize(tmp_path)
+            try:
+                size -= os.path.getsize(path)
+            except OSError:
+                pass
+            os.replace(tmp_path, path)
+        except (OSError, ValueError):
+            # ValueError - массив объектов, требующий pickle
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._account_disk(size)
+
+    def _account_disk(self, added: int) -> None:
+        """
+        Функция учёта изменения размера дискового уровня.
+        Каталог сканируется, только когда учтённый размер превышает
+        disk_bytes или с последнего сканирования прошло больше
+        DISK_RESCAN_SEC секунд.
+        """
+        with self._lock:
+            self._disk_used += added
+            if self._evicting or (
+                self._disk_used <= self.disk_bytes
+                and monotonic() - self._disk_scanned < DISK_RESCAN_SEC
+            ):
+                return
+            self._evicting = True
+        try:
+            self._evict_disk()
+        finally:
+            with self._lock:
+                self._evicting = False
+
+    def _evict_disk(self) -> None:
+        """
+        Функция пересчёта размера дискового уровня и вытеснения
+        давно не использованных записей при его переполнении.
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith((ARRAY_SUFFIX, JSON_SUFFIX)):
+                continue
+            try:
+                info = entry.stat()
+            except OSError:
+                continue
+            entries.append((info.st_mtime, info.st_size, entry.path))
+            total += info.st_size
+        if total > self.disk_bytes:
+            target = self.disk_bytes * DISK_LOW_WATERMARK
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                if total <= target:
+                    break
+        with self._lock:
+            self._disk_used = total
+            self._disk_scanned = monotonic()
+
+    def clear(self) -> None:
+        """
+        Функция очистки обоих уровней кэша.
+        """
+        with self._lock:
+            self._memory.clear()
+            self._memory_used = 0
+            self._disk_used = 0
+        if self.directory is not None:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith((ARRAY_SUFFIX, JSON_SUFFIX)):
+                    os.remove(entry.path)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Счётчики кэша: попадания по уровням, промахи, занятый
+        объём памяти и учтённый размер дискового уровня.
+        """
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_used,
+                "disk_bytes": self._disk_used,
+            }
+
+
+_CACHE: ResultCache | None = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """
+    Функция получения общего для процесса кэша результатов.
+
+    :return:
+    cache : ResultCache
+        Кэш результатов. Если приватный каталог CACHE_DIR
+        недоступен, кэш работает только в памяти.
+    """
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            try:
+                _CACHE = ResultCache()
+            except OSError as error:
+                logging.warning("Disk cache disabled. %s", error)
+                _CACHE = ResultCache(None)
+        return _CACHE
+
+
+def set_result_cache(cache: ResultCache) -> ResultCache | None:
+    """
+    Функция замены общего для процесса кэша результатов,
+    например, на кэш без дискового уровня в бенчмарках.
+
+    :param
+    cache : ResultCache
+        Новый кэш результатов.
+    :return:
+    previous : ResultCache | None
+        Предыдущий кэш результатов.
+    """
+    global _CACHE
+    with _CACHE_LOCK:
+        previous, _CACHE = _CACHE, cache
+        return previous
@@ -2,12 +2,48 @@
 Модуль с функциями склеивания треков в плейлист.
 """
 
-from typing import List, Tuple
+import asyncio
+from functools import lru_cache
+from time import perf_counter
+from typing import AsyncIterator, Dict, Hashable, Iterator, List, Tuple
 import librosa as lb
 import numpy as np
+from lib.metrics import STAGE_SECONDS, get_metrics, stage
 
 
-async def transient_cross(
+BLOCK_SIZE = 65536
+
+
+@lru_cache(maxsize=16)
+def fade_curves(
+    length: int,
+    sigmoid_coef: int | float = 4,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Кэшируемая функция построения кривых кроссфейда - сигмоид
+    нарастания и затухания громкости заданной длины.
+
+    :param
+    length : int
+        Длина перехода в сэмплах.
+    sigmoid_coef : int | float = 4
+        Крутизна сигмоиды.
+    :return:
+    increasing : numpy.ndarray
+        Кривая нарастания громкости (float32, только для чтения).
+    decreasing : numpy.ndarray
+        Кривая затухания громкости (float32, только для чтения).
+    """
+    x = np.linspace(start=0., stop=1., num=length, dtype=np.float32)
+    increasing = 1 / (1 + np.exp(sigmoid_coef - 2 * sigmoid_coef * x))
+    increasing = increasing.astype(np.float32)
+    decreasing = 1 - increasing
+    increasing.flags.writeable = False
+    decreasing.flags.writeable = False
+    return increasing, decreasing
+
+
+def cross_tracks(
     data_1: np.ndarray,
     data_2: np.ndarray,
     sample_rate_1: int | float,
@@ -16,7 +52,7 @@ async def transient_cross(
     sigmoid_coef: int | float = 4,
 ) -> Tuple[np.ndarray, int | float]:
     """
-    Асинхронная функция склеивания двух аудиотреков.
+    Функция склеивания двух аудиотреков.
     Выбранная транзиента для кроссфейда - сигмоида.
 
     :param
@@ -60,28 +96,464 @@ async def transient_cross(
 
     # Плавное уменьшение громкости tail_1
     # и плавное увеличение громкости head_2
-    increasing = list(
-        map(
-            lambda x: 1 / (
-                    1 + np.exp(sigmoid_coef - 2 * sigmoid_coef * x)
-            ),
-            np.linspace(start=0., stop=1., num=len(tail_1))
-        )
-    )
-    decreasing = list(
-        map(
-            lambda x: 1 - 1 / (
-                    1 + np.exp(sigmoid_coef - 2 * sigmoid_coef * x)
-            ),
-            np.linspace(start=0., stop=1., num=len(head_2))
-        )
-    )
+    increasing, decreasing = fade_curves(len(tail_1), sigmoid_coef)
     head_2 = head_2 * increasing
     tail_1 = tail_1 * decreasing
 
     return np.concatenate([head_1, head_2 + tail_1, tail_2]), sample_rate
 
 
+async def transient_cross(
+    data_1: np.ndarray,
+    data_2: np.ndarray,
+    sample_rate_1: int | float,
+    sample_rate_2: int | float,
+    cross_len: int | float = 5,
+    sigmoid_coef: int | float = 4,
+) -> Tuple[np.ndarray, int | float]:
+    """
+    Асинхронная функция склеивания двух аудиотреков, см. cross_tracks.
+    Вычисления исполняются в отдельном потоке, не блокируя цикл событий.
+
+    :param
+    data_1 : np.ndarray
+        Первый трек.
+    data_2 : np.ndarray
+        Второй трек.
+    sample_rate_1 : int | float
+        Частота дискретизации первого трека.
+    sample_rate_2 : int | float
+        Частота дискретизации первого трека.
+    cross_len : int | float = 5
+         Длина перекрытия треков при их склейке в секундах.
+    sigmoid_coef : int | float = 4
+        Крутизна сигмоиды, от величины параметра зависит
+        гладкость при переходе от одного трека к другому.
+    :return:
+    data_merged : numpy.ndarray
+        ndarray со склеенными хайлайтами переданных треков.
+    sample_rate : int | float
+        sample rate конечного аудиофайла.
+    """
+    return await asyncio.to_thread(
+        cross_tracks,
+        data_1,
+        data_2,
+        sample_rate_1,
+        sample_rate_2,
+        cross_len,
+        sigmoid_coef,
+    )
+
+
+def assemble_playlist(
+    data: List[np.ndarray],
+    sample_rates: List[int | float],
+    selected_idxs: List[int],
+    cross_len: int | float = 5,
+    sigmoid_coef: int | float = 4,
+) -> Tuple[np.ndarray, int | float]:
+    """
+    Функция склеивания хайлайтов в плейлист за один проход.
+
+    Каждый хайлайт приводится к итоговой частоте дискретизации
+    один раз, длина плейлиста вычисляется заранее, а переходы
+    смешиваются на месте в одном предвыделенном float32 буфере.
+
+    :param
+    data : List[np.ndarray]
+        Список из переданных хайлайтов.
+    sample_rates : List[int | float]
+        Список частот дискретизации переданных хайлайтов.
+    selected_idxs : List[int]
+        Список индексов треков в порядке следования в плейлисте.
+    cross_len : int | float = 5
+        Длина перекрытия треков при склеивании в секундах.
+    sigmoid_coef : int | float = 4
+        Крутизна сигмоиды перехода.
+    :return:
+    data_merged : np.ndarray
+        ndarray со склеенными хайлайтами переданных треков.
+    sample_rate : int | float
+        sample rate конечного аудиофайла с плейлистом.
+    """
+    with stage("crossfade"):
+        return _assemble_playlist(
+            data, sample_rates, selected_idxs, cross_len, sigmoid_coef
+        )
+
+
+def playlist_overlaps(
+    lengths: List[int],
+    cross_samples: int,
+) -> List[int]:
+    """
+    Функция вычисления длин переходов плейлиста. Переход
+    не длиннее следующего трека и не заходит на участок предыдущего,
+    уже смешанный с треком перед ним.
+
+    :param
+    lengths : List[int]
+        Длины треков в порядке следования в сэмплах.
+    cross_samples : int
+        Длина перекрытия в сэмплах.
+    :return:
+    overlaps : List[int]
+        Длина перехода к каждому треку от предыдущего,
+        для первого трека - 0.
+    """
+    overlaps = [0]
+    for prev, cur in zip(lengths, lengths[1:]):
+        overlaps.append(min(cross_samples, cur, prev - overlaps[-1]))
+    return overlaps
+
+
+def _assemble_playlist(
+    data: List[np.ndarray],
+    sample_rates: List[int | float],
+    selected_idxs: List[int],
+    cross_len: int | float,
+    sigmoid_coef: int | float,
+) -> Tuple[np.ndarray, int | float]:
+    """
+    Функция склеивания хайлайтов в плейлист, см. assemble_playlist.
+    """
+    sample_rate = min(sample_rates[idx] for idx in selected_idxs)
+    tracks = [
+        lb.resample(
+            y=data[idx],
+            orig_sr=sample_rates[idx],
+            target_sr=sample_rate,
+        ).astype(np.float32, copy=False)
+        for idx in selected_idxs
+    ]
+
+    overlaps = playlist_overlaps(
+        [len(track) for track in tracks],
+        int(round(cross_len * sample_rate)),
+    )[1:]
+    data_merged = np.empty(
+        sum(len(track) for track in tracks) - sum(overlaps),
+        dtype=np.float32,
+    )
+
+    data_merged[: len(tracks[0])] = tracks[0]
+    position = len(tracks[0])
+    for track, overlap in zip(tracks[1:], overlaps):
+        if overlap > 0:
+            increasing, decreasing = fade_curves(overlap, sigmoid_coef)
+            transition = data_merged[position - overlap: position]
+            transition *= decreasing
+            transition += track[:overlap] * increasing
+        tail = track[overlap:]
+        data_merged[position: position + len(tail)] = tail
+        position += len(tail)
+    return data_merged, sample_rate
+
+
+class PlaylistBuffer:
+    """
+    Класс предвыделенного буфера плейлиста с инкрементальной
+    пересборкой. Плейлист делится на участки: переход между соседними
+    треками и тело трека между переходами. При повторной сборке
+    участки в начале плейлиста, совпадающие с прошлой сборкой,
+    остаются на месте, совпадающие участки в конце сдвигаются одним
+    копированием, а заново смешиваются только участки рядом
+    с изменёнными позициями. Результат совпадает с assemble_playlist.
+
+    :param
+    sigmoid_coef : int | float = 4
+        Крутизна сигмоиды перехода.
+    headroom : float = 1.25
+        Во сколько раз буфер больше плейлиста при выделении,
+        чтобы добавление трека не требовало нового буфера.
+    """
+
+    def __init__(
+        self,
+        sigmoid_coef: int | float = 4,
+        headroom: float = 1.25,
+    ):
+        """
+        Конструктор класса PlaylistBuffer.
+
+        :param
+        sigmoid_coef : int | float = 4
+            Крутизна сигмоиды перехода.
+        headroom : float = 1.25
+            Запас размера буфера.
+        """
+        self.sigmoid_coef = sigmoid_coef
+        self.headroom = headroom
+        self._buffer = np.empty(0, dtype=np.float32)
+        # участки прошлой сборки: (описание, смещение, длина)
+        self._pieces: List[Tuple[tuple, int, int]] = []
+        self._params: Tuple[int | float, int] | None = None
+        self.last_build: Dict[str, int] = {}
+
+    def render(
+        self,
+        keys: List[Hashable],
+        tracks: List[np.ndarray],
+        sample_rate: int | float,
+        cross_len: int | float = 5,
+    ) -> np.ndarray:
+        """
+        Функция сборки плейлиста из треков в порядке следования.
+        Возвращает представление буфера, которое остаётся
+        корректным до следующего вызова render.
+
+        :param
+        keys : List[Hashable]
+            Ключи треков: треки с одинаковым ключом должны
+            совпадать по содержимому.
+        tracks : List[np.ndarray]
+            float32 хайлайты с частотой дискретизации sample_rate.
+        sample_rate : int | float
+            Частота дискретизации плейлиста.
+        cross_len : int | float = 5
+            Длина перекрытия треков при склеивании в секундах.
+        :return:
+        data_merged : np.ndarray
+            Склеенный плейлист.
+        """
+        with stage("crossfade"):
+            return self._render(keys, tracks, sample_rate, cross_len)
+
+    def _render(
+        self,
+        keys: List[Hashable],
+        tracks: List[np.ndarray],
+        sample_rate: int | float,
+        cross_len: int | float,
+    ) -> np.ndarray:
+        """
+        Функция сборки плейлиста, см. render.
+        """
+        cross_samples = int(round(cross_len * sample_rate))
+        overlaps = playlist_overlaps(
+            [len(track) for track in tracks], cross_samples
+        ) + [0]
+        # участок: (описание, смещение, длина) и индекс трека;
+        # описание однозначно определяет содержимое участка
+        pieces = []
+        owners = []
+        offset = 0
+        for idx, track in enumerate(tracks):
+            if overlaps[idx] > 0:
+                pieces.append(
+                    (
+                        ("mix", keys[idx - 1], keys[idx], overlaps[idx]),
+                        offset,
+                        overlaps[idx],
+                    )
+                )
+                owners.append(idx)
+                offset += overlaps[idx]
+            length = len(track) - overlaps[idx] - overlaps[idx + 1]
+            pieces.append(
+                (
+                    ("body", keys[idx], overlaps[idx], overlaps[idx + 1]),
+                    offset,
+                    length,
+                )
+            )
+            owners.append(idx)
+            offset += length
+        total = offset
+
+        params = (sample_rate, cross_samples)
+        old = self._pieces if self._params == params else []
+        common = min(len(pieces), len(old))
+        prefix = 0
+        while prefix < common and pieces[prefix] == old[prefix]:
+            prefix += 1
+        suffix = 0
+        while (
+            suffix < common - prefix
+            and pieces[-1 - suffix][0] == old[-1 - suffix][0]
+        ):
+            suffix += 1
+        prefix_end = 0
+        if prefix:
+            prefix_end = pieces[prefix - 1][1] + pieces[prefix - 1][2]
+
+        buffer = self._buffer
+        if total > len(buffer):
+            buffer = np.empty(int(total * self.headroom), dtype=np.float32)
+            buffer[:prefix_end] = self._buffer[:prefix_end]
+        moved = 0
+        if suffix:
+            old_start = old[-suffix][1]
+            moved = old[-1][1] + old[-1][2] - old_start
+            new_start = pieces[-suffix][1]
+            # numpy копирует пересекающиеся диапазоны через буфер
+            buffer[new_start: new_start + moved] = (
+                self._buffer[old_start: old_start + moved]
+            )
+
+        rendered = 0
+        remixed = 0
+        for (description, offset, length), idx in zip(
+            pieces[prefix: len(pieces) - suffix],
+            owners[prefix: len(pieces) - suffix],
+        ):
+            target = buffer[offset: offset + length]
+            if description[0] == "mix":
+                increasing, decreasing = fade_curves(
+                    length, self.sigmoid_coef
+                )
+                previous = tracks[idx - 1]
+                np.multiply(
+                    previous[len(previous) - length:], decreasing, out=target
+                )
+                target += tracks[idx][:length] * increasing
+                remixed += 1
+            else:
+                target[:] = tracks[idx][overlaps[idx]: overlaps[idx] + length]
+            rendered += length
+
+        self._buffer = buffer
+        self._pieces = pieces
+        self._params = params
+        transitions = sum(1 for piece in pieces if piece[0][0] == "mix")
+        self.last_build = {
+            "samples": total,
+            "samples_in_place": prefix_end,
+            "samples_moved": moved,
+            "samples_rendered": rendered,
+            "transitions": transitions,
+            "transitions_remixed": remixed,
+        }
+        return buffer[:total]
+
+
+def stream_playlist(
+    data: List[np.ndarray],
+    sample_rates: List[int | float],
+    selected_idxs: List[int],
+    cross_len: int | float = 5,
+    sigmoid_coef: int | float = 4,
+    block_size: int = BLOCK_SIZE,
+) -> Iterator[np.ndarray]:
+    """
+    Генератор, склеивающий хайлайты в плейлист по блокам фиксированного
+    размера. Результат совпадает с assemble_playlist, но в памяти
+    одновременно находятся только один передискретизированный трек,
+    отложенный для перехода хвост предыдущего и текущий блок.
+
+    :param
+    data : List[np.ndarray]
+        Список из переданных хайлайтов.
+    sample_rates : List[int | float]
+        Список частот дискретизации переданных хайлайтов.
+    selected_idxs : List[int]
+        Список индексов треков в порядке следования в плейлисте.
+    cross_len : int | float = 5
+        Длина перекрытия треков при склеивании в секундах.
+    sigmoid_coef : int | float = 4
+        Крутизна сигмоиды перехода.
+    block_size : int = BLOCK_SIZE
+        Размер блока в сэмплах. Последний блок может быть короче.
+    :return:
+    blocks : Iterator[np.ndarray]
+        float32 блоки плейлиста с частотой дискретизации
+        min(sample_rates[idx] for idx in selected_idxs).
+    """
+    sample_rate = min(sample_rates[idx] for idx in selected_idxs)
+    cross_samples = int(round(cross_len * sample_rate))
+    block = np.empty(block_size, dtype=np.float32)
+    filled = 0
+    # хвост предыдущего трека, ещё не попавший в плейлист:
+    # он будет смешан с началом следующего трека
+    pending = np.empty(0, dtype=np.float32)
+
+    for number, idx in enumerate(selected_idxs):
+        track = lb.resample(
+            y=data[idx],
+            orig_sr=sample_rates[idx],
+            target_sr=sample_rate,
+        ).astype(np.float32, copy=False)
+
+        overlap = min(cross_samples, len(pending), len(track))
+        pieces = [pending[: len(pending) - overlap]]
+        if overlap > 0:
+            increasing, decreasing = fade_curves(overlap, sigmoid_coef)
+            pieces.append(
+                pending[len(pending) - overlap:] * decreasing
+                + track[:overlap] * increasing
+            )
+        if number == len(selected_idxs) - 1:
+            pieces.append(track[overlap:])
+            pending = np.empty(0, dtype=np.float32)
+        else:
+            keep = max(min(cross_samples, len(track) - overlap), 0)
+            pieces.append(track[overlap: len(track) - keep])
+            pending = track[len(track) - keep:].copy()
+        del track
+
+        for piece in pieces:
+            offset = 0
+            while offset < len(piece):
+                size = min(block_size - filled, len(piece) - offset)
+                block[filled: filled + size] = piece[offset: offset + size]
+                filled += size
+                offset += size
+                if filled == block_size:
+                    yield block.copy()
+                    filled = 0
+    if filled > 0:
+        yield block[:filled].copy()
+
+
+async def stream_setlist(
+    data: List[np.ndarray],
+    sample_rates: List[int | float],
+    selected_idxs: List[int],
+    cross_len: int | float = 5,
+    block_size: int = BLOCK_SIZE,
+) -> AsyncIterator[np.ndarray]:
+    """
+    Асинхронный генератор блоков плейлиста, см. stream_playlist.
+    Каждый блок вычисляется в отдельном потоке.
+
+    :param
+    data : List[np.ndarray]
+        Список из переданных хайлайтов.
+    sample_rates : List[int | float]
+        Список частот дискретизации переданных хайлайтов.
+    selected_idxs : List[int]
+        Список индексов отсортированных треков.
+    cross_len : int | float = 5
+        Длина перекрытия треков при склеивании в секундах.
+    block_size : int = BLOCK_SIZE
+        Размер блока в сэмплах.
+    :return:
+    blocks : AsyncIterator[np.ndarray]
+        float32 блоки плейлиста.
+    """
+    blocks = stream_playlist(
+        data,
+        sample_rates,
+        selected_idxs,
+        cross_len,
+        block_size=block_size,
+    )
+    # время считается только по вычислению блоков,
+    # без ожидания их потребителем
+    elapsed = 0.0
+    while True:
+        start = perf_counter()
+        block = await asyncio.to_thread(next, blocks, None)
+        elapsed += perf_counter() - start
+        if block is None:
+            get_metrics().observe(
+                STAGE_SECONDS, elapsed, stage="crossfade_stream"
+            )
+            return
+        yield block
+
+
 async def crossfade_setlist(
     data: List[np.ndarray],
     sample_rates: List[int | float],
@@ -90,7 +562,7 @@ async def crossfade_setlist(
 ) -> Tuple[np.ndarray, int | float]:
     """
     Асинхронная функция склеивания переданного списка хайлайтов
-    в один аудиофайл-плейлист.
+    в один аудиофайл-плейлист, см. assemble_playlist.
 
     :param
     data : List[np.ndarray]
@@ -107,23 +579,13 @@ async def crossfade_setlist(
     sample_rates_result : int | float
         sample rate конечного аудиофайла с плейлистом.
     """
-    if len(data) <= 1:
-        return data[0], sample_rates[0]
+    if len(selected_idxs) <= 1:
+        return data[selected_idxs[0]], sample_rates[selected_idxs[0]]
 
-    data_merged, sample_rates_result = await transient_cross(
-        data[selected_idxs[0]],
-        data[selected_idxs[1]],
-        sample_rates[selected_idxs[0]],
-        sample_rates[selected_idxs[1]],
+    return await asyncio.to_thread(
+        assemble_playlist,
+        data,
+        sample_rates,
+        selected_idxs,
         cross_len,
     )
-
-    for i in selected_idxs[2:]:
-        data_merged, sample_rates_result = await transient_cross(
-            data_merged,
-            data[i],
-            sample_rates_result,
-            sample_rates[i],
-            cross_len,
-        )
-    return data_merged, sample_rates_result
@@ -2,89 +2,800 @@
 Модуль выделения хайлайтов из аудиофайлов.
 """
 
-import gc
+import asyncio
 from math import floor
-from typing import List
+from typing import BinaryIO, Dict, List, Sequence, Tuple
 import librosa as lb
 import numpy as np
-from lib.model import AudioHighlightsModel
+import soundfile as sf
+from lib.cache import audio_hash, get_result_cache, make_key, model_version
+from lib.ingest import DEFAULT_QUALITY, RESAMPLE_QUALITY, stream_audio
+from lib.metrics import stage
+from lib.model import (
+    CHUNK_SIZE,
+    FAST_SR,
+    FRAME_PER_SEC,
+    MAX_TRACK_DURATION_SEC,
+    MODEL_VARIANTS,
+    SR,
+    AudioHighlightsModel,
+)
+from lib.parallel import (
+    PARALLEL_BACKEND,
+    TrackProcessingError,
+    gather_tracks,
+)
 from lib.utils import (
     get_max_area_section,
     NotSupportedModelException,
 )
+from lib.window_search import (
+    HIGHLIGHT_DURATIONS_SEC,
+    HighlightWindow,
+    find_highlight_windows,
+)
 
 
 HIGHLIGHT_DURATION_SEC = 30
-MAX_TRACK_DURATION_SEC = 200
+# уровни качества поиска хайлайта от самого точного к самому дешёвому:
+# "full" - модель на признаках с частотой SR, "fast" - та же модель
+# на признаках быстрого режима (аудио с частотой FAST_SR),
+# "heuristic" - кривая громкости и атак трека без модели
+HIGHLIGHT_TIERS = ("full", "fast", "heuristic")
+DEFAULT_TIER = "full"
 
 
-async def get_highlight(
+class HighlightResult:
+    """
+    Класс результата выделения хайлайта из трека.
+
+    :param
+    highlight : numpy.ndarray
+        Выделенный хайлайт.
+    start_sec : float
+        Начало хайлайта в секундах.
+    tier : str
+        Уровень качества из HIGHLIGHT_TIERS, на котором выделен
+        хайлайт.
+    """
+
+    def __init__(
+        self,
+        highlight: np.ndarray,
+        start_sec: float,
+        tier: str,
+    ):
+        """
+        Конструктор класса HighlightResult.
+
+        :param
+        highlight : numpy.ndarray
+            Выделенный хайлайт.
+        start_sec : float
+            Начало хайлайта в секундах.
+        tier : str
+            Уровень качества, на котором выделен хайлайт.
+        """
+        self.highlight = highlight
+        self.start_sec = start_sec
+        self.tier = tier
+
+    def __repr__(self):
+        return (
+            f"HighlightResult(start_sec={self.start_sec:.3f}, "
+            f"samples={len(self.highlight)}, tier={self.tier!r})"
+        )
+
+
+def crop_track(
     track: np.ndarray,
     sample_rate: int | float,
-) -> np.ndarray:
+) -> Tuple[np.ndarray, float]:
     """
-    Асинхронная функция выделения хайлайта из переданного аудиофайла.
+    Функция обрезки трека до максимальной длительности,
+    которую обрабатывает модель.
 
     :param
     track : numpy.ndarray
-        Аудиофайл для выделения хайлайта.
+        Аудиофайл.
     sample_rate : int | float
         Частота дискретизации переданного трека.
     :return:
-    highlight : numpy.ndarray
-        Выделенный хайлайт.
+    track : numpy.ndarray
+        Обрезанный аудиофайл.
+    duration : float
+        Длительность обрезанного аудиофайла в секундах.
     """
-    duration = lb.get_duration(
-        y=track,
-        sr=sample_rate,
-    )
-
-    if duration <= HIGHLIGHT_DURATION_SEC:
-        return track
-
+    # длительность считается без lb.get_duration: обрезка выполняется
+    # в цикле событий, а первое обращение к librosa.core.audio
+    # компилирует numba-функции и блокирует цикл на секунды
+    duration = track.shape[-1] / sample_rate
     if duration >= MAX_TRACK_DURATION_SEC:
         track = track[: floor(MAX_TRACK_DURATION_SEC * sample_rate)]
-        duration = lb.get_duration(
+        duration = track.shape[-1] / sample_rate
+    return track, duration
+
+
+def check_model(
+    model: AudioHighlightsModel,
+) -> None:
+    """
+    Функция проверки, что предсказание модели можно использовать
+    для поиска хайлайта по площади под кривой: веса модели должны
+    быть одним из вариантов lib.model.MODEL_VARIANTS.
+
+    :param
+    model : AudioHighlightsModel
+        Модель, сделавшая предсказание.
+    """
+    if model.ONNX_WEIGHTS_PATH not in MODEL_VARIANTS.values():
+        raise NotSupportedModelException(
+            model="Unsupported model",
+            msg="Unsupported weights type"
+        ) from Exception
+
+
+def check_tier(
+    tier: str,
+) -> None:
+    """
+    Функция проверки уровня качества поиска хайлайта.
+
+    :param
+    tier : str
+        Уровень из HIGHLIGHT_TIERS.
+    """
+    if tier not in HIGHLIGHT_TIERS:
+        raise ValueError(
+            f"Unsupported highlight tier: {tier}. "
+            f"Expected one of {', '.join(HIGHLIGHT_TIERS)}"
+        )
+
+
+def resample_for_tier(
+    track: np.ndarray,
+    sample_rate: int | float,
+    tier: str = DEFAULT_TIER,
+) -> np.ndarray:
+    """
+    Функция приведения трека к частоте дискретизации признаков
+    уровня: SR для "full", FAST_SR для "fast". Для быстрого уровня
+    используется самая быстрая передискретизация, поскольку полоса
+    мел-фильтров заканчивается задолго до частоты Найквиста.
+
+    :param
+    track : numpy.ndarray
+        Аудиофайл.
+    sample_rate : int | float
+        Частота дискретизации переданного трека.
+    tier : str = DEFAULT_TIER
+        Уровень "full" или "fast".
+    :return:
+    track : numpy.ndarray
+        Аудиофайл с частотой дискретизации признаков уровня.
+    """
+    if tier == "fast":
+        if sample_rate == FAST_SR:
+            return track
+        return lb.resample(
             y=track,
-            sr=sample_rate,
+            orig_sr=sample_rate,
+            target_sr=FAST_SR,
+            res_type=RESAMPLE_QUALITY["fast"],
         )
-    model = AudioHighlightsModel()
-    features = await model.extract_features(track)
-    prediction = await model.predict(features)
+    if sample_rate == SR:
+        return track
+    return lb.resample(y=track, orig_sr=sample_rate, target_sr=SR)
+
+
+def energy_curve(
+    track: np.ndarray,
+    sample_rate: int | float,
+) -> np.ndarray:
+    """
+    Функция эвристической кривой интересности трека без модели:
+    сумма нормированных средней громкости (RMS) и энергии атак
+    (положительного прироста RMS между кадрами) по чанкам.
+    Кадры и чанки совпадают по длительности с кадрами и чанками
+    модели, поэтому кривая подаётся в тот же поиск хайлайта,
+    что и предсказание модели.
+
+    :param
+    track : numpy.ndarray
+        Аудиофайл.
+    sample_rate : int | float
+        Частота дискретизации переданного трека.
+    :return:
+    curve : numpy.ndarray
+        Кривая со значениями от 0 до 1, одно значение на чанк.
+    """
+    hop = max(round(sample_rate / FRAME_PER_SEC), 1)
+    n_frames = track.shape[-1] // hop
+    if n_frames == 0:
+        return np.zeros(1, dtype=np.float32)
+    frames = np.asarray(
+        track[: n_frames * hop], dtype=np.float32
+    ).reshape(n_frames, hop)
+    rms = np.sqrt(np.einsum("ij,ij->i", frames, frames) / hop)
+    onset = np.maximum(np.diff(rms, prepend=rms[0]), 0)
+    starts = np.arange(0, n_frames, CHUNK_SIZE)
+    counts = np.diff(np.append(starts, n_frames))
+    curve = np.zeros(len(starts), dtype=np.float64)
+    for values in (rms, onset):
+        chunks = np.add.reduceat(values, starts) / counts
+        peak = chunks.max()
+        if peak > 0:
+            curve += chunks / peak
+    return (curve / 2).astype(np.float32)
+
+
+def slice_window(
+    track: np.ndarray,
+    sample_rate: int | float,
+    start_sec: float,
+    duration_sec: float,
+) -> np.ndarray:
+    """
+    Функция вырезания фрагмента трека.
+
+    :param
+    track : numpy.ndarray
+        Аудиофайл.
+    sample_rate : int | float
+        Частота дискретизации переданного трека.
+    start_sec : float
+        Начало фрагмента в секундах.
+    duration_sec : float
+        Длительность фрагмента в секундах.
+    :return:
+    fragment : numpy.ndarray
+        Вырезанный фрагмент.
+    """
+    return track[
+        floor(start_sec * sample_rate): floor(
+            (start_sec + duration_sec) * sample_rate
+        )
+    ]
+
+
+def features_key(
+    content_hash: str,
+    tier: str = DEFAULT_TIER,
+) -> str:
+    """
+    Функция ключа признаков трека в кэше результатов. Ключ общий
+    для выделения хайлайтов и анализа темпа, см. lib.analysis.
+
+    :param
+    content_hash : str
+        Хэш содержимого трека, см. lib.cache.audio_hash.
+    tier : str = DEFAULT_TIER
+        Уровень "full" или "fast".
+    :return:
+    key : str
+        Ключ записи.
+    """
+    return make_key(content_hash, "features", tier=tier)
+
+
+def compute_features_cached(
+    track: np.ndarray,
+    sample_rate: int | float,
+    model: AudioHighlightsModel,
+    content_hash: str,
+    tier: str = DEFAULT_TIER,
+) -> np.ndarray:
+    """
+    Функция выделения признаков трека с использованием кэша результатов.
+    Признаки не зависят от весов модели, поэтому переиспользуются
+    и после их обновления.
+
+    :param
+    track : numpy.ndarray
+        Аудиофайл.
+    sample_rate : int | float
+        Частота дискретизации переданного трека. Треки, декодированные
+        не через lib.ingest, приводятся к частоте модели SR.
+    model : AudioHighlightsModel
+        Модель, выделяющая признаки.
+    content_hash : str
+        Хэш содержимого трека, см. lib.cache.audio_hash.
+    tier : str = DEFAULT_TIER
+        Уровень "full" или "fast": для "fast" признаки выделяются
+        в быстром режиме, см. AudioHighlightsModel.compute_features_fast.
+    :return:
+    features : numpy.ndarray
+        Выделенные из аудиофайла признаки.
+    """
+    cache = get_result_cache()
+    key = features_key(content_hash, tier)
+    features = cache.get(key)
+    if features is None:
+        if tier == "fast":
+            with stage("features_fast"):
+                features = model.compute_features_fast(
+                    resample_for_tier(track, sample_rate, tier)
+                )
+        else:
+            with stage("features"):
+                features = model.compute_features(
+                    resample_for_tier(track, sample_rate), SR
+                )
+        cache.set(key, features)
+    return features
+
+
+def compute_features_batch_cached(
+    tracks: List[np.ndarray],
+    sample_rates: List[int | float],
+    model: AudioHighlightsModel,
+    content_hashes: List[str],
+    batch_size: int,
+) -> List[np.ndarray]:
+    """
+    Функция выделения признаков нескольких треков с использованием
+    кэша результатов. Признаки треков, которых нет в кэше, выделяются
+    группами по batch_size треков близкой длины одним вызовом STFT,
+    см. AudioHighlightsModel.compute_features_batch.
+
+    :param
+    tracks : List[numpy.ndarray]
+        Аудиофайлы.
+    sample_rates : List[int | float]
+        Частоты дискретизации переданных треков.
+    model : AudioHighlightsModel
+        Модель, выделяющая признаки.
+    content_hashes : List[str]
+        Хэши содержимого треков, см. lib.cache.audio_hash.
+    batch_size : int
+        Количество треков в одном вызове STFT.
+    :return:
+    features : List[numpy.ndarray]
+        Выделенные признаки в порядке переданных треков.
+    """
+    cache = get_result_cache()
+    keys = [features_key(content_hash) for content_hash in content_hashes]
+    features = [cache.get(key) for key in keys]
+    missing = sorted(
+        (idx for idx, value in enumerate(features) if value is None),
+        key=lambda idx: len(tracks[idx]) / sample_rates[idx],
+    )
+    for start in range(0, len(missing), batch_size):
+        group = missing[start:start + batch_size]
+        with stage("features"):
+            signals = [
+                resample_for_tier(tracks[idx], sample_rates[idx])
+                for idx in group
+            ]
+            batch = model.compute_features_batch(signals, SR)
+        for idx, value in zip(group, batch):
+            features[idx] = value
+            cache.set(keys[idx], value)
+    return features
+
+
+def predict_track(
+    track: np.ndarray,
+    sample_rate: int | float,
+    model: AudioHighlightsModel | None,
+    content_hash: str | None = None,
+    chunked: bool = False,
+    tier: str = DEFAULT_TIER,
+) -> np.ndarray:
+    """
+    Функция предсказания модели для трека
+    с использованием кэша результатов.
+
+    :param
+    track : numpy.ndarray
+        Аудиофайл.
+    sample_rate : int | float
+        Частота дискретизации переданного трека.
+    model : AudioHighlightsModel | None
+        Модель для предсказания. Для уровня "heuristic" не используется.
+    content_hash : str | None = None
+        Хэш содержимого трека. Если не передан, вычисляется.
+    chunked : bool = False
+        Если True, предсказание делается по перекрывающимся окнам,
+        см. AudioHighlightsModel.run_chunked, и память не зависит
+        от длительности трека.
+    tier : str = DEFAULT_TIER
+        Уровень качества из HIGHLIGHT_TIERS. Для "heuristic" вместо
+        предсказания модели возвращается energy_curve без кэша.
+    :return:
+    prediction : numpy.ndarray
+        Предсказание нейросети для переданного трека.
+    """
+    if tier == "heuristic":
+        # кривая вычисляется быстрее хэширования трека,
+        # поэтому в кэше не хранится
+        with stage("predict_heuristic"):
+            return energy_curve(track, sample_rate)
+    if content_hash is None:
+        content_hash = audio_hash(track, sample_rate)
+    cache = get_result_cache()
+    key = make_key(
+        content_hash,
+        "prediction",
+        model=model_version(model.ONNX_WEIGHTS_PATH),
+        chunked=chunked,
+        tier=tier,
+    )
+    prediction = cache.get(key)
+    if prediction is None:
+        if chunked:
+            with stage("predict_chunked"):
+                prediction = model.run_chunked(
+                    resample_for_tier(track, sample_rate, tier),
+                    fast=tier == "fast",
+                )
+        else:
+            features = compute_features_cached(
+                track, sample_rate, model, content_hash, tier
+            )
+            with stage("predict"):
+                prediction = model.run(features)
+        cache.set(key, prediction)
+    return prediction
+
+
+def highlight_start(
+    prediction: np.ndarray,
+    duration: float,
+    model: AudioHighlightsModel | None,
+) -> float:
+    """
+    Функция нахождения начала хайлайта по предсказанию модели.
 
-    if model.ONNX_WEIGHTS_PATH.startswith("weights/retrain"):
+    :param
+    prediction : numpy.ndarray
+        Предсказание нейросети для трека.
+    duration : float
+        Длительность трека в секундах.
+    model : AudioHighlightsModel | None
+        Модель, сделавшая предсказание. None - кривая построена
+        без модели, см. energy_curve.
+    :return:
+    highlight_start_sec : float
+        Начало хайлайта в секундах.
+    """
+    if model is not None:
+        check_model(model)
+    with stage("highlight_search"):
         highlight_start_sec = get_max_area_section(
             graph_list=prediction,
             highlight_duration=HIGHLIGHT_DURATION_SEC,
         )
-    else:
-        raise NotSupportedModelException(
-            model="Unsupported model",
-            msg="Unsupported weights type"
-        ) from Exception
 
     if highlight_start_sec + HIGHLIGHT_DURATION_SEC > duration:
         highlight_start_sec = duration - HIGHLIGHT_DURATION_SEC
+    return highlight_start_sec
 
-    # для исключения переполнения памяти, модель с весами инициируется
-    # при каждом выделении хайлайта, а затем удаляется
-    # вместе с выделенными фичами после предсказания
-    del model
-    del features
-    gc.collect()
 
-    highlight = track[
-        floor(highlight_start_sec * sample_rate): floor(
-            (highlight_start_sec + HIGHLIGHT_DURATION_SEC) * sample_rate
+def cut_highlight(
+    track: np.ndarray,
+    sample_rate: int | float,
+    duration: float,
+    prediction: np.ndarray,
+    model: AudioHighlightsModel,
+) -> np.ndarray:
+    """
+    Функция вырезания хайлайта из трека по предсказанию модели.
+
+    :param
+    track : numpy.ndarray
+        Аудиофайл, по которому сделано предсказание.
+    sample_rate : int | float
+        Частота дискретизации переданного трека.
+    duration : float
+        Длительность переданного трека в секундах.
+    prediction : numpy.ndarray
+        Предсказание нейросети для переданного трека.
+    model : AudioHighlightsModel
+        Модель, сделавшая предсказание.
+    :return:
+    highlight : numpy.ndarray
+        Выделенный хайлайт.
+    """
+    return slice_window(
+        track,
+        sample_rate,
+        highlight_start(prediction, duration, model),
+        HIGHLIGHT_DURATION_SEC,
+    )
+
+
+def extract_highlight_offset(
+    track: np.ndarray,
+    sample_rate: int | float,
+    model: AudioHighlightsModel | None = None,
+    chunked: bool = False,
+    tier: str = DEFAULT_TIER,
+) -> HighlightResult:
+    """
+    Функция выделения хайлайта из переданного аудиофайла
+    вместе с его началом в треке и уровнем качества.
+    Объявлена на уровне модуля, чтобы исполняться в пуле процессов.
+    Признаки, предсказание и начало хайлайта сохраняются в кэше
+    результатов по хэшу содержимого трека, кроме уровня "heuristic".
+
+    :param
+    track : numpy.ndarray
+        Аудиофайл для выделения хайлайта.
+    sample_rate : int | float
+        Частота дискретизации переданного трека.
+    model : AudioHighlightsModel | None = None
+        Модель для предсказания. Если не передана, создаётся новая,
+        использующая общий для процесса пул ONNX-сессий.
+    chunked : bool = False
+        Если True, хайлайт ищется по всему треку с потоковым
+        инференсом, иначе - в первых MAX_TRACK_DURATION_SEC секундах.
+    tier : str = DEFAULT_TIER
+        Уровень качества из HIGHLIGHT_TIERS.
+    :return:
+    result : HighlightResult
+        Хайлайт, его начало в секундах и уровень качества.
+    """
+    check_tier(tier)
+    if chunked:
+        duration = track.shape[-1] / sample_rate
+    else:
+        track, duration = crop_track(track, sample_rate)
+    if duration <= HIGHLIGHT_DURATION_SEC:
+        return HighlightResult(track, 0.0, tier)
+
+    if tier == "heuristic":
+        prediction = predict_track(track, sample_rate, None, tier=tier)
+        start_sec = highlight_start(prediction, duration, None)
+    else:
+        if model is None:
+            model = AudioHighlightsModel()
+        content_hash = audio_hash(track, sample_rate)
+        cache = get_result_cache()
+        key = make_key(
+            content_hash,
+            "highlight",
+            model=model_version(model.ONNX_WEIGHTS_PATH),
+            duration=HIGHLIGHT_DURATION_SEC,
+            chunked=chunked,
+            tier=tier,
         )
-    ]
-    return highlight
+        start_sec = cache.get(key)
+        if start_sec is None:
+            prediction = predict_track(
+                track, sample_rate, model, content_hash, chunked, tier
+            )
+            start_sec = highlight_start(prediction, duration, model)
+            cache.set(key, start_sec)
+    return HighlightResult(
+        slice_window(track, sample_rate, start_sec, HIGHLIGHT_DURATION_SEC),
+        start_sec,
+        tier,
+    )
+
+
+def extract_highlight(
+    track: np.ndarray,
+    sample_rate: int | float,
+    model: AudioHighlightsModel | None = None,
+    chunked: bool = False,
+    tier: str = DEFAULT_TIER,
+) -> np.ndarray:
+    """
+    Функция выделения хайлайта из переданного аудиофайла,
+    см. extract_highlight_offset.
+    Объявлена на уровне модуля, чтобы исполняться в пуле процессов.
+
+    :param
+    track : numpy.ndarray
+        Аудиофайл для выделения хайлайта.
+    sample_rate : int | float
+        Частота дискретизации переданного трека.
+    model : AudioHighlightsModel | None = None
+        Модель для предсказания. Если не передана, создаётся новая,
+        использующая общий для процесса пул ONNX-сессий.
+    chunked : bool = False
+        Если True, хайлайт ищется по всему треку с потоковым
+        инференсом, иначе - в первых MAX_TRACK_DURATION_SEC секундах.
+    tier : str = DEFAULT_TIER
+        Уровень качества из HIGHLIGHT_TIERS.
+    :return:
+    highlight : numpy.ndarray
+        Выделенный хайлайт.
+    """
+    return extract_highlight_offset(
+        track, sample_rate, model, chunked, tier
+    ).highlight
+
+
+def extract_highlight_from_file(
+    file: str | BinaryIO,
+    model: AudioHighlightsModel | None = None,
+    quality: str = DEFAULT_QUALITY,
+) -> Tuple[np.ndarray, int, float]:
+    """
+    Функция выделения хайлайта из аудиофайла на диске произвольной
+    длительности. Трек не загружается в память целиком: предсказание
+    делается потоково по блокам файла, после чего из файла читается
+    только фрагмент хайлайта в исходном качестве.
+
+    :param
+    file : str | BinaryIO
+        Путь к файлу или открытый бинарный файл, поддерживаемый
+        soundfile.
+    model : AudioHighlightsModel | None = None
+        Модель для предсказания. Если не передана, создаётся новая,
+        использующая общий для процесса пул ONNX-сессий.
+    quality : str = DEFAULT_QUALITY
+        Уровень качества передискретизации, см. lib.ingest.
+    :return:
+    highlight : numpy.ndarray
+        Выделенный хайлайт с исходной частотой дискретизации.
+    sample_rate : int
+        Исходная частота дискретизации файла.
+    start_sec : float
+        Начало хайлайта в секундах.
+    """
+    with sf.SoundFile(file) as sound_file:
+        sample_rate = sound_file.samplerate
+        duration = sound_file.frames / sample_rate
+        start_sec = 0.0
+        if duration > HIGHLIGHT_DURATION_SEC:
+            if model is None:
+                model = AudioHighlightsModel()
+            check_model(model)
+            prediction = model.run_stream(
+                stream_audio(sound_file, quality=quality)
+            )
+            start_sec = highlight_start(prediction, duration, model)
+            sound_file.seek(floor(start_sec * sample_rate))
+        highlight = sound_file.read(
+            frames=floor(HIGHLIGHT_DURATION_SEC * sample_rate),
+            dtype="float32",
+            always_2d=True,
+        ).mean(axis=1)
+    return highlight, sample_rate, start_sec
+
+
+async def get_highlight(
+    track: np.ndarray,
+    sample_rate: int | float,
+    model: AudioHighlightsModel | None = None,
+    chunked: bool = False,
+    tier: str = DEFAULT_TIER,
+    return_offsets: bool = False,
+) -> np.ndarray | HighlightResult:
+    """
+    Асинхронная функция выделения хайлайта из переданного аудиофайла.
+    Вычисления исполняются в отдельном потоке, не блокируя цикл событий.
+
+    :param
+    track : numpy.ndarray
+        Аудиофайл для выделения хайлайта.
+    sample_rate : int | float
+        Частота дискретизации переданного трека.
+    model : AudioHighlightsModel | None = None
+        Модель для предсказания. Если не передана, создаётся новая,
+        использующая общий для процесса пул ONNX-сессий.
+    chunked : bool = False
+        Если True, хайлайт ищется по всему треку, см. extract_highlight.
+    tier : str = DEFAULT_TIER
+        Уровень качества из HIGHLIGHT_TIERS: "fast" и "heuristic"
+        дешевле "full", но начало хайлайта может отличаться,
+        см. lib.tiers.TierPolicy.
+    return_offsets : bool = False
+        Если True, вместо хайлайта возвращается HighlightResult
+        с началом хайлайта и уровнем качества.
+    :return:
+    highlight : numpy.ndarray | HighlightResult
+        Выделенный хайлайт.
+    """
+    extract = extract_highlight_offset if return_offsets else extract_highlight
+    return await asyncio.to_thread(
+        extract, track, sample_rate, model, chunked, tier
+    )
+
+
+def extract_highlight_windows(
+    track: np.ndarray,
+    sample_rate: int | float,
+    durations: Sequence[int | float] = HIGHLIGHT_DURATIONS_SEC,
+    top_k: int = 1,
+    resolution: float = 1.0,
+    model: AudioHighlightsModel | None = None,
+) -> Dict[int | float, List[HighlightWindow]]:
+    """
+    Функция поиска окон хайлайтов нескольких длительностей
+    по одному предсказанию модели.
+
+    :param
+    track : numpy.ndarray
+        Аудиофайл для выделения хайлайтов.
+    sample_rate : int | float
+        Частота дискретизации переданного трека.
+    durations : Sequence[int | float] = HIGHLIGHT_DURATIONS_SEC
+        Длительности хайлайтов в секундах.
+    top_k : int = 1
+        Количество непересекающихся окон для каждой длительности.
+    resolution : float = 1.0
+        Шаг перебора начала окна в секундах.
+    model : AudioHighlightsModel | None = None
+        Модель для предсказания. Если не передана, создаётся новая,
+        использующая общий для процесса пул ONNX-сессий.
+    :return:
+    windows : Dict[int | float, List[HighlightWindow]]
+        Найденные окна по длительностям. Окна длиннее трека
+        начинаются с его начала.
+    """
+    track, duration = crop_track(track, sample_rate)
+    if model is None:
+        model = AudioHighlightsModel()
+    check_model(model)
+    prediction = predict_track(track, sample_rate, model)
+    windows = find_highlight_windows(prediction, durations, top_k, resolution)
+    # предсказание покрывает и дополнение признаков нулями,
+    # поэтому окна не должны выходить за конец трека
+    for duration_windows in windows.values():
+        for window in duration_windows:
+            window.start_sec = max(
+                min(window.start_sec, duration - window.duration_sec), 0.0
+            )
+    return windows
+
+
+async def get_highlight_windows(
+    track: np.ndarray,
+    sample_rate: int | float,
+    durations: Sequence[int | float] = HIGHLIGHT_DURATIONS_SEC,
+    top_k: int = 1,
+    resolution: float = 1.0,
+    model: AudioHighlightsModel | None = None,
+) -> Dict[int | float, List[HighlightWindow]]:
+    """
+    Асинхронная функция поиска окон хайлайтов нескольких длительностей
+    по одному предсказанию модели, см. extract_highlight_windows.
+    Фрагменты трека по найденным окнам вырезаются через slice_window.
+
+    :param
+    track : numpy.ndarray
+        Аудиофайл для выделения хайлайтов.
+    sample_rate : int | float
+        Частота дискретизации переданного трека.
+    durations : Sequence[int | float] = HIGHLIGHT_DURATIONS_SEC
+        Длительности хайлайтов в секундах.
+    top_k : int = 1
+        Количество непересекающихся окон для каждой длительности.
+    resolution : float = 1.0
+        Шаг перебора начала окна в секундах.
+    model : AudioHighlightsModel | None = None
+        Модель для предсказания. Если не передана, создаётся новая,
+        использующая общий для процесса пул ONNX-сессий.
+    :return:
+    windows : Dict[int | float, List[HighlightWindow]]
+        Найденные окна по длительностям.
+    """
+    return await asyncio.to_thread(
+        extract_highlight_windows,
+        track,
+        sample_rate,
+        durations,
+        top_k,
+        resolution,
+        model,
+    )
 
 
 async def get_highlights_list(
     data: List[np.ndarray],
     sample_rates: List[int | float],
-) -> List[np.ndarray]:
+    batch_size: int = 1,
+    workers: int | None = None,
+    backend: str = PARALLEL_BACKEND,
+    return_exceptions: bool = False,
+    chunked: bool = False,
+    return_offsets: bool = False,
+    tier: str = DEFAULT_TIER,
+) -> List[np.ndarray | HighlightResult | TrackProcessingError]:
     """
     Асинхронная функция, принимающая аудиофайлы
     и возвращающая список хайлайтов из них.
@@ -94,13 +805,155 @@ async def get_highlights_list(
         Список с аудиофайлами.
     sample_rates : List[int | float]
         Список частот дискретизации переданных треков.
+    batch_size : int = 1
+        Количество треков в одном вызове модели. При значении больше 1
+        признаки треков одной длины объединяются в пакеты,
+        см. AudioHighlightsModel.predict_batch, а треки обрабатываются
+        в текущем процессе.
+    workers : int | None = None
+        Количество параллельных исполнителей при batch_size = 1,
+        см. lib.parallel.gather_tracks.
+    backend : str = PARALLEL_BACKEND
+        Тип пула исполнителей: "process" или "thread".
+    return_exceptions : bool = False
+        Если True, для треков, которые не удалось обработать,
+        вместо хайлайта возвращается TrackProcessingError.
+    chunked : bool = False
+        Если True, хайлайты ищутся по всему треку с потоковым
+        инференсом, см. extract_highlight. Пакетный режим
+        при этом не используется.
+    return_offsets : bool = False
+        Если True, вместо хайлайта возвращается HighlightResult
+        с началом хайлайта в секундах и уровнем качества.
+    tier : str = DEFAULT_TIER
+        Уровень качества из HIGHLIGHT_TIERS. Пакетный режим
+        используется только для "full".
     :return:
-    highlights_list : List[numpy.ndarray]
-        Список хайлайтов переданных треков.
+    highlights_list : List[ndarray | HighlightResult | TrackProcessingError]
+        Список хайлайтов переданных треков в исходном порядке.
+    """
+    check_tier(tier)
+    with stage("get_highlights_list"):
+        return await _get_highlights_list(
+            data,
+            sample_rates,
+            batch_size,
+            workers,
+            backend,
+            return_exceptions,
+            chunked,
+            return_offsets,
+            tier,
+        )
+
+
+async def _get_highlights_list(
+    data: List[np.ndarray],
+    sample_rates: List[int | float],
+    batch_size: int,
+    workers: int | None,
+    backend: str,
+    return_exceptions: bool,
+    chunked: bool,
+    return_offsets: bool,
+    tier: str,
+) -> List[np.ndarray | HighlightResult | TrackProcessingError]:
+    """
+    Асинхронная функция выделения хайлайтов, см. get_highlights_list.
     """
+    extract = extract_highlight_offset if return_offsets else extract_highlight
+    if chunked:
+        return await gather_tracks(
+            extract,
+            [
+                (value, sample_rates[idx], None, True, tier)
+                for idx, value in enumerate(data)
+            ],
+            workers=workers,
+            backend=backend,
+            return_exceptions=return_exceptions,
+        )
+    if batch_size <= 1 or tier != "full":
+        # обрезаем треки заранее, чтобы не передавать в процессы
+        # части аудио, которые модель всё равно не обработает
+        return await gather_tracks(
+            extract,
+            [
+                (
+                    crop_track(value, sample_rates[idx])[0],
+                    sample_rates[idx],
+                    None,
+                    False,
+                    tier,
+                )
+                for idx, value in enumerate(data)
+            ],
+            workers=workers,
+            backend=backend,
+            return_exceptions=return_exceptions,
+        )
+
     highlights_list = []
+    to_predict = []
     for idx, value in enumerate(data):
-        highlights_list.append(
-            await get_highlight(value, sample_rates[idx])
+        track, duration = crop_track(value, sample_rates[idx])
+        highlights_list.append(track)
+        if duration > HIGHLIGHT_DURATION_SEC:
+            to_predict.append((idx, duration))
+    starts = [0.0] * len(data)
+    if not to_predict:
+        return (
+            [
+                HighlightResult(highlight, 0.0, tier)
+                for highlight in highlights_list
+            ]
+            if return_offsets else highlights_list
+        )
+
+    model = AudioHighlightsModel()
+    cache = get_result_cache()
+    version = model_version(model.ONNX_WEIGHTS_PATH)
+    predictions = {}
+    missing = []
+    for idx, _ in to_predict:
+        content_hash = audio_hash(highlights_list[idx], sample_rates[idx])
+        key = make_key(
+            content_hash,
+            "prediction",
+            model=version,
+            chunked=False,
+            tier=tier,
+        )
+        predictions[idx] = cache.get(key)
+        if predictions[idx] is None:
+            missing.append((idx, content_hash, key))
+
+    if missing:
+        features = await asyncio.to_thread(
+            compute_features_batch_cached,
+            [highlights_list[idx] for idx, _, _ in missing],
+            [sample_rates[idx] for idx, _, _ in missing],
+            model,
+            [content_hash for _, content_hash, _ in missing],
+            batch_size,
+        )
+        batch_predictions = await model.predict_batch(features, batch_size)
+        del features
+        for (idx, _, key), prediction in zip(missing, batch_predictions):
+            cache.set(key, prediction)
+            predictions[idx] = prediction
+
+    for idx, duration in to_predict:
+        starts[idx] = highlight_start(predictions[idx], duration, model)
+        highlights_list[idx] = slice_window(
+            highlights_list[idx],
+            sample_rates[idx],
+            starts[idx],
+            HIGHLIGHT_DURATION_SEC,
         )
+    if return_offsets:
+        return [
+            HighlightResult(highlight, start_sec, tier)
+            for highlight, start_sec in zip(highlights_list, starts)
+        ]
     return highlights_list
@@ -0,0 +1,288 @@
+"""
+Модуль загрузки (декодирования) аудиофайлов.
+
+Из файла декодируется только та часть, которая нужна пайплайну,
+после чего аудио один раз передискретизируется к частоте модели
+с выбранным качеством. Несколько файлов декодируются параллельно.
+"""
+
+import io
+import os
+from typing import BinaryIO, Iterator, List, Tuple
+import librosa as lb
+import numpy as np
+import soundfile as sf
+import soxr
+from lib.cache import bytes_hash, get_result_cache, make_key
+from lib.metrics import stage
+from lib.model import MAX_TRACK_DURATION_SEC, SR
+from lib.parallel import TrackProcessingError, gather_tracks
+
+
+# уровень качества: тип передискретизации librosa
+RESAMPLE_QUALITY = {
+    "fast": "soxr_lq",
+    "balanced": "soxr_hq",
+    "best": "soxr_vhq",
+}
+DEFAULT_QUALITY = "balanced"
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".flac", ".ogg")
+DECODE_WORKERS = 4
+STREAM_BLOCK_SEC = 10
+
+
+class DecodedTrack:
+    """
+    Класс декодированного аудиофайла.
+
+    :param
+    name : str
+        Имя файла.
+    audio : numpy.ndarray
+        Моно-аудио с частотой дискретизации sample_rate.
+    sample_rate : int
+        Частота дискретизации audio (частота модели).
+    native_sample_rate : int
+        Исходная частота дискретизации файла. Сохраняется, чтобы
+        при необходимости отрендерить результат в исходном качестве,
+        см. decode_segment.
+    content_hash : str
+        Хэш содержимого исходного файла.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        audio: np.ndarray,
+        sample_rate: int,
+        native_sample_rate: int,
+        content_hash: str,
+    ):
+        """
+        Конструктор класса DecodedTrack.
+
+        :param
+        name : str
+            Имя файла.
+        audio : numpy.ndarray
+            Моно-аудио с частотой дискретизации sample_rate.
+        sample_rate : int
+            Частота дискретизации audio (частота модели).
+        native_sample_rate : int
+            Исходная частота дискретизации файла.
+        content_hash : str
+            Хэш содержимого исходного файла.
+        """
+        self.name = name
+        self.audio = audio
+        self.sample_rate = sample_rate
+        self.native_sample_rate = native_sample_rate
+        self.content_hash = content_hash
+
+    @property
+    def duration(self) -> float:
+        """
+        Длительность декодированного аудио в секундах.
+        """
+        return len(self.audio) / self.sample_rate
+
+
+def list_audio_files(directory: str) -> List[str]:
+    """
+    Функция рекурсивного поиска аудиофайлов в директории.
+
+    :param
+    directory : str
+        Директория с треками.
+    :return:
+    paths : List[str]
+        Пути к файлам с расширениями AUDIO_EXTENSIONS
+        в отсортированном порядке.
+    """
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        paths.extend(
+            os.path.join(root, file) for file in sorted(files)
+            if file.lower().endswith(AUDIO_EXTENSIONS)
+        )
+    return paths
+
+
+def decode_audio(
+    name: str,
+    data: bytes,
+    max_duration: int | float | None = MAX_TRACK_DURATION_SEC,
+    quality: str = DEFAULT_QUALITY,
+) -> DecodedTrack:
+    """
+    Функция декодирования аудиофайла.
+    Объявлена на уровне модуля, чтобы исполняться в пуле.
+
+    :param
+    name : str
+        Имя файла.
+    data : bytes
+        Содержимое файла (.mp3, .wav и другие форматы,
+        поддерживаемые librosa).
+    max_duration : int | float | None = MAX_TRACK_DURATION_SEC
+        Длительность декодируемого начала файла в секундах.
+        None - файл декодируется целиком.
+    quality : str = DEFAULT_QUALITY
+        Уровень качества передискретизации: "fast", "balanced", "best".
+    :return:
+    track : DecodedTrack
+        Декодированный аудиофайл с частотой дискретизации модели.
+    """
+    if quality not in RESAMPLE_QUALITY:
+        raise ValueError(f"Unsupported resample quality: {quality}")
+    with stage("decode"):
+        audio, native_sample_rate = lb.load(
+            path=io.BytesIO(data),
+            sr=None,
+            duration=max_duration,
+        )
+        native_sample_rate = int(native_sample_rate)
+        audio = lb.resample(
+            y=audio,
+            orig_sr=native_sample_rate,
+            target_sr=SR,
+            res_type=RESAMPLE_QUALITY[quality],
+        )
+
+    content_hash = bytes_hash(data)
+    get_result_cache().set(
+        make_key(content_hash, "audio", max_duration=max_duration),
+        {
+            "native_sample_rate": native_sample_rate,
+            "n_samples": len(audio),
+            "duration": len(audio) / SR,
+        },
+    )
+    return DecodedTrack(name, audio, SR, native_sample_rate, content_hash)
+
+
+def decode_segment(
+    data: bytes,
+    offset: int | float,
+    duration: int | float,
+) -> Tuple[np.ndarray, int]:
+    """
+    Функция декодирования фрагмента аудиофайла в исходной частоте
+    дискретизации, например, хайлайта, найденного по аудио с частотой
+    модели, чтобы отдать его в качестве исходного файла.
+
+    :param
+    data : bytes
+        Содержимое файла.
+    offset : int | float
+        Начало фрагмента в секундах.
+    duration : int | float
+        Длительность фрагмента в секундах.
+    :return:
+    audio : numpy.ndarray
+        Моно-аудио фрагмента.
+    native_sample_rate : int
+        Исходная частота дискретизации файла.
+    """
+    with stage("decode"):
+        audio, native_sample_rate = lb.load(
+            path=io.BytesIO(data),
+            sr=None,
+            offset=offset,
+            duration=duration,
+        )
+    return audio, int(native_sample_rate)
+
+
+def stream_audio(
+    file: str | BinaryIO | sf.SoundFile,
+    quality: str = DEFAULT_QUALITY,
+    block_duration: int | float = STREAM_BLOCK_SEC,
+) -> Iterator[np.ndarray]:
+    """
+    Генератор потокового декодирования аудиофайла блоками
+    с передискретизацией к частоте модели. В памяти одновременно
+    находится только один блок, поэтому длительность файла
+    не ограничена.
+
+    :param
+    file : str | BinaryIO | soundfile.SoundFile
+        Путь к файлу, открытый бинарный файл или открытый SoundFile
+        в формате, поддерживаемом soundfile.
+    quality : str = DEFAULT_QUALITY
+        Уровень качества передискретизации: "fast", "balanced", "best".
+    block_duration : int | float = STREAM_BLOCK_SEC
+        Длительность блока в секундах исходного файла.
+    :return:
+    blocks : Iterator[numpy.ndarray]
+        float32 моно-блоки с частотой дискретизации SR.
+    """
+    if quality not in RESAMPLE_QUALITY:
+        raise ValueError(f"Unsupported resample quality: {quality}")
+    if isinstance(file, sf.SoundFile):
+        sound_file = file
+    else:
+        sound_file = sf.SoundFile(file)
+    try:
+        native_sample_rate = sound_file.samplerate
+        resampler = None
+        if native_sample_rate != SR:
+            resampler = soxr.ResampleStream(
+                native_sample_rate,
+                SR,
+                1,
+                dtype="float32",
+                quality=RESAMPLE_QUALITY[quality].split("_")[1].upper(),
+            )
+        block_frames = max(int(block_duration * native_sample_rate), 1)
+        for block in sound_file.blocks(
+            blocksize=block_frames,
+            dtype="float32",
+            always_2d=True,
+        ):
+            block = block.mean(axis=1)
+            if resampler is not None:
+                block = resampler.resample_chunk(block)
+            yield block
+        if resampler is not None:
+            yield resampler.resample_chunk(
+                np.zeros(0, dtype=np.float32), last=True
+            )
+    finally:
+        if sound_file is not file:
+            sound_file.close()
+
+
+async def decode_uploads(
+    files: List[Tuple[str, bytes]],
+    max_duration: int | float | None = MAX_TRACK_DURATION_SEC,
+    quality: str = DEFAULT_QUALITY,
+    workers: int = DECODE_WORKERS,
+) -> List[DecodedTrack | TrackProcessingError]:
+    """
+    Асинхронная функция параллельного декодирования загруженных файлов.
+    Декодирование и передискретизация исполняются в пуле потоков:
+    libsndfile и soxr отпускают GIL.
+
+    :param
+    files : List[Tuple[str, bytes]]
+        Список пар (имя файла, содержимое).
+    max_duration : int | float | None = MAX_TRACK_DURATION_SEC
+        Длительность декодируемого начала файла в секундах.
+    quality : str = DEFAULT_QUALITY
+        Уровень качества передискретизации: "fast", "balanced", "best".
+    workers : int = DECODE_WORKERS
+        Количество параллельно декодируемых файлов.
+    :return:
+    tracks : List[DecodedTrack | TrackProcessingError]
+        Декодированные файлы в исходном порядке. Для файлов,
+        которые не удалось декодировать, - TrackProcessingError.
+    """
+    return await gather_tracks(
+        decode_audio,
+        [(name, data, max_duration, quality) for name, data in files],
+        workers=workers,
+        backend="thread",
+        return_exceptions=True,
+    )
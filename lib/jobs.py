@@ -0,0 +1,454 @@
+"""
+Модуль очереди заданий HTTP API.
+
+Задания на выделение хайлайтов и формирование плейлистов попадают
+в ограниченную очередь и обрабатываются фиксированным числом
+исполнителей, использующих пайплайн lib. Когда очередь заполнена,
+новое задание отклоняется, а не накапливается в памяти.
+Результаты заданий записываются во временные файлы, а количество
+хранимых заданий ограничено. Уровень качества поиска хайлайтов
+выбирается по глубине очереди и задержке заданий, см. lib.tiers,
+и сохраняется в описании каждого результата.
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import uuid
+from collections import OrderedDict
+from time import time
+from typing import Any, AsyncIterator, Dict, List, Tuple
+import numpy as np
+from lib.audio_writer import AUDIO_FORMATS, single_block, write_blocks
+from lib.cache import CACHE_ROOT, private_directory
+from lib.highlight import get_highlights_list
+from lib.ingest import decode_segment, decode_uploads
+from lib.metrics import PREFIX, get_metrics, request
+from lib.model import MAX_TRACK_DURATION_SEC
+from lib.parallel import TrackProcessingError
+from lib.playlist_forming import playlist_pipeline_stream
+from lib.tiers import AUTO_TIER, TierPolicy
+
+
+JOB_KINDS = ("highlights", "playlist")
+QUEUE_SIZE = 16
+JOB_WORKERS = 2
+JOBS_HISTORY = 256
+# каталог доступен только пользователю сервиса, см.
+# lib.cache.private_directory: из него отдаются результаты заданий
+RESULTS_DIR = os.path.join(CACHE_ROOT, "jobs")
+QUEUE_DEPTH = f"{PREFIX}_job_queue_depth"
+JOBS_TOTAL = f"{PREFIX}_jobs_total"
+
+
+class QueueFullError(Exception):
+    """
+    Класс исключения, возникающего при попытке поставить задание
+    в заполненную очередь.
+    """
+
+    def __init__(
+        self,
+        msg: str,
+    ):
+        """
+        Конструктор класса QueueFullError.
+
+        :param
+        msg : str
+            Сообщение при вызове исключения.
+        """
+        super().__init__(msg)
+        self.msg = msg
+
+
+class Job:
+    """
+    Класс задания на обработку загруженных аудиофайлов.
+
+    :param
+    kind : str
+        Тип задания: "highlights" или "playlist".
+    files : List[Tuple[str, bytes]]
+        Список пар (имя файла, содержимое).
+    params : Dict[str, Any]
+        Параметры задания: "full_track" (bool), "tier" (str, уровень
+        качества или AUTO_TIER) и "native_rate" (bool, хайлайт
+        в исходной частоте дискретизации файла) для хайлайтов,
+        "cross_len" (float) для плейлиста, "format" (str, ключ AUDIO_FORMATS)
+        и "bitrate_kbps" (int | None) для результатов обоих типов.
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        files: List[Tuple[str, bytes]],
+        params: Dict[str, Any],
+    ):
+        """
+        Конструктор класса Job.
+
+        :param
+        kind : str
+            Тип задания: "highlights" или "playlist".
+        files : List[Tuple[str, bytes]]
+            Список пар (имя файла, содержимое).
+        params : Dict[str, Any]
+            Параметры задания.
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unsupported job kind: {kind}")
+        if params.get("format", "wav") not in AUDIO_FORMATS:
+            raise ValueError(f"Unsupported audio format: {params['format']}")
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.files = files
+        self.params = params
+        self.status = "queued"
+        self.created = time()
+        self.error: str | None = None
+        self.results: List[Dict[str, Any]] = []
+        self.done = asyncio.Event()
+
+    @property
+    def directory(self) -> str:
+        """
+        Каталог с файлами результатов задания.
+        """
+        return os.path.join(RESULTS_DIR, self.id)
+
+    @property
+    def audio_format(self) -> str:
+        """
+        Формат файлов результатов задания.
+        """
+        return self.params.get("format", "wav")
+
+    async def write_result(
+        self,
+        name: str,
+        blocks: AsyncIterator[np.ndarray],
+        sample_rate: int | float,
+    ) -> Tuple[str, int]:
+        """
+        Асинхронная функция однократного кодирования результата
+        в файл в формате и с битрейтом задания.
+
+        :param
+        name : str
+            Имя файла результата без расширения.
+        blocks : AsyncIterator[numpy.ndarray]
+            Асинхронный генератор блоков аудио.
+        sample_rate : int | float
+            Частота дискретизации аудио.
+        :return:
+        path : str
+            Путь к файлу результата.
+        frames : int
+            Количество записанных сэмплов.
+        """
+        path = os.path.join(self.directory, f"{name}.{self.audio_format}")
+        frames = await write_blocks(
+            path,
+            blocks,
+            sample_rate,
+            self.audio_format,
+            bitrate_kbps=self.params.get("bitrate_kbps"),
+        )
+        return path, frames
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Функция представления задания в виде словаря для ответа API.
+
+        :return:
+        job : Dict[str, Any]
+            Идентификатор, тип, статус, ошибка и описание результатов
+            без путей к файлам.
+        """
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "error": self.error,
+            "results": [
+                {key: value for key, value in result.items() if key != "path"}
+                for result in self.results
+            ],
+        }
+
+
+class JobQueue:
+    """
+    Класс ограниченной очереди заданий с пулом исполнителей.
+
+    :param
+    size : int = QUEUE_SIZE
+        Максимальное количество ожидающих заданий.
+    workers : int = JOB_WORKERS
+        Количество одновременно обрабатываемых заданий.
+    history : int = JOBS_HISTORY
+        Максимальное количество хранимых заданий, включая завершённые.
+        Файлы вытесненных заданий удаляются.
+    track_workers : int | None = None
+        Количество параллельных исполнителей внутри задания,
+        см. lib.parallel.gather_tracks.
+    policy : TierPolicy | None = None
+        Политика выбора уровня качества хайлайтов. Если не передана,
+        используется политика с порогами lib.tiers.TIER_THRESHOLDS.
+    """
+
+    def __init__(
+        self,
+        size: int = QUEUE_SIZE,
+        workers: int = JOB_WORKERS,
+        history: int = JOBS_HISTORY,
+        track_workers: int | None = None,
+        policy: TierPolicy | None = None,
+    ):
+        """
+        Конструктор класса JobQueue.
+
+        :param
+        size : int = QUEUE_SIZE
+            Максимальное количество ожидающих заданий.
+        workers : int = JOB_WORKERS
+            Количество одновременно обрабатываемых заданий.
+        history : int = JOBS_HISTORY
+            Максимальное количество хранимых заданий.
+        track_workers : int | None = None
+            Количество параллельных исполнителей внутри задания.
+        policy : TierPolicy | None = None
+            Политика выбора уровня качества хайлайтов.
+        """
+        self.workers = workers
+        self.history = history
+        self.track_workers = track_workers
+        self.policy = policy or TierPolicy()
+        self._queue: asyncio.Queue[Job] = asyncio.Queue(maxsize=size)
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._tasks: List[asyncio.Task] = []
+        self.accepting = False
+
+    def start(self) -> None:
+        """
+        Функция запуска исполнителей очереди.
+        """
+        private_directory(RESULTS_DIR)
+        self.accepting = True
+        self._tasks = [
+            asyncio.create_task(self._worker())
+            for _ in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        """
+        Функция остановки исполнителей и удаления файлов результатов.
+        """
+        self.accepting = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for job in self._jobs.values():
+            shutil.rmtree(job.directory, ignore_errors=True)
+        self._jobs.clear()
+
+    def __len__(self) -> int:
+        """
+        Количество хранимых заданий, включая завершённые.
+        """
+        return len(self._jobs)
+
+    @property
+    def pending(self) -> int:
+        """
+        Количество ожидающих в очереди заданий.
+        """
+        return self._queue.qsize()
+
+    @property
+    def full(self) -> bool:
+        """
+        True, если очередь не примет новое задание.
+        """
+        return self._queue.full()
+
+    def submit(self, job: Job) -> Job:
+        """
+        Функция постановки задания в очередь без ожидания.
+
+        :param
+        job : Job
+            Задание.
+        :return:
+        job : Job
+            Поставленное в очередь задание.
+        """
+        if not self.accepting:
+            raise QueueFullError("Job queue is not accepting jobs")
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(
+                f"Job queue is full ({self._queue.maxsize} jobs)"
+            ) from None
+        self._jobs[job.id] = job
+        self._evict()
+        get_metrics().set(QUEUE_DEPTH, self._queue.qsize())
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        """
+        Функция получения задания по идентификатору.
+
+        :param
+        job_id : str
+            Идентификатор задания.
+        :return:
+        job : Job | None
+            Задание или None, если оно не найдено или вытеснено.
+        """
+        return self._jobs.get(job_id)
+
+    def _evict(self) -> None:
+        """
+        Функция вытеснения самых старых завершённых заданий.
+        """
+        finished = [
+            job_id for job_id, job in self._jobs.items() if job.done.is_set()
+        ]
+        for job_id in finished[: max(len(self._jobs) - self.history, 0)]:
+            job = self._jobs.pop(job_id)
+            shutil.rmtree(job.directory, ignore_errors=True)
+
+    async def _worker(self) -> None:
+        """
+        Исполнитель, последовательно обрабатывающий задания из очереди.
+        """
+        while True:
+            job = await self._queue.get()
+            get_metrics().set(QUEUE_DEPTH, self._queue.qsize())
+            job.status = "running"
+            try:
+                os.makedirs(job.directory, mode=0o700, exist_ok=True)
+                with request(job.kind):
+                    if job.kind == "highlights":
+                        await self._run_highlights(job)
+                    else:
+                        await self._run_playlist(job)
+                job.status = "done"
+            except asyncio.CancelledError:
+                job.status = "failed"
+                job.error = "Service is shutting down"
+                raise
+            except Exception as e:
+                logging.exception("Job %s failed", job.id)
+                job.status = "failed"
+                job.error = getattr(e, "msg", None) or str(e)
+            finally:
+                get_metrics().inc(JOBS_TOTAL, kind=job.kind, status=job.status)
+                # загруженные файлы больше не нужны
+                job.files = []
+                job.done.set()
+                self._queue.task_done()
+
+    async def _run_highlights(self, job: Job) -> None:
+        """
+        Функция выполнения задания на выделение хайлайтов.
+        """
+        full_track = job.params.get("full_track", False)
+        # уровень выбирается при запуске задания, а не при постановке
+        # в очередь, чтобы учесть нагрузку на момент обработки
+        tier = self.policy.choose(
+            self.pending, job.params.get("tier", AUTO_TIER)
+        )
+        tracks = await decode_uploads(
+            job.files,
+            max_duration=None if full_track else MAX_TRACK_DURATION_SEC,
+        )
+        decoded = [
+            track for track in tracks
+            if not isinstance(track, TrackProcessingError)
+        ]
+        highlights = []
+        if decoded:
+            # политика учитывает только время обработки без ожидания
+            # в очереди, нормированное на длительность аудио
+            with self.policy.track(
+                sum(len(track.audio) / track.sample_rate for track in decoded)
+            ):
+                highlights = await get_highlights_list(
+                    [track.audio for track in decoded],
+                    [track.sample_rate for track in decoded],
+                    workers=self.track_workers,
+                    return_exceptions=True,
+                    chunked=full_track,
+                    return_offsets=True,
+                    tier=tier,
+                )
+        highlights = iter(highlights)
+        for idx, track in enumerate(tracks):
+            name = job.files[idx][0]
+            result = (
+                track if isinstance(track, TrackProcessingError)
+                else next(highlights)
+            )
+            if isinstance(result, TrackProcessingError):
+                job.results.append({"name": name, "error": result.msg})
+                continue
+            highlight, start_sec = result.highlight, result.start_sec
+            duration_sec = len(highlight) / track.sample_rate
+            sample_rate = track.sample_rate
+            if (
+                job.params.get("native_rate", False)
+                and track.native_sample_rate > track.sample_rate
+            ):
+                # хайлайт заново декодируется из загруженного файла
+                # в исходной частоте дискретизации
+                highlight, sample_rate = await asyncio.to_thread(
+                    decode_segment, job.files[idx][1], start_sec, duration_sec
+                )
+            path, _ = await job.write_result(
+                str(idx), single_block(highlight), sample_rate
+            )
+            job.results.append(
+                {
+                    "name": name,
+                    "start_sec": round(float(start_sec), 3),
+                    "duration_sec": round(duration_sec, 3),
+                    "sample_rate": sample_rate,
+                    "tier": result.tier,
+                    "format": job.audio_format,
+                    "path": path,
+                }
+            )
+
+    async def _run_playlist(self, job: Job) -> None:
+        """
+        Функция выполнения задания на формирование плейлиста.
+        """
+        tracks = [
+            track for track in await decode_uploads(job.files)
+            if not isinstance(track, TrackProcessingError)
+        ]
+        if not tracks:
+            raise ValueError("No tracks could be decoded")
+        blocks, sample_rate = await playlist_pipeline_stream(
+            [track.audio for track in tracks],
+            [track.sample_rate for track in tracks],
+            cross_len=job.params.get("cross_len", 5),
+            workers=self.track_workers,
+        )
+        path, frames = await job.write_result(
+            "playlist", blocks, sample_rate
+        )
+        job.results.append(
+            {
+                "name": "playlist",
+                "duration_sec": round(frames / sample_rate, 3),
+                "format": job.audio_format,
+                "path": path,
+            }
+        )
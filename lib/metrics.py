@@ -0,0 +1,584 @@
+"""
+Модуль метрик и профилирования пайплайна.
+
+Этапы пайплайна, инференс ONNX и обработка запросов записывают
+счётчики и гистограммы длительности в общий для процесса реестр,
+который отдаётся в текстовом формате Prometheus (через HTTP API
+или файл для textfile-коллектора). Метрики, записанные в процессах
+пула исполнителей, передаются в основной процесс вместе
+с результатом трека, см. lib.parallel.
+
+Для каждого запроса фиксируется пиковый RSS процесса, а при включённом
+профилировании (enable_profiling) стеки потоков периодически
+сэмплируются, и профили самых медленных запросов сохраняются
+в формате collapsed stacks (flamegraph.pl, speedscope).
+"""
+
+import heapq
+import itertools
+import os
+import re
+import resource
+import sys
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from time import perf_counter, sleep, time
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+from lib.cache import CACHE_ROOT, private_directory
+
+
+METRICS_PATH = os.path.join(tempfile.gettempdir(), "audio-highlight.prom")
+# каталог доступен только пользователю сервиса, см.
+# lib.cache.private_directory: профилировщик удаляет в нём файлы
+PROFILE_DIR = os.path.join(CACHE_ROOT, "profiles")
+PREFIX = "audio_highlight"
+STAGE_SECONDS = f"{PREFIX}_stage_seconds"
+STAGE_ERRORS = f"{PREFIX}_stage_errors_total"
+INFERENCE_SECONDS = f"{PREFIX}_inference_seconds"
+REQUEST_SECONDS = f"{PREFIX}_request_seconds"
+REQUEST_PEAK_RSS = f"{PREFIX}_request_peak_rss_bytes"
+OUTPUT_BYTES = f"{PREFIX}_output_bytes_total"
+REQUEST_OUTPUT_BYTES = f"{PREFIX}_request_output_bytes"
+TIME_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120,
+)
+MEMORY_BUCKETS = tuple(2 ** power * 1024 ** 2 for power in range(6, 15))
+OUTPUT_BUCKETS = tuple(2 ** power * 1024 ** 2 for power in range(-4, 10))
+# границы длительности входа инференса в секундах для метки input_sec
+INPUT_SEC_BUCKETS = (30, 60, 120, 200, 400, 800, 1600)
+MEMORY_SAMPLE_SEC = 0.05
+PROFILE_INTERVAL_SEC = 0.01
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class MetricsRegistry:
+    """
+    Потокобезопасный реестр метрик: счётчики, значения (gauge)
+    и гистограммы с метками.
+    """
+
+    def __init__(self):
+        """
+        Конструктор класса MetricsRegistry.
+        """
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        # (имя, метки) -> [границы, счётчики по корзинам, сумма, количество]
+        self._histograms: Dict[Tuple[str, Labels], List[Any]] = {}
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> Tuple[str, Labels]:
+        """
+        Функция построения ключа метрики по имени и меткам.
+        """
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        """
+        Функция увеличения счётчика.
+
+        :param
+        name : str
+            Имя метрики.
+        value : float = 1.0
+            Приращение.
+        labels : Any
+            Метки метрики.
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels: Any) -> None:
+        """
+        Функция установки текущего значения (gauge).
+
+        :param
+        name : str
+            Имя метрики.
+        value : float
+            Значение.
+        labels : Any
+            Метки метрики.
+        """
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+        buckets: Sequence[float] = TIME_BUCKETS,
+        **labels: Any,
+    ) -> None:
+        """
+        Функция добавления наблюдения в гистограмму.
+
+        :param
+        name : str
+            Имя метрики.
+        value : float
+            Наблюдаемое значение.
+        buckets : Sequence[float] = TIME_BUCKETS
+            Верхние границы корзин, задаются при первом наблюдении.
+        labels : Any
+            Метки метрики.
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = [tuple(buckets), [0] * len(buckets), 0.0, 0]
+                self._histograms[key] = histogram
+            for idx, bound in enumerate(histogram[0]):
+                if value <= bound:
+                    histogram[1][idx] += 1
+                    break
+            histogram[2] += value
+            histogram[3] += 1
+
+    def drain(self) -> Dict[str, Any]:
+        """
+        Функция извлечения накопленных счётчиков и гистограмм
+        с их обнулением, чтобы передать их в другой процесс.
+
+        :return:
+        snapshot : Dict[str, Any]
+            Счётчики и гистограммы, см. merge.
+        """
+        with self._lock:
+            snapshot = {
+                "counters": self._counters,
+                "histograms": self._histograms,
+            }
+            self._counters = {}
+            self._histograms = {}
+        return snapshot
+
+    def merge(self, snapshot: Dict[str, Any]) -> None:
+        """
+        Функция добавления метрик, извлечённых drain в другом процессе.
+
+        :param
+        snapshot : Dict[str, Any]
+            Результат MetricsRegistry.drain.
+        """
+        with self._lock:
+            for key, value in snapshot["counters"].items():
+                self._counters[key] = self._counters.get(key, 0.0) + value
+            for key, (bounds, counts, total, count) in snapshot[
+                "histograms"
+            ].items():
+                histogram = self._histograms.get(key)
+                if histogram is None or histogram[0] != bounds:
+                    histogram = [bounds, [0] * len(bounds), 0.0, 0]
+                    self._histograms[key] = histogram
+                histogram[1] = [a + b for a, b in zip(histogram[1], counts)]
+                histogram[2] += total
+                histogram[3] += count
+
+    def render(self) -> str:
+        """
+        Функция представления метрик в текстовом формате Prometheus.
+
+        :return:
+        text : str
+            Метрики в формате text/plain; version=0.0.4.
+        """
+        def labels_text(labels: Labels, extra: str = "") -> str:
+            items = [f'{k}="{_escape(v)}"' for k, v in labels]
+            if extra:
+                items.append(extra)
+            return "{" + ",".join(items) + "}" if items else ""
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted(
+                (key, (value[0], list(value[1]), value[2], value[3]))
+                for key, value in self._histograms.items()
+            )
+        lines = []
+        typed = set()
+        for metric_type, items in (("counter", counters), ("gauge", gauges)):
+            for (name, labels), value in items:
+                if name not in typed:
+                    lines.append(f"# TYPE {name} {metric_type}")
+                    typed.add(name)
+                lines.append(
+                    f"{name}{labels_text(labels)} {_format(value)}"
+                )
+        for (name, labels), (bounds, counts, total, count) in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                le = f'le="{_format(bound)}"'
+                lines.append(
+                    f"{name}_bucket{labels_text(labels, le)} {cumulative}"
+                )
+            le = 'le="+Inf"'
+            lines.append(f"{name}_bucket{labels_text(labels, le)} {count}")
+            lines.append(f"{name}_sum{labels_text(labels)} {_format(total)}")
+            lines.append(f"{name}_count{labels_text(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str = METRICS_PATH) -> None:
+        """
+        Функция атомарной записи метрик в файл, например,
+        для textfile-коллектора node_exporter.
+
+        :param
+        path : str = METRICS_PATH
+            Путь к файлу метрик.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as metrics_file:
+            metrics_file.write(self.render())
+        os.replace(tmp_path, path)
+
+
+def _format(value: float) -> str:
+    """
+    Функция представления числа в формате Prometheus без потери точности.
+    """
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _escape(value: str) -> str:
+    """
+    Функция экранирования значения метки Prometheus.
+    """
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+_METRICS = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    """
+    Функция получения общего для процесса реестра метрик.
+
+    :return:
+    metrics : MetricsRegistry
+        Реестр метрик.
+    """
+    return _METRICS
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Контекстный менеджер замера этапа пайплайна: длительность
+    записывается в гистограмму STAGE_SECONDS, а ошибки -
+    в счётчик STAGE_ERRORS с меткой stage.
+
+    :param
+    name : str
+        Название этапа.
+    """
+    start = perf_counter()
+    try:
+        yield
+    except Exception:
+        _METRICS.inc(STAGE_ERRORS, stage=name)
+        raise
+    finally:
+        _METRICS.observe(STAGE_SECONDS, perf_counter() - start, stage=name)
+
+
+def input_length_label(duration_sec: float) -> str:
+    """
+    Функция получения метки длительности входа инференса:
+    ближайшей сверху границы из INPUT_SEC_BUCKETS.
+
+    :param
+    duration_sec : float
+        Длительность входа в секундах.
+    :return:
+    label : str
+        Граница корзины или "+Inf".
+    """
+    for bound in INPUT_SEC_BUCKETS:
+        if duration_sec <= bound:
+            return str(bound)
+    return "+Inf"
+
+
+def current_rss() -> int:
+    """
+    Функция получения текущего RSS процесса в байтах.
+    Если /proc недоступен, возвращается пиковый RSS процесса.
+    """
+    try:
+        with open("/proc/self/statm", "r", encoding="ascii") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class MemorySampler:
+    """
+    Класс фонового сэмплирования RSS процесса для активных запросов.
+    Поток работает только пока есть активные запросы. RSS общий
+    для процесса, поэтому при параллельных запросах пик каждого
+    включает память остальных.
+
+    :param
+    interval : float = MEMORY_SAMPLE_SEC
+        Интервал сэмплирования в секундах.
+    """
+
+    def __init__(self, interval: float = MEMORY_SAMPLE_SEC):
+        """
+        Конструктор класса MemorySampler.
+
+        :param
+        interval : float = MEMORY_SAMPLE_SEC
+            Интервал сэмплирования в секундах.
+        """
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._peaks: Dict[int, int] = {}
+        self._thread: threading.Thread | None = None
+        self._tokens = itertools.count()
+
+    def start(self) -> int:
+        """
+        Функция начала отслеживания пика для запроса.
+
+        :return:
+        token : int
+            Идентификатор отслеживания для stop.
+        """
+        token = next(self._tokens)
+        with self._lock:
+            self._peaks[token] = current_rss()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name="audio-highlight-memory",
+                    daemon=True,
+                )
+                self._thread.start()
+        return token
+
+    def stop(self, token: int) -> int:
+        """
+        Функция окончания отслеживания пика для запроса.
+
+        :param
+        token : int
+            Идентификатор, полученный из start.
+        :return:
+        peak : int
+            Пиковый RSS процесса за время запроса в байтах.
+        """
+        rss = current_rss()
+        with self._lock:
+            return max(self._peaks.pop(token), rss)
+
+    def _run(self) -> None:
+        """
+        Цикл сэмплирования, завершается, когда активных запросов нет.
+        """
+        while True:
+            sleep(self.interval)
+            rss = current_rss()
+            with self._lock:
+                if not self._peaks:
+                    self._thread = None
+                    return
+                for token, peak in self._peaks.items():
+                    if rss > peak:
+                        self._peaks[token] = rss
+
+
+def collapse_stack(frame: Any) -> str:
+    """
+    Функция представления стека потока в формате collapsed stacks:
+    вызовы от корня к текущему кадру через ";".
+
+    :param
+    frame : types.FrameType
+        Текущий кадр потока.
+    :return:
+    stack : str
+        Строка вида "file.py:func;file.py:func".
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SlowRequestProfiler:
+    """
+    Класс сэмплирующего профилировщика запросов: пока запрос
+    выполняется, стеки всех потоков процесса сэмплируются
+    с заданным интервалом, а профили top_n самых медленных
+    запросов сохраняются в directory.
+
+    :param
+    top_n : int
+        Количество сохраняемых профилей самых медленных запросов.
+    interval : float = PROFILE_INTERVAL_SEC
+        Интервал сэмплирования стеков в секундах.
+    directory : str = PROFILE_DIR
+        Каталог профилей.
+    """
+
+    def __init__(
+        self,
+        top_n: int,
+        interval: float = PROFILE_INTERVAL_SEC,
+        directory: str = PROFILE_DIR,
+    ):
+        """
+        Конструктор класса SlowRequestProfiler.
+
+        :param
+        top_n : int
+            Количество сохраняемых профилей самых медленных запросов.
+        interval : float = PROFILE_INTERVAL_SEC
+            Интервал сэмплирования стеков в секундах.
+        directory : str = PROFILE_DIR
+            Каталог профилей.
+        """
+        self.top_n = top_n
+        self.interval = interval
+        self.directory = directory
+        private_directory(directory)
+        self._lock = threading.Lock()
+        # куча (длительность, путь к профилю) сохранённых запросов
+        self._slowest: List[Tuple[float, str]] = []
+
+    @contextmanager
+    def profile(self, name: str) -> Iterator[None]:
+        """
+        Контекстный менеджер профилирования запроса.
+
+        :param
+        name : str
+            Тип запроса, попадает в имя файла профиля.
+        """
+        stacks: Counter = Counter()
+        done = threading.Event()
+        sampler_id = []
+
+        def sample():
+            sampler_id.append(threading.get_ident())
+            while not done.wait(self.interval):
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == sampler_id[0]:
+                        continue
+                    stacks[collapse_stack(frame)] += 1
+
+        thread = threading.Thread(
+            target=sample, name="audio-highlight-profiler", daemon=True
+        )
+        start = perf_counter()
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+            thread.join()
+            self._offer(name, perf_counter() - start, stacks)
+
+    def _offer(self, name: str, duration: float, stacks: Counter) -> None:
+        """
+        Функция сохранения профиля, если запрос входит в top_n
+        самых медленных, с удалением вытесненного профиля.
+        """
+        with self._lock:
+            if (
+                len(self._slowest) >= self.top_n
+                and duration <= self._slowest[0][0]
+            ):
+                return
+            safe_name = re.sub(r"[^\w.-]", "_", name)
+            path = os.path.join(
+                self.directory,
+                f"{duration:09.3f}s_{safe_name}_{int(time() * 1000)}.txt",
+            )
+            with open(path, "w", encoding="utf-8") as profile_file:
+                for stack, count in stacks.most_common():
+                    profile_file.write(f"{stack} {count}\n")
+            heapq.heappush(self._slowest, (duration, path))
+            if len(self._slowest) > self.top_n:
+                _, evicted = heapq.heappop(self._slowest)
+                try:
+                    os.remove(evicted)
+                except OSError:
+                    pass
+
+
+_MEMORY_SAMPLER = MemorySampler()
+_PROFILER: SlowRequestProfiler | None = None
+
+
+def enable_profiling(
+    top_n: int,
+    interval: float = PROFILE_INTERVAL_SEC,
+    directory: str = PROFILE_DIR,
+) -> None:
+    """
+    Функция включения профилирования запросов, см. SlowRequestProfiler.
+    По умолчанию профилирование выключено.
+
+    :param
+    top_n : int
+        Количество сохраняемых профилей самых медленных запросов.
+        0 - выключить профилирование.
+    interval : float = PROFILE_INTERVAL_SEC
+        Интервал сэмплирования стеков в секундах.
+    directory : str = PROFILE_DIR
+        Каталог профилей.
+    """
+    global _PROFILER
+    _PROFILER = (
+        SlowRequestProfiler(top_n, interval, directory) if top_n > 0 else None
+    )
+
+
+@contextmanager
+def request(name: str) -> Iterator[None]:
+    """
+    Контекстный менеджер замера запроса: длительность и пиковый RSS
+    процесса записываются в гистограммы REQUEST_SECONDS
+    и REQUEST_PEAK_RSS с меткой kind, а при включённом профилировании
+    запрос профилируется.
+
+    :param
+    name : str
+        Тип запроса: "highlights", "playlist" и т.п.
+    """
+    profiler = _PROFILER
+    token = _MEMORY_SAMPLER.start()
+    start = perf_counter()
+    try:
+        if profiler is None:
+            yield
+        else:
+            with profiler.profile(name):
+                yield
+    finally:
+        _METRICS.observe(REQUEST_SECONDS, perf_counter() - start, kind=name)
+        _METRICS.observe(
+            REQUEST_PEAK_RSS,
+            _MEMORY_SAMPLER.stop(token),
+            buckets=MEMORY_BUCKETS,
+            kind=name,
+        )
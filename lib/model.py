@@ -3,10 +3,15 @@
 которая выделяет из аудиотреков хайлайты.
 """
 
-from typing import List
+import asyncio
+import os
+from functools import lru_cache
+from time import perf_counter
+from typing import Dict, Iterable, Iterator, List, Tuple
 import librosa as lb
 import numpy as np
-import onnxruntime as rt
+from lib.metrics import INFERENCE_SECONDS, get_metrics, input_length_label
+from lib.session_pool import get_session_pool
 from lib.utils import NotSupportedModelException
 
 
@@ -14,6 +19,15 @@ SR = 22050
 N_FFT = 2048
 N_HOP = 512
 N_MEL = 128
+F_MIN = 20
+F_MAX = 5000
+# быстрый режим признаков: аудио с половинной частотой дискретизации
+# (полоса мел-фильтров до F_MAX сохраняется), окно и шаг STFT вдвое
+# короче в сэмплах, поэтому ширина частотного бина и частота кадров
+# те же, что у модели, а STFT обходится примерно вчетверо дешевле
+FAST_SR = SR // 2
+FAST_N_FFT = N_FFT // 2
+FAST_N_HOP = N_HOP // 2
 
 SHAPE = (N_MEL, None, 1)
 CHUNK_SIZE = 43
@@ -21,6 +35,280 @@ N_CHUNK = 72
 N_FRAME = N_CHUNK * CHUNK_SIZE
 FRAME_PER_SEC = SR / N_HOP
 SEC_PER_CHUNK = round(CHUNK_SIZE / FRAME_PER_SEC)
+# длина признаков по оси времени дополняется нулями до кратной
+FEATURE_FRAME_MULTIPLE = 9
+BATCH_SIZE = 4
+# длительность начала трека, которое обрабатывается без потокового режима
+MAX_TRACK_DURATION_SEC = 200
+# перекрытие соседних окон потокового инференса в чанках (секундах);
+# шаг окна кратен 9 кадрам, как и длина признаков
+OVERLAP_CHUNKS = 18
+WINDOW_HOP_CHUNKS = N_CHUNK - OVERLAP_CHUNKS
+
+# варианты весов модели, предсказания которых пригодны для поиска
+# хайлайта по площади под кривой; INT8 варианты создаются из fp32
+# весов скриптом python -m lib.quantization
+MODEL_VARIANTS: Dict[str, str] = {
+    "fp32": "weights/retrain.onnx",
+    "int8": "weights/retrain.int8.onnx",
+    "int8-static": "weights/retrain.int8-static.onnx",
+}
+REFERENCE_VARIANT = "fp32"
+# вариант, используемый без --model и MODEL_VARIANT_ENV
+DEFAULT_VARIANT = "fp32"
+# переменная окружения с вариантом модели по умолчанию, наследуется
+# процессами-исполнителями, см. lib.parallel
+MODEL_VARIANT_ENV = "AUDIO_HIGHLIGHT_MODEL"
+
+
+@lru_cache(maxsize=4)
+def mel_filterbank(
+    sample_rate: int | float = SR,
+    n_fft: int = N_FFT,
+    n_mels: int = N_MEL,
+    fmin: float = F_MIN,
+    fmax: float | None = F_MAX,
+) -> np.ndarray:
+    """
+    Кэшируемая функция построения мел-фильтров.
+    Фильтры строятся один раз на процесс, а не для каждого трека.
+
+    :param
+    sample_rate : int | float = SR
+        Частота дискретизации аудио.
+    n_fft : int = N_FFT
+        Размер окна STFT.
+    n_mels : int = N_MEL
+        Количество мел-полос.
+    fmin : float = F_MIN
+        Нижняя частота фильтров.
+    fmax : float | None = F_MAX
+        Верхняя частота фильтров. None - половина частоты дискретизации.
+    :return:
+    mel_basis : numpy.ndarray
+        Матрица фильтров (n_mels, 1 + n_fft // 2), только для чтения.
+    """
+    mel_basis = lb.filters.mel(
+        sr=sample_rate,
+        n_fft=n_fft,
+        n_mels=n_mels,
+        fmin=fmin,
+        fmax=fmax,
+    )
+    mel_basis.flags.writeable = False
+    return mel_basis
+
+
+@lru_cache(maxsize=1)
+def fast_mel_filterbank() -> np.ndarray:
+    """
+    Кэшируемая функция построения мел-фильтров быстрого режима
+    признаков (FAST_SR, FAST_N_FFT). Амплитуда спектра пропорциональна
+    длине окна, поэтому фильтры умножаются на N_FFT / FAST_N_FFT,
+    чтобы признаки были в масштабе признаков модели.
+
+    :return:
+    mel_basis : numpy.ndarray
+        Матрица фильтров (N_MEL, 1 + FAST_N_FFT // 2), только для чтения.
+    """
+    mel_basis = mel_filterbank(FAST_SR, FAST_N_FFT) * (N_FFT / FAST_N_FFT)
+    mel_basis.flags.writeable = False
+    return mel_basis
+
+
+@lru_cache(maxsize=2)
+def stft_window(n_fft: int = N_FFT) -> np.ndarray:
+    """
+    Кэшируемая функция построения окна Ханна для STFT,
+    того же, что librosa строит по умолчанию при каждом вызове.
+
+    :param
+    n_fft : int = N_FFT
+        Длина окна.
+    :return:
+    window : numpy.ndarray
+        Окно длины n_fft, только для чтения.
+    """
+    window = lb.filters.get_window("hann", n_fft, fftbins=True)
+    window.flags.writeable = False
+    return window
+
+
+def magnitude_spectrogram(
+    file: np.ndarray,
+    n_fft: int = N_FFT,
+    hop_length: int = N_HOP,
+) -> np.ndarray:
+    """
+    Функция вычисления амплитудного спектра аудиофайла
+    с параметрами, на которых обучена модель.
+
+    :param
+    file : numpy.ndarray
+        Аудиофайл с частотой дискретизации SR (FAST_SR для быстрого
+        режима) или несколько аудиофайлов одной длины, сложенных
+        по первой оси.
+    n_fft : int = N_FFT
+        Размер окна STFT, FAST_N_FFT - для быстрого режима.
+    hop_length : int = N_HOP
+        Шаг STFT, FAST_N_HOP - для быстрого режима.
+    :return:
+    magnitude : numpy.ndarray
+        Амплитудный спектр (..., 1 + n_fft // 2, кадры).
+    """
+    return np.abs(
+        lb.stft(
+            y=file,
+            n_fft=n_fft,
+            hop_length=hop_length,
+            window=stft_window(n_fft),
+        )
+    )
+
+
+def padded_frames(n_frames: int) -> int:
+    """
+    Функция длины признаков с учётом дополнения
+    до кратной FEATURE_FRAME_MULTIPLE.
+
+    :param
+    n_frames : int
+        Количество кадров спектра.
+    :return:
+    n_padded : int
+        Длина признаков по оси времени.
+    """
+    return -(-n_frames // FEATURE_FRAME_MULTIPLE) * FEATURE_FRAME_MULTIPLE
+
+
+def spectrogram_windows(
+    blocks: Iterable[np.ndarray],
+    n_fft: int = N_FFT,
+    hop_length: int = N_HOP,
+) -> Iterator[Tuple[int, np.ndarray, bool]]:
+    """
+    Генератор амплитудного спектра аудио по перекрывающимся окнам
+    из N_FRAME кадров с шагом WINDOW_HOP_CHUNKS чанков.
+    Аудио поступает блоками произвольного размера, в памяти хранится
+    только одно окно, поэтому потребление памяти не зависит
+    от длительности трека. Кадры окон совпадают с кадрами
+    magnitude_spectrogram для всего трека.
+
+    :param
+    blocks : Iterable[numpy.ndarray]
+        Блоки моно-аудио с частотой дискретизации SR
+        (FAST_SR для быстрого режима).
+    n_fft : int = N_FFT
+        Размер окна STFT, FAST_N_FFT - для быстрого режима.
+    hop_length : int = N_HOP
+        Шаг STFT, FAST_N_HOP - для быстрого режима.
+    :return:
+    windows : Iterator[Tuple[int, numpy.ndarray, bool]]
+        Номер первого чанка окна, амплитудный спектр окна
+        и признак последнего окна.
+    """
+    half = n_fft // 2
+    hop_frames = WINDOW_HOP_CHUNKS * CHUNK_SIZE
+    shift = hop_frames * hop_length
+    capacity = (N_FRAME - 1) * hop_length + n_fft
+    # буфер в координатах дополненного сигнала, как в lb.stft(center=True)
+    buffer = np.zeros(capacity, dtype=np.float32)
+    filled = half
+    start_frame = 0
+    n_samples = 0
+    for block in blocks:
+        block = np.ravel(block)
+        pos = 0
+        while pos < len(block):
+            take = min(capacity - filled, len(block) - pos)
+            buffer[filled:filled + take] = block[pos:pos + take]
+            filled += take
+            pos += take
+            n_samples += take
+            if filled == capacity:
+                yield start_frame // CHUNK_SIZE, np.abs(
+                    lb.stft(
+                        y=buffer,
+                        n_fft=n_fft,
+                        hop_length=hop_length,
+                        window=stft_window(n_fft),
+                        center=False,
+                    )
+                ), False
+                buffer[:filled - shift] = buffer[shift:filled]
+                filled -= shift
+                start_frame += hop_frames
+
+    if n_samples == 0:
+        raise ValueError("Empty audio stream")
+    # оставшиеся кадры до конца трека с дополнением нулями справа
+    n_frames = 1 + n_samples // hop_length
+    tail = np.zeros(
+        (n_frames - start_frame - 1) * hop_length + n_fft, np.float32
+    )
+    tail[:filled] = buffer[:filled]
+    yield start_frame // CHUNK_SIZE, np.abs(
+        lb.stft(
+            y=tail,
+            n_fft=n_fft,
+            hop_length=hop_length,
+            window=stft_window(n_fft),
+            center=False,
+        )
+    ), True
+
+
+def variant_weights_path(variant: str) -> str:
+    """
+    Функция получения пути к весам варианта модели.
+    Наличие файла проверяется сразу, чтобы не получить ошибку
+    только при создании ONNX-сессии.
+
+    :param
+    variant : str
+        Название варианта из MODEL_VARIANTS.
+    :return:
+    weights_path : str
+        Путь к .onnx файлу с весами.
+    """
+    if variant not in MODEL_VARIANTS:
+        raise NotSupportedModelException(
+            model=variant,
+            msg=f"Unknown model variant, expected one of "
+                f"{', '.join(MODEL_VARIANTS)}"
+        )
+    weights_path = MODEL_VARIANTS[variant]
+    if not os.path.exists(weights_path):
+        msg = f"Weights file {weights_path} not found"
+        if variant != REFERENCE_VARIANT:
+            msg += ", create INT8 weights with: python -m lib.quantization"
+        raise NotSupportedModelException(model=variant, msg=msg)
+    return weights_path
+
+
+def observe_inference(
+    seconds: float,
+    n_frames: int,
+    mode: str,
+) -> None:
+    """
+    Функция записи длительности вызова ONNX-сессии в гистограмму
+    с метками длительности входа и режима инференса.
+
+    :param
+    seconds : float
+        Длительность вызова в секундах.
+    n_frames : int
+        Длина входа по оси времени в кадрах признаков.
+    mode : str
+        Режим инференса: "single" или "batch".
+    """
+    get_metrics().observe(
+        INFERENCE_SECONDS,
+        seconds,
+        input_sec=input_length_label(n_frames / FRAME_PER_SEC),
+        mode=mode,
+    )
 
 
 class AudioHighlightsModel:
@@ -28,19 +316,29 @@ class AudioHighlightsModel:
     Класс модели Audio Highlight, инициализирущий веса нейронной сети,
     выделяющий необходимые признаки из аудиофайлов и осуществляющий
     предсказание хайлайта трека.
+    Асинхронные методы исполняют вычисления в отдельном потоке,
+    не блокируя цикл событий.
+    Сессии onnxruntime берутся из общего для процесса пула,
+    поэтому создание экземпляра класса не загружает веса повторно.
 
     :param
     model_type : str = "onnx"
         Тип модели. По умолчанию приложение поддерживает инициализацию
         и инференс только .onnx моделей.
         Инференс происходит на CPU.
+    variant : str | None = None
+        Вариант весов из MODEL_VARIANTS. Если не передан, берётся
+        из переменной окружения MODEL_VARIANT_ENV, а если и она
+        не задана - используются веса ONNX_WEIGHTS_PATH варианта
+        DEFAULT_VARIANT.
     """
 
-    ONNX_WEIGHTS_PATH = "weights/weights.onnx"
+    ONNX_WEIGHTS_PATH = MODEL_VARIANTS[DEFAULT_VARIANT]
 
     def __init__(
         self,
         model_type: str = "onnx",
+        variant: str | None = None,
     ):
         """
         Конструктор класса AudioHighlightsModel
@@ -48,20 +346,161 @@ class AudioHighlightsModel:
         model_type : str = "onnx"
             Тип модели. По умолчанию приложение поддерживает инициализацию
             и инференс только .onnx моделей.
+        variant : str | None = None
+            Вариант весов из MODEL_VARIANTS.
         """
         self.model_type = model_type
-        try:
-            self.model = rt.InferenceSession(self.ONNX_WEIGHTS_PATH)
-            self.input_name = self.model.get_inputs()[0].name
-        except Exception as e:
-            raise NotSupportedModelException(
-                model=self.model_type,
-                msg=str(e)
-            ) from e
+        requested = variant or os.environ.get(MODEL_VARIANT_ENV) or None
+        if requested is not None:
+            self.ONNX_WEIGHTS_PATH = variant_weights_path(requested)
+        self.variant = requested or DEFAULT_VARIANT
+        self.pool = get_session_pool(self.ONNX_WEIGHTS_PATH)
+        self.input_name = self.pool.input_name
+
+    @staticmethod
+    def compute_features(
+        file: np.ndarray,
+        sample_rate: int | float = SR,
+    ) -> np.ndarray:
+        """
+        Статическая функция выделения признаков из аудиофайла.
+
+        :param
+        file : numpy.ndarray
+            Аудиофайл.
+        sample_rate : int | float = SR
+            Частота дискретизации аудиофайла. Модель обучена
+            на признаках с частотой SR, другие частоты не поддерживаются.
+        :return:
+        feature_crop : numpy.ndarray
+            Выделенные из аудиофайла признаки.
+        """
+        if sample_rate != SR:
+            raise ValueError(
+                f"Features require sample rate {SR}, got {sample_rate}"
+            )
+        return AudioHighlightsModel.features_from_spectrogram(
+            magnitude_spectrogram(np.asarray(file, dtype=np.float32))
+        )
+
+    @staticmethod
+    def compute_features_fast(
+        file: np.ndarray,
+        sample_rate: int | float = FAST_SR,
+    ) -> np.ndarray:
+        """
+        Статическая функция выделения признаков в быстром режиме:
+        по аудио с частотой FAST_SR с окном FAST_N_FFT и шагом
+        FAST_N_HOP. Форма признаков та же, что у compute_features,
+        а значения близки к ним, поэтому признаки подаются той же
+        модели.
+
+        :param
+        file : numpy.ndarray
+            Аудиофайл.
+        sample_rate : int | float = FAST_SR
+            Частота дискретизации аудиофайла, должна быть равна FAST_SR.
+        :return:
+        feature_crop : numpy.ndarray
+            Выделенные из аудиофайла признаки.
+        """
+        if sample_rate != FAST_SR:
+            raise ValueError(
+                f"Fast features require sample rate {FAST_SR}, "
+                f"got {sample_rate}"
+            )
+        return AudioHighlightsModel.features_from_spectrogram(
+            magnitude_spectrogram(
+                np.asarray(file, dtype=np.float32), FAST_N_FFT, FAST_N_HOP
+            ),
+            mel_basis=fast_mel_filterbank(),
+        )
+
+    @staticmethod
+    def compute_features_batch(
+        files: List[np.ndarray],
+        sample_rate: int | float = SR,
+    ) -> List[np.ndarray]:
+        """
+        Статическая функция выделения признаков из нескольких
+        аудиофайлов одним векторизованным вызовом STFT.
+        Файлы дополняются нулями до длины самого длинного, поэтому
+        выгоднее передавать файлы близкой длительности. Признаки
+        совпадают с признаками compute_features для каждого файла.
+
+        :param
+        files : List[numpy.ndarray]
+            Аудиофайлы.
+        sample_rate : int | float = SR
+            Частота дискретизации аудиофайлов, должна быть равна SR.
+        :return:
+        features : List[numpy.ndarray]
+            Выделенные признаки в порядке переданных файлов.
+        """
+        if sample_rate != SR:
+            raise ValueError(
+                f"Features require sample rate {SR}, got {sample_rate}"
+            )
+        if not files:
+            return []
+        lengths = [len(file) for file in files]
+        signals = np.zeros((len(files), max(lengths)), dtype=np.float32)
+        for row, file in enumerate(files):
+            signals[row, :lengths[row]] = file
+        # дополнение нулями справа совпадает с дополнением lb.stft
+        # (center=True), поэтому кадры каждого файла не меняются
+        magnitude = magnitude_spectrogram(signals)
+        del signals
+        return [
+            AudioHighlightsModel.features_from_spectrogram(
+                magnitude[row, :, :1 + length // N_HOP]
+            )
+            for row, length in enumerate(lengths)
+        ]
+
+    @staticmethod
+    def features_from_spectrogram(
+        magnitude: np.ndarray,
+        out: np.ndarray | None = None,
+        mel_basis: np.ndarray | None = None,
+    ) -> np.ndarray:
+        """
+        Статическая функция выделения признаков из уже вычисленного
+        амплитудного спектра, см. magnitude_spectrogram. Позволяет
+        переиспользовать один спектр для признаков модели и анализа
+        темпа, см. lib.analysis.
+
+        Мел-спектр записывается сразу в float32 тензор формы
+        (1, N_MEL, кадры, 1), дополненный нулями до длины padded_frames.
+
+        :param
+        magnitude : numpy.ndarray
+            Амплитудный спектр аудиофайла.
+        out : numpy.ndarray | None = None
+            Буфер для признаков, например от предыдущего окна
+            того же размера. Если не передан или не подходит
+            по форме, выделяется новый.
+        mel_basis : numpy.ndarray | None = None
+            Мел-фильтры, по умолчанию mel_filterbank(),
+            fast_mel_filterbank() - для быстрого режима.
+        :return:
+        feature_crop : numpy.ndarray
+            Выделенные из аудиофайла признаки.
+        """
+        n_frames = magnitude.shape[-1]
+        shape = (1, N_MEL, padded_frames(n_frames), 1)
+        if out is None or out.shape != shape or out.dtype != np.float32:
+            out = np.empty(shape, dtype=np.float32)
+        if mel_basis is None:
+            mel_basis = mel_filterbank()
+        np.matmul(mel_basis, magnitude, out=out[0, :, :n_frames, 0])
+        out[0, :, n_frames:, 0] = 0
+        return out
 
     @staticmethod
     async def extract_features(
         file: np.ndarray,
+        sample_rate: int | float = SR,
     ) -> np.ndarray:
         """
         Статическая асинхронная функция выделения признаков из аудиофайла.
@@ -69,57 +508,231 @@ class AudioHighlightsModel:
         :param
         file : numpy.ndarray
             Аудиофайл.
+        sample_rate : int | float = SR
+            Частота дискретизации аудиофайла, должна быть равна SR.
         :return:
         feature_crop : numpy.ndarray
             Выделенные из аудиофайла признаки.
         """
-        data = lb.feature.melspectrogram(
-            y=file,
-            sr=SR,
-            n_fft=N_FFT,
-            hop_length=N_HOP,
-            power=1,
-            n_mels=N_MEL,
-            fmin=20,
-            fmax=5000,
+        return await asyncio.to_thread(
+            AudioHighlightsModel.compute_features, file, sample_rate
         )
-        data = np.reshape(data, (data.shape[0], data.shape[1], 1))
-        feature_length = len(data[1])
-        remain = feature_length % 9
-        remain_np = np.zeros([128, 9 - remain, 1])
-        feature_crop = np.concatenate((data, remain_np), axis=1)
-        feature_crop = np.expand_dims(feature_crop, axis=0)
-        return feature_crop
 
-    async def predict(
+    def run(
         self,
         track_features: np.ndarray,
-    ) -> List[float]:
+    ) -> np.ndarray:
         """
-        Асинхронная функция предсказания хайлайта
-        на основе переданных признаков.
+        Функция предсказания хайлайта на основе переданных признаков.
+
+        Признаки копируются в заранее выделенный float32 буфер сессии
+        той же формы: длина входа не меняется, см. run_batch.
 
         :param
         track_features : numpy.ndarray
             Выделенные из аудиофайла признаки.
         :return:
-        prediction: List[float]
+        prediction: numpy.ndarray
             Предсказание нейросети хайлайта.
         """
+        length = track_features.shape[2]
         try:
-            return self.model.run(
-                None, {self.input_name: track_features.astype(np.float32)}
-            )[0][0].tolist()
+            with self.pool.session() as session:
+                buffers = self.pool.buffers(session, (1, N_MEL, length, 1))
+                buffers.input[...] = track_features
+                start = perf_counter()
+                output = buffers.run()[0].copy()
         except Exception as e:
             raise NotSupportedModelException(
                 model=self.model_type,
                 msg="Not supported model type"
             ) from e
+        observe_inference(perf_counter() - start, length, "single")
+        return output
+
+    async def predict(
+        self,
+        track_features: np.ndarray,
+    ) -> np.ndarray:
+        """
+        Асинхронная функция предсказания хайлайта
+        на основе переданных признаков.
+
+        :param
+        track_features : numpy.ndarray
+            Выделенные из аудиофайла признаки.
+        :return:
+        prediction: numpy.ndarray
+            Предсказание нейросети хайлайта.
+        """
+        return await asyncio.to_thread(self.run, track_features)
+
+    def run_batch(
+        self,
+        tracks_features: List[np.ndarray],
+        batch_size: int = BATCH_SIZE,
+    ) -> List[np.ndarray]:
+        """
+        Функция пакетного предсказания хайлайтов
+        для признаков нескольких треков.
+
+        В один вызов модели попадают только треки с одинаковой длиной
+        признаков: модель содержит блок self-attention, поэтому
+        дополнение нулями до общей оси времени меняет всё предсказание,
+        а не только его конец, и результат трека зависел бы от соседей
+        по пакету. Признаки копируются в буферы сессии, предсказания
+        совпадают с run для каждого трека.
+
+        :param
+        tracks_features : List[numpy.ndarray]
+            Список признаков треков, полученных из extract_features.
+        batch_size : int = BATCH_SIZE
+            Максимальное количество треков в одном вызове модели.
+        :return:
+        predictions : List[numpy.ndarray]
+            Предсказания нейросети в порядке переданных треков.
+        """
+        groups: Dict[int, List[int]] = {}
+        for idx, track_features in enumerate(tracks_features):
+            groups.setdefault(track_features.shape[2], []).append(idx)
+        predictions: Dict[int, np.ndarray] = {}
+        for length, indices in groups.items():
+            for start in range(0, len(indices), batch_size):
+                bucket = indices[start:start + batch_size]
+                try:
+                    with self.pool.session() as session:
+                        buffers = self.pool.buffers(
+                            session, (len(bucket), N_MEL, length, 1)
+                        )
+                        for row, idx in enumerate(bucket):
+                            buffers.input[row] = tracks_features[idx][0]
+                        start_time = perf_counter()
+                        output = buffers.run()
+                        for row, idx in enumerate(bucket):
+                            predictions[idx] = output[row].copy()
+                except Exception as e:
+                    raise NotSupportedModelException(
+                        model=self.model_type,
+                        msg="Not supported model type"
+                    ) from e
+                observe_inference(
+                    perf_counter() - start_time, length, "batch"
+                )
+        return [predictions[idx] for idx in range(len(tracks_features))]
+
+    def run_stream(
+        self,
+        blocks: Iterable[np.ndarray],
+        fast: bool = False,
+    ) -> np.ndarray:
+        """
+        Функция потокового предсказания хайлайта для трека
+        произвольной длительности.
+
+        Признаки вычисляются по перекрывающимся окнам,
+        см. spectrogram_windows, модель запускается для каждого окна,
+        а предсказания окон склеиваются: от каждого окна берётся
+        центральная часть, края перекрытия отбрасываются.
+
+        :param
+        blocks : Iterable[numpy.ndarray]
+            Блоки моно-аудио с частотой дискретизации SR
+            (FAST_SR, если fast).
+        fast : bool = False
+            Если True, признаки выделяются в быстром режиме,
+            см. compute_features_fast.
+        :return:
+        prediction: numpy.ndarray
+            Предсказание нейросети хайлайта, одно значение на чанк.
+        """
+        trim = OVERLAP_CHUNKS // 2
+        parts: List[np.ndarray] = []
+        features = None
+        if fast:
+            windows = spectrogram_windows(blocks, FAST_N_FFT, FAST_N_HOP)
+            mel_basis = fast_mel_filterbank()
+        else:
+            windows = spectrogram_windows(blocks)
+            mel_basis = mel_filterbank()
+        for start_chunk, magnitude, is_last in windows:
+            # окна одного размера переиспользуют буфер признаков:
+            # run копирует их во входной буфер сессии
+            features = self.features_from_spectrogram(
+                magnitude, features, mel_basis
+            )
+            output = self.run(features)
+            del magnitude
+            keep_from = 0 if start_chunk == 0 else trim
+            keep_to = len(output) if is_last else N_CHUNK - trim
+            parts.append(output[keep_from:keep_to])
+        if not parts:
+            return np.zeros(0, dtype=np.float32)
+        return np.concatenate(parts)
+
+    def run_chunked(
+        self,
+        file: np.ndarray,
+        fast: bool = False,
+    ) -> np.ndarray:
+        """
+        Функция предсказания хайлайта для аудиофайла
+        по перекрывающимся окнам, см. run_stream. В отличие от run,
+        признаки всего трека в памяти не собираются.
+
+        :param
+        file : numpy.ndarray
+            Аудиофайл с частотой дискретизации SR (FAST_SR, если fast).
+        fast : bool = False
+            Если True, признаки выделяются в быстром режиме.
+        :return:
+        prediction: numpy.ndarray
+            Предсказание нейросети хайлайта.
+        """
+        return self.run_stream((file,), fast)
+
+    async def predict_chunked(
+        self,
+        file: np.ndarray,
+    ) -> np.ndarray:
+        """
+        Асинхронная функция предсказания хайлайта для аудиофайла
+        по перекрывающимся окнам, см. run_chunked.
+
+        :param
+        file : numpy.ndarray
+            Аудиофайл с частотой дискретизации SR.
+        :return:
+        prediction: numpy.ndarray
+            Предсказание нейросети хайлайта.
+        """
+        return await asyncio.to_thread(self.run_chunked, file)
+
+    async def predict_batch(
+        self,
+        tracks_features: List[np.ndarray],
+        batch_size: int = BATCH_SIZE,
+    ) -> List[np.ndarray]:
+        """
+        Асинхронная функция пакетного предсказания хайлайтов
+        для признаков нескольких треков, см. run_batch.
+
+        :param
+        tracks_features : List[numpy.ndarray]
+            Список признаков треков, полученных из extract_features.
+        batch_size : int = BATCH_SIZE
+            Максимальное количество треков в одном вызове модели.
+        :return:
+        predictions : List[numpy.ndarray]
+            Предсказания нейросети в порядке переданных треков.
+        """
+        return await asyncio.to_thread(
+            self.run_batch, tracks_features, batch_size
+        )
 
     async def extract_predict(
         self,
         file: np.ndarray,
-    ) -> List[float]:
+    ) -> np.ndarray:
         """
         Асинхронная функция выделения и предсказания
         хайлайта сразу из аудиофайла.
@@ -128,7 +741,7 @@ class AudioHighlightsModel:
         file : numpy.ndarray
             Аудиофайл.
         :return:
-        prediction: List[float] | None
+        prediction: numpy.ndarray
             Предсказание нейросети хайлайта.
         """
         features = await self.extract_features(file)
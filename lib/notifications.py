@@ -0,0 +1,451 @@
+"""
+Модуль отправки уведомлений в телеграм.
+
+Сообщения ставятся в очередь и отправляются фоновым потоком
+со своим циклом событий и общей HTTP-сессией, поэтому вызывающий код
+(колбэки Streamlit, Watchdog-бот) не ждёт ответа Telegram API.
+Сообщения, пришедшие пачкой за COALESCE_SEC, объединяются в одно,
+между отправками в чат выдерживается MIN_SEND_INTERVAL_SEC, а при
+ошибках отправка повторяется с экспоненциальной задержкой или через
+retry_after, который возвращает Telegram при превышении лимитов.
+
+Поведение можно проверить без Telegram на локальной заглушке,
+см. benchmarks.notification_drill.
+"""
+
+import asyncio
+import atexit
+import logging
+import random
+import threading
+from typing import Dict, List
+import aiohttp
+from lib.utils import CONFIG, FeedbackMessage
+
+
+TELEGRAM_API_URL = "https://api.telegram.org"
+# максимальная длина сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+MESSAGE_SEPARATOR = "\n\n"
+QUEUE_SIZE = 256
+COALESCE_SEC = 2.0
+MIN_SEND_INTERVAL_SEC = 1.0
+REQUEST_TIMEOUT_SEC = 10
+CONNECTION_LIMIT = 4
+MAX_RETRIES = 5
+BACKOFF_BASE_SEC = 1.0
+BACKOFF_MAX_SEC = 60.0
+CLOSE_TIMEOUT_SEC = 10.0
+
+
+def coalesce_messages(
+    messages: List[str],
+    limit: int = MAX_MESSAGE_LENGTH,
+) -> List[str]:
+    """
+    Функция объединения пачки сообщений в минимальное количество
+    сообщений не длиннее limit. Повторяющиеся сообщения
+    отправляются один раз с количеством повторов.
+
+    :param
+    messages : List[str]
+        Сообщения в порядке поступления.
+    limit : int = MAX_MESSAGE_LENGTH
+        Максимальная длина сообщения.
+    :return:
+    texts : List[str]
+        Объединённые сообщения.
+    """
+    counts: Dict[str, int] = {}
+    for message in messages:
+        counts[message] = counts.get(message, 0) + 1
+    texts = []
+    current = ""
+    for message, count in counts.items():
+        if count > 1:
+            message = f"{message}\n(x{count})"
+        for start in range(0, len(message), limit):
+            part = message[start:start + limit]
+            if not current:
+                current = part
+            elif len(current) + len(MESSAGE_SEPARATOR) + len(part) <= limit:
+                current += MESSAGE_SEPARATOR + part
+            else:
+                texts.append(current)
+                current = part
+    if current:
+        texts.append(current)
+    return texts
+
+
+class NotificationDispatcher:
+    """
+    Класс фоновой отправки сообщений в чат Telegram.
+    Поток отправки запускается при первом сообщении.
+
+    :param
+    token : str
+        Токен телеграм-бота.
+    chat_id : int | str
+        Идентификатор чата.
+    api_url : str = TELEGRAM_API_URL
+        Адрес Telegram Bot API.
+    queue_size : int = QUEUE_SIZE
+        Максимальное количество неотправленных сообщений,
+        сообщения сверх него отбрасываются.
+    coalesce_sec : float = COALESCE_SEC
+        Сколько секунд собирать пачку сообщений перед отправкой.
+    min_interval_sec : float = MIN_SEND_INTERVAL_SEC
+        Минимальный интервал между отправками в чат.
+    timeout : float = REQUEST_TIMEOUT_SEC
+        Таймаут запроса к Telegram API в секундах.
+    max_retries : int = MAX_RETRIES
+        Количество повторов отправки сообщения.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        chat_id: int | str,
+        api_url: str = TELEGRAM_API_URL,
+        queue_size: int = QUEUE_SIZE,
+        coalesce_sec: float = COALESCE_SEC,
+        min_interval_sec: float = MIN_SEND_INTERVAL_SEC,
+        timeout: float = REQUEST_TIMEOUT_SEC,
+        max_retries: int = MAX_RETRIES,
+    ):
+        """
+        Конструктор класса NotificationDispatcher.
+
+        :param
+        token : str
+            Токен телеграм-бота.
+        chat_id : int | str
+            Идентификатор чата.
+        api_url : str = TELEGRAM_API_URL
+            Адрес Telegram Bot API.
+        queue_size : int = QUEUE_SIZE
+            Максимальное количество неотправленных сообщений.
+        coalesce_sec : float = COALESCE_SEC
+            Время сбора пачки сообщений в секундах.
+        min_interval_sec : float = MIN_SEND_INTERVAL_SEC
+            Минимальный интервал между отправками в секундах.
+        timeout : float = REQUEST_TIMEOUT_SEC
+            Таймаут запроса в секундах.
+        max_retries : int = MAX_RETRIES
+            Количество повторов отправки.
+        """
+        self.url = f"{api_url.rstrip('/')}/bot{token}/sendMessage"
+        self.chat_id = chat_id
+        self.queue_size = queue_size
+        self.coalesce_sec = coalesce_sec
+        self.min_interval_sec = min_interval_sec
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+        self._condition = threading.Condition()
+        self._pending = 0
+        self._thread: threading.Thread | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+        self._last_sent = float("-inf")
+
+        self.submitted = 0
+        self.dropped = 0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+
+    def start(self) -> None:
+        """
+        Функция запуска потока отправки, если он ещё не запущен.
+        """
+        with self._condition:
+            if self._thread is not None:
+                return
+            ready = threading.Event()
+            self._thread = threading.Thread(
+                target=self._run_loop,
+                args=(ready,),
+                name="notifications",
+                daemon=True,
+            )
+            self._thread.start()
+        ready.wait()
+
+    def _run_loop(self, ready: threading.Event) -> None:
+        """
+        Функция потока отправки: цикл событий с обработчиком очереди.
+        """
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        self._worker = self._loop.create_task(self._work())
+        self._loop.call_soon(ready.set)
+        try:
+            self._loop.run_until_complete(self._worker)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop.close()
+
+    def submit(self, message: FeedbackMessage | str) -> bool:
+        """
+        Функция постановки сообщения в очередь отправки.
+        Не блокирует вызывающий поток.
+
+        :param
+        message : FeedbackMessage | str
+            Сообщение.
+        :return:
+        accepted : bool
+            False, если очередь заполнена или поток отправки
+            остановлен и сообщение отброшено.
+        """
+        self.start()
+        with self._condition:
+            self.submitted += 1
+            if self._pending >= self.queue_size:
+                self.dropped += 1
+                logging.warning("Notification queue is full, message dropped")
+                return False
+            self._pending += 1
+        try:
+            self._loop.call_soon_threadsafe(
+                self._queue.put_nowait, str(message)
+            )
+        except RuntimeError:
+            # цикл событий потока отправки закрыт
+            with self._condition:
+                self._pending -= 1
+                self.dropped += 1
+                self._condition.notify_all()
+            logging.warning("Notification loop is closed, message dropped")
+            return False
+        return True
+
+    async def _work(self) -> None:
+        """
+        Асинхронная функция обработки очереди: собирает пачку сообщений
+        и отправляет её объединённой.
+        """
+        loop = asyncio.get_running_loop()
+        async with aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=CONNECTION_LIMIT),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        ) as session:
+            while True:
+                batch = [await self._queue.get()]
+                deadline = loop.time() + self.coalesce_sec
+                while len(batch) < self.queue_size:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(
+                            await asyncio.wait_for(
+                                self._queue.get(), remaining
+                            )
+                        )
+                    except asyncio.TimeoutError:
+                        break
+                try:
+                    for text in coalesce_messages(batch):
+                        await self._send(session, text)
+                except Exception:
+                    # ошибка одной пачки не должна останавливать
+                    # поток отправки
+                    logging.exception("Failed to send notifications")
+                    self.failed += 1
+                finally:
+                    with self._condition:
+                        self._pending -= len(batch)
+                        self._condition.notify_all()
+
+    def _backoff(self, attempt: int) -> float:
+        """
+        Функция экспоненциальной задержки перед повтором со случайной
+        составляющей, чтобы повторы не приходили одновременно.
+        """
+        delay = min(BACKOFF_BASE_SEC * 2 ** attempt, BACKOFF_MAX_SEC)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _retry_after(
+        self,
+        response: aiohttp.ClientResponse,
+        attempt: int,
+    ) -> float:
+        """
+        Асинхронная функция получения задержки перед повтором
+        из ответа 429: retry_after из тела ответа Telegram,
+        заголовок Retry-After или экспоненциальная задержка, если
+        ответ не от Telegram (например, от прокси) и не разбирается.
+
+        :param
+        response : aiohttp.ClientResponse
+            Ответ со статусом 429.
+        attempt : int
+            Номер попытки отправки.
+        :return:
+        delay : float
+            Задержка перед повтором в секундах.
+        """
+        try:
+            payload = await response.json(content_type=None)
+            return float(payload["parameters"]["retry_after"])
+        except (ValueError, AttributeError, KeyError, TypeError):
+            pass
+        try:
+            return float(response.headers["Retry-After"])
+        except (ValueError, KeyError):
+            return self._backoff(attempt)
+
+    async def _send(
+        self,
+        session: aiohttp.ClientSession,
+        text: str,
+    ) -> bool:
+        """
+        Асинхронная функция отправки одного сообщения с повторами.
+
+        :param
+        session : aiohttp.ClientSession
+            HTTP-сессия.
+        text : str
+            Текст сообщения.
+        :return:
+        sent : bool
+            True, если Telegram принял сообщение.
+        """
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            wait = self._last_sent + self.min_interval_sec - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                async with session.post(
+                    self.url,
+                    json={"chat_id": self.chat_id, "text": text},
+                ) as response:
+                    self._last_sent = loop.time()
+                    if response.status == 200:
+                        self.sent += 1
+                        return True
+                    if response.status == 429:
+                        delay = await self._retry_after(response, attempt)
+                    elif response.status >= 500:
+                        delay = self._backoff(attempt)
+                    else:
+                        logging.error(
+                            "Telegram rejected the message: %s %s",
+                            response.status,
+                            await response.text(),
+                        )
+                        self.failed += 1
+                        return False
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logging.warning("Telegram API error: %s", e)
+                delay = self._backoff(attempt)
+            if attempt < self.max_retries:
+                self.retries += 1
+                await asyncio.sleep(delay)
+        logging.error(
+            "Notification was not sent after %s retries", self.max_retries
+        )
+        self.failed += 1
+        return False
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        Функция ожидания отправки всех сообщений из очереди.
+
+        :param
+        timeout : float | None = None
+            Максимальное время ожидания в секундах.
+        :return:
+        flushed : bool
+            True, если очередь опустела.
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self._pending == 0, timeout
+            )
+
+    def close(self, timeout: float = CLOSE_TIMEOUT_SEC) -> None:
+        """
+        Функция остановки потока отправки после отправки
+        оставшихся сообщений, но не дольше timeout секунд.
+
+        :param
+        timeout : float = CLOSE_TIMEOUT_SEC
+            Максимальное время ожидания в секундах.
+        """
+        if self._thread is None:
+            return
+        self.flush(timeout)
+        try:
+            self._loop.call_soon_threadsafe(self._worker.cancel)
+        except RuntimeError:
+            # цикл событий уже закрыт
+            pass
+        self._thread.join(timeout)
+        with self._condition:
+            self._thread = None
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Счётчики сообщений: поставленные в очередь, отброшенные,
+        отправленные (после объединения), не отправленные и повторы.
+        """
+        with self._condition:
+            return {
+                "submitted": self.submitted,
+                "dropped": self.dropped,
+                "pending": self._pending,
+                "sent": self.sent,
+                "failed": self.failed,
+                "retries": self.retries,
+            }
+
+
+_DISPATCHER: NotificationDispatcher | None = None
+_DISPATCHER_LOCK = threading.Lock()
+
+
+def get_dispatcher() -> NotificationDispatcher:
+    """
+    Функция получения общего для процесса диспетчера уведомлений
+    с настройками из lib/config.yaml. Оставшиеся сообщения
+    отправляются при завершении процесса.
+
+    :return:
+    dispatcher : NotificationDispatcher
+        Диспетчер уведомлений.
+    """
+    global _DISPATCHER
+    with _DISPATCHER_LOCK:
+        if _DISPATCHER is None:
+            _DISPATCHER = NotificationDispatcher(
+                CONFIG["TELEGRAM_BOT_TOKEN"],
+                CONFIG["TELEGRAM_CHAT_ID"],
+                api_url=CONFIG.get("TELEGRAM_API_URL", TELEGRAM_API_URL),
+            )
+            atexit.register(_DISPATCHER.close)
+        return _DISPATCHER
+
+
+def notify(message: FeedbackMessage | str) -> bool:
+    """
+    Функция отправки сообщения в телеграм через общий диспетчер.
+    Не ждёт ответа Telegram, см. NotificationDispatcher.submit.
+
+    :param
+    message : FeedbackMessage | str
+        Сообщение, которое надо передать в телеграм-бот.
+    :return:
+    accepted : bool
+        False, если очередь отправки заполнена.
+    """
+    return get_dispatcher().submit(message)
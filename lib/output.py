@@ -0,0 +1,298 @@
+"""
+Модуль выдачи результатов пользователю.
+
+Результат кодируется один раз в выбранный формат, и один и тот же
+буфер отдаётся и плееру, и кнопке скачивания. Временные файлы
+результатов (плейлисты записываются на диск по блокам) создаются
+в приватном каталоге пользователя, который очищается от файлов старше
+заданного времени жизни и от давно не использованных файлов сверх
+лимита размера. Объём отданных данных записывается в метрики.
+"""
+
+import os
+import tempfile
+import threading
+from time import time
+from typing import Dict
+import numpy as np
+from lib.audio_writer import encode_audio, get_mime_type
+from lib.cache import CACHE_ROOT, private_directory
+from lib.metrics import (
+    OUTPUT_BUCKETS,
+    OUTPUT_BYTES,
+    REQUEST_OUTPUT_BYTES,
+    get_metrics,
+    stage,
+)
+
+
+# каталог доступен только пользователю сервиса, см.
+# lib.cache.private_directory: из него отдаются результаты,
+# а OutputJanitor удаляет в нём файлы
+OUTPUT_DIR = os.path.join(CACHE_ROOT, "output")
+OUTPUT_TTL_SEC = 60 * 60
+OUTPUT_MAX_BYTES = 1024 ** 3
+
+
+class EncodedAudio:
+    """
+    Класс закодированного результата.
+
+    :param
+    data : bytes
+        Закодированный файл.
+    audio_format : str
+        Формат аудио, ключ lib.audio_writer.AUDIO_FORMATS.
+    """
+
+    def __init__(
+        self,
+        data: bytes,
+        audio_format: str,
+    ):
+        """
+        Конструктор класса EncodedAudio.
+
+        :param
+        data : bytes
+            Закодированный файл.
+        audio_format : str
+            Формат аудио.
+        """
+        self.data = data
+        self.audio_format = audio_format
+
+    @property
+    def mime(self) -> str:
+        """
+        MIME-тип результата.
+        """
+        return get_mime_type(self.audio_format)
+
+    @property
+    def size(self) -> int:
+        """
+        Размер результата в байтах.
+        """
+        return len(self.data)
+
+    def file_name(self, stem: str) -> str:
+        """
+        Функция получения имени файла результата с расширением формата.
+        """
+        return f"{stem}.{self.audio_format}"
+
+    @classmethod
+    def from_file(cls, path: str, audio_format: str) -> "EncodedAudio":
+        """
+        Функция чтения уже закодированного файла результата.
+
+        :param
+        path : str
+            Путь к файлу.
+        audio_format : str
+            Формат аудио.
+        :return:
+        encoded : EncodedAudio
+            Результат.
+        """
+        with open(path, "rb") as file:
+            return cls(file.read(), audio_format)
+
+
+def encode_result(
+    audio: np.ndarray,
+    sample_rate: int | float,
+    audio_format: str = "wav",
+    bitrate_kbps: int | None = None,
+) -> EncodedAudio:
+    """
+    Функция однократного кодирования результата в память.
+
+    :param
+    audio : numpy.ndarray
+        Моно-аудио.
+    sample_rate : int | float
+        Частота дискретизации аудио.
+    audio_format : str = "wav"
+        Формат аудио, ключ lib.audio_writer.AUDIO_FORMATS.
+    bitrate_kbps : int | None = None
+        Битрейт для форматов со сжатием с потерями.
+    :return:
+    encoded : EncodedAudio
+        Результат.
+    """
+    with stage("encode"):
+        data = encode_audio(audio, sample_rate, audio_format, bitrate_kbps)
+    return EncodedAudio(data, audio_format)
+
+
+def record_served(
+    kind: str,
+    n_bytes: int,
+    audio_format: str,
+) -> None:
+    """
+    Функция записи объёма отданных за запрос данных: счётчик
+    OUTPUT_BYTES и гистограмма REQUEST_OUTPUT_BYTES.
+
+    :param
+    kind : str
+        Тип запроса: "highlights", "playlist" и т.п.
+    n_bytes : int
+        Объём отданных данных в байтах.
+    audio_format : str
+        Формат результата.
+    """
+    metrics = get_metrics()
+    metrics.inc(OUTPUT_BYTES, n_bytes, kind=kind, format=audio_format)
+    metrics.observe(
+        REQUEST_OUTPUT_BYTES,
+        n_bytes,
+        buckets=OUTPUT_BUCKETS,
+        kind=kind,
+        format=audio_format,
+    )
+
+
+class OutputJanitor:
+    """
+    Класс каталога временных файлов результатов с удалением файлов
+    старше ttl_sec и давно не использованных файлов сверх max_bytes.
+
+    :param
+    directory : str = OUTPUT_DIR
+        Каталог временных файлов.
+    ttl_sec : float = OUTPUT_TTL_SEC
+        Время жизни файла с последнего использования в секундах.
+    max_bytes : int = OUTPUT_MAX_BYTES
+        Максимальный суммарный размер файлов.
+    """
+
+    def __init__(
+        self,
+        directory: str = OUTPUT_DIR,
+        ttl_sec: float = OUTPUT_TTL_SEC,
+        max_bytes: int = OUTPUT_MAX_BYTES,
+    ):
+        """
+        Конструктор класса OutputJanitor.
+
+        :param
+        directory : str = OUTPUT_DIR
+            Каталог временных файлов.
+        ttl_sec : float = OUTPUT_TTL_SEC
+            Время жизни файла в секундах.
+        max_bytes : int = OUTPUT_MAX_BYTES
+            Максимальный суммарный размер файлов.
+        """
+        self.directory = directory
+        self.ttl_sec = ttl_sec
+        self.max_bytes = max_bytes
+        private_directory(directory)
+        self._lock = threading.Lock()
+        self.removed = 0
+
+    def new_path(self, suffix: str) -> str:
+        """
+        Функция создания пустого временного файла результата.
+        Перед созданием каталог очищается.
+
+        :param
+        suffix : str
+            Расширение файла, например ".mp3".
+        :return:
+        path : str
+            Путь к файлу.
+        """
+        self.sweep()
+        fd, path = tempfile.mkstemp(dir=self.directory, suffix=suffix)
+        os.close(fd)
+        return path
+
+    def touch(self, path: str) -> bool:
+        """
+        Функция продления времени жизни файла при повторном
+        использовании.
+
+        :param
+        path : str
+            Путь к файлу.
+        :return:
+        exists : bool
+            False, если файл уже удалён.
+        """
+        try:
+            os.utime(path)
+        except OSError:
+            return False
+        return True
+
+    def sweep(self) -> int:
+        """
+        Функция удаления просроченных файлов и давно не
+        использованных файлов сверх max_bytes.
+
+        :return:
+        removed : int
+            Количество удалённых файлов.
+        """
+        with self._lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+            expired_before = time() - self.ttl_sec
+            removed = 0
+            for mtime, size, path in sorted(entries):
+                if mtime >= expired_before and total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+            self.removed += removed
+            return removed
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Счётчики каталога: количество и размер файлов,
+        количество удалённых файлов.
+        """
+        files = 0
+        total = 0
+        for entry in os.scandir(self.directory):
+            try:
+                total += entry.stat().st_size
+            except OSError:
+                continue
+            files += 1
+        return {"files": files, "bytes": total, "removed": self.removed}
+
+
+_JANITOR: OutputJanitor | None = None
+_JANITOR_LOCK = threading.Lock()
+
+
+def get_output_janitor() -> OutputJanitor:
+    """
+    Функция получения общего для процесса каталога временных
+    файлов результатов.
+
+    :return:
+    janitor : OutputJanitor
+        Каталог временных файлов результатов.
+    """
+    global _JANITOR
+    with _JANITOR_LOCK:
+        if _JANITOR is None:
+            _JANITOR = OutputJanitor()
+        return _JANITOR
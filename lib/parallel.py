@@ -0,0 +1,241 @@
+"""
+Модуль параллельного исполнения потрековых вычислений.
+
+Выделение признаков, инференс и оценка темпа выполняются для каждого
+трека независимо, поэтому распределяются по пулу процессов
+(или потоков для частей, отпускающих GIL). Результаты возвращаются
+в исходном порядке треков, а ошибка одного трека не прерывает
+обработку остальных. Метрики, записанные процессами-исполнителями,
+передаются в основной процесс вместе с результатами.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+from lib.metrics import get_metrics
+
+
+PARALLEL_BACKEND = "process"
+PARALLEL_WORKERS = min(4, os.cpu_count() or 1)
+SUPPORTED_BACKENDS = ("process", "thread")
+
+
+class TrackProcessingError(Exception):
+    """
+    Класс исключения, возникающего при ошибке обработки одного трека.
+    Исходное исключение доступно в атрибуте __cause__
+    (при исполнении в пуле процессов - в виде текста в msg).
+    """
+
+    def __init__(
+        self,
+        track_idx: int,
+        msg: str,
+    ):
+        """
+        Конструктор класса TrackProcessingError.
+
+        :param
+        track_idx : int
+            Индекс трека в переданном списке.
+        msg : str
+            Сообщение при вызове исключения.
+        """
+        super().__init__(track_idx, msg)
+        self.track_idx = track_idx
+        self.msg = msg
+
+    def __str__(self):
+        return f"Track {self.track_idx}: {self.msg}"
+
+
+_EXECUTORS: Dict[Tuple[str, int], Executor] = {}
+_EXECUTORS_LOCK = threading.Lock()
+
+
+def get_executor(
+    backend: str = PARALLEL_BACKEND,
+    workers: int = PARALLEL_WORKERS,
+) -> Executor:
+    """
+    Функция получения общего для процесса пула исполнителей.
+    Пулы создаются один раз и переиспользуются, чтобы процессы-исполнители
+    загружали веса модели только при первом обращении.
+
+    :param
+    backend : str = PARALLEL_BACKEND
+        Тип пула: "process" или "thread".
+    workers : int = PARALLEL_WORKERS
+        Количество исполнителей.
+    :return:
+    executor : Executor
+        Пул исполнителей.
+    """
+    if backend not in SUPPORTED_BACKENDS:
+        raise ValueError(f"Unsupported parallel backend: {backend}")
+    key = (backend, workers)
+    with _EXECUTORS_LOCK:
+        executor = _EXECUTORS.get(key)
+        if executor is None:
+            if backend == "process":
+                # spawn вместо fork: onnxruntime и numba держат
+                # собственные пулы потоков, которые не переживают fork
+                executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            else:
+                executor = ThreadPoolExecutor(
+                    max_workers=workers,
+                    thread_name_prefix="audio-highlight",
+                )
+            _EXECUTORS[key] = executor
+        return executor
+
+
+def shutdown_executors() -> None:
+    """
+    Функция остановки всех созданных пулов исполнителей.
+    """
+    with _EXECUTORS_LOCK:
+        executors = list(_EXECUTORS.values())
+        _EXECUTORS.clear()
+    for executor in executors:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def run_track(
+    func: Callable[..., Any],
+    track_idx: int,
+    args: Tuple,
+) -> Any:
+    """
+    Функция-обёртка обработки одного трека, приводящая любую ошибку
+    к TrackProcessingError с индексом трека.
+
+    :param
+    func : Callable[..., Any]
+        Функция обработки трека. Для пула процессов должна быть
+        объявлена на уровне модуля.
+    track_idx : int
+        Индекс трека в переданном списке.
+    args : Tuple
+        Аргументы функции обработки.
+    :return:
+    result : Any
+        Результат функции обработки.
+    """
+    try:
+        return func(*args)
+    except TrackProcessingError:
+        raise
+    except Exception as e:
+        msg = getattr(e, "msg", None) or str(e) or type(e).__name__
+        raise TrackProcessingError(track_idx, msg) from e
+
+
+def run_track_collect(
+    func: Callable[..., Any],
+    track_idx: int,
+    args: Tuple,
+) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Функция-обёртка обработки одного трека в пуле процессов:
+    вместе с результатом возвращает метрики, накопленные
+    процессом-исполнителем, см. lib.metrics.MetricsRegistry.drain.
+
+    :param
+    func : Callable[..., Any]
+        Функция обработки трека, объявленная на уровне модуля.
+    track_idx : int
+        Индекс трека в переданном списке.
+    args : Tuple
+        Аргументы функции обработки.
+    :return:
+    result : Any
+        Результат функции обработки.
+    metrics : Dict[str, Any]
+        Метрики процесса-исполнителя.
+    """
+    result = run_track(func, track_idx, args)
+    return result, get_metrics().drain()
+
+
+async def gather_tracks(
+    func: Callable[..., Any],
+    args_list: Sequence[Tuple],
+    workers: int | None = None,
+    backend: str = PARALLEL_BACKEND,
+    return_exceptions: bool = False,
+) -> List[Any]:
+    """
+    Асинхронная функция применения func к каждому набору аргументов
+    с распределением по пулу исполнителей.
+
+    :param
+    func : Callable[..., Any]
+        Синхронная функция обработки одного трека.
+    args_list : Sequence[Tuple]
+        Аргументы функции для каждого трека.
+    workers : int | None = None
+        Количество исполнителей. None - PARALLEL_WORKERS,
+        1 - последовательное исполнение в одном фоновом потоке.
+    backend : str = PARALLEL_BACKEND
+        Тип пула: "process" или "thread".
+    return_exceptions : bool = False
+        Если True, вместо результата трека с ошибкой возвращается
+        TrackProcessingError, иначе первая ошибка пробрасывается.
+    :return:
+    results : List[Any]
+        Результаты в исходном порядке треков.
+    """
+    if workers is None:
+        workers = PARALLEL_WORKERS
+
+    if workers <= 1 or len(args_list) <= 1:
+        # последовательное исполнение в отдельном потоке: цикл событий
+        # не блокируется, а между треками остаются точки отмены
+        results: List[Any] = []
+        for idx, args in enumerate(args_list):
+            try:
+                results.append(
+                    await asyncio.to_thread(run_track, func, idx, args)
+                )
+            except TrackProcessingError as e:
+                if not return_exceptions:
+                    raise
+                results.append(e)
+        return results
+
+    loop = asyncio.get_running_loop()
+    executor = get_executor(backend, workers)
+    wrapper = run_track_collect if backend == "process" else run_track
+    futures = [
+        loop.run_in_executor(executor, wrapper, func, idx, args)
+        for idx, args in enumerate(args_list)
+    ]
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    for idx, result in enumerate(results):
+        if backend == "process" and not isinstance(result, Exception):
+            result, metrics = result
+            get_metrics().merge(metrics)
+            results[idx] = result
+        if isinstance(result, Exception) and not isinstance(
+            result, TrackProcessingError
+        ):
+            # ошибка пула (например, аварийное завершение процесса)
+            error = TrackProcessingError(idx, str(result))
+            error.__cause__ = result
+            results[idx] = error
+        if not return_exceptions and isinstance(
+            results[idx], TrackProcessingError
+        ):
+            raise results[idx]
+    return results
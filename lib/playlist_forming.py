@@ -2,22 +2,103 @@
 Модуль с пайплайном формирования плейлиста из хайлайтов загруженнх треков.
 """
 
-from typing import Tuple, List
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, Tuple, List
+import librosa as lb
+import numpy as np
 from numpy import ndarray
-from lib.utils import sort_tracks
-from lib.highlight import get_highlights_list
-from lib.crossfade import crossfade_setlist
+from lib.analysis import estimate_tempos, sort_tracks
+from lib.highlight import DEFAULT_TIER, get_highlights_list
+from lib.crossfade import (
+    BLOCK_SIZE,
+    PlaylistBuffer,
+    crossfade_setlist,
+    stream_setlist,
+)
+from lib.metrics import PREFIX, get_metrics
+from lib.parallel import PARALLEL_BACKEND, TrackProcessingError
+
+
+PLAYLIST_TRACKS = f"{PREFIX}_playlist_tracks_total"
+PLAYLIST_SAMPLES = f"{PREFIX}_playlist_samples_total"
+# ключ трека в IncrementalPlaylist: (ключ содержимого, уровень качества,
+# поиск хайлайта по всему треку)
+TrackKey = Tuple[str, str, bool]
+
+
+async def prepare_playlist(
+    data: List[ndarray],
+    sample_rates: List[int | float],
+    workers: int | None = None,
+    backend: str = PARALLEL_BACKEND,
+) -> Tuple[List[ndarray | TrackProcessingError], List[int]]:
+    """
+    Асинхронная функция подготовки плейлиста: треки сортируются по БПМ,
+    затем из каждого выделяется хайлайт.
+    Треки, которые не удалось обработать, пропускаются.
+
+    :param
+    data : List[ndarray]
+        Список с аудиофайлами.
+    sample_rates : List[int | float]
+        Список частот дискретизации переданных треков.
+    workers : int | None = None
+        Количество параллельных исполнителей,
+        см. lib.parallel.gather_tracks.
+    backend : str = PARALLEL_BACKEND
+        Тип пула исполнителей: "process" или "thread".
+    :return:
+    highlights : List[ndarray | TrackProcessingError]
+        Хайлайты треков в исходном порядке.
+    selected_idxs : List[int]
+        Индексы успешно обработанных треков в порядке следования
+        в плейлисте.
+    """
+    selected_idxs = await sort_tracks(
+        data,
+        sample_rates,
+        workers=workers,
+        backend=backend,
+    )
+    await asyncio.sleep(0)
+    highlights = await get_highlights_list(
+        data,
+        sample_rates,
+        workers=workers,
+        backend=backend,
+        return_exceptions=True,
+    )
+    errors = [
+        highlight for highlight in highlights
+        if isinstance(highlight, TrackProcessingError)
+    ]
+    for error in errors:
+        logging.warning("Track skipped from playlist. %s", error)
+    selected_idxs = [
+        idx for idx in selected_idxs
+        if not isinstance(highlights[idx], TrackProcessingError)
+    ]
+    if not selected_idxs:
+        raise errors[0] if errors else ValueError("No tracks to process")
+    await asyncio.sleep(0)
+    return highlights, selected_idxs
 
 
 async def playlist_pipeline(
     data: List[ndarray],
     sample_rates: List[int | float],
     cross_len: int | float = 5,
+    workers: int | None = None,
+    backend: str = PARALLEL_BACKEND,
 ) -> Tuple[List[ndarray] | ndarray, int | float]:
     """
     Асинхронная функция по созданию плейлиста из выбранных треков.
     Сначала треки сортируются по БПМ, затем из каждого выделяется хайлайт,
     после чего список хайлайтов склеивается с указанным перекрытием.
+    Треки, которые не удалось обработать, пропускаются.
+    Все вычисления исполняются вне цикла событий, а между этапами
+    пайплайна есть точки отмены.
 
     :param
     data : List[ndarray]
@@ -26,24 +107,406 @@ async def playlist_pipeline(
         Список частот дискретизации переданных треков.
     cross_len : int | float = 5
         Длина перекрытия треков при их склейке в секундах.
+    workers : int | None = None
+        Количество параллельных исполнителей,
+        см. lib.parallel.gather_tracks.
+    backend : str = PARALLEL_BACKEND
+        Тип пула исполнителей: "process" или "thread".
     :return:
     data_merged : numpy.ndarray
         ndarray со склеенными хайлайтами переданных треков.
     sample_rate : int | float
         sample rate конечного аудиофайла с плейлистом.
     """
-    selected_idxs = await sort_tracks(
+    highlights, selected_idxs = await prepare_playlist(
         data,
         sample_rates,
+        workers=workers,
+        backend=backend,
     )
-    data = await get_highlights_list(
-        data,
+    data_merged, sample_rate = await crossfade_setlist(
+        highlights,
         sample_rates,
+        selected_idxs,
+        cross_len,
     )
-    data_merged, sample_rate = await crossfade_setlist(
+    return data_merged, sample_rate
+
+
+async def playlist_pipeline_stream(
+    data: List[ndarray],
+    sample_rates: List[int | float],
+    cross_len: int | float = 5,
+    workers: int | None = None,
+    backend: str = PARALLEL_BACKEND,
+    block_size: int = BLOCK_SIZE,
+) -> Tuple[AsyncIterator[ndarray], int | float]:
+    """
+    Асинхронная функция по созданию плейлиста из выбранных треков
+    в потоковом режиме: в отличие от playlist_pipeline, склеенный
+    плейлист не собирается в памяти целиком, а отдаётся блоками
+    фиксированного размера, см. lib.crossfade.stream_playlist.
+
+    :param
+    data : List[ndarray]
+        Список с аудиофайлами.
+    sample_rates : List[int | float]
+        Список частот дискретизации переданных треков.
+    cross_len : int | float = 5
+        Длина перекрытия треков при их склейке в секундах.
+    workers : int | None = None
+        Количество параллельных исполнителей,
+        см. lib.parallel.gather_tracks.
+    backend : str = PARALLEL_BACKEND
+        Тип пула исполнителей: "process" или "thread".
+    block_size : int = BLOCK_SIZE
+        Размер блока в сэмплах.
+    :return:
+    blocks : AsyncIterator[ndarray]
+        Асинхронный генератор float32 блоков плейлиста.
+    sample_rate : int | float
+        sample rate конечного аудиофайла с плейлистом.
+    """
+    highlights, selected_idxs = await prepare_playlist(
         data,
         sample_rates,
+        workers=workers,
+        backend=backend,
+    )
+    sample_rate = min(sample_rates[idx] for idx in selected_idxs)
+    blocks = stream_setlist(
+        highlights,
+        sample_rates,
         selected_idxs,
         cross_len,
+        block_size=block_size,
     )
-    return data_merged, sample_rate
+    return blocks, sample_rate
+
+
+class IncrementalPlaylist:
+    """
+    Класс инкрементальной сборки плейлиста, например, для одной
+    сессии приложения. Темп и хайлайт каждого трека вычисляются
+    один раз и хранятся по ключу трека, уровню качества и режиму
+    поиска, поэтому при изменении набора треков обрабатываются только
+    добавленные треки, а при смене уровня или режима треки
+    обрабатываются заново.
+    build пересобирает склейку в памяти через
+    lib.crossfade.PlaylistBuffer, build_stream отдаёт её блоками.
+
+    :param
+    cross_len : int | float = 5
+        Длина перекрытия треков при их склейке в секундах.
+    workers : int | None = None
+        Количество параллельных исполнителей,
+        см. lib.parallel.gather_tracks.
+    backend : str = PARALLEL_BACKEND
+        Тип пула исполнителей: "process" или "thread".
+    """
+
+    def __init__(
+        self,
+        cross_len: int | float = 5,
+        workers: int | None = None,
+        backend: str = PARALLEL_BACKEND,
+    ):
+        """
+        Конструктор класса IncrementalPlaylist.
+
+        :param
+        cross_len : int | float = 5
+            Длина перекрытия треков в секундах.
+        workers : int | None = None
+            Количество параллельных исполнителей.
+        backend : str = PARALLEL_BACKEND
+            Тип пула исполнителей.
+        """
+        self.cross_len = cross_len
+        self.workers = workers
+        self.backend = backend
+        # ключ трека: (темп, хайлайт, частота дискретизации)
+        self._tracks: Dict[TrackKey, Tuple[float, ndarray, int | float]] = {}
+        self._resampled: Dict[Tuple[TrackKey, int | float], ndarray] = {}
+        self._buffer = PlaylistBuffer()
+        self.last_build: Dict[str, int] = {}
+
+    def __contains__(self, key: TrackKey) -> bool:
+        """
+        True, если темп и хайлайт трека уже вычислены для ключа
+        (ключ трека, уровень качества, поиск по всему треку).
+        """
+        return key in self._tracks
+
+    def retain(self, keys: List[str]) -> None:
+        """
+        Функция удаления треков, ключей которых нет в keys,
+        например, после удаления файла пользователем.
+
+        :param
+        keys : List[str]
+            Ключи треков, которые надо сохранить.
+        """
+        keep = set(keys)
+        for key in [key for key in self._tracks if key[0] not in keep]:
+            del self._tracks[key]
+        for key in [
+            key for key in self._resampled if key[0][0] not in keep
+        ]:
+            del self._resampled[key]
+
+    async def _analyse(
+        self,
+        keys: List[TrackKey],
+        data: List[ndarray],
+        sample_rates: List[int | float],
+        tier: str,
+        chunked: bool,
+    ) -> Dict[TrackKey, TrackProcessingError]:
+        """
+        Асинхронная функция оценки темпа и выделения хайлайтов
+        новых треков. Ошибки не сохраняются: трек, который
+        не удалось обработать, обрабатывается заново при следующей
+        сборке, например, после нехватки памяти в исполнителе.
+
+        :return:
+        errors : Dict[TrackKey, TrackProcessingError]
+            Ошибки обработки по ключам треков.
+        """
+        tempos = await estimate_tempos(
+            data, sample_rates, workers=self.workers, backend=self.backend
+        )
+        await asyncio.sleep(0)
+        highlights = await get_highlights_list(
+            data,
+            sample_rates,
+            workers=self.workers,
+            backend=self.backend,
+            return_exceptions=True,
+            chunked=chunked,
+            tier=tier,
+        )
+        errors = {}
+        for key, tempo, highlight, sample_rate in zip(
+            keys, tempos, highlights, sample_rates
+        ):
+            if isinstance(tempo, TrackProcessingError):
+                errors[key] = tempo
+            elif isinstance(highlight, TrackProcessingError):
+                errors[key] = highlight
+            else:
+                self._tracks[key] = (tempo, highlight, sample_rate)
+        return errors
+
+    def _resample(
+        self,
+        key: TrackKey,
+        sample_rate: int | float,
+    ) -> ndarray:
+        """
+        Функция получения хайлайта трека с частотой дискретизации
+        плейлиста, передискретизированный хайлайт сохраняется.
+        """
+        resampled = self._resampled.get((key, sample_rate))
+        if resampled is None:
+            _, highlight, track_sample_rate = self._tracks[key]
+            resampled = lb.resample(
+                y=highlight,
+                orig_sr=track_sample_rate,
+                target_sr=sample_rate,
+            ).astype(np.float32, copy=False)
+            self._resampled[(key, sample_rate)] = resampled
+        return resampled
+
+    def _render(
+        self,
+        keys: List[TrackKey],
+        sample_rate: int | float,
+    ) -> ndarray:
+        """
+        Функция склейки хайлайтов треков в порядке keys.
+        """
+        return self._buffer.render(
+            keys,
+            [self._resample(key, sample_rate) for key in keys],
+            sample_rate,
+            self.cross_len,
+        )
+
+    async def _select(
+        self,
+        keys: List[str],
+        data: List[ndarray],
+        sample_rates: List[int | float],
+        tier: str,
+        chunked: bool,
+    ) -> Tuple[List[TrackKey], int | float, int]:
+        """
+        Асинхронная функция обработки новых треков и выбора
+        порядка треков в плейлисте: треки сортируются по БПМ,
+        треки, которые не удалось обработать, пропускаются.
+
+        :return:
+        selected_keys : List[TrackKey]
+            Ключи треков в порядке следования в плейлисте.
+        sample_rate : int | float
+            sample rate конечного аудиофайла с плейлистом.
+        computed : int
+            Количество треков, обработанных при этой сборке.
+        """
+        track_keys = [(key, tier, chunked) for key in keys]
+        new_idxs = {}
+        for idx, key in enumerate(track_keys):
+            if key not in self._tracks and key not in new_idxs:
+                new_idxs[key] = idx
+        failed = {}
+        if new_idxs:
+            failed = await self._analyse(
+                list(new_idxs),
+                [data[idx] for idx in new_idxs.values()],
+                [sample_rates[idx] for idx in new_idxs.values()],
+                tier,
+                chunked,
+            )
+        await asyncio.sleep(0)
+
+        errors = []
+        selected_idxs = []
+        for idx, key in enumerate(track_keys):
+            if key in failed:
+                # индекс ошибки относится к треку в списке keys,
+                # а не к списку новых треков
+                error = TrackProcessingError(idx, failed[key].msg)
+                error.__cause__ = failed[key].__cause__
+                errors.append(error)
+                logging.warning("Track skipped from playlist. %s", error)
+            else:
+                selected_idxs.append(idx)
+        if not selected_idxs:
+            raise errors[0] if errors else ValueError("No tracks to process")
+        # сортировка стабильна, как в lib.analysis.sort_tracks
+        selected_idxs.sort(key=lambda idx: self._tracks[track_keys[idx]][0])
+        sample_rate = min(sample_rates[idx] for idx in selected_idxs)
+
+        metrics = get_metrics()
+        metrics.inc(PLAYLIST_TRACKS, len(new_idxs), result="computed")
+        metrics.inc(
+            PLAYLIST_TRACKS, len(keys) - len(new_idxs), result="reused"
+        )
+        return (
+            [track_keys[idx] for idx in selected_idxs],
+            sample_rate,
+            len(new_idxs),
+        )
+
+    async def build(
+        self,
+        keys: List[str],
+        data: List[ndarray],
+        sample_rates: List[int | float],
+        tier: str = DEFAULT_TIER,
+        chunked: bool = False,
+    ) -> Tuple[ndarray, int | float]:
+        """
+        Асинхронная функция сборки плейлиста из выбранных треков:
+        треки сортируются по БПМ, хайлайты склеиваются с перекрытием.
+        Треки, которые не удалось обработать, пропускаются.
+        Результат совпадает с playlist_pipeline.
+
+        :param
+        keys : List[str]
+            Ключи треков: треки с одинаковым ключом должны совпадать
+            по содержимому, например, хэш содержимого файла.
+        data : List[ndarray]
+            Список с аудиофайлами.
+        sample_rates : List[int | float]
+            Список частот дискретизации переданных треков.
+        tier : str = DEFAULT_TIER
+            Уровень качества поиска хайлайтов из
+            lib.highlight.HIGHLIGHT_TIERS.
+        chunked : bool = False
+            Если True, хайлайты ищутся по всему треку,
+            см. lib.highlight.get_highlights_list.
+        :return:
+        data_merged : numpy.ndarray
+            Склеенный плейлист. Представление буфера, которое
+            остаётся корректным до следующего вызова build.
+        sample_rate : int | float
+            sample rate конечного аудиофайла с плейлистом.
+        """
+        selected_keys, sample_rate, computed = await self._select(
+            keys, data, sample_rates, tier, chunked
+        )
+        data_merged = await asyncio.to_thread(
+            self._render, selected_keys, sample_rate
+        )
+        self.last_build = {
+            "tracks": len(keys),
+            "tracks_computed": computed,
+            "tracks_reused": len(keys) - computed,
+            **self._buffer.last_build,
+        }
+        metrics = get_metrics()
+        for result in ("in_place", "moved", "rendered"):
+            metrics.inc(
+                PLAYLIST_SAMPLES,
+                self._buffer.last_build[f"samples_{result}"],
+                result=result,
+            )
+        return data_merged, sample_rate
+
+    async def build_stream(
+        self,
+        keys: List[str],
+        data: List[ndarray],
+        sample_rates: List[int | float],
+        tier: str = DEFAULT_TIER,
+        chunked: bool = False,
+        block_size: int = BLOCK_SIZE,
+    ) -> Tuple[AsyncIterator[ndarray], int | float]:
+        """
+        Асинхронная функция сборки плейлиста в потоковом режиме:
+        темп и хайлайты переиспользуются, как в build, но склейка
+        не собирается в буфере целиком, а отдаётся блоками
+        через lib.crossfade.stream_setlist. Пиковая память не растёт
+        с длиной плейлиста, зато переходы смешиваются заново при каждой
+        сборке; смешивание дешевле обработки треков.
+
+        :param
+        keys : List[str]
+            Ключи треков, см. build.
+        data : List[ndarray]
+            Список с аудиофайлами.
+        sample_rates : List[int | float]
+            Список частот дискретизации переданных треков.
+        tier : str = DEFAULT_TIER
+            Уровень качества поиска хайлайтов, см. build.
+        chunked : bool = False
+            Поиск хайлайтов по всему треку, см. build.
+        block_size : int = BLOCK_SIZE
+            Размер блока в сэмплах.
+        :return:
+        blocks : AsyncIterator[ndarray]
+            Асинхронный генератор float32 блоков плейлиста. Блоки
+            корректны, пока треки не удалены через retain.
+        sample_rate : int | float
+            sample rate конечного аудиофайла с плейлистом.
+        """
+        selected_keys, sample_rate, computed = await self._select(
+            keys, data, sample_rates, tier, chunked
+        )
+        entries = [self._tracks[key] for key in selected_keys]
+        blocks = stream_setlist(
+            [highlight for _, highlight, _ in entries],
+            [track_sample_rate for _, _, track_sample_rate in entries],
+            list(range(len(entries))),
+            self.cross_len,
+            block_size=block_size,
+        )
+        self.last_build = {
+            "tracks": len(keys),
+            "tracks_computed": computed,
+            "tracks_reused": len(keys) - computed,
+            "transitions": max(len(entries) - 1, 0),
+        }
+        return blocks, sample_rate
@@ -0,0 +1,206 @@
+"""
+Модуль создания INT8 вариантов весов модели, см. lib.model.MODEL_VARIANTS.
+
+Динамическая квантизация переводит в INT8 только веса, а масштабы
+активаций вычисляются на лету при каждом запуске. Статическая
+квантизация дополнительно фиксирует масштабы активаций по признакам
+калибровочных треков и обычно быстрее, но требует калибровочного набора,
+похожего на реальные данные. Точность вариантов относительно fp32
+проверяется бенчмарком benchmarks.model_variants.
+
+Запуск из корня репозитория:
+    python -m lib.quantization --calibration music/
+"""
+
+import argparse
+import os
+from typing import Dict, Iterator, List
+import numpy as np
+import onnxruntime as rt
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    CalibrationMethod,
+    QuantFormat,
+    QuantType,
+    quantize_dynamic,
+    quantize_static,
+)
+from lib.ingest import decode_audio, list_audio_files
+from lib.model import (
+    MODEL_VARIANTS,
+    REFERENCE_VARIANT,
+    AudioHighlightsModel,
+)
+
+
+CALIBRATION_TRACKS = 32
+
+
+class FeaturesDataReader(CalibrationDataReader):
+    """
+    Класс, передающий признаки калибровочных треков
+    в статическую квантизацию onnxruntime.
+
+    :param
+    input_name : str
+        Имя входного тензора модели.
+    features : List[numpy.ndarray]
+        Признаки треков, см. AudioHighlightsModel.compute_features.
+    """
+
+    def __init__(
+        self,
+        input_name: str,
+        features: List[np.ndarray],
+    ):
+        """
+        Конструктор класса FeaturesDataReader.
+
+        :param
+        input_name : str
+            Имя входного тензора модели.
+        features : List[numpy.ndarray]
+            Признаки треков.
+        """
+        self.input_name = input_name
+        self.features = features
+        self._iterator: Iterator[np.ndarray] = iter(features)
+
+    def get_next(self) -> Dict[str, np.ndarray] | None:
+        """
+        Функция получения входа модели для следующего трека.
+
+        :return:
+        inputs : Dict[str, numpy.ndarray] | None
+            Вход модели или None, если треки закончились.
+        """
+        features = next(self._iterator, None)
+        if features is None:
+            return None
+        return {self.input_name: features.astype(np.float32)}
+
+    def rewind(self) -> None:
+        """
+        Функция возврата к первому треку.
+        """
+        self._iterator = iter(self.features)
+
+
+def load_calibration_features(
+    directory: str,
+    limit: int = CALIBRATION_TRACKS,
+) -> List[np.ndarray]:
+    """
+    Функция выделения признаков калибровочных треков из директории.
+
+    :param
+    directory : str
+        Директория с треками, обходится рекурсивно.
+    limit : int = CALIBRATION_TRACKS
+        Максимальное количество треков.
+    :return:
+    features : List[numpy.ndarray]
+        Признаки треков.
+    """
+    features = []
+    for path in list_audio_files(directory)[:limit]:
+        with open(path, "rb") as audio_file:
+            track = decode_audio(os.path.basename(path), audio_file.read())
+        features.append(AudioHighlightsModel.compute_features(track.audio))
+    return features
+
+
+def quantize_dynamic_weights(
+    source: str,
+    target: str,
+) -> str:
+    """
+    Функция динамической квантизации весов модели в INT8.
+
+    :param
+    source : str
+        Путь к fp32 весам.
+    target : str
+        Путь, по которому сохраняются квантизованные веса.
+    :return:
+    target : str
+        Путь к квантизованным весам.
+    """
+    # ConvInteger на CPU в onnxruntime реализован только для uint8 весов
+    quantize_dynamic(source, target, weight_type=QuantType.QUInt8)
+    return target
+
+
+def quantize_static_weights(
+    source: str,
+    target: str,
+    features: List[np.ndarray],
+) -> str:
+    """
+    Функция статической квантизации весов и активаций модели в INT8
+    с калибровкой по признакам треков.
+
+    :param
+    source : str
+        Путь к fp32 весам.
+    target : str
+        Путь, по которому сохраняются квантизованные веса.
+    features : List[numpy.ndarray]
+        Признаки калибровочных треков.
+    :return:
+    target : str
+        Путь к квантизованным весам.
+    """
+    if not features:
+        raise ValueError("Static quantization needs calibration tracks")
+    input_name = rt.InferenceSession(
+        source, providers=["CPUExecutionProvider"]
+    ).get_inputs()[0].name
+    quantize_static(
+        source,
+        target,
+        FeaturesDataReader(input_name, features),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        calibrate_method=CalibrationMethod.MinMax,
+    )
+    return target
+
+
+def main():
+    """
+    Точка входа квантизации весов.
+    """
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--source", default=MODEL_VARIANTS[REFERENCE_VARIANT]
+    )
+    parser.add_argument(
+        "--calibration",
+        default=None,
+        help="директория с калибровочными треками; без неё создаётся "
+             "только вариант с динамической квантизацией",
+    )
+    parser.add_argument(
+        "--calibration-tracks", type=int, default=CALIBRATION_TRACKS
+    )
+    args = parser.parse_args()
+
+    print(quantize_dynamic_weights(args.source, MODEL_VARIANTS["int8"]))
+    if args.calibration is not None:
+        features = load_calibration_features(
+            args.calibration, args.calibration_tracks
+        )
+        print(
+            quantize_static_weights(
+                args.source, MODEL_VARIANTS["int8-static"], features
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
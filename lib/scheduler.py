@@ -0,0 +1,364 @@
+"""
+Модуль общего для процесса планировщика вычислительных задач
+приложения: выделения хайлайтов и сборки плейлистов.
+
+Streamlit исполняет скрипт каждой сессии в отдельном потоке, поэтому
+без планировщика задачи всех пользователей запускаются одновременно
+и конкурируют за ядра и память. Планировщик ограничивает количество
+одновременно выполняющихся задач и суммарное количество сэмплов
+аудио, которые они обрабатывают. Ожидающие задачи запускаются
+по очереди сессий (round-robin): после запуска задачи сессия
+переходит в конец очереди, поэтому большая загрузка одной сессии,
+разбитая на порции по GROUP_TRACKS треков, не задерживает запрос
+другой сессии дольше, чем на одну порцию.
+"""
+
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from time import perf_counter
+from typing import AsyncIterator, Callable, Deque, Dict, List
+from lib.metrics import PREFIX, get_metrics
+from lib.model import SR
+
+
+MAX_CONCURRENT_JOBS = 2
+# суммарная длительность аудио выполняющихся задач - час с частотой SR;
+# задача больше лимита запускается, только когда других задач нет
+MAX_ACTIVE_SAMPLES = 60 * 60 * SR
+# сколько раз задачу, не помещающуюся в лимит памяти, могут обойти
+# задачи поменьше, прежде чем планировщик будет ждать освобождения
+# памяти для неё
+MAX_BYPASS = 4
+# количество треков в одной порции задачи выделения хайлайтов
+GROUP_TRACKS = 4
+POSITION_UPDATE_SEC = 1.0
+SCHEDULER_PENDING = f"{PREFIX}_scheduler_pending"
+SCHEDULER_RUNNING = f"{PREFIX}_scheduler_running"
+SCHEDULER_SAMPLES = f"{PREFIX}_scheduler_active_samples"
+SCHEDULER_WAIT = f"{PREFIX}_scheduler_wait_seconds"
+
+
+class SchedulerTicket:
+    """
+    Класс заявки на запуск задачи.
+
+    :param
+    session_id : str
+        Идентификатор сессии, поставившей задачу.
+    samples : int
+        Количество сэмплов аудио, которые обрабатывает задача.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        samples: int,
+    ):
+        """
+        Конструктор класса SchedulerTicket. Создаётся в цикле
+        событий, который будет ожидать запуска задачи.
+
+        :param
+        session_id : str
+            Идентификатор сессии.
+        samples : int
+            Количество сэмплов аудио задачи.
+        """
+        self.session_id = session_id
+        self.samples = samples
+        self.created = perf_counter()
+        self.bypassed = 0
+        self.admitted = False
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+
+
+class InferenceScheduler:
+    """
+    Класс планировщика задач с ограничением количества одновременных
+    задач и обрабатываемых сэмплов и очередью сессий.
+
+    :param
+    max_jobs : int = MAX_CONCURRENT_JOBS
+        Максимальное количество одновременно выполняющихся задач.
+    max_samples : int = MAX_ACTIVE_SAMPLES
+        Максимальное суммарное количество сэмплов аудио
+        выполняющихся задач.
+    max_bypass : int = MAX_BYPASS
+        Сколько раз задачу, не помещающуюся в max_samples,
+        могут обойти задачи поменьше.
+    """
+
+    def __init__(
+        self,
+        max_jobs: int = MAX_CONCURRENT_JOBS,
+        max_samples: int = MAX_ACTIVE_SAMPLES,
+        max_bypass: int = MAX_BYPASS,
+    ):
+        """
+        Конструктор класса InferenceScheduler.
+
+        :param
+        max_jobs : int = MAX_CONCURRENT_JOBS
+            Максимальное количество одновременных задач.
+        max_samples : int = MAX_ACTIVE_SAMPLES
+            Максимальное количество сэмплов выполняющихся задач.
+        max_bypass : int = MAX_BYPASS
+            Сколько раз задачу могут обойти задачи поменьше.
+        """
+        if max_jobs < 1:
+            raise ValueError("max_jobs must be positive")
+        self.max_jobs = max_jobs
+        self.max_samples = max_samples
+        self.max_bypass = max_bypass
+        self._lock = threading.Lock()
+        # очереди заявок сессий в порядке обхода
+        self._sessions: OrderedDict[str, Deque[SchedulerTicket]] = (
+            OrderedDict()
+        )
+        self._running: List[SchedulerTicket] = []
+        self.active_samples = 0
+
+    @property
+    def pending(self) -> int:
+        """
+        Количество ожидающих запуска задач.
+        """
+        with self._lock:
+            return sum(len(queue) for queue in self._sessions.values())
+
+    @property
+    def running(self) -> int:
+        """
+        Количество выполняющихся задач.
+        """
+        with self._lock:
+            return len(self._running)
+
+    def _order(self) -> List[SchedulerTicket]:
+        """
+        Функция получения ожидающих заявок в порядке запуска:
+        по одной заявке от каждой сессии по кругу.
+        """
+        queues = list(self._sessions.values())
+        order = []
+        depth = 0
+        while True:
+            layer = [queue[depth] for queue in queues if depth < len(queue)]
+            if not layer:
+                return order
+            order.extend(layer)
+            depth += 1
+
+    def position(self, ticket: SchedulerTicket) -> int | None:
+        """
+        Функция получения позиции заявки в очереди.
+
+        :param
+        ticket : SchedulerTicket
+            Заявка.
+        :return:
+        position : int | None
+            Количество заявок, которые будут запущены раньше.
+            None - задача уже запущена или заявка отменена.
+        """
+        with self._lock:
+            try:
+                return self._order().index(ticket)
+            except ValueError:
+                return None
+
+    def _remove(self, ticket: SchedulerTicket) -> bool:
+        """
+        Функция удаления заявки из очереди её сессии.
+        """
+        queue = self._sessions.get(ticket.session_id)
+        if queue is None or ticket not in queue:
+            return False
+        queue.remove(ticket)
+        if not queue:
+            del self._sessions[ticket.session_id]
+        return True
+
+    def _dispatch(self) -> None:
+        """
+        Функция запуска ожидающих задач, для которых есть место.
+        Вызывается под блокировкой.
+        """
+        while len(self._running) < self.max_jobs:
+            order = self._order()
+            admitted = None
+            for idx, ticket in enumerate(order):
+                if (
+                    not self._running
+                    or self.active_samples + ticket.samples
+                    <= self.max_samples
+                ):
+                    admitted = ticket
+                    break
+                if ticket.bypassed >= self.max_bypass:
+                    # ждём освобождения памяти для этой задачи
+                    break
+            if admitted is None:
+                break
+            for ticket in order[:idx]:
+                ticket.bypassed += 1
+            self._remove(admitted)
+            try:
+                admitted._loop.call_soon_threadsafe(admitted._event.set)
+            except RuntimeError:
+                # цикл событий сессии уже закрыт, задача не нужна
+                continue
+            if admitted.session_id in self._sessions:
+                # сессия уступает очередь остальным
+                self._sessions.move_to_end(admitted.session_id)
+            admitted.admitted = True
+            self._running.append(admitted)
+            self.active_samples += admitted.samples
+            get_metrics().observe(
+                SCHEDULER_WAIT, perf_counter() - admitted.created
+            )
+        self._record()
+
+    def _record(self) -> None:
+        """
+        Функция записи состояния планировщика в метрики.
+        Вызывается под блокировкой.
+        """
+        metrics = get_metrics()
+        metrics.set(
+            SCHEDULER_PENDING,
+            sum(len(queue) for queue in self._sessions.values()),
+        )
+        metrics.set(SCHEDULER_RUNNING, len(self._running))
+        metrics.set(SCHEDULER_SAMPLES, self.active_samples)
+
+    def submit(
+        self,
+        session_id: str,
+        samples: int,
+    ) -> SchedulerTicket:
+        """
+        Функция постановки задачи в очередь. Вызывается из цикла
+        событий, который будет ожидать запуска задачи.
+
+        :param
+        session_id : str
+            Идентификатор сессии.
+        samples : int
+            Количество сэмплов аудио, которые обрабатывает задача.
+        :return:
+        ticket : SchedulerTicket
+            Заявка на запуск задачи.
+        """
+        ticket = SchedulerTicket(session_id, samples)
+        with self._lock:
+            self._sessions.setdefault(session_id, deque()).append(ticket)
+            self._dispatch()
+        return ticket
+
+    def release(self, ticket: SchedulerTicket) -> None:
+        """
+        Функция завершения задачи или отмены заявки.
+
+        :param
+        ticket : SchedulerTicket
+            Заявка.
+        """
+        with self._lock:
+            if ticket in self._running:
+                self._running.remove(ticket)
+                self.active_samples -= ticket.samples
+            else:
+                self._remove(ticket)
+            self._dispatch()
+
+    async def wait(
+        self,
+        ticket: SchedulerTicket,
+        on_position: Callable[[int], None] | None = None,
+    ) -> None:
+        """
+        Асинхронная функция ожидания запуска задачи.
+
+        :param
+        ticket : SchedulerTicket
+            Заявка.
+        on_position : Callable[[int], None] | None = None
+            Функция, которой раз в POSITION_UPDATE_SEC секунд
+            передаётся позиция заявки в очереди, см. position.
+        """
+        while not ticket._event.is_set():
+            position = self.position(ticket)
+            if on_position is not None and position is not None:
+                on_position(position)
+            try:
+                await asyncio.wait_for(
+                    ticket._event.wait(), POSITION_UPDATE_SEC
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        session_id: str,
+        samples: int,
+        on_position: Callable[[int], None] | None = None,
+    ) -> AsyncIterator[SchedulerTicket]:
+        """
+        Асинхронный контекстный менеджер выполнения задачи:
+        ожидает запуска задачи, а при выходе освобождает место
+        или отменяет заявку.
+
+        :param
+        session_id : str
+            Идентификатор сессии.
+        samples : int
+            Количество сэмплов аудио, которые обрабатывает задача.
+        on_position : Callable[[int], None] | None = None
+            Функция, которой передаётся позиция заявки в очереди.
+        """
+        ticket = self.submit(session_id, samples)
+        try:
+            await self.wait(ticket, on_position)
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Состояние планировщика: количество ожидающих
+        и выполняющихся задач и сэмплов в обработке.
+        """
+        with self._lock:
+            return {
+                "pending": sum(
+                    len(queue) for queue in self._sessions.values()
+                ),
+                "running": len(self._running),
+                "active_samples": self.active_samples,
+            }
+
+
+_SCHEDULER: InferenceScheduler | None = None
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def get_inference_scheduler() -> InferenceScheduler:
+    """
+    Функция получения общего для процесса планировщика задач.
+
+    :return:
+    scheduler : InferenceScheduler
+        Планировщик с ограничениями MAX_CONCURRENT_JOBS
+        и MAX_ACTIVE_SAMPLES.
+    """
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = InferenceScheduler()
+        return _SCHEDULER
@@ -0,0 +1,661 @@
+"""
+Модуль с общим для процесса пулом ONNX-сессий.
+
+Веса модели загружаются в rt.InferenceSession один раз на процесс
+(или не более POOL_SIZE раз), после чего сессии переиспользуются всеми
+вызовами выделения хайлайтов и всеми сессиями Streamlit.
+
+Граф модели оптимизируется onnxruntime при первой загрузке и сохраняется
+в приватный каталог кэша пользователя, поэтому следующие процессы
+загружают уже оптимизированную модель. Рядом с ней сохраняются хэши
+исходных весов и самой оптимизированной модели, которые проверяются
+перед загрузкой. Вход и выход сессии привязываются к заранее выделенным float32
+буферам (I/O binding), которые переиспользуются между вызовами
+с одинаковой формой входа.
+"""
+
+import hashlib
+import json
+import os
+import platform
+import queue
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Dict, Iterator, Tuple
+import numpy as np
+import onnxruntime as rt
+from lib.cache import CACHE_ROOT, model_version, private_directory
+from lib.metrics import PREFIX, get_metrics
+from lib.utils import NotSupportedModelException
+
+
+POOL_SIZE = 2
+INTRA_OP_NUM_THREADS = 2
+# переменные окружения с настройками пулов, создаваемых
+# get_session_pool; через окружение настройки передаются
+# и процессам-исполнителям
+POOL_SIZE_ENV = "AUDIO_HIGHLIGHT_POOL_SIZE"
+INTRA_OP_NUM_THREADS_ENV = "AUDIO_HIGHLIGHT_INTRA_OP_THREADS"
+INTER_OP_NUM_THREADS = 1
+GRAPH_OPTIMIZATION_LEVEL = rt.GraphOptimizationLevel.ORT_ENABLE_ALL
+# каталог оптимизированных моделей, None отключает их сохранение
+OPTIMIZED_MODEL_DIR = os.path.join(CACHE_ROOT, "ort")
+# количество форм входа, для которых у сессии хранятся буферы
+IO_BUFFERS_PER_SESSION = 8
+POOL_LOADS = f"{PREFIX}_session_pool_loads_total"
+POOL_LOAD_SECONDS = f"{PREFIX}_session_pool_load_seconds"
+POOL_HITS = f"{PREFIX}_session_pool_hits_total"
+POOL_WAITS = f"{PREFIX}_session_pool_waits_total"
+POOL_WAIT_SECONDS = f"{PREFIX}_session_pool_wait_seconds"
+POOL_SESSIONS = f"{PREFIX}_session_pool_sessions"
+
+
+def optimized_model_path(
+    weights_path: str,
+    optimization_level: rt.GraphOptimizationLevel = GRAPH_OPTIMIZATION_LEVEL,
+) -> str:
+    """
+    Функция получения пути к оптимизированной модели на диске.
+    Оптимизированный граф зависит от весов, версии onnxruntime,
+    уровня оптимизации и архитектуры процессора, поэтому все они
+    входят в имя файла.
+
+    :param
+    weights_path : str
+        Путь к .onnx файлу с весами модели.
+    optimization_level : rt.GraphOptimizationLevel
+        Уровень оптимизации графа.
+    :return:
+    path : str
+        Путь к оптимизированной модели.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(
+        ":".join(
+            [rt.__version__, str(optimization_level), platform.machine()]
+        ).encode()
+    )
+    return os.path.join(
+        OPTIMIZED_MODEL_DIR,
+        f"{model_version(weights_path)}-{digest.hexdigest()}.onnx",
+    )
+
+
+def bind_optimized_model(
+    path: str,
+    weights_path: str,
+) -> None:
+    """
+    Функция привязки оптимизированной модели к исходным весам:
+    рядом с моделью сохраняются хэши исходных весов и самой модели.
+
+    :param
+    path : str
+        Путь к оптимизированной модели.
+    weights_path : str
+        Путь к .onnx файлу с исходными весами модели.
+    """
+    binding = {
+        "weights": model_version(weights_path),
+        "model": model_version(path),
+    }
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.json.tmp"
+    with open(tmp_path, "w") as binding_file:
+        json.dump(binding, binding_file)
+    os.replace(tmp_path, f"{path}.json")
+
+
+def check_optimized_model(
+    path: str,
+    weights_path: str,
+) -> bool:
+    """
+    Функция проверки, что оптимизированная модель построена
+    из исходных весов и не изменялась после сохранения.
+
+    :param
+    path : str
+        Путь к оптимизированной модели.
+    weights_path : str
+        Путь к .onnx файлу с исходными весами модели.
+    :return:
+    valid : bool
+        Совпадают ли хэши весов и модели с сохранёнными
+        в bind_optimized_model.
+    """
+    try:
+        with open(f"{path}.json") as binding_file:
+            binding = json.load(binding_file)
+        return (
+            binding.get("weights") == model_version(weights_path)
+            and binding.get("model") == model_version(path)
+        )
+    except (OSError, ValueError, AttributeError):
+        return False
+
+
+class IOBuffers:
+    """
+    Класс привязки входа и выхода сессии к заранее выделенным буферам
+    для одной формы входа. Вызывающий код заполняет input на месте,
+    а run возвращает буфер выхода, который перезаписывается
+    следующим вызовом.
+
+    :param
+    session : rt.InferenceSession
+        Сессия onnxruntime.
+    shape : Tuple[int, ...]
+        Форма входного тензора.
+    """
+
+    def __init__(
+        self,
+        session: rt.InferenceSession,
+        shape: Tuple[int, ...],
+    ):
+        """
+        Конструктор класса IOBuffers.
+
+        :param
+        session : rt.InferenceSession
+            Сессия onnxruntime.
+        shape : Tuple[int, ...]
+            Форма входного тензора.
+        """
+        self._session = session
+        self._input_name = session.get_inputs()[0].name
+        self._output_name = session.get_outputs()[0].name
+        self.input = np.zeros(shape, dtype=np.float32)
+        self.output: np.ndarray | None = None
+        self._binding = session.io_binding()
+
+    def run(self) -> np.ndarray:
+        """
+        Функция запуска сессии на текущем содержимом input.
+
+        :return:
+        output : numpy.ndarray
+            Буфер первого выхода модели.
+        """
+        # привязка входа не копирует буфер, но обновляется перед каждым
+        # запуском, чтобы onnxruntime видел изменённое содержимое
+        self._binding.bind_cpu_input(self._input_name, self.input)
+        if self.output is None:
+            # форма выхода известна только после первого запуска,
+            # дальше onnxruntime пишет выход сразу в self.output
+            self._binding.bind_output(self._output_name, "cpu")
+            self._session.run_with_iobinding(self._binding)
+            self.output = np.ascontiguousarray(
+                self._binding.copy_outputs_to_cpu()[0]
+            )
+            self._binding.clear_binding_outputs()
+            self._binding.bind_output(
+                self._output_name,
+                "cpu",
+                0,
+                self.output.dtype.type,
+                list(self.output.shape),
+                self.output.ctypes.data,
+            )
+            return self.output
+        self._session.run_with_iobinding(self._binding)
+        return self.output
+
+
+class InferenceSessionPool:
+    """
+    Потокобезопасный пул сессий onnxruntime для одного файла весов.
+
+    Сессии создаются лениво: новая сессия загружается только если все
+    уже загруженные заняты и размер пула ещё не достигнут, иначе
+    вызывающий поток ждёт освобождения сессии. У каждой сессии есть
+    свои буферы ввода-вывода, см. buffers.
+
+    :param
+    weights_path : str
+        Путь к .onnx файлу с весами модели.
+    size : int = POOL_SIZE
+        Максимальное количество одновременно загруженных сессий.
+    intra_op_num_threads : int = INTRA_OP_NUM_THREADS
+        Количество потоков внутри одного оператора графа.
+    inter_op_num_threads : int = INTER_OP_NUM_THREADS
+        Количество потоков для параллельного исполнения операторов.
+    optimization_level : rt.GraphOptimizationLevel
+        Уровень оптимизации графа, по умолчанию GRAPH_OPTIMIZATION_LEVEL.
+    """
+
+    def __init__(
+        self,
+        weights_path: str,
+        size: int = POOL_SIZE,
+        intra_op_num_threads: int = INTRA_OP_NUM_THREADS,
+        inter_op_num_threads: int = INTER_OP_NUM_THREADS,
+        optimization_level: rt.GraphOptimizationLevel = (
+            GRAPH_OPTIMIZATION_LEVEL
+        ),
+    ):
+        """
+        Конструктор класса InferenceSessionPool.
+
+        :param
+        weights_path : str
+            Путь к .onnx файлу с весами модели.
+        size : int = POOL_SIZE
+            Максимальное количество одновременно загруженных сессий.
+        intra_op_num_threads : int = INTRA_OP_NUM_THREADS
+            Количество потоков внутри одного оператора графа.
+        inter_op_num_threads : int = INTER_OP_NUM_THREADS
+            Количество потоков для параллельного исполнения операторов.
+        optimization_level : rt.GraphOptimizationLevel
+            Уровень оптимизации графа.
+        """
+        if size < 1:
+            raise ValueError("Session pool size must be positive")
+        self.weights_path = weights_path
+        # метка пула в метриках
+        self.model_label = os.path.basename(weights_path)
+        self.size = size
+        self.intra_op_num_threads = intra_op_num_threads
+        self.inter_op_num_threads = inter_op_num_threads
+        self.optimization_level = optimization_level
+
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._input_name: str | None = None
+        self._buffers: Dict[int, OrderedDict] = {}
+
+        self.loads = 0
+        self.load_time_sec = 0.0
+        self.hits = 0
+        self.waits = 0
+
+    def _session_options(
+        self,
+        optimized: bool = False,
+    ) -> rt.SessionOptions:
+        """
+        Функция формирования настроек сессии onnxruntime.
+
+        :param
+        optimized : bool = False
+            Загружается ли уже оптимизированная модель: для неё
+            оптимизация графа отключается.
+        :return:
+        options : rt.SessionOptions
+            Настройки сессии с явно заданными количеством потоков,
+            уровнем оптимизации графа и настройками памяти.
+        """
+        options = rt.SessionOptions()
+        options.intra_op_num_threads = self.intra_op_num_threads
+        options.inter_op_num_threads = self.inter_op_num_threads
+        options.execution_mode = rt.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = (
+            rt.GraphOptimizationLevel.ORT_DISABLE_ALL
+            if optimized
+            else self.optimization_level
+        )
+        # арена и планирование памяти по форме входа окупаются
+        # при повторяющихся формах, например окнах lib.model.run_stream
+        options.enable_cpu_mem_arena = True
+        options.enable_mem_pattern = True
+        return options
+
+    def _create_session(self) -> rt.InferenceSession:
+        """
+        Функция создания сессии. Если оптимизированная модель уже
+        сохранена на диск, загружается она, иначе граф оптимизируется
+        и результат сохраняется для следующих загрузок.
+
+        :return:
+        session : rt.InferenceSession
+            Созданная сессия.
+        """
+        providers = ["CPUExecutionProvider"]
+        if OPTIMIZED_MODEL_DIR is None:
+            return rt.InferenceSession(
+                self.weights_path,
+                sess_options=self._session_options(),
+                providers=providers,
+            )
+
+        path = optimized_model_path(
+            self.weights_path, self.optimization_level
+        )
+        if check_optimized_model(path, self.weights_path):
+            try:
+                return rt.InferenceSession(
+                    path,
+                    sess_options=self._session_options(optimized=True),
+                    providers=providers,
+                )
+            except Exception:
+                # повреждённый файл оптимизированной модели
+                # пересоздаётся из исходных весов
+                pass
+        for stale_path in (path, f"{path}.json"):
+            try:
+                os.remove(stale_path)
+            except OSError:
+                pass
+
+        try:
+            private_directory(OPTIMIZED_MODEL_DIR)
+        except OSError:
+            # каталог недоступен: модель оптимизируется в памяти
+            return rt.InferenceSession(
+                self.weights_path,
+                sess_options=self._session_options(),
+                providers=providers,
+            )
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        options = self._session_options()
+        options.optimized_model_filepath = tmp_path
+        session = rt.InferenceSession(
+            self.weights_path,
+            sess_options=options,
+            providers=providers,
+        )
+        try:
+            os.replace(tmp_path, path)
+            bind_optimized_model(path, self.weights_path)
+        except OSError:
+            pass
+        return session
+
+    def _load_session(self) -> rt.InferenceSession:
+        """
+        Функция загрузки новой сессии с весами модели.
+
+        :return:
+        session : rt.InferenceSession
+            Загруженная сессия.
+        """
+        start = perf_counter()
+        try:
+            session = self._create_session()
+        except Exception as e:
+            with self._lock:
+                self._created -= 1
+            raise NotSupportedModelException(
+                model=self.weights_path,
+                msg=str(e)
+            ) from e
+        elapsed = perf_counter() - start
+        metrics = get_metrics()
+        metrics.inc(POOL_LOADS, model=self.model_label)
+        metrics.observe(POOL_LOAD_SECONDS, elapsed, model=self.model_label)
+        with self._lock:
+            self.loads += 1
+            self.load_time_sec += elapsed
+            self._buffers[id(session)] = OrderedDict()
+            if self._input_name is None:
+                self._input_name = session.get_inputs()[0].name
+        return session
+
+    def buffers(
+        self,
+        session: rt.InferenceSession,
+        shape: Tuple[int, ...],
+    ) -> IOBuffers:
+        """
+        Функция получения буферов ввода-вывода сессии для формы входа.
+        Для каждой сессии хранятся буферы не более
+        IO_BUFFERS_PER_SESSION последних форм.
+        Буферами можно пользоваться только пока сессия выдана
+        вызывающему потоку.
+
+        :param
+        session : rt.InferenceSession
+            Сессия, полученная через acquire().
+        shape : Tuple[int, ...]
+            Форма входного тензора.
+        :return:
+        buffers : IOBuffers
+            Буферы ввода-вывода.
+        """
+        with self._lock:
+            cached = self._buffers.setdefault(id(session), OrderedDict())
+        buffers = cached.get(shape)
+        if buffers is None:
+            buffers = IOBuffers(session, shape)
+            cached[shape] = buffers
+            if len(cached) > IO_BUFFERS_PER_SESSION:
+                cached.popitem(last=False)
+        else:
+            cached.move_to_end(shape)
+        return buffers
+
+    def acquire(self) -> rt.InferenceSession:
+        """
+        Функция получения сессии из пула.
+        Свободная сессия считается попаданием, при исчерпании пула
+        вызывающий поток блокируется до освобождения сессии.
+
+        :return:
+        session : rt.InferenceSession
+            Сессия, которую необходимо вернуть через release().
+        """
+        try:
+            session = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                return self._load_session()
+            start = perf_counter()
+            session = self._idle.get()
+            metrics = get_metrics()
+            metrics.inc(POOL_WAITS, model=self.model_label)
+            metrics.observe(
+                POOL_WAIT_SECONDS,
+                perf_counter() - start,
+                model=self.model_label,
+            )
+            with self._lock:
+                self.waits += 1
+        get_metrics().inc(POOL_HITS, model=self.model_label)
+        with self._lock:
+            self.hits += 1
+        return session
+
+    def release(self, session: rt.InferenceSession) -> None:
+        """
+        Функция возврата сессии в пул.
+
+        :param
+        session : rt.InferenceSession
+            Сессия, полученная через acquire().
+        """
+        self._idle.put(session)
+
+    @contextmanager
+    def session(self) -> Iterator[rt.InferenceSession]:
+        """
+        Контекстный менеджер, выдающий сессию из пула
+        и возвращающий её обратно по выходу из блока.
+        """
+        session = self.acquire()
+        try:
+            yield session
+        finally:
+            self.release(session)
+
+    @property
+    def input_name(self) -> str:
+        """
+        Имя входного тензора модели.
+        """
+        if self._input_name is None:
+            with self.session():
+                pass
+        return self._input_name
+
+    @property
+    def stats(self) -> Dict[str, int | float]:
+        """
+        Счётчики пула: количество и суммарное время загрузок весов,
+        количество переиспользований и ожиданий свободной сессии.
+        """
+        with self._lock:
+            return {
+                "weights_path": self.weights_path,
+                "size": self.size,
+                "sessions": self._created,
+                "loads": self.loads,
+                "load_time_sec": self.load_time_sec,
+                "hits": self.hits,
+                "waits": self.waits,
+            }
+
+
+def _env_int(name: str, default: int) -> int:
+    """
+    Функция чтения положительного целого числа из переменной окружения.
+    """
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(
+            f"{name} must be an integer, got {value!r}"
+        ) from None
+    if number < 1:
+        raise ValueError(f"{name} must be positive, got {number}")
+    return number
+
+
+_POOLS: Dict[str, InferenceSessionPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_session_pool(weights_path: str) -> InferenceSessionPool:
+    """
+    Функция получения общего для процесса пула сессий
+    для переданного файла весов. Размер пула и количество потоков
+    оператора берутся из переменных окружения POOL_SIZE_ENV
+    и INTRA_OP_NUM_THREADS_ENV, а без них - POOL_SIZE
+    и INTRA_OP_NUM_THREADS.
+
+    :param
+    weights_path : str
+        Путь к .onnx файлу с весами модели.
+    :return:
+    pool : InferenceSessionPool
+        Пул сессий.
+    """
+    with _POOLS_LOCK:
+        pool = _POOLS.get(weights_path)
+        if pool is None:
+            pool = InferenceSessionPool(
+                weights_path,
+                size=_env_int(POOL_SIZE_ENV, POOL_SIZE),
+                intra_op_num_threads=_env_int(
+                    INTRA_OP_NUM_THREADS_ENV, INTRA_OP_NUM_THREADS
+                ),
+            )
+            _POOLS[weights_path] = pool
+        return pool
+
+
+def configure_from_args(
+    pool_size: int | None = None,
+    intra_op_threads: int | None = None,
+) -> None:
+    """
+    Функция применения настроек пула сессий из аргументов командной
+    строки: значения записываются в переменные окружения POOL_SIZE_ENV
+    и INTRA_OP_NUM_THREADS_ENV, через которые их получают
+    get_session_pool и процессы-исполнители. Окружение не меняется,
+    если хотя бы одно значение некорректно.
+
+    :param
+    pool_size : int | None = None
+        Количество ONNX-сессий в пуле. None - не менять.
+    intra_op_threads : int | None = None
+        Количество потоков внутри одного оператора графа.
+        None - не менять.
+    """
+    settings = (
+        ("pool size", pool_size, POOL_SIZE_ENV),
+        ("intra-op threads", intra_op_threads, INTRA_OP_NUM_THREADS_ENV),
+    )
+    for name, value, _ in settings:
+        if value is not None and value < 1:
+            raise ValueError(f"{name} must be positive, got {value}")
+    for _, value, env in settings:
+        if value is not None:
+            os.environ[env] = str(value)
+
+
+def configure_session_pool(
+    weights_path: str,
+    size: int = POOL_SIZE,
+    intra_op_num_threads: int = INTRA_OP_NUM_THREADS,
+    inter_op_num_threads: int = INTER_OP_NUM_THREADS,
+    optimization_level: rt.GraphOptimizationLevel = GRAPH_OPTIMIZATION_LEVEL,
+) -> InferenceSessionPool:
+    """
+    Функция (пере)создания пула сессий с заданными настройками.
+    Уже выданные сессии старого пула продолжают работать
+    до возврата, после чего удаляются.
+
+    :param
+    weights_path : str
+        Путь к .onnx файлу с весами модели.
+    size : int = POOL_SIZE
+        Максимальное количество одновременно загруженных сессий.
+    intra_op_num_threads : int = INTRA_OP_NUM_THREADS
+        Количество потоков внутри одного оператора графа.
+    inter_op_num_threads : int = INTER_OP_NUM_THREADS
+        Количество потоков для параллельного исполнения операторов.
+    optimization_level : rt.GraphOptimizationLevel
+        Уровень оптимизации графа.
+    :return:
+    pool : InferenceSessionPool
+        Новый пул сессий.
+    """
+    pool = InferenceSessionPool(
+        weights_path,
+        size=size,
+        intra_op_num_threads=intra_op_num_threads,
+        inter_op_num_threads=inter_op_num_threads,
+        optimization_level=optimization_level,
+    )
+    with _POOLS_LOCK:
+        _POOLS[weights_path] = pool
+    return pool
+
+
+def get_session_pool_stats() -> Dict[str, Dict[str, int | float]]:
+    """
+    Функция получения счётчиков всех пулов процесса.
+
+    :return:
+    stats : Dict[str, Dict[str, int | float]]
+        Счётчики пулов по путям к весам.
+    """
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+    return {pool.weights_path: pool.stats for pool in pools}
+
+
+def record_session_pool_metrics() -> None:
+    """
+    Функция записи количества загруженных сессий пулов процесса
+    в метрики. Загрузки, попадания и ожидания пулов записываются
+    в метрики по мере работы, в том числе в процессах-исполнителях.
+    """
+    metrics = get_metrics()
+    for stats in get_session_pool_stats().values():
+        metrics.set(
+            POOL_SESSIONS,
+            stats["sessions"],
+            model=os.path.basename(stats["weights_path"]),
+        )
@@ -0,0 +1,186 @@
+"""
+Модуль политики выбора уровня качества поиска хайлайта под нагрузкой.
+
+Уровни lib.highlight.HIGHLIGHT_TIERS отличаются стоимостью
+и точностью. Пока очередь заданий короткая и обработка быстрая,
+используется полный уровень; когда глубина очереди или сглаженная
+стоимость обработки превышают настроенные пороги, политика выбирает
+более дешёвый уровень, а после спада нагрузки возвращается к полному.
+
+Стоимость обработки - секунды вычислений на секунду аудио без учёта
+ожидания в очереди: ожидание уже учитывается глубиной очереди,
+а нормировка на длительность аудио не даёт одному большому запросу
+перевести политику на дешёвый уровень. Выбранные уровни и сглаженная
+стоимость записываются в метрики.
+"""
+
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Dict, Iterator, Tuple
+from lib.highlight import DEFAULT_TIER, HIGHLIGHT_TIERS, check_tier
+from lib.metrics import PREFIX, get_metrics
+
+
+# уровень, выбираемый политикой по текущей нагрузке
+AUTO_TIER = "auto"
+# пороги перехода на уровень: (глубина очереди, секунды обработки
+# на секунду аудио); уровень выбирается, если превышен любой
+# из порогов, а из нескольких подходящих выбирается самый дешёвый.
+# При стоимости 0.05 трек длительностью 3 минуты обрабатывается 9 секунд
+TIER_THRESHOLDS: Dict[str, Tuple[int, float]] = {
+    "fast": (4, 0.05),
+    "heuristic": (12, 0.15),
+}
+# вес последнего замера в экспоненциальном среднем стоимости
+COST_SMOOTHING = 0.3
+TIERS_TOTAL = f"{PREFIX}_highlight_tiers_total"
+TIER_COST = f"{PREFIX}_tier_cost_seconds_per_audio_second"
+
+
+class TierPolicy:
+    """
+    Класс политики выбора уровня качества по глубине очереди
+    и сглаженной стоимости обработки запросов.
+
+    :param
+    thresholds : Dict[str, Tuple[int, float]] = TIER_THRESHOLDS
+        Пороги перехода на уровни: (глубина очереди, секунды
+        обработки на секунду аудио). Уровни без порогов политикой
+        не выбираются.
+    smoothing : float = COST_SMOOTHING
+        Вес последнего замера в экспоненциальном среднем стоимости.
+    """
+
+    def __init__(
+        self,
+        thresholds: Dict[str, Tuple[int, float]] = TIER_THRESHOLDS,
+        smoothing: float = COST_SMOOTHING,
+    ):
+        """
+        Конструктор класса TierPolicy.
+
+        :param
+        thresholds : Dict[str, Tuple[int, float]] = TIER_THRESHOLDS
+            Пороги перехода на уровни.
+        smoothing : float = COST_SMOOTHING
+            Вес последнего замера стоимости.
+        """
+        for tier in thresholds:
+            check_tier(tier)
+        if not 0 < smoothing <= 1:
+            raise ValueError("smoothing must be in (0, 1]")
+        self.thresholds = dict(thresholds)
+        self.smoothing = smoothing
+        self.cost: float | None = None
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def choose(
+        self,
+        queue_depth: int | None = None,
+        requested: str = AUTO_TIER,
+    ) -> str:
+        """
+        Функция выбора уровня качества для нового запроса.
+
+        :param
+        queue_depth : int | None = None
+            Количество ожидающих запросов. None - количество
+            выполняющихся запросов, см. track.
+        requested : str = AUTO_TIER
+            Запрошенный уровень. Явно запрошенный уровень
+            из HIGHLIGHT_TIERS возвращается без изменений.
+        :return:
+        tier : str
+            Уровень из HIGHLIGHT_TIERS.
+        """
+        if requested == AUTO_TIER:
+            with self._lock:
+                depth = self.active if queue_depth is None else queue_depth
+                cost = self.cost or 0.0
+            tier = DEFAULT_TIER
+            # от самого дешёвого уровня к самому точному
+            for candidate in reversed(HIGHLIGHT_TIERS):
+                if candidate not in self.thresholds:
+                    continue
+                max_depth, max_cost = self.thresholds[candidate]
+                if depth >= max_depth or cost >= max_cost:
+                    tier = candidate
+                    break
+        else:
+            check_tier(requested)
+            tier = requested
+        get_metrics().inc(TIERS_TOTAL, tier=tier, requested=requested)
+        return tier
+
+    def observe(
+        self,
+        processing_sec: float,
+        audio_sec: float,
+    ) -> None:
+        """
+        Функция учёта стоимости обработки завершённого запроса.
+
+        :param
+        processing_sec : float
+            Время обработки запроса в секундах без ожидания в очереди.
+        audio_sec : float
+            Суммарная длительность обработанного аудио в секундах.
+            Запросы без аудио не учитываются.
+        """
+        if audio_sec <= 0:
+            return
+        cost = processing_sec / audio_sec
+        with self._lock:
+            if self.cost is None:
+                self.cost = cost
+            else:
+                self.cost += self.smoothing * (cost - self.cost)
+            cost = self.cost
+        get_metrics().set(TIER_COST, cost)
+
+    @contextmanager
+    def track(
+        self,
+        audio_sec: float,
+    ) -> Iterator[None]:
+        """
+        Контекстный менеджер обработки запроса: на время обработки
+        запрос учитывается в active, а после успешного завершения
+        время обработки передаётся в observe. Ожидание в очереди
+        не должно входить в блок менеджера.
+
+        :param
+        audio_sec : float
+            Суммарная длительность обрабатываемого аудио в секундах.
+        """
+        with self._lock:
+            self.active += 1
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.active -= 1
+        self.observe(perf_counter() - start, audio_sec)
+
+
+_POLICY: TierPolicy | None = None
+_POLICY_LOCK = threading.Lock()
+
+
+def get_tier_policy() -> TierPolicy:
+    """
+    Функция получения общей для процесса политики выбора уровня
+    качества, например, для всех сессий приложения.
+
+    :return:
+    policy : TierPolicy
+        Политика с порогами TIER_THRESHOLDS.
+    """
+    global _POLICY
+    with _POLICY_LOCK:
+        if _POLICY is None:
+            _POLICY = TierPolicy()
+        return _POLICY
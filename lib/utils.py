@@ -2,12 +2,9 @@
 Модуль со вспомогательными функциями и классами
 """
 
-import copy
-import requests
 from typing import List
-import librosa as lb
 import yaml
-from numpy import ndarray
+from lib.window_search import find_top_windows
 
 
 CONFIG_PATH = "lib/config.yaml"
@@ -35,6 +32,7 @@ class NotSupportedModelException(Exception):
         msg : str
             Сообщение при вызове исключения.
         """
+        super().__init__(model, msg)
         self.model = model
         self.msg = msg
 
@@ -76,53 +74,13 @@ class FeedbackMessage:
         return message_string
 
 
-async def sort_tracks(
-    datas: List[ndarray],
-    sample_rates: List[int | float],
-) -> List[int]:
-    """
-    Асинхронная функция сортировки треков по БПМ.
-
-    :param
-    data : List[ndarray]
-        Список с аудиофайлами.
-    sample_rates : List[int | float]
-        Список частот дискретизации переданных треков.
-    :return:
-    indices_new
-        Список индексов отсортированных треков.
-    """
-    datas_local = copy.deepcopy(datas)
-    sample_rates_local = copy.deepcopy(sample_rates)
-
-    indices = list(range(len(datas_local)))
-    tempos = [
-        lb.beat.beat_track(
-            y=datas_local[i],
-            sr=sample_rates_local[i],
-        )[0][0] for i in indices
-    ]
-
-    indices_new = []
-    # Итеративно ищем самый медленный трек
-    # из оставшихся, сохраняем его индекс,
-    # а его самого удаляем отовсюду
-    while len(indices) > 0:
-        cur = tempos.index(min(tempos))
-        indices_new.append(indices[cur])
-        del indices[cur]
-        del tempos[cur]
-        del datas_local[cur]
-        del sample_rates_local[cur]
-    return indices_new
-
-
 def get_max_area_section(
     graph_list: List[float],
     highlight_duration: int,
 ) -> int | float:
     """
     Функция для нахождения области графа с максимальной площадью.
+    Поиск выполняется за линейное время, см. lib.window_search.
 
     :param
     graph_list : List[float]
@@ -132,31 +90,8 @@ def get_max_area_section(
     :return:
     highlight_start : int
         Индекс элемента graph_list, откуда начинается хайлайт.
+        Если хайлайт длиннее предсказания, - 0.
     """
-    highlight_start = 0
-    max_area = 0.0
-    for i in range(len(graph_list) - highlight_duration):
-        cur_area = sum(graph_list[i:i + highlight_duration])
-        if cur_area > max_area:
-            highlight_start = i
-            max_area = cur_area
-    return highlight_start
-
-
-def send_telegram_message(message: FeedbackMessage | str) -> None:
-    """
-    Функция отправки сообщений с помощью telegram-бота
-
-    :param
-    message:FeedbackMessage | str
-        Сообщение, которое надо передать в telegram-бот
-    """
-    url = f"https://api.telegram.org/bot{CONFIG['TELEGRAM_BOT_TOKEN']}/sendMessage"
-    params = {
-        "chat_id": CONFIG["TELEGRAM_CHAT_ID"],
-        "text": message
-    }
-    requests.post(
-        url=url, 
-        params=params,
-    )
+    if highlight_duration >= len(graph_list):
+        return 0
+    return int(find_top_windows(graph_list, highlight_duration)[0].start_sec)
@@ -1,90 +1,628 @@
 """
 Модуль с Watchdog-ботом, следящим за статусом докер-контейнеров сервиса.
+
+Бот опрашивает Docker Engine API с заданным интервалом, а поток событий
+Docker будит его раньше, если у контейнеров что-то произошло.
+Сообщение в телеграм отправляется, только если новый статус держится
+дольше DEBOUNCE_SEC, поэтому кратковременные переходы статуса
+не приводят к лавине уведомлений. Кроме статуса отслеживаются
+перезапуски контейнеров и превышение порогов загрузки CPU и памяти.
+
+Для проверки бота без Docker его можно направить на локальный
+поддельный Docker API, см. benchmarks.watchdog_drill.
+
+Запуск из корня репозитория:
+    python -m lib.watchdog_service --interval 15 --debounce 30
 """
-import os
-import logging
-import docker
+
+import argparse
 import asyncio
-from watchdog.observers.polling import PollingObserver
-from watchdog.events import FileSystemEventHandler
-from utils import send_telegram_message
+import json
+import logging
+import signal
+from time import monotonic
+from typing import Any, AsyncIterator, Callable, Dict, List, Tuple
+import aiohttp
+from lib.notifications import notify
 
 
-# Инициализация клиента Docker
-client = docker.from_env()
-DOCKER_CONTAINER_NAMES = {
-    "app": None,
-    "nginx-entrypoint": None,
-}
+DOCKER_URL = "unix:///var/run/docker.sock"
+DOCKER_CONTAINER_NAMES = ("app", "api", "nginx-entrypoint")
+POLL_INTERVAL_SEC = 15
+DEBOUNCE_SEC = 30
+CPU_ALERT_PERCENT = 90
+MEMORY_ALERT_PERCENT = 90
+REQUEST_TIMEOUT_SEC = 10
+EVENTS_RETRY_SEC = 5
+# статус контейнера, который не найден или недоступен
+MISSING_STATUS = "missing"
 
 
-class DockerContainerHandler(FileSystemEventHandler):
+class DockerAPI:
     """
-    Класс обработчика событий смены статусов контейнеров
+    Класс асинхронного клиента Docker Engine API.
+    Используется как асинхронный контекстный менеджер.
+
+    :param
+    url : str = DOCKER_URL
+        Адрес Docker API: unix:///путь/к/сокету, tcp://хост:порт
+        или http://хост:порт.
+    timeout : float = REQUEST_TIMEOUT_SEC
+        Таймаут запросов состояния контейнеров в секундах.
     """
-    def on_modified(self, event):
+
+    def __init__(
+        self,
+        url: str = DOCKER_URL,
+        timeout: float = REQUEST_TIMEOUT_SEC,
+    ):
         """
-        Метод обработки событий в случае изменения статусов контейнеров
+        Конструктор класса DockerAPI.
+
+        :param
+        url : str = DOCKER_URL
+            Адрес Docker API.
+        timeout : float = REQUEST_TIMEOUT_SEC
+            Таймаут запросов в секундах.
         """
-        for key, value in DOCKER_CONTAINER_NAMES.items():
-            msg = f"Checking container {key} on modified."
-            try:
-                container = client.containers.get(key)
-            except Exception as e:
-                msg += (
-                    f"\nThere is no running containers with name {key}!\n"
-                    f"Something happened, check server!"
+        self.url = url
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session: aiohttp.ClientSession | None = None
+
+    async def __aenter__(self) -> "DockerAPI":
+        if self.url.startswith("unix://"):
+            connector = aiohttp.UnixConnector(path=self.url[len("unix://"):])
+            self._base_url = "http://docker"
+        else:
+            connector = aiohttp.TCPConnector()
+            self._base_url = "http://" + self.url.split("://", 1)[-1]
+        self._session = aiohttp.ClientSession(connector=connector)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._session.close()
+
+    async def inspect(self, name: str) -> Dict[str, Any] | None:
+        """
+        Асинхронная функция получения описания контейнера.
+
+        :param
+        name : str
+            Имя контейнера.
+        :return:
+        info : Dict[str, Any] | None
+            Описание контейнера или None, если контейнер не найден.
+        """
+        async with self._session.get(
+            f"{self._base_url}/containers/{name}/json",
+            timeout=self.timeout,
+        ) as response:
+            if response.status == 404:
+                return None
+            response.raise_for_status()
+            return await response.json()
+
+    async def stats(self, name: str) -> Dict[str, Any]:
+        """
+        Асинхронная функция получения одного снимка потребления
+        ресурсов контейнера.
+
+        :param
+        name : str
+            Имя контейнера.
+        :return:
+        stats : Dict[str, Any]
+            Снимок статистики контейнера.
+        """
+        async with self._session.get(
+            f"{self._base_url}/containers/{name}/stats",
+            params={"stream": "false", "one-shot": "true"},
+            timeout=self.timeout,
+        ) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def events(
+        self,
+        names: Tuple[str, ...],
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Асинхронный генератор событий переданных контейнеров.
+
+        :param
+        names : Tuple[str, ...]
+            Имена контейнеров.
+        :return:
+        events : AsyncIterator[Dict[str, Any]]
+            События Docker в порядке поступления. Строки, которые
+            не являются JSON-объектом, пропускаются.
+        """
+        filters = json.dumps({"type": ["container"], "container": names})
+        async with self._session.get(
+            f"{self._base_url}/events",
+            params={"filters": filters},
+            timeout=aiohttp.ClientTimeout(total=None),
+        ) as response:
+            response.raise_for_status()
+            async for line in response.content:
+                if not line.strip():
+                    continue
+                # повреждённая строка пропускается, а не обрывает поток
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    logging.warning("Malformed Docker event: %r", line[:200])
+                    continue
+                if isinstance(event, dict):
+                    yield event
+
+
+class DebouncedValue:
+    """
+    Класс значения, изменение которого подтверждается, только если
+    новое значение наблюдается непрерывно в течение заданного времени.
+
+    :param
+    value : Any = None
+        Начальное подтверждённое значение.
+    """
+
+    def __init__(self, value: Any = None):
+        """
+        Конструктор класса DebouncedValue.
+
+        :param
+        value : Any = None
+            Начальное подтверждённое значение.
+        """
+        self.value = value
+        self._pending: Any = None
+        self._since = 0.0
+
+    def update(
+        self,
+        value: Any,
+        now: float,
+        delay: float,
+    ) -> bool:
+        """
+        Функция учёта нового наблюдения.
+
+        :param
+        value : Any
+            Наблюдаемое значение.
+        now : float
+            Время наблюдения в секундах.
+        delay : float
+            Время, в течение которого значение должно держаться.
+        :return:
+        changed : bool
+            True, если подтверждённое значение изменилось.
+        """
+        if value == self.value:
+            self._pending = None
+            return False
+        if self._pending is None or value != self._pending:
+            self._pending = value
+            self._since = now
+        if now - self._since >= delay:
+            self.value = value
+            self._pending = None
+            return True
+        return False
+
+    def due(self, delay: float) -> float | None:
+        """
+        Функция получения времени, когда ожидающее значение
+        будет подтверждено.
+
+        :param
+        delay : float
+            Время, в течение которого значение должно держаться.
+        :return:
+        due : float | None
+            Время подтверждения или None, если ожидающего значения нет.
+        """
+        if self._pending is None:
+            return None
+        return self._since + delay
+
+
+class ContainerState:
+    """
+    Класс отслеживаемого состояния контейнера.
+
+    :param
+    name : str
+        Имя контейнера.
+    """
+
+    def __init__(self, name: str):
+        """
+        Конструктор класса ContainerState.
+
+        :param
+        name : str
+            Имя контейнера.
+        """
+        self.name = name
+        self.status = DebouncedValue()
+        self.cpu_high = DebouncedValue(False)
+        self.memory_high = DebouncedValue(False)
+        self.started_at: str | None = None
+        self.restart_count = 0
+        self.restarts = 0
+        self.cpu_percent: float | None = None
+        self.memory_percent: float | None = None
+        self._cpu_total: int | None = None
+        self._system_total: int | None = None
+
+    def update_usage(self, stats: Dict[str, Any]) -> None:
+        """
+        Функция расчёта загрузки CPU и памяти по снимку статистики.
+        Загрузка CPU считается по разности с предыдущим снимком.
+
+        :param
+        stats : Dict[str, Any]
+            Снимок статистики контейнера, см. DockerAPI.stats.
+        """
+        cpu_stats = stats.get("cpu_stats", {})
+        cpu_total = cpu_stats.get("cpu_usage", {}).get("total_usage")
+        system_total = cpu_stats.get("system_cpu_usage")
+        if (
+            cpu_total is not None
+            and system_total is not None
+            and self._cpu_total is not None
+            and system_total > self._system_total
+        ):
+            self.cpu_percent = (
+                (cpu_total - self._cpu_total)
+                / (system_total - self._system_total)
+                * cpu_stats.get("online_cpus", 1)
+                * 100
+            )
+        self._cpu_total = cpu_total
+        self._system_total = system_total
+
+        memory_stats = stats.get("memory_stats", {})
+        usage = memory_stats.get("usage")
+        limit = memory_stats.get("limit")
+        if usage is not None and limit:
+            # страничный кэш файлов не считается занятой памятью,
+            # как и в docker stats
+            inactive = memory_stats.get("stats", {})
+            usage -= inactive.get(
+                "inactive_file", inactive.get("total_inactive_file", 0)
+            )
+            self.memory_percent = usage / limit * 100
+
+
+class ContainerWatchdog:
+    """
+    Класс Watchdog-бота: опрашивает Docker API и отправляет
+    уведомления об изменении статуса, перезапусках и превышении
+    порогов загрузки контейнеров.
+
+    :param
+    api : DockerAPI
+        Открытый клиент Docker API.
+    names : Tuple[str, ...] = DOCKER_CONTAINER_NAMES
+        Имена отслеживаемых контейнеров.
+    notify : Callable[[str], Any] = notify
+        Синхронная функция отправки уведомления,
+        исполняется в отдельном потоке.
+    interval : float = POLL_INTERVAL_SEC
+        Интервал опроса в секундах.
+    debounce : float = DEBOUNCE_SEC
+        Время, в течение которого новый статус или превышение порога
+        должны держаться до отправки уведомления.
+    cpu_alert_percent : float = CPU_ALERT_PERCENT
+        Порог загрузки CPU в процентах одного ядра.
+    memory_alert_percent : float = MEMORY_ALERT_PERCENT
+        Порог потребления памяти в процентах от лимита контейнера.
+    """
+
+    def __init__(
+        self,
+        api: DockerAPI,
+        names: Tuple[str, ...] = DOCKER_CONTAINER_NAMES,
+        notify: Callable[[str], Any] = notify,
+        interval: float = POLL_INTERVAL_SEC,
+        debounce: float = DEBOUNCE_SEC,
+        cpu_alert_percent: float = CPU_ALERT_PERCENT,
+        memory_alert_percent: float = MEMORY_ALERT_PERCENT,
+    ):
+        """
+        Конструктор класса ContainerWatchdog.
+
+        :param
+        api : DockerAPI
+            Открытый клиент Docker API.
+        names : Tuple[str, ...] = DOCKER_CONTAINER_NAMES
+            Имена отслеживаемых контейнеров.
+        notify : Callable[[str], Any] = notify
+            Функция отправки уведомления.
+        interval : float = POLL_INTERVAL_SEC
+            Интервал опроса в секундах.
+        debounce : float = DEBOUNCE_SEC
+            Время подтверждения изменений в секундах.
+        cpu_alert_percent : float = CPU_ALERT_PERCENT
+            Порог загрузки CPU в процентах.
+        memory_alert_percent : float = MEMORY_ALERT_PERCENT
+            Порог потребления памяти в процентах.
+        """
+        self.api = api
+        self.notify = notify
+        self.interval = interval
+        self.debounce = debounce
+        self.cpu_alert_percent = cpu_alert_percent
+        self.memory_alert_percent = memory_alert_percent
+        self.containers = {name: ContainerState(name) for name in names}
+        self._wakeup = asyncio.Event()
+
+    async def _poll(
+        self,
+        state: ContainerState,
+    ) -> Tuple[Dict[str, Any] | None, Dict[str, Any] | None]:
+        """
+        Асинхронная функция получения описания и статистики контейнера.
+        Ошибки Docker API считаются отсутствием контейнера.
+
+        :param
+        state : ContainerState
+            Состояние контейнера.
+        :return:
+        info : Dict[str, Any] | None
+            Описание контейнера, см. DockerAPI.inspect.
+        stats : Dict[str, Any] | None
+            Снимок статистики, если контейнер работает.
+        """
+        try:
+            info = await self.api.inspect(state.name)
+            stats = None
+            if info is not None and info["State"]["Status"] == "running":
+                stats = await self.api.stats(state.name)
+            return info, stats
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.warning("Docker API error for %s: %s", state.name, e)
+            return None, None
+
+    def observe(
+        self,
+        state: ContainerState,
+        info: Dict[str, Any] | None,
+        stats: Dict[str, Any] | None,
+        now: float,
+    ) -> List[str]:
+        """
+        Функция учёта наблюдения контейнера.
+
+        :param
+        state : ContainerState
+            Состояние контейнера.
+        info : Dict[str, Any] | None
+            Описание контейнера, см. DockerAPI.inspect.
+        stats : Dict[str, Any] | None
+            Снимок статистики работающего контейнера.
+        now : float
+            Время наблюдения в секундах.
+        :return:
+        messages : List[str]
+            Уведомления, вызванные наблюдением.
+        """
+        messages = []
+        status = MISSING_STATUS if info is None else info["State"]["Status"]
+        first = state.status.value is None
+        if state.status.update(status, now, 0 if first else self.debounce):
+            if status == MISSING_STATUS:
+                messages.append(
+                    f"There is no running containers with name "
+                    f"{state.name}!\nSomething happened, check server!"
                 )
-                logging.exception(msg)
-                logging.exception(e)
-                send_telegram_message(msg)
             else:
-                if value != container.status:
-                    msg += (
-                        f"\nContainer name: {container.name}\n"
-                        f"Container status: {container.status}"
+                messages.append(
+                    ("Polling containers check.\n" if first else "")
+                    + f"Container name: {state.name}\n"
+                    f"Container status: {status}"
+                )
+        if info is None:
+            return messages
+
+        started_at = info["State"].get("StartedAt")
+        restart_count = info.get("RestartCount", 0)
+        if state.started_at is not None and started_at != state.started_at:
+            state.restarts += 1
+            messages.append(
+                f"Container {state.name} restarted "
+                f"(restart policy count: {restart_count}, "
+                f"restarts seen: {state.restarts})"
+            )
+        state.started_at = started_at
+        state.restart_count = restart_count
+
+        if stats is None:
+            return messages
+        state.update_usage(stats)
+        for value, threshold, flag, resource in (
+            (
+                state.cpu_percent,
+                self.cpu_alert_percent,
+                state.cpu_high,
+                "CPU",
+            ),
+            (
+                state.memory_percent,
+                self.memory_alert_percent,
+                state.memory_high,
+                "memory",
+            ),
+        ):
+            if value is None:
+                continue
+            if flag.update(value >= threshold, now, self.debounce):
+                messages.append(
+                    f"Container {state.name} {resource} usage "
+                    + (
+                        f"is above {threshold:.0f}%: {value:.1f}%"
+                        if flag.value
+                        else f"is back to normal: {value:.1f}%"
+                    )
+                )
+        return messages
+
+    async def check(self) -> List[str]:
+        """
+        Асинхронная функция одного опроса всех контейнеров.
+
+        :return:
+        messages : List[str]
+            Отправленные уведомления.
+        """
+        states = list(self.containers.values())
+        polled = await asyncio.gather(*[self._poll(state) for state in states])
+        now = monotonic()
+        messages = []
+        for state, (info, stats) in zip(states, polled):
+            messages.extend(self.observe(state, info, stats, now))
+        for message in messages:
+            logging.info(message)
+            try:
+                await asyncio.to_thread(self.notify, message)
+            except Exception:
+                logging.exception("Failed to send notification")
+        return messages
+
+    def _next_delay(self) -> float:
+        """
+        Функция времени до следующего опроса: не позже интервала
+        и не позже момента подтверждения ожидающих изменений.
+        """
+        now = monotonic()
+        delay = self.interval
+        for state in self.containers.values():
+            for value in (state.status, state.cpu_high, state.memory_high):
+                due = value.due(self.debounce)
+                if due is not None:
+                    delay = min(delay, max(due - now, 0))
+        return delay
+
+    async def listen_events(self) -> None:
+        """
+        Асинхронная функция чтения потока событий Docker: каждое
+        событие отслеживаемого контейнера запускает внеочередной опрос.
+        При разрыве потока подключение повторяется.
+        """
+        while True:
+            try:
+                async for event in self.api.events(
+                    tuple(self.containers)
+                ):
+                    logging.info(
+                        "Docker event: %s %s",
+                        event.get("Action"),
+                        event.get("Actor", {}).get("Attributes", {}).get(
+                            "name"
+                        ),
                     )
-                    logging.exception(msg)
-                    send_telegram_message(msg)
-                    DOCKER_CONTAINER_NAMES[key] = container.status
+                    self._wakeup.set()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logging.warning("Docker events stream error: %s", e)
+            await asyncio.sleep(EVENTS_RETRY_SEC)
 
+    async def run(self, stop: asyncio.Event) -> None:
+        """
+        Асинхронная функция цикла наблюдения.
 
-async def watchdog_bot():
+        :param
+        stop : asyncio.Event
+            Событие остановки бота.
+        """
+        events = asyncio.create_task(self.listen_events())
+        try:
+            while not stop.is_set():
+                self._wakeup.clear()
+                await self.check()
+                wakeup = asyncio.create_task(self._wakeup.wait())
+                stopped = asyncio.create_task(stop.wait())
+                await asyncio.wait(
+                    (wakeup, stopped),
+                    timeout=self._next_delay(),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                wakeup.cancel()
+                stopped.cancel()
+        finally:
+            events.cancel()
+
+
+async def watchdog_bot(
+    url: str = DOCKER_URL,
+    names: Tuple[str, ...] = DOCKER_CONTAINER_NAMES,
+    interval: float = POLL_INTERVAL_SEC,
+    debounce: float = DEBOUNCE_SEC,
+    cpu_alert_percent: float = CPU_ALERT_PERCENT,
+    memory_alert_percent: float = MEMORY_ALERT_PERCENT,
+) -> None:
     """
-    Функция запуска Watchdog-бота
+    Функция запуска Watchdog-бота до получения SIGINT или SIGTERM.
+    Параметры см. ContainerWatchdog.
     """
-    # Настройка логгирования
-    logging.basicConfig(level=logging.INFO)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    async with DockerAPI(url) as api:
+        await ContainerWatchdog(
+            api,
+            names,
+            interval=interval,
+            debounce=debounce,
+            cpu_alert_percent=cpu_alert_percent,
+            memory_alert_percent=memory_alert_percent,
+        ).run(stop)
 
-    for key, value in DOCKER_CONTAINER_NAMES.items():
-        container = client.containers.get(key)
-        DOCKER_CONTAINER_NAMES[key] = container.status
-        send_telegram_message(
-            f"Polling containers check.\n"
-            f"Container name: {key}\n"
-            f"Container status: {container.status}"
-        )
-
-    observer = PollingObserver()
 
-    # Создание экземпляра обработчика событий и наблюдателя
-    event_handler = DockerContainerHandler()
-    observer.schedule(
-        event_handler,
-        path=os.path.dirname("/var/run/docker.sock"),
-        recursive=False
+def main():
+    """
+    Точка входа Watchdog-бота.
+    """
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--docker-url", default=DOCKER_URL)
+    parser.add_argument(
+        "--containers", nargs="+", default=list(DOCKER_CONTAINER_NAMES)
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=POLL_INTERVAL_SEC,
+        help="интервал опроса Docker API в секундах",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=DEBOUNCE_SEC,
+        help="сколько секунд изменение должно держаться до уведомления",
+    )
+    parser.add_argument("--cpu-alert", type=float, default=CPU_ALERT_PERCENT)
+    parser.add_argument(
+        "--memory-alert", type=float, default=MEMORY_ALERT_PERCENT
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(
+        watchdog_bot(
+            args.docker_url,
+            tuple(args.containers),
+            args.interval,
+            args.debounce,
+            args.cpu_alert,
+            args.memory_alert,
+        )
     )
-    observer.start()
-
-    try:
-        # Запуск цикла наблюдения
-        while True:
-            pass
-    except KeyboardInterrupt:
-        # Остановка всех наблюдателей
-        event_handler.stop()
-    event_handler.join()
 
 
 if __name__ == "__main__":
-    asyncio.run(watchdog_bot())
+    main()
@@ -0,0 +1,216 @@
+"""
+Модуль поиска участков с максимальной площадью под кривой предсказания.
+
+Кривая предсказания модели рассматривается как ступенчатая функция
+(одно значение на секунду), площадь окна считается как разность
+её первообразной на концах окна. Первообразная строится префиксными
+суммами один раз, поэтому поиск для любого количества длительностей
+выполняется за линейное время от длины кривой.
+"""
+
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
+
+
+HIGHLIGHT_DURATIONS_SEC = (15, 30, 60)
+
+
+class HighlightWindow:
+    """
+    Класс найденного окна хайлайта.
+
+    :param
+    start_sec : float
+        Начало окна в секундах.
+    duration_sec : float
+        Длительность окна в секундах.
+    score : float
+        Площадь под кривой предсказания внутри окна.
+    """
+
+    def __init__(
+        self,
+        start_sec: float,
+        duration_sec: float,
+        score: float,
+    ):
+        """
+        Конструктор класса HighlightWindow.
+
+        :param
+        start_sec : float
+            Начало окна в секундах.
+        duration_sec : float
+            Длительность окна в секундах.
+        score : float
+            Площадь под кривой предсказания внутри окна.
+        """
+        self.start_sec = start_sec
+        self.duration_sec = duration_sec
+        self.score = score
+
+    @property
+    def end_sec(self) -> float:
+        """
+        Конец окна в секундах.
+        """
+        return self.start_sec + self.duration_sec
+
+    def to_dict(self) -> Dict[str, float]:
+        """
+        Функция представления окна в виде словаря.
+
+        :return:
+        window : Dict[str, float]
+            Начало, длительность и площадь окна.
+        """
+        return {
+            "start_sec": self.start_sec,
+            "duration_sec": self.duration_sec,
+            "score": self.score,
+        }
+
+    def __repr__(self):
+        return (
+            f"HighlightWindow(start_sec={self.start_sec:.3f}, "
+            f"duration_sec={self.duration_sec}, score={self.score:.4f})"
+        )
+
+
+def window_scores(
+    prediction: Sequence[float] | np.ndarray,
+    duration: int | float,
+    resolution: float = 1.0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Функция вычисления площадей всех окон заданной длительности.
+    Длительность и шаг должны быть положительными, а окно
+    не длиннее кривой предсказания, иначе вызывается ValueError.
+
+    :param
+    prediction : Sequence[float] | numpy.ndarray
+        Предсказание модели, одно значение на секунду.
+    duration : int | float
+        Длительность окна в секундах.
+    resolution : float = 1.0
+        Шаг перебора начала окна в секундах.
+    :return:
+    starts : numpy.ndarray
+        Начала окон в секундах.
+    scores : numpy.ndarray
+        Площади окон.
+    """
+    curve = np.asarray(prediction, dtype=np.float64).ravel()
+    length = curve.size
+    if duration <= 0:
+        raise ValueError(f"Window duration must be positive, got {duration}")
+    if resolution <= 0:
+        raise ValueError(f"Resolution must be positive, got {resolution}")
+    if duration > length:
+        raise ValueError(
+            f"Window of {duration} s is longer than the prediction "
+            f"of {length} s"
+        )
+    # первообразная ступенчатой функции в целых точках
+    integral = np.concatenate(([0.0], np.cumsum(curve)))
+    last_start = length - duration
+    n_starts = int(np.floor(last_start / resolution + 1e-9)) + 1
+    starts = np.arange(n_starts) * resolution
+    ends = np.minimum(starts + duration, length)
+    if float(resolution).is_integer() and float(duration).is_integer():
+        scores = (
+            integral[ends.astype(np.int64)] - integral[starts.astype(np.int64)]
+        )
+    else:
+        grid = np.arange(length + 1)
+        scores = np.interp(ends, grid, integral) - np.interp(
+            starts, grid, integral
+        )
+    return starts, scores
+
+
+def find_top_windows(
+    prediction: Sequence[float] | np.ndarray,
+    duration: int | float,
+    top_k: int = 1,
+    resolution: float = 1.0,
+) -> List[HighlightWindow]:
+    """
+    Функция поиска top_k непересекающихся окон
+    с максимальной площадью под кривой предсказания.
+    Ограничения на параметры те же, что у window_scores,
+    top_k должно быть положительным.
+
+    :param
+    prediction : Sequence[float] | numpy.ndarray
+        Предсказание модели, одно значение на секунду.
+    duration : int | float
+        Длительность окна в секундах.
+    top_k : int = 1
+        Количество искомых окон.
+    resolution : float = 1.0
+        Шаг перебора начала окна в секундах.
+    :return:
+    windows : List[HighlightWindow]
+        Окна в порядке убывания площади.
+    """
+    if top_k <= 0:
+        raise ValueError(f"top_k must be positive, got {top_k}")
+    starts, scores = window_scores(prediction, duration, resolution)
+    if top_k == 1:
+        best = int(np.argmax(scores))
+        return [
+            HighlightWindow(float(starts[best]), duration, float(scores[best]))
+        ]
+
+    windows: List[HighlightWindow] = []
+    # стабильная сортировка: при равных площадях раньше идёт более
+    # раннее окно, как и при поиске одного окна через argmax
+    for idx in np.argsort(-scores, kind="stable"):
+        start = float(starts[idx])
+        if all(
+            start + duration <= window.start_sec
+            or start >= window.end_sec
+            for window in windows
+        ):
+            windows.append(
+                HighlightWindow(start, duration, float(scores[idx]))
+            )
+            if len(windows) == top_k:
+                break
+    return windows
+
+
+def find_highlight_windows(
+    prediction: Sequence[float] | np.ndarray,
+    durations: Sequence[int | float] = HIGHLIGHT_DURATIONS_SEC,
+    top_k: int = 1,
+    resolution: float = 1.0,
+) -> Dict[int | float, List[HighlightWindow]]:
+    """
+    Функция поиска лучших окон для нескольких длительностей
+    по одному предсказанию модели.
+
+    :param
+    prediction : Sequence[float] | numpy.ndarray
+        Предсказание модели, одно значение на секунду.
+    durations : Sequence[int | float] = HIGHLIGHT_DURATIONS_SEC
+        Длительности окон в секундах.
+    top_k : int = 1
+        Количество непересекающихся окон для каждой длительности.
+    resolution : float = 1.0
+        Шаг перебора начала окна в секундах.
+    :return:
+    windows : Dict[int | float, List[HighlightWindow]]
+        Найденные окна по длительностям. Для длительностей больше
+        длины кривой возвращается одно окно, начинающееся с её начала.
+    """
+    curve = np.asarray(prediction, dtype=np.float64).ravel()
+    return {
+        duration: (
+            find_top_windows(curve, duration, top_k, resolution)
+            if duration <= curve.size
+            else [HighlightWindow(0.0, duration, float(curve.sum()))]
+        )
+        for duration in durations
+    }
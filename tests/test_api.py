@@ -0,0 +1,113 @@
+"""
+Тесты HTTP API на синтетических треках, см. benchmarks.api_load.
+"""
+
+import asyncio
+import io
+import os
+import stat
+import aiohttp
+import pytest
+import soundfile as sf
+from aiohttp.test_utils import TestClient, TestServer
+import lib.jobs
+from api import create_app
+from benchmarks.api_load import encode_wav
+from lib.jobs import JobQueue
+
+
+def make_form(sample_rate: int = 22050, **fields) -> aiohttp.FormData:
+    """
+    Функция формирования multipart-запроса с одним синтетическим
+    треком с частотой дискретизации sample_rate и текстовыми
+    полями fields.
+    """
+    form = aiohttp.FormData()
+    form.add_field(
+        "files", encode_wav(40, 0, sample_rate), filename="0.wav",
+        content_type="audio/wav",
+    )
+    for name, value in fields.items():
+        form.add_field(name, value)
+    return form
+
+
+def test_results_are_encoded_in_requested_format():
+    async def run():
+        async with TestClient(TestServer(create_app())) as client:
+            response = await client.post(
+                "/highlights",
+                data=make_form(
+                    tier="heuristic", format="mp3", bitrate_kbps="128"
+                ),
+            )
+            assert response.status == 202
+            job = await response.json()
+            response = await client.get(f"/jobs/{job['id']}?wait=30")
+            job = await response.json()
+            assert job["status"] == "done"
+            assert job["results"][0]["format"] == "mp3"
+            response = await client.get(f"/jobs/{job['id']}/results/0")
+            assert response.status == 200
+            assert response.headers["Content-Type"] == "audio/mpeg"
+            return await response.read()
+
+    data = asyncio.run(run())
+    assert sf.info(io.BytesIO(data)).format == "MP3"
+
+
+def test_highlight_in_native_sample_rate():
+    async def run():
+        async with TestClient(TestServer(create_app())) as client:
+            response = await client.post(
+                "/highlights",
+                data=make_form(44100, tier="heuristic", native_rate="1"),
+            )
+            job = await response.json()
+            response = await client.get(f"/jobs/{job['id']}?wait=30")
+            job = await response.json()
+            response = await client.get(f"/jobs/{job['id']}/results/0")
+            return job["results"][0], await response.read()
+
+    result, data = asyncio.run(run())
+    info = sf.info(io.BytesIO(data))
+    assert result["sample_rate"] == info.samplerate == 44100
+    assert info.duration == pytest.approx(result["duration_sec"], abs=0.01)
+
+
+def test_invalid_output_params_are_rejected():
+    async def run():
+        async with TestClient(TestServer(create_app())) as client:
+            statuses = []
+            for fields in (
+                {"format": "aiff"},
+                {"format": "wav", "bitrate_kbps": "128"},
+                {"format": "ogg", "bitrate_kbps": "100"},
+            ):
+                response = await client.post(
+                    "/playlists", data=make_form(**fields)
+                )
+                statuses.append(response.status)
+            return statuses
+
+    assert asyncio.run(run()) == [400, 400, 400]
+
+
+def test_results_directory_is_private(tmp_path, monkeypatch):
+    directory = tmp_path / "jobs"
+    directory.mkdir()
+    os.chmod(directory, 0o777)
+    monkeypatch.setattr(lib.jobs, "RESULTS_DIR", str(directory))
+
+    async def run():
+        queue = JobQueue()
+        queue.start()
+        await queue.stop()
+
+    asyncio.run(run())
+    assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+
+    directory.rmdir()
+    directory.symlink_to(tmp_path)
+    with pytest.raises(PermissionError):
+        asyncio.run(run())
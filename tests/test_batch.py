@@ -0,0 +1,77 @@
+"""
+Тесты пакетной обработки.
+"""
+
+import argparse
+import asyncio
+import os
+import pytest
+import soundfile as sf
+import batch
+from benchmarks.synthetic import generate_tracks
+from lib.cache import ResultCache, set_result_cache
+from lib.model import SR
+
+
+def make_args(directory: str, **overrides) -> argparse.Namespace:
+    """
+    Функция формирования параметров запуска batch.py по умолчанию.
+    """
+    params = {
+        "inputs": [directory],
+        "workers": 1,
+        "backend": "thread",
+        "batch_size": 1,
+        "group_size": 2,
+        "full_track": False,
+        "quality": batch.DEFAULT_QUALITY,
+        "tier": batch.DEFAULT_TIER,
+        "audio_format": "wav",
+        "offsets": "csv",
+        "playlist": True,
+        "cross_len": 2,
+        "metrics": None,
+    }
+    params.update(overrides)
+    return argparse.Namespace(**params)
+
+
+@pytest.fixture
+def catalogue(tmp_path):
+    """
+    Фикстура директории с синтетическими треками.
+    """
+    previous = set_result_cache(ResultCache(None))
+    for idx, track in enumerate(generate_tracks([50, 70, 40], SR)):
+        sf.write(str(tmp_path / f"track{idx}.wav"), track, SR)
+    yield str(tmp_path)
+    if previous is not None:
+        set_result_cache(previous)
+
+
+def test_playlist_reuses_saved_offsets(catalogue, monkeypatch):
+    args = make_args(catalogue)
+    paths = batch.collect_tracks(args.inputs)[catalogue]
+    offsets_path = batch.output_paths(paths[1], "wav", "csv")[1]
+    batch.write_offsets(
+        offsets_path,
+        {"track": "track1.wav", "start_sec": 12.5, "duration_sec": 30.0},
+    )
+    assert batch.read_offsets(offsets_path)["start_sec"] == "12.5"
+
+    computed = []
+    original = batch.get_highlights_list
+
+    async def counting(data, *args, **kwargs):
+        computed.append(len(data))
+        return await original(data, *args, **kwargs)
+
+    monkeypatch.setattr(batch, "get_highlights_list", counting)
+    asyncio.run(batch.build_playlist(catalogue, paths, args))
+
+    # хайлайт выделен только для треков без сохранённого начала,
+    # по одному в каждой группе
+    assert computed == [1, 1]
+    playlist = os.path.join(catalogue, "playlist.wav")
+    # три хайлайта по 30 секунд и два перекрытия по 2 секунды
+    assert sf.info(playlist).duration == pytest.approx(86, abs=0.1)
@@ -0,0 +1,79 @@
+"""
+Тесты дискового уровня кэша результатов.
+"""
+
+import os
+import stat
+import numpy as np
+import pytest
+import lib.cache
+from lib.cache import ResultCache, make_key, private_directory
+
+
+def test_private_directory_permissions(tmp_path):
+    directory = tmp_path / "cache"
+    directory.mkdir(mode=0o777)
+    os.chmod(directory, 0o777)
+    private_directory(str(directory))
+    assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+
+
+def test_private_directory_rejects_symlink(tmp_path):
+    target = tmp_path / "target"
+    target.mkdir()
+    link = tmp_path / "link"
+    link.symlink_to(target)
+    with pytest.raises(PermissionError):
+        private_directory(str(link))
+
+
+def test_disk_roundtrip_without_pickle(tmp_path):
+    cache = ResultCache(str(tmp_path), memory_bytes=0)
+    array_key = make_key("audio", "features")
+    scalar_key = make_key("audio", "highlight")
+    pair_key = make_key("audio", "playlist")
+    array = np.arange(12, dtype=np.float32).reshape(3, 4)
+    cache.set(array_key, array)
+    cache.set(scalar_key, np.float64(12.5))
+    cache.set(pair_key, ("output.mp3", 44100))
+
+    suffixes = [os.path.splitext(name)[1] for name in os.listdir(tmp_path)]
+    assert sorted(suffixes) == [".json", ".json", ".npy"]
+    np.testing.assert_array_equal(cache.get(array_key), array)
+    assert cache.get(scalar_key) == 12.5
+    assert cache.get(pair_key) == ["output.mp3", 44100]
+    assert cache.stats["disk_hits"] == 3
+
+
+def test_object_values_stay_in_memory(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    key = make_key("audio", "objects")
+    value = np.array([object()], dtype=object)
+    cache.set(key, value)
+    assert cache.get(key) is value
+    assert os.listdir(tmp_path) == []
+
+
+def test_eviction_scans_only_on_overflow(tmp_path, monkeypatch):
+    entry = np.zeros(1024, dtype=np.uint8)
+    entry_size = entry.nbytes + 128
+    cache = ResultCache(
+        str(tmp_path), memory_bytes=0, disk_bytes=40 * entry_size
+    )
+    scans = []
+    original = os.scandir
+
+    def counting(path):
+        scans.append(path)
+        return original(path)
+
+    monkeypatch.setattr(lib.cache.os, "scandir", counting)
+    for idx in range(120):
+        cache.set(make_key(str(idx), "features"), entry)
+    # каталог сканируется при первом сохранении и переполнениях,
+    # а не при каждом сохранении
+    assert 1 < len(scans) < 120 // 3
+    assert cache.stats["disk_bytes"] <= 40 * entry_size
+    assert len(os.listdir(tmp_path)) <= 40
+    assert cache.get(make_key("119", "features")) is not None
+    assert cache.get(make_key("0", "features")) is None
@@ -0,0 +1,50 @@
+"""
+Тесты отзывчивости цикла событий при тяжёлой обработке,
+см. benchmarks.event_loop_lag.
+"""
+
+import asyncio
+from time import sleep
+import pytest
+from benchmarks.event_loop_lag import measure_lag, run_benchmark
+from lib.cache import ResultCache, set_result_cache
+
+
+# допустимая задержка цикла событий; синхронное выделение хайлайтов
+# или сведение плейлиста в цикле событий занимает секунды
+MAX_LAG_SEC = 0.25
+INTERVAL_SEC = 0.01
+
+
+@pytest.fixture
+def empty_cache():
+    """
+    Фикстура пустого кэша результатов без дискового уровня,
+    чтобы обработка не подменялась чтением из кэша.
+    """
+    previous = set_result_cache(ResultCache(None))
+    yield
+    if previous is not None:
+        set_result_cache(previous)
+
+
+def test_playlist_does_not_block_event_loop(empty_cache):
+    lags = asyncio.run(run_benchmark(3, 1, "thread", INTERVAL_SEC))
+    assert lags
+    assert max(lags) < MAX_LAG_SEC
+
+
+def test_blocking_call_is_detected():
+    async def run():
+        lags = []
+        stop = asyncio.Event()
+        monitor = asyncio.create_task(measure_lag(INTERVAL_SEC, lags, stop))
+        await asyncio.sleep(INTERVAL_SEC)
+        # синхронная работа в цикле событий
+        sleep(2 * MAX_LAG_SEC)
+        await asyncio.sleep(INTERVAL_SEC)
+        stop.set()
+        await monitor
+        return lags
+
+    assert max(asyncio.run(run())) >= MAX_LAG_SEC
@@ -0,0 +1,50 @@
+"""
+Тесты переиспользования признаков между анализом темпа
+и выделением хайлайтов.
+"""
+
+import asyncio
+import pytest
+import lib.analysis
+import lib.model
+from benchmarks.synthetic import generate_tracks
+from lib.analysis import sort_tracks
+from lib.cache import ResultCache, set_result_cache
+from lib.highlight import get_highlights_list
+from lib.model import SR
+
+
+@pytest.fixture
+def spectrogram_calls(monkeypatch):
+    """
+    Фикстура, подсчитывающая вычисления амплитудного спектра
+    в пустом кэше результатов без дискового уровня.
+    """
+    calls = []
+    original = lib.model.magnitude_spectrogram
+
+    def counting(*args, **kwargs):
+        calls.append(args[0].shape)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(lib.model, "magnitude_spectrogram", counting)
+    monkeypatch.setattr(lib.analysis, "magnitude_spectrogram", counting)
+    previous = set_result_cache(ResultCache(None))
+    yield calls
+    if previous is not None:
+        set_result_cache(previous)
+
+
+def test_highlights_reuse_features_from_sorting(spectrogram_calls):
+    tracks = generate_tracks([45, 60], SR)
+    srs = [SR] * len(tracks)
+
+    async def run():
+        await sort_tracks(tracks, srs, backend="thread")
+        sorted_calls = len(spectrogram_calls)
+        await get_highlights_list(tracks, srs, backend="thread")
+        return sorted_calls
+
+    sorted_calls = asyncio.run(run())
+    assert sorted_calls == len(tracks)
+    assert len(spectrogram_calls) == len(tracks)
@@ -0,0 +1,17 @@
+"""
+Тесты метрик и профилирования.
+"""
+
+import os
+import stat
+from lib.metrics import SlowRequestProfiler
+
+
+def test_profile_directory_is_private(tmp_path):
+    directory = tmp_path / "profiles"
+    directory.mkdir()
+    os.chmod(directory, 0o777)
+    profiler = SlowRequestProfiler(1, directory=str(directory))
+    with profiler.profile("test"):
+        pass
+    assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
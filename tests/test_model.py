@@ -0,0 +1,66 @@
+"""
+Тесты модели выделения хайлайтов.
+"""
+
+import numpy as np
+import pytest
+from lib.highlight import check_model
+from lib.model import (
+    DEFAULT_VARIANT,
+    MODEL_VARIANT_ENV,
+    MODEL_VARIANTS,
+    N_MEL,
+    AudioHighlightsModel,
+    variant_weights_path,
+)
+from lib.utils import NotSupportedModelException
+
+
+def test_default_variant_passes_check(monkeypatch):
+    monkeypatch.delenv(MODEL_VARIANT_ENV, raising=False)
+    model = AudioHighlightsModel()
+    assert model.variant == DEFAULT_VARIANT == "fp32"
+    assert model.ONNX_WEIGHTS_PATH == MODEL_VARIANTS["fp32"]
+    check_model(model)
+
+
+def test_run_batch_matches_run(monkeypatch):
+    model = AudioHighlightsModel()
+    rng = np.random.default_rng(0)
+    features = [
+        rng.standard_normal((1, N_MEL, frames, 1)).astype(np.float32)
+        for frames in (387, 900, 387, 450, 387)
+    ]
+    shapes = []
+    original = model.pool.buffers
+
+    def recording(session, shape):
+        shapes.append(shape)
+        return original(session, shape)
+
+    monkeypatch.setattr(model.pool, "buffers", recording)
+    batched = model.run_batch(features, batch_size=2)
+    # в пакет попадают только треки одной длины, без дополнения
+    assert sorted(shapes) == [
+        (1, N_MEL, 387, 1),
+        (1, N_MEL, 450, 1),
+        (1, N_MEL, 900, 1),
+        (2, N_MEL, 387, 1),
+    ]
+    assert len(batched) == len(features)
+    for track_features, prediction in zip(features, batched):
+        np.testing.assert_allclose(
+            prediction, model.run(track_features), rtol=1e-5, atol=1e-6
+        )
+    # run передаёт в модель признаки исходной длины
+    assert shapes[-1] == features[-1].shape
+
+
+def test_missing_variant_names_quantization(monkeypatch, tmp_path):
+    monkeypatch.setitem(
+        MODEL_VARIANTS, "int8", str(tmp_path / "missing.int8.onnx")
+    )
+    with pytest.raises(NotSupportedModelException) as error:
+        variant_weights_path("int8")
+    assert "python -m lib.quantization" in error.value.msg
+    assert variant_weights_path("fp32") == MODEL_VARIANTS["fp32"]
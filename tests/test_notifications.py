@@ -0,0 +1,80 @@
+"""
+Тесты фоновой отправки уведомлений на заглушке Telegram Bot API,
+см. benchmarks.notification_drill.
+"""
+
+import asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from benchmarks.notification_drill import TelegramStub
+from lib.notifications import NotificationDispatcher
+
+
+async def run_with_stub(stub: TelegramStub, scenario) -> None:
+    """
+    Асинхронная функция запуска сценария с диспетчером, который
+    отправляет сообщения на локальную заглушку.
+    """
+    app = web.Application()
+    app.router.add_post("/bot{token}/sendMessage", stub.send_message)
+    server = TestServer(app)
+    await server.start_server()
+    dispatcher = NotificationDispatcher(
+        "TEST",
+        1,
+        api_url=f"http://{server.host}:{server.port}",
+        coalesce_sec=0.05,
+        min_interval_sec=0.0,
+        max_retries=2,
+    )
+    try:
+        await asyncio.to_thread(scenario, dispatcher)
+    finally:
+        await asyncio.to_thread(dispatcher.close, 10)
+        await server.close()
+
+
+def test_plain_text_429_is_retried():
+    stub = TelegramStub(0.0, 0.0, rate_limit_sec=0.5, proxy_429=True)
+
+    def scenario(dispatcher):
+        for text in ("first", "second"):
+            assert dispatcher.submit(text)
+            assert dispatcher.flush(10)
+        stats = dispatcher.stats
+        assert stats["retries"] == 1
+        assert stats["failed"] == 0
+
+    asyncio.run(run_with_stub(stub, scenario))
+    assert stub.rate_limited == 1
+    assert stub.texts == ["first", "second"]
+
+
+def test_worker_survives_send_errors():
+    stub = TelegramStub(0.0, 0.0, rate_limit_sec=0.0)
+
+    def scenario(dispatcher):
+        original = dispatcher._send
+        calls = []
+
+        async def failing(session, text):
+            calls.append(text)
+            if len(calls) == 1:
+                raise RuntimeError("unexpected response")
+            return await original(session, text)
+
+        dispatcher._send = failing
+        assert dispatcher.submit("lost")
+        assert dispatcher.flush(10)
+        assert dispatcher.submit("delivered")
+        assert dispatcher.flush(10)
+        assert dispatcher.stats["failed"] == 1
+
+        # остановленный цикл событий не принимает сообщения
+        dispatcher._loop.call_soon_threadsafe(dispatcher._worker.cancel)
+        dispatcher._thread.join(10)
+        assert not dispatcher.submit("dropped")
+        assert dispatcher.stats["pending"] == 0
+
+    asyncio.run(run_with_stub(stub, scenario))
+    assert stub.texts == ["delivered"]
@@ -0,0 +1,27 @@
+"""
+Тесты выдачи результатов.
+"""
+
+import os
+import stat
+import pytest
+from lib.output import OutputJanitor
+
+
+def test_janitor_directory_is_private(tmp_path):
+    directory = tmp_path / "output"
+    directory.mkdir(mode=0o777)
+    os.chmod(directory, 0o777)
+    janitor = OutputJanitor(str(directory))
+    assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+    path = janitor.new_path(".wav")
+    assert os.path.dirname(path) == str(directory)
+
+
+def test_janitor_rejects_symlink(tmp_path):
+    target = tmp_path / "target"
+    target.mkdir()
+    link = tmp_path / "output"
+    link.symlink_to(target)
+    with pytest.raises(PermissionError):
+        OutputJanitor(str(link))
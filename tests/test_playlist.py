@@ -0,0 +1,132 @@
+"""
+Тесты инкрементальной сборки плейлиста.
+"""
+
+import asyncio
+import numpy as np
+import pytest
+import lib.highlight
+import lib.playlist_forming
+from benchmarks.synthetic import generate_tracks
+from lib.cache import ResultCache, set_result_cache
+from lib.highlight import get_highlights_list
+from lib.model import SR
+from lib.parallel import TrackProcessingError
+from lib.playlist_forming import IncrementalPlaylist
+
+
+@pytest.fixture
+def tracks():
+    """
+    Фикстура синтетических треков и пустого кэша результатов
+    без дискового уровня.
+    """
+    previous = set_result_cache(ResultCache(None))
+    yield generate_tracks([40, 50, 45], SR)
+    if previous is not None:
+        set_result_cache(previous)
+
+
+def test_stream_matches_buffer(tracks):
+    keys = ["a", "b", "c"]
+    srs = [SR] * len(tracks)
+
+    async def run():
+        builder = IncrementalPlaylist(cross_len=2, backend="thread")
+        merged, sample_rate = await builder.build(keys, tracks, srs)
+        merged = merged.copy()
+        blocks, stream_rate = await builder.build_stream(
+            keys, tracks, srs, block_size=4096
+        )
+        streamed = np.concatenate([block async for block in blocks])
+        return merged, sample_rate, streamed, stream_rate, builder
+
+    merged, sample_rate, streamed, stream_rate, builder = asyncio.run(run())
+    assert stream_rate == sample_rate
+    np.testing.assert_allclose(streamed, merged, atol=1e-5)
+    assert builder.last_build["tracks_reused"] == len(keys)
+
+
+def test_failed_tracks_are_retried(tracks, monkeypatch, caplog):
+    keys = ["a", "b", "c"]
+    srs = [SR] * len(tracks)
+    original = lib.playlist_forming.get_highlights_list
+    calls = []
+
+    async def failing_once(data, *args, **kwargs):
+        calls.append(len(data))
+        highlights = await original(data, *args, **kwargs)
+        if len(calls) == 2:
+            # сбой исполнителя на новом треке второй сборки
+            highlights[0] = TrackProcessingError(0, "OOM")
+        return highlights
+
+    monkeypatch.setattr(
+        lib.playlist_forming, "get_highlights_list", failing_once
+    )
+
+    async def run():
+        builder = IncrementalPlaylist(cross_len=2, backend="thread")
+        await builder.build(keys[:2], tracks[:2], srs[:2])
+        await builder.build(keys, tracks, srs)
+        failed = dict(builder.last_build)
+        await builder.build(keys, tracks, srs)
+        return failed, builder.last_build
+
+    failed, retried = asyncio.run(run())
+    assert calls == [2, 1, 1]
+    assert failed["tracks_computed"] == 1
+    # сбойный трек обработан заново, остальные взяты из прошлых сборок
+    assert retried["tracks_computed"] == 1
+    assert retried["tracks_reused"] == 2
+    # индекс в сообщении - индекс трека в сборке, а не в пакете
+    assert "Track 2: OOM" in caplog.text
+
+
+def test_tracks_are_kept_per_tier(tracks):
+    keys = ["a", "b", "c"]
+    srs = [SR] * len(tracks)
+
+    async def run():
+        builder = IncrementalPlaylist(cross_len=2, backend="thread")
+        await builder.build(keys, tracks, srs, tier="heuristic")
+        heuristic = dict(builder.last_build)
+        await builder.build(keys, tracks, srs)
+        return heuristic, builder
+
+    heuristic, builder = asyncio.run(run())
+    assert heuristic["tracks_computed"] == len(keys)
+    # хайлайты другого уровня не переиспользуются
+    assert builder.last_build["tracks_computed"] == len(keys)
+    assert ("a", "heuristic", False) in builder
+    assert ("a", "full", False) in builder
+    builder.retain(keys[1:])
+    assert ("a", "heuristic", False) not in builder
+
+
+def test_full_track_matches_highlights(monkeypatch):
+    previous = set_result_cache(ResultCache(None))
+    # треки длиннее окна, которое обрабатывается без chunked
+    monkeypatch.setattr(lib.highlight, "MAX_TRACK_DURATION_SEC", 40)
+    tracks = generate_tracks([90, 100], SR)
+    keys = ["a", "b"]
+    srs = [SR] * len(tracks)
+
+    async def run():
+        builder = IncrementalPlaylist(cross_len=2, backend="thread")
+        await builder.build(keys, tracks, srs, chunked=True)
+        highlights = await get_highlights_list(
+            tracks, srs, backend="thread", chunked=True
+        )
+        return builder, highlights
+
+    try:
+        builder, highlights = asyncio.run(run())
+    finally:
+        if previous is not None:
+            set_result_cache(previous)
+    assert ("a", "full", False) not in builder
+    for key, highlight in zip(keys, highlights):
+        np.testing.assert_array_equal(
+            builder._tracks[(key, "full", True)][1], highlight
+        )
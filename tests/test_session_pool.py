@@ -0,0 +1,110 @@
+"""
+Тесты сохранения оптимизированной модели пулом ONNX-сессий.
+"""
+
+import os
+import stat
+import pytest
+import lib.session_pool
+from lib.metrics import get_metrics
+from lib.model import MODEL_VARIANTS
+from lib.session_pool import (
+    INTRA_OP_NUM_THREADS_ENV,
+    POOL_HITS,
+    POOL_LOADS,
+    POOL_SESSIONS,
+    POOL_SIZE_ENV,
+    InferenceSessionPool,
+    check_optimized_model,
+    configure_from_args,
+    configure_session_pool,
+    get_session_pool,
+    optimized_model_path,
+    record_session_pool_metrics,
+)
+
+
+WEIGHTS_PATH = MODEL_VARIANTS["fp32"]
+
+
+@pytest.fixture
+def model_dir(tmp_path, monkeypatch):
+    """
+    Фикстура временного каталога оптимизированных моделей.
+    """
+    directory = str(tmp_path / "ort")
+    monkeypatch.setattr(lib.session_pool, "OPTIMIZED_MODEL_DIR", directory)
+    return directory
+
+
+def test_optimized_model_is_bound_to_weights(model_dir, tmp_path):
+    other_weights = tmp_path / "other.onnx"
+    with open(WEIGHTS_PATH, "rb") as weights_file:
+        other_weights.write_bytes(weights_file.read() + b"\0")
+    InferenceSessionPool(WEIGHTS_PATH, size=1).acquire()
+    path = optimized_model_path(WEIGHTS_PATH)
+    assert os.path.dirname(path) == model_dir
+    assert stat.S_IMODE(os.stat(model_dir).st_mode) == 0o700
+    assert check_optimized_model(path, WEIGHTS_PATH)
+    assert not check_optimized_model(path, str(other_weights))
+
+
+def test_modified_optimized_model_is_rebuilt(model_dir):
+    InferenceSessionPool(WEIGHTS_PATH, size=1).acquire()
+    path = optimized_model_path(WEIGHTS_PATH)
+    with open(path, "ab") as model_file:
+        model_file.write(b"\0")
+    assert not check_optimized_model(path, WEIGHTS_PATH)
+
+    InferenceSessionPool(WEIGHTS_PATH, size=1).acquire()
+    assert check_optimized_model(path, WEIGHTS_PATH)
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    """
+    Фикстура пустого реестра пулов процесса.
+    """
+    monkeypatch.setattr(lib.session_pool, "_POOLS", {})
+
+
+def test_pool_settings_from_environment(pools, monkeypatch):
+    monkeypatch.setenv(POOL_SIZE_ENV, "3")
+    monkeypatch.setenv(INTRA_OP_NUM_THREADS_ENV, "1")
+    pool = get_session_pool(WEIGHTS_PATH)
+    assert pool.size == 3
+    assert pool.intra_op_num_threads == 1
+    assert get_session_pool(WEIGHTS_PATH) is pool
+
+
+def test_invalid_pool_settings(pools, monkeypatch):
+    monkeypatch.setenv(POOL_SIZE_ENV, "0")
+    with pytest.raises(ValueError):
+        get_session_pool(WEIGHTS_PATH)
+
+
+def test_pool_stats_are_exported(pools, model_dir):
+    pool = configure_session_pool(WEIGHTS_PATH, size=1)
+    assert get_session_pool(WEIGHTS_PATH) is pool
+    with pool.session():
+        pass
+    with pool.session():
+        pass
+    record_session_pool_metrics()
+    text = get_metrics().render()
+    label = f'model="{os.path.basename(WEIGHTS_PATH)}"'
+    assert f"{POOL_LOADS}{{{label}}}" in text
+    assert f"{POOL_HITS}{{{label}}}" in text
+    assert f"{POOL_SESSIONS}{{{label}}} 1" in text
+
+
+def test_configure_from_args(monkeypatch):
+    monkeypatch.delenv(POOL_SIZE_ENV, raising=False)
+    monkeypatch.delenv(INTRA_OP_NUM_THREADS_ENV, raising=False)
+    with pytest.raises(ValueError):
+        configure_from_args(3, 0)
+    # при ошибке окружение не меняется
+    assert POOL_SIZE_ENV not in os.environ
+    configure_from_args(3)
+    assert os.environ[POOL_SIZE_ENV] == "3"
+    assert INTRA_OP_NUM_THREADS_ENV not in os.environ
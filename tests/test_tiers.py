@@ -0,0 +1,75 @@
+"""
+Тесты уровней качества и политики выбора уровня.
+"""
+
+import asyncio
+import pytest
+from benchmarks.synthetic import generate_tracks
+from lib.cache import ResultCache, set_result_cache
+from lib.highlight import HIGHLIGHT_DURATION_SEC, get_highlights_list
+from lib.model import SR
+from lib.tiers import TierPolicy
+
+
+THRESHOLDS = {"fast": (4, 0.05), "heuristic": (12, 0.15)}
+
+
+def test_cost_is_normalised_by_audio_duration():
+    policy = TierPolicy(THRESHOLDS, smoothing=1.0)
+    # десять минут аудио за 20 секунд - обычная нагрузка
+    policy.observe(20.0, 600.0)
+    assert policy.choose(0) == "full"
+    # тот же объём аудио вдвое дольше
+    policy.observe(40.0, 600.0)
+    assert policy.choose(0) == "fast"
+    policy.observe(1.0, 5.0)
+    assert policy.choose(0) == "heuristic"
+
+
+def test_queue_depth_selects_tier():
+    policy = TierPolicy(THRESHOLDS)
+    assert policy.choose(3) == "full"
+    assert policy.choose(4) == "fast"
+    assert policy.choose(12) == "heuristic"
+    assert policy.choose(12, requested="full") == "full"
+
+
+def test_requests_without_audio_are_ignored():
+    policy = TierPolicy(THRESHOLDS)
+    policy.observe(5.0, 0.0)
+    assert policy.cost is None
+
+
+def test_failed_requests_are_not_observed():
+    policy = TierPolicy(THRESHOLDS)
+    with pytest.raises(RuntimeError):
+        with policy.track(60.0):
+            assert policy.active == 1
+            raise RuntimeError
+    assert policy.active == 0
+    assert policy.cost is None
+
+    with policy.track(60.0):
+        pass
+    assert policy.cost is not None and policy.cost < 0.05
+
+
+def test_results_record_tier():
+    previous = set_result_cache(ResultCache(None))
+    try:
+        tracks = generate_tracks([40, 20], SR)
+        results = asyncio.run(
+            get_highlights_list(
+                tracks,
+                [SR] * len(tracks),
+                backend="thread",
+                return_offsets=True,
+                tier="heuristic",
+            )
+        )
+    finally:
+        if previous is not None:
+            set_result_cache(previous)
+    assert [result.tier for result in results] == ["heuristic"] * 2
+    assert results[1].start_sec == 0.0
+    assert len(results[0].highlight) == HIGHLIGHT_DURATION_SEC * SR
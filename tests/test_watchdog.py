@@ -0,0 +1,81 @@
+"""
+Тесты Watchdog-бота на поддельном Docker API.
+"""
+
+import asyncio
+from aiohttp.test_utils import TestServer
+from benchmarks.watchdog_drill import FakeDocker
+from lib.watchdog_service import ContainerWatchdog, DockerAPI
+
+
+DEBOUNCE_SEC = 0.5
+
+
+async def wait_for(condition, timeout: float = 5.0) -> None:
+    """
+    Функция ожидания выполнения условия condition.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, "condition was not met in time"
+        await asyncio.sleep(0.02)
+
+
+def test_debounce_and_restarts():
+    names = ["app", "api"]
+    docker = FakeDocker(names)
+    messages = []
+
+    async def run():
+        server = TestServer(docker.app())
+        await server.start_server()
+        stop = asyncio.Event()
+        try:
+            async with DockerAPI(
+                f"http://{server.host}:{server.port}"
+            ) as api:
+                # опросы по интервалу не успевают произойти, поэтому
+                # изменения замечаются только по потоку событий
+                watchdog = ContainerWatchdog(
+                    api,
+                    tuple(names),
+                    notify=messages.append,
+                    interval=60,
+                    debounce=DEBOUNCE_SEC,
+                )
+                task = asyncio.create_task(watchdog.run(stop))
+                await wait_for(
+                    lambda: docker.subscribers and len(messages) == 2
+                )
+                # повреждённое событие не обрывает поток событий
+                docker.emit_raw(b"not json\n")
+                docker.emit_raw(b"[1, 2]\n")
+
+                # кратковременное падение короче времени подтверждения
+                docker.set_status("app", "exited")
+                await asyncio.sleep(DEBOUNCE_SEC / 5)
+                docker.set_status("app", "running")
+                await wait_for(
+                    lambda: "Container app restarted" in messages[-1]
+                )
+
+                docker.restart("api")
+                await wait_for(
+                    lambda: "Container api restarted" in messages[-1]
+                )
+
+                docker.set_status("api", "exited")
+                await wait_for(lambda: "status: exited" in messages[-1])
+                stop.set()
+                await task
+        finally:
+            await server.close()
+
+    asyncio.run(run())
+    assert all("Polling containers check" in text for text in messages[:2])
+    status_messages = [text for text in messages if "status: exited" in text]
+    assert status_messages == [
+        "Container name: api\nContainer status: exited"
+    ]
+    assert sum("restarted" in text for text in messages) == 2
@@ -0,0 +1,53 @@
+"""
+Тесты поиска окон с максимальной площадью под кривой предсказания.
+"""
+
+import numpy as np
+import pytest
+from lib.utils import get_max_area_section
+from lib.window_search import (
+    find_highlight_windows,
+    find_top_windows,
+    window_scores,
+)
+
+
+PREDICTION = np.array([0, 1, 5, 5, 1, 0, 0, 3, 3, 0], dtype=np.float32)
+
+
+def test_best_window():
+    starts, scores = window_scores(PREDICTION, 2)
+    assert len(starts) == len(PREDICTION) - 1
+    assert find_top_windows(PREDICTION, 2)[0].start_sec == 2
+    windows = find_top_windows(PREDICTION, 2, top_k=2)
+    assert [window.start_sec for window in windows] == [2, 7]
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"duration": 2, "resolution": 0},
+        {"duration": 2, "resolution": -0.5},
+        {"duration": 0},
+        {"duration": len(PREDICTION) + 1},
+    ],
+)
+def test_invalid_window_parameters(kwargs):
+    with pytest.raises(ValueError):
+        window_scores(PREDICTION, **kwargs)
+    with pytest.raises(ValueError):
+        find_top_windows(PREDICTION, **kwargs)
+
+
+@pytest.mark.parametrize("top_k", [0, -1])
+def test_invalid_top_k(top_k):
+    with pytest.raises(ValueError):
+        find_top_windows(PREDICTION, 2, top_k=top_k)
+
+
+def test_long_windows_start_at_the_beginning():
+    windows = find_highlight_windows(PREDICTION, durations=(2, 30))
+    assert windows[2][0].start_sec == 2
+    assert windows[30][0].start_sec == 0
+    assert windows[30][0].score == pytest.approx(PREDICTION.sum())
+    assert get_max_area_section(list(PREDICTION), 30) == 0